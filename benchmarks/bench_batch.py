@@ -0,0 +1,77 @@
+"""Grids per second: BatchVerifier vs Evaluator, one grid at a time.
+
+Checks a batch of candidate grids against two specs: Unruly (no three
+equal colors in a row or column of a window, and as many of each color in
+every row and column) on an 8x8 grid, and 9x9 Sudoku with no clues. The
+Unruly batch is random grids with a few valid ones planted; the Sudoku
+batch is relabelled valid grids, half of them with a cell changed. The
+scalar Evaluator checks a prefix of each batch, and the verdicts are
+compared.
+
+    PYTHONPATH=src python benchmarks/bench_batch.py 100000
+"""
+import sys
+import time
+
+import numpy as np
+
+from bench_template import sudoku_template
+
+from puzzlespec import PuzzleSpecBuilder, func_var
+from puzzlespec.compiler.backends.batch import BatchVerifier
+from puzzlespec.compiler.backends.evaluator import Evaluator
+from puzzlespec.libs import nd, std, topology as topo
+
+
+def unruly(n):
+    p = PuzzleSpecBuilder()
+    BW, C = std.make_enum('B', 'W')
+    color = func_var(topo.Grid2D(n, n).cells(), BW, name='color')
+    for size in ((1, 3), (3, 1)):
+        p += nd.tiles(color, size=size, stride=(1, 1)).forall(lambda w: ~std.all_same(w))
+    for i in range(n):
+        p += std.sum([(color((i, j)) == C.B).to_int() for j in range(n)]) == n//2
+        p += std.sum([(color((j, i)) == C.B).to_int() for j in range(n)]) == n//2
+    return p.build("Unruly")
+
+
+def unruly_grids(n, count, rng):
+    grids = rng.integers(0, 2, size=(count, n, n), dtype=np.int8)
+    r, c = np.indices((n, n))
+    for i, g in enumerate(((r+c) % 2, (r//2 + c) % 2, (r + c//2) % 2)):
+        grids[i::97] = g
+    return grids
+
+
+def sudoku_grids(N, count, rng):
+    bs = int(N**0.5)
+    r, c = np.indices((N, N))
+    grid = (bs*(r % bs) + r//bs + c) % N
+    grids = np.stack([rng.permutation(N)[grid] + 1 for _ in range(count)])
+    rows, cols = rng.integers(0, N, size=(2, count//2))
+    grids[np.arange(count//2)*2, rows, cols] = rng.integers(1, N+1, size=count//2)
+    return grids
+
+
+def bench(name, spec, var, grids, scalar, **shared):
+    bv = BatchVerifier(spec)
+    bv.verify({var: grids[:2], **shared})
+    start = time.perf_counter()
+    ok = bv.verify({var: grids, **shared})
+    t_batch = time.perf_counter() - start
+    ev = Evaluator(spec)
+    start = time.perf_counter()
+    ref = [ev.check({var: g, **shared}).ok for g in grids[:scalar]]
+    t_scalar = time.perf_counter() - start
+    assert ok[:scalar].tolist() == ref
+    rate, rate_scalar = len(grids)/t_batch, scalar/t_scalar
+    print(f"{name:>8} {len(grids):>8} {int(ok.sum()):>7} {rate:>12.0f} {rate_scalar:>13.1f} {rate/rate_scalar:>8.0f}x")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    scalar = min(count, 300)
+    rng = np.random.default_rng(0)
+    print(f"{'spec':>8} {'grids':>8} {'valid':>7} {'batch /s':>12} {'scalar /s':>13} {'speedup':>9}")
+    bench("unruly8", unruly(8), "color", unruly_grids(8, count, rng), scalar)
+    bench("sudoku9", sudoku_template().spec, "cell_digits", sudoku_grids(9, count, rng), scalar, N=9, givens={})
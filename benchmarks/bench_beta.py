@@ -0,0 +1,63 @@
+"""De Bruijn beta reduction of deeply nested nd index-map lambdas.
+
+Takes the closed index-map lambdas that nd.tiles and nd.rows build over a
+16x16 grid, resolves them to de Bruijn form and stacks `depth` applications
+of them (cycling through the lambdas) on the bound variable of an outer
+lambda, so every redex's argument is an open term that the next redex shifts
+and substitutes into several places. Reports the unique node counts before
+and after normalization and the wall time of BetaReductionPass iterated to a
+fixed point and of NbEPass, after checking both reach the same node.
+
+    PYTHONPATH=src python benchmarks/bench_beta.py 8 16 32 64
+"""
+import sys
+import time
+
+from bench_node_memory import unique_nodes
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.passes.analyses.info import count
+from puzzlespec.compiler.passes.pass_base import Context, PassManager
+from puzzlespec.compiler.passes.transforms.beta_reduction import BetaReductionPass
+from puzzlespec.compiler.passes.transforms.nbe import NbEPass
+from puzzlespec.compiler.passes.transforms.resolve_vars import resolve_bound_vars
+from puzzlespec.libs import nd
+
+
+def index_maps(N: int = 16, bs: int = 4):
+    Cells = nd.fin(N)*nd.fin(N)
+    lams = []
+    for dom in (nd.tiles(Cells, (bs, bs), (bs, bs)), nd.rows(Cells)):
+        root = resolve_bound_vars(dom.node)
+        closed = BetaReductionPass().free_bound
+        lams += [n for n in unique_nodes(root) if isinstance(n, ir.Lambda) and closed(n) == 0]
+    return lams
+
+
+def nested_redexes(depth: int, lams):
+    argT = lams[0].T.children[0]
+    term = ir.BoundVar(argT, 0)
+    for i in range(depth):
+        lam = lams[i % len(lams)]
+        term = ir.Apply(lam.T.children[1], lam, term)
+    return ir.Lambda(ir.PiT(argT, term.T), term)
+
+
+def timed(group, root, repeats: int = 3):
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = PassManager(group(), max_iter=100).run(root, Context())
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    depths = [int(a) for a in sys.argv[1:]] or [8, 16, 32, 64]
+    lams = index_maps()
+    print(f"{'depth':>6} {'nodes':>7} {'reduced':>8} {'beta ms':>9} {'nbe ms':>8}")
+    for depth in depths:
+        root = nested_redexes(depth, lams)
+        t_beta, r_beta = timed(lambda: [BetaReductionPass()], root)
+        t_nbe, r_nbe = timed(lambda: [NbEPass()], root)
+        assert r_beta is r_nbe, f"depth {depth}: NbE result differs"
+        print(f"{depth:>6} {count(root, unique=True):>7} {count(r_nbe, unique=True):>8} {t_beta*1e3:>9.2f} {t_nbe*1e3:>8.2f}")
@@ -0,0 +1,50 @@
+"""Per-node dispatch cost of pass handlers on a built 9x9 Sudoku.
+
+Runs CanonicalizePass and TypeCheckingPass over the fully built spec and
+reports the wall time per dispatched node (one handler call per uncached
+node) together with the cost of the handler lookup alone.
+
+    PYTHONPATH=src python benchmarks/bench_dispatch.py [N] [repeats]
+"""
+import sys
+import time
+
+from bench_node_memory import build_sudoku, unique_nodes
+from puzzlespec.compiler.passes.pass_base import Context
+from puzzlespec.compiler.passes.analyses.type_check import TypeCheckingPass
+from puzzlespec.compiler.passes.transforms.canonicalize import CanonicalizePass
+
+
+def time_pass(cls, root, repeats: int):
+    best, dispatched = float("inf"), 0
+    for _ in range(repeats):
+        p = cls()
+        start = time.perf_counter()
+        p(root, Context())
+        best = min(best, time.perf_counter() - start)
+        dispatched = len(p._cache)
+    return best, dispatched
+
+
+def time_lookup(cls, nodes, repeats: int):
+    table = cls._dispatch
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for n in nodes:
+            table[type(n)]
+        best = min(best, time.perf_counter() - start)
+    return best / len(nodes)
+
+
+if __name__ == "__main__":
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 9
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    root = build_sudoku(N, opt=True)._spec
+    nodes = unique_nodes(root)
+    print(f"Sudoku{N}: {len(nodes)} unique nodes")
+    print(f"{'pass':<20} {'dispatched':>10} {'total ms':>9} {'us/node':>8} {'lookup ns':>10}")
+    for cls in (CanonicalizePass, TypeCheckingPass):
+        total, dispatched = time_pass(cls, root, repeats)
+        lookup = time_lookup(cls, nodes, repeats)
+        print(f"{cls.__name__:<20} {dispatched:>10} {total*1e3:>9.2f} {total/dispatched*1e6:>8.2f} {lookup*1e9:>10.1f}")
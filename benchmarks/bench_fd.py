@@ -0,0 +1,96 @@
+"""FDSolver on scalar Sudoku specs.
+
+Builds the scalar form Scalarize produces for demo/sudokuN.py: one Int per
+cell with domain range(1, N+1), AllDistinct over every row, column and box,
+and an Eq per given. The 9x9 instance is Inkala's "hardest Sudoku"; larger
+ones keep a seeded random ~50% of the cells of a shuffled solved grid.
+Reports the best-of-3 wall time of compiling and of solving, with search
+node/fail/restart counts, after checking the solution.
+
+    PYTHONPATH=src python benchmarks/bench_fd.py 9 16 25
+"""
+import random
+import sys
+import time
+
+from puzzlespec.compiler.backends.fd import FDSolver
+from puzzlespec.compiler.dsl import ir
+
+IntT = ir.IntT()
+BoolT = ir.BoolT()
+
+HARDEST_9 = (
+    "8........"
+    "..36....."
+    ".7..9.2.."
+    ".5...7..."
+    "....457.."
+    "...1...3."
+    "..1....68"
+    "..85...1."
+    ".9....4.."
+)
+
+
+def lit(v):
+    return ir.Lit(IntT, v)
+
+
+def givens(N: int, keep: float = 0.5, seed: int = 0):
+    if N == 9:
+        return {(i // 9, i % 9): int(ch) for i, ch in enumerate(HARDEST_9) if ch != "."}
+    return random_givens(N, keep, seed)
+
+
+def random_givens(N: int, keep: float = 0.5, seed: int = 0):
+    rng = random.Random(seed)
+    bs = int(N**0.5)
+    digits = list(range(1, N+1))
+    rng.shuffle(digits)
+    rows = [g*bs + r for g in rng.sample(range(bs), bs) for r in rng.sample(range(bs), bs)]
+    cols = [g*bs + c for g in rng.sample(range(bs), bs) for c in rng.sample(range(bs), bs)]
+    grid = {(r, c): digits[(bs*(ri % bs) + ri // bs + ci) % N] for r, ri in zip(rows, range(N)) for c, ci in zip(cols, range(N))}
+    return {rc: v for rc, v in grid.items() if rng.random() < keep}
+
+
+def sudoku_spec(N: int, clues):
+    bs = int(N**0.5)
+    T = ir.IntT(ref=ir.Range(ir.DomT(IntT), lit(1), lit(N+1), lit(1)))
+    cell = {(r, c): ir.VarRef(T, r*N + c) for r in range(N) for c in range(N)}
+    def distinct(cells):
+        vals = [cell[rc] for rc in cells]
+        return ir.AllDistinct(BoolT, ir.TupleLit(ir.TupleT(*(T for _ in vals)), *vals))
+    groups = [[(r, c) for c in range(N)] for r in range(N)]
+    groups += [[(r, c) for r in range(N)] for c in range(N)]
+    groups += [[(br*bs + r, bc*bs + c) for r in range(bs) for c in range(bs)] for br in range(bs) for bc in range(bs)]
+    cons = [distinct(g) for g in groups] + [ir.Eq(BoolT, cell[rc], lit(v)) for rc, v in clues.items()]
+    return ir.Spec(ir.TupleLit(ir.TupleT(*(BoolT for _ in cons)), *cons), ir.TupleLit(ir.TupleT()))
+
+
+def check(N: int, clues, sol):
+    bs = int(N**0.5)
+    grid = [[sol[r*N + c] for c in range(N)] for r in range(N)]
+    full = list(range(1, N+1))
+    assert all(sorted(row) == full for row in grid)
+    assert all(sorted(col) == full for col in zip(*grid))
+    assert all(sorted(grid[br+r][bc+c] for r in range(bs) for c in range(bs)) == full
+               for br in range(0, N, bs) for bc in range(0, N, bs))
+    assert all(grid[r][c] == v for (r, c), v in clues.items())
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [9, 16, 25]
+    print(f"{'N':>3} {'clues':>6} {'compile ms':>11} {'solve ms':>9} {'nodes':>6} {'fails':>6} {'restarts':>9}")
+    for N in sizes:
+        clues = givens(N)
+        spec = sudoku_spec(N, clues)
+        t_compile = t_solve = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            solver = FDSolver(spec)
+            mid = time.perf_counter()
+            sol = solver.solve()
+            end = time.perf_counter()
+            t_compile, t_solve = min(t_compile, mid - start), min(t_solve, end - mid)
+        check(N, clues, sol)
+        print(f"{N:>3} {len(clues):>6} {t_compile*1e3:>11.2f} {t_solve*1e3:>9.2f} {solver.nodes:>6} {solver.fails:>6} {solver.restarts:>9}")
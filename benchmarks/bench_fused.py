@@ -0,0 +1,59 @@
+"""Fused vs separate rewrite passes for the simplify() fixed-point group.
+
+Runs Canonicalize, ConstFold, AlgebraicSimplification, DomainSimplification
+and GuardOpt to a fixed point on the Sudoku rules, once as separate
+full-tree passes under PassManager and once as a single FusedTransform,
+checks both reach the same node and reports the wall time of each. The same
+rules run by EqualitySaturation are reported alongside, with the unique node
+count of each result. Shared pass caches are cleared before every run.
+
+    PYTHONPATH=src python benchmarks/bench_fused.py 4 9 16
+"""
+import sys
+import time
+
+from bench_node_memory import build_sudoku, unique_nodes
+from puzzlespec.compiler.passes.analyses.info import count
+from puzzlespec.compiler.passes.egraph import EqualitySaturation
+from puzzlespec.compiler.passes.pass_base import Context, FusedTransform, PassManager
+from puzzlespec.compiler.passes.transforms import (
+    AlgebraicSimplificationPass, CanonicalizePass, ConstFoldPass, DomainSimplificationPass,
+)
+from puzzlespec.compiler.passes.transforms.guard_opt import GuardLift, GuardOpt
+
+
+def rewrites():
+    return [
+        CanonicalizePass(),
+        ConstFoldPass(),
+        AlgebraicSimplificationPass(),
+        DomainSimplificationPass(),
+        GuardOpt(),
+    ]
+
+
+def timed(group, root, repeats: int = 3):
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        for p in rewrites():
+            type(p).clear_cache()
+        start = time.perf_counter()
+        result = PassManager(group(), max_iter=20).run(root, Context())
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [4, 9, 16]
+    print(f"{'N':>4} {'nodes':>7} {'separate ms':>12} {'fused ms':>9} {'speedup':>8} {'eqsat ms':>9} {'fused nodes':>12} {'eqsat nodes':>12}")
+    for N in sizes:
+        spec = build_sudoku(N)._spec
+        root = PassManager(GuardLift()).run(spec, Context())
+        t_sep, r_sep = timed(rewrites, root)
+        t_fused, r_fused = timed(lambda: [FusedTransform(*rewrites())], root)
+        assert r_sep is r_fused, f"Sudoku{N}: fused result differs"
+        t_eqsat, r_eqsat = timed(lambda: [EqualitySaturation()], root)
+        print(
+            f"{N:>4} {len(unique_nodes(root)):>7} {t_sep*1e3:>12.2f} {t_fused*1e3:>9.2f} {t_sep/t_fused:>8.2f}"
+            f" {t_eqsat*1e3:>9.2f} {count(r_fused, unique=True):>12} {count(r_eqsat, unique=True):>12}"
+        )
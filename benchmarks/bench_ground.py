@@ -0,0 +1,123 @@
+"""Scalarize grounding time on Sudoku rules, batched vs per element.
+
+Builds the Sudoku rules directly as HOAS IR over Cells = Fin(N)xFin(N), with
+the cell digits already a FuncLit of Int VarRefs (what Scalarize makes of
+the func var) and a FuncLit of given digits (0 for blank):
+
+    forall c in Cells: 1 <= cell(c) <= N
+    forall c in Cells: 0 < given(c) => cell(c) = given(c)
+    forall r in Fin(N): distinct(lambda j in Fin(N): cell((r, j)))   (and cols)
+    forall b in Fin(N): distinct(lambda k in Fin(N): cell((b//s*s + k//s, b%s*s + k%s)))
+
+and reports the best-of-3 wall time of Scalarize(aggressive=True) grounding
+them with batch=True (one walk of each body over NumPy index arrays) and
+batch=False (Apply + normalize + visit per element). It then does the same
+for demo/sudokuN.py's spec built with the DSL at a fixed N, whose nd.fin
+Cells, rows, cols and tiles are enumerated by utils._dom_size/_iterate.
+
+    PYTHONPATH=src python benchmarks/bench_ground.py 9 16 25
+"""
+import random
+import sys
+import time
+
+from puzzlespec import PuzzleSpecBuilder, U, Unit, func_var
+from puzzlespec.compiler.backends.passes.ground import index_domain
+from puzzlespec.compiler.backends.passes.scalarize import Scalarize
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.dsl.envs import SymTable
+from puzzlespec.compiler.passes.envobj import EnvsObj
+from puzzlespec.compiler.passes.pass_base import Context, PassManager
+from puzzlespec.libs import nd, std
+
+IntT = ir.IntT()
+BoolT = ir.BoolT()
+carT = ir.TupleT(IntT, IntT)
+
+
+def lit(v):
+    return ir.Lit(IntT, v)
+
+
+def lam(argT, resT, body, name):
+    return ir.LambdaHOAS(ir.PiTHOAS(argT, resT, name), body, name)
+
+
+def sudoku_rules(N: int, seed: int = 0):
+    s = int(N**0.5)
+    fin = ir.Fin(ir.DomT(IntT), lit(N))
+    Cells = ir.CartProd(ir.DomT(carT), fin, fin)
+    cellT = ir.TupleT(IntT, IntT, ref=Cells)
+    layout = ir._DenseLayout(val_map={e._key: i for i, e in enumerate(index_domain(Cells).elems())})
+    rng = random.Random(seed)
+    cell = ir.FuncLit(ir.PiTHOAS(cellT, IntT, "c"), Cells, *(ir.VarRef(IntT, i) for i in range(N*N)), layout=layout)
+    given = ir.FuncLit(ir.PiTHOAS(cellT, IntT, "c"), Cells, *(lit(rng.choice([0, rng.randint(1, N)])) for _ in range(N*N)), layout=layout)
+
+    c = ir.BoundVarHOAS(cellT, True, "c")
+    cd = ir.Apply(IntT, cell, c)
+    in_range = ir.Conj(BoolT, ir.LtEq(BoolT, lit(1), cd), ir.LtEq(BoolT, cd, lit(N)))
+    givens = ir.Implies(BoolT, ir.Lt(BoolT, lit(0), ir.Apply(IntT, given, c)), ir.Eq(BoolT, cd, ir.Apply(IntT, given, c)))
+    cons = [ir.Forall(BoolT, lam(cellT, BoolT, body, "c")) for body in (in_range, givens)]
+
+    finT = ir.IntT(ref=fin)
+    o = ir.BoundVarHOAS(finT, True, "o")
+    k = ir.BoundVarHOAS(finT, True, "k")
+    div = lambda a, b: ir.FloorDiv(IntT, a, lit(b))
+    mod = lambda a, b: ir.Mod(IntT, a, lit(b))
+    mul = lambda a, b: ir.Prod(IntT, a, lit(b))
+    groups = [
+        (o, k),
+        (k, o),
+        (ir.Sum(IntT, mul(div(o, s), s), div(k, s)), ir.Sum(IntT, mul(mod(o, s), s), mod(k, s))),
+    ]
+    for r, col in groups:
+        inner = lam(finT, IntT, ir.Apply(IntT, cell, ir.TupleLit(carT, r, col)), "k")
+        cons.append(ir.Forall(BoolT, lam(finT, BoolT, ir.AllDistinct(BoolT, inner), "o")))
+    return ir.TupleLit(ir.TupleT(*(BoolT for _ in cons)), *cons)
+
+
+def dsl_sudoku(N: int):
+    bs = int(N**0.5)
+    p = PuzzleSpecBuilder()
+    Cells = nd.fin(N)*nd.fin(N)
+    Digits = nd.range(1, N+1)
+    cell_digits = func_var(Cells, Digits, name="cell_digits")
+    p += nd.rows(cell_digits).forall(lambda vals: std.distinct(vals))
+    p += nd.cols(cell_digits).forall(lambda vals: std.distinct(vals))
+    p += nd.tiles(cell_digits, size=(bs, bs), stride=(bs, bs)).forall(lambda vals: std.distinct(vals))
+    givens = func_var(Cells, U(Unit) + Digits, name="givens")
+    p += Cells.forall(lambda c: givens(c).match(lambda _: True, lambda d: cell_digits(c) == d))
+    return p.build("Sudoku")
+
+
+def timed_spec(spec, batch: bool, repeats: int = 3):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        spec.transform(Scalarize(max_dom_size=10**6, aggressive=True, batch=batch), ctx=Context(spec.envs_obj))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def timed(root, batch: bool, repeats: int = 3):
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = PassManager(Scalarize(max_dom_size=10**6, aggressive=True, batch=batch)).run(root, Context(EnvsObj(SymTable())))
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [9, 16, 25]
+    print(f"{'N':>3} {'batched ms':>11} {'per-elem ms':>12} {'speedup':>8}")
+    for N in sizes:
+        root = sudoku_rules(N)
+        t_batch, _ = timed(root, True)
+        t_elem, _ = timed(root, False)
+        print(f"{N:>3} {t_batch*1e3:>11.1f} {t_elem*1e3:>12.1f} {t_elem/t_batch:>7.1f}x")
+    print("DSL spec")
+    for N in sizes:
+        spec = dsl_sudoku(N)
+        t_batch, t_elem = timed_spec(spec, True), timed_spec(spec, False)
+        print(f"{N:>3} {t_batch*1e3:>11.1f} {t_elem*1e3:>12.1f} {t_elem/t_batch:>7.1f}x")
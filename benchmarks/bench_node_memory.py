@@ -0,0 +1,83 @@
+"""Memory footprint of IR nodes on demo/sudokuN.py-style specs.
+
+Builds the Sudoku rules (rows/cols/tiles distinct + givens) for a concrete
+grid size, walks every unique node of the resulting spec and reports the
+average number of bytes owned by a node: the instance itself, its __dict__
+(if any) and the tuples/dicts hanging off it (children, key, cached field and
+named-children dicts, metadata). Child nodes are not counted.
+
+    PYTHONPATH=src python benchmarks/bench_node_memory.py 9 16 25
+"""
+import contextlib
+import io
+import sys
+
+from puzzlespec import func_var, Unit, U, PuzzleSpecBuilder
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.libs import std, nd
+
+
+def build_sudoku(N: int, opt: bool = False):
+    p = PuzzleSpecBuilder()
+    Cells = nd.fin(N)*nd.fin(N)
+    Digits = nd.range(1, N+1)
+    bs = int(N**0.5)
+    cell_digits = func_var(Cells, Digits, name="cell_digits")
+    p += nd.rows(cell_digits).forall(lambda row_vals: std.distinct(row_vals))
+    p += nd.cols(cell_digits).forall(lambda col_vals: std.distinct(col_vals))
+    p += nd.tiles(cell_digits, size=(bs, bs), stride=(bs, bs)).forall(lambda box_vals: std.distinct(box_vals))
+    givens = func_var(Cells, U(Unit) + Digits, name="givens")
+    p += Cells.forall(
+        lambda c: givens(c).match(
+            lambda _: True,
+            lambda d: cell_digits(c)==d
+        )
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        return p.build(f"Sudoku{N}", opt=opt)
+
+
+def _attrs(node: ir.Node):
+    if hasattr(node, "__dict__"):
+        yield from node.__dict__.values()
+    for cls in type(node).__mro__:
+        for s in getattr(cls, "__slots__", ()):
+            if s != "__weakref__" and hasattr(node, s):
+                yield getattr(node, s)
+
+
+def node_bytes(node: ir.Node) -> int:
+    seen = set()
+    def owned(v) -> int:
+        if isinstance(v, ir.Node) or id(v) in seen or not isinstance(v, (tuple, dict)):
+            return 0
+        seen.add(id(v))
+        vals = v.values() if isinstance(v, dict) else v
+        return sys.getsizeof(v) + sum(owned(x) for x in vals)
+    total = sys.getsizeof(node)
+    if hasattr(node, "__dict__"):
+        total += sys.getsizeof(node.__dict__)
+    return total + sum(owned(v) for v in _attrs(node))
+
+
+def unique_nodes(root: ir.Node):
+    seen = {}
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        if id(n) in seen:
+            continue
+        seen[id(n)] = n
+        # Touch the lazily cached accessors as a pass would
+        n.field_dict, n.named_children_dict
+        stack.extend(n.all_nodes)
+    return list(seen.values())
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [9, 16, 25]
+    print(f"{'N':>4} {'nodes':>8} {'bytes':>10} {'bytes/node':>11}")
+    for N in sizes:
+        nodes = unique_nodes(build_sudoku(N)._spec)
+        total = sum(node_bytes(n) for n in nodes)
+        print(f"{N:>4} {len(nodes):>8} {total:>10} {total/len(nodes):>11.1f}")
@@ -0,0 +1,45 @@
+"""PortfolioSolver on Sudoku: every config alone, then the race.
+
+Compiles bench_template.py's Sudoku template at each N and solves one
+instance (bench_fd.py's givens: Inkala's "hardest Sudoku" at N=9, a seeded
+random ~50% clue subset otherwise). Each config of default_configs() is first
+run alone in this process on the serialized spec (encoding included), then
+all of them race in a PortfolioSolver, whose time includes starting the
+workers and handing them the spec. The size of the serialized spec is
+reported too. Solutions are checked.
+
+On a machine with fewer cores than configs the race time-shares them, so it
+is the fastest config's time scaled by the oversubscription, plus startup.
+
+    PYTHONPATH=src python benchmarks/bench_portfolio.py 9 16
+"""
+import sys
+import time
+
+from bench_fd import givens
+from bench_template import check, sudoku_template
+
+from puzzlespec.compiler.backends import portfolio
+from puzzlespec.compiler.backends.portfolio import PortfolioSolver
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [9, 16]
+    for N in sizes:
+        compiled = sudoku_template().compile(N=N)
+        solver = PortfolioSolver(compiled)
+        clues = givens(N)
+        assume = compiled.assumptions(givens=clues)
+        print(f"N={N}: {len(solver.data)} bytes of serialized IR")
+        for config in solver.configs:
+            start = time.perf_counter()
+            vals = portfolio._run(solver.data, config, assume)
+            t = time.perf_counter() - start
+            check(N, clues, compiled._read(compiled.outputs["cell_digits"], vals))
+            extra = {k: v for k, v in vars(config).items() if k not in ("encoding", "seed")}
+            print(f"  {config.encoding:>4} seed={config.seed} {t:>8.3f} s  {extra}")
+        start = time.perf_counter()
+        sol, config = solver.solve(givens=clues)
+        t = time.perf_counter() - start
+        check(N, clues, sol["cell_digits"])
+        print(f"  race {t:>15.3f} s  won by {config.encoding} seed={config.seed}")
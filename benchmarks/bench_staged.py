@@ -0,0 +1,45 @@
+"""Checks per second of single assignments: StagedEvaluator vs Evaluator.
+
+Checks candidate grids one at a time against 8x8 Unruly and 9x9 Sudoku with
+no clues (the specs and grids of bench_batch), with the spec as built and
+optimized. The verdicts of the two evaluators are compared.
+
+    PYTHONPATH=src python benchmarks/bench_staged.py 300
+"""
+import sys
+import time
+
+import numpy as np
+
+from bench_batch import sudoku_grids, unruly, unruly_grids
+from bench_template import sudoku_template
+
+from puzzlespec.compiler.backends.evaluator import Evaluator
+from puzzlespec.compiler.backends.staged import StagedEvaluator
+
+
+def rate(ev, var, grids, shared):
+    start = time.perf_counter()
+    oks = [ev.check({var: g, **shared}).ok for g in grids]
+    return oks, len(grids)/(time.perf_counter() - start)
+
+
+def bench(name, spec, var, grids, **shared):
+    for label, s in (("built", spec), ("opt", spec.optimize())):
+        start = time.perf_counter()
+        st = StagedEvaluator(s)
+        t_stage = time.perf_counter() - start
+        st.check({var: grids[0], **shared})
+        oks, r_staged = rate(st, var, grids, shared)
+        ref, r_interp = rate(Evaluator(s), var, grids, shared)
+        assert oks == ref
+        print(f"{name:>8} {label:>6} {sum(oks):>6} {t_stage*1e3:>9.1f} {r_interp:>12.1f} {r_staged:>12.1f} "
+              f"{r_staged/r_interp:>8.1f}x")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rng = np.random.default_rng(0)
+    print(f"{'spec':>8} {'':>6} {'valid':>6} {'stage ms':>9} {'interp /s':>12} {'staged /s':>12} {'speedup':>9}")
+    bench("unruly8", unruly(8), "color", unruly_grids(8, count, rng))
+    bench("sudoku9", sudoku_template().spec, "cell_digits", sudoku_grids(9, count, rng), N=9, givens={})
@@ -0,0 +1,87 @@
+"""Instances per second: one SpecTemplate vs lowering every instance.
+
+Builds demo/sudokuN.py's spec with N a var, compiles a SpecTemplate for it
+at each N, and solves a batch of instances (seeded random ~50% clue subsets
+of shuffled solved grids, as in bench_fd.py) by binding their givens as
+assumptions of the one compiled solver. For comparison, a few instances are
+solved by lowering the spec again per instance, which is what substituting
+each instance into the spec and handing it to a backend costs at least.
+Solutions are checked.
+
+It then generates a puzzle per N with a seeded template: a random solved
+grid, minimized by CompiledTemplate.minimize, which blanks one clue at a time
+and keeps the blank if count_solutions(limit=2) stays 1.
+
+    PYTHONPATH=src python benchmarks/bench_template.py 4 9 16
+"""
+import sys
+import time
+
+from bench_fd import random_givens
+
+from puzzlespec import PuzzleSpecBuilder, U, Unit, func_var, var
+from puzzlespec.compiler.dsl.template import SpecTemplate
+from puzzlespec.libs import nd, std
+
+
+def sudoku_template(seed=None):
+    p = PuzzleSpecBuilder()
+    N = var(std.Nat, name="N")
+    bs = std.isqrt(N)
+    Cells = nd.fin(N)*nd.fin(N)
+    Digits = nd.range(1, N+1)
+    cell_digits = func_var(Cells, Digits, name="cell_digits")
+    p += nd.rows(cell_digits).forall(lambda vals: std.distinct(vals))
+    p += nd.cols(cell_digits).forall(lambda vals: std.distinct(vals))
+    p += nd.tiles(cell_digits, size=(bs, bs), stride=(bs, bs)).forall(lambda vals: std.distinct(vals))
+    givens = func_var(Cells, U(Unit) + Digits, name="givens")
+    p += Cells.forall(lambda c: givens(c).match(lambda _: True, lambda d: cell_digits(c) == d))
+    return SpecTemplate(p.build("Sudoku"), gen_vars=["givens"], seed=seed)
+
+
+def check(N: int, clues, sol):
+    bs = int(N**0.5)
+    grid = [[sol[(r, c)] for c in range(N)] for r in range(N)]
+    full = list(range(1, N+1))
+    assert all(sorted(row) == full for row in grid)
+    assert all(sorted(col) == full for col in zip(*grid))
+    assert all(sorted(grid[br+r][bc+c] for r in range(bs) for c in range(bs)) == full
+               for br in range(0, N, bs) for bc in range(0, N, bs))
+    assert all(grid[r][c] == v for (r, c), v in clues.items())
+
+
+def run(compiled, instances, N):
+    start = time.perf_counter()
+    for clues in instances:
+        sol = compiled.solve(givens=clues)
+        check(N, clues, sol["cell_digits"])
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [4, 9, 16]
+    count, relowered = 200, 3
+    print(f"{'N':>3} {'compile ms':>11} {'template inst/s':>16} {'relower inst/s':>15} {'speedup':>8}")
+    for N in sizes:
+        tmpl = sudoku_template()
+        instances = [random_givens(N, seed=i) for i in range(count)]
+        start = time.perf_counter()
+        compiled = tmpl.compile(N=N)
+        t_compile = time.perf_counter() - start
+        rate = count / run(compiled, instances, N)
+        start = time.perf_counter()
+        for clues in instances[:relowered]:
+            sol = tmpl._lower({"N": N}).solve(givens=clues)
+            check(N, clues, sol["cell_digits"])
+        rate_relower = relowered / (time.perf_counter() - start)
+        print(f"{N:>3} {t_compile*1e3:>11.1f} {rate:>16.1f} {rate_relower:>15.2f} {rate/rate_relower:>7.0f}x")
+    print(f"{'N':>3} {'clues':>6} {'generate s':>11}")
+    for N in sizes:
+        compiled = sudoku_template(seed=N).compile(N=N)
+        start = time.perf_counter()
+        grid = compiled.solve()["cell_digits"]
+        clues = compiled.minimize("givens", grid)
+        t_gen = time.perf_counter() - start
+        kept = {rc: v for rc, v in clues.items() if v is not None}
+        check(N, kept, compiled.solve(givens=clues)["cell_digits"])
+        print(f"{N:>3} {len(kept):>6} {t_gen:>11.2f}")
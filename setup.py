@@ -28,6 +28,10 @@ setup(
         "hwtypes",
     ],
     extras_require={
+        # SMT/CNF solving in the portfolio and the backend tests
+        "solvers": [
+            "z3-solver",
+        ],
         "dev": [
             "pytest",
             "pytest-cov",
@@ -1,3 +1,16 @@
-from ..compiler.dsl.smt_backend import SMTBackend
+from .smtlib import SMTLibEmitter, emit_smtlib
+from .cnf import CNFEncoder, emit_dimacs
+from .fd import FDSolver
 
-__all__ = ['SMTBackend']
\ No newline at end of file
+__all__ = ['SMTBackend', 'SMTLibEmitter', 'emit_smtlib', 'CNFBackend', 'CNFEncoder', 'emit_dimacs', 'FDSolver']
+
+# The spec-level backends live in dsl and import this package's passes, so
+# they are loaded on first use rather than here
+def __getattr__(name: str):
+    if name == 'SMTBackend':
+        from ..dsl.smt_backend import SMTBackend
+        return SMTBackend
+    if name == 'CNFBackend':
+        from ..dsl.cnf_backend import CNFBackend
+        return CNFBackend
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,1336 @@
+from __future__ import annotations
+
+import contextlib
+import functools
+import math
+import operator
+import typing as tp
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from ..dsl import ir
+from ..dsl.serialize import _from_key
+from ..dsl.spec import PuzzleSpec
+from .evaluator import _CONST, _MISSING, _analyze, _by_sid, _is_option, _obl, _var_names
+
+# Vectorized checking of a batch of assignments against a spec.
+#
+# BatchVerifier walks the same IR as Evaluator, but every value holds all the
+# candidates at once: Int/Bool/Enum values are NumPy arrays whose last axis is
+# the batch (size 1, or a Python scalar, where the value is the same for every
+# candidate). Enums are their label's index; tuples, Unit and sums are
+# tuple, None and _BSum over such arrays.
+#
+# A quantifier or reduction does not loop over its domain. It opens a slot of
+# axes in front of the ones already in use, one per factor of the domain
+# (Fin(8)×Fin(6) opens two), and binds its lambda to the domain's elements
+# laid out along them: the elements of a slot opened with b axes in use have
+# shape (*shape, 1, ..., 1) with b+1 trailing axes, and broadcast against
+# everything bound further out. The body is evaluated once, for every
+# element, and the slot's axes are reduced away again. So
+#
+#   Forall over tiles(color, (1, 3))   all over (8, 6)
+#     ¬AllSame over a window           min == max over (1, 3)
+#       color(r + dr, c + dc)          one (1, 3, 8, 6, B) view of color
+#
+# A func var's argument is a product of arithmetic progressions and its
+# values are an array over them (with the batch last). Applying it gathers,
+# except that when the indices do not depend on the candidate and are affine
+# in the slot axes -- rows, cols, tiles and windows all are -- the result is
+# an as_strided view of the var's array instead. AllDistinct sorts along the
+# slot and compares neighbours; AllSame compares the min and the max.
+#
+# Obligations are evaluated too. Where one fails, for the candidates in
+# whose evaluation it occurs (Ite, Implies, Conj, Disj and Match mask the
+# branches they would not take; a quantifier's body sees all its elements),
+# the candidate is rejected. Domains whose size depends on a candidate or on
+# an enclosing element are only supported as Fin/Range, masked to the
+# largest size.
+#
+# Values are given by SymTable name, as for Evaluator, except that a value
+# may hold a batch: an Int/Bool/Enum var takes a scalar or an array of shape
+# (B,), and a func var an array of shape (B, *dims) or (*dims,) for one
+# shared by all candidates, with an axis per factor of its domain, or a
+# mapping or callable (shared). Option codomains take a NumPy masked array,
+# masked where the value is None.
+
+class _BSum:
+    """A value of a sum type: the variant index and a payload per variant
+    (None for Unit, and for variants no candidate takes)."""
+    __slots__ = ('tag', 'vals')
+
+    def __init__(self, tag, vals: tp.Sequence):
+        self.tag = tag
+        self.vals = tuple(vals)
+
+
+## Array helpers
+
+def _trim(a: np.ndarray) -> np.ndarray:
+    """a without leading axes of size 1, other than the batch axis."""
+    while a.ndim > 1 and a.shape[0] == 1:
+        a = a[0]
+    return a
+
+def _lift(a: np.ndarray, ndim: int) -> np.ndarray:
+    return a.reshape((1,)*(ndim - a.ndim) + a.shape) if a.ndim < ndim else a
+
+def _along(vals: np.ndarray, base: int) -> np.ndarray:
+    """A 1-d array of elements laid out along a slot opened at base."""
+    return vals.reshape(vals.shape + (1,)*(base+1))
+
+def _scalar(v, what: str) -> int:
+    a = np.asarray(v)
+    if a.ndim and not (a == a.flat[0]).all():
+        raise ValueError(f"{what} must be the same for every candidate and element")
+    return int(a.flat[0]) if a.ndim else int(a)
+
+def _map(fn: tp.Callable, v, *rest):
+    """fn over the arrays of a value (a tuple, a sum or an array)."""
+    if isinstance(v, tuple):
+        return tuple(_map(fn, c, *(r[i] for r in rest)) for i, c in enumerate(v))
+    if isinstance(v, _BSum):
+        return _BSum(fn(v.tag, *(r.tag for r in rest)), (
+            None if p is None else _map(fn, p, *(r.vals[i] for r in rest)) for i, p in enumerate(v.vals)
+        ))
+    if v is None:
+        return None
+    if isinstance(v, (_BFunc, _BDom)):
+        raise ValueError("Cannot vectorize functions or domains as elements here")
+    return fn(v, *rest)
+
+def _eq(a, b):
+    if isinstance(a, tuple):
+        return functools.reduce(np.logical_and, (_eq(x, y) for x, y in zip(a, b)), True)
+    if isinstance(a, _BSum):
+        res = a.tag == b.tag
+        for i, (x, y) in enumerate(zip(a.vals, b.vals)):
+            if x is not None and y is not None:
+                res = res & ((a.tag != i) | _eq(x, y))
+        return res
+    if a is None:
+        return True
+    return a == b
+
+def _select(c, a, b):
+    if isinstance(a, tuple):
+        return tuple(_select(c, x, y) for x, y in zip(a, b))
+    if isinstance(a, _BSum):
+        return _BSum(np.where(c, a.tag, b.tag), (
+            y if x is None else x if y is None else _select(c, x, y) for x, y in zip(a.vals, b.vals)
+        ))
+    if a is None:
+        return None
+    if isinstance(a, (_BFunc, _BDom)):
+        raise ValueError("Cannot vectorize a choice between functions or domains")
+    return np.where(c, a, b)
+
+def _stack(vals: tp.Sequence, base: int):
+    """Values bound outside a slot opened at base, as elements along it."""
+    def stack(*arrs):
+        arrs = [_lift(_trim(np.asarray(a)), base+1) for a in arrs]
+        shape = np.broadcast_shapes(*(a.shape for a in arrs))
+        return np.stack([np.broadcast_to(a, shape) for a in arrs])
+    return _map(stack, *vals)
+
+def _flat(v, shape: tp.Tuple[int, ...], base: int):
+    """Elements laid out along a slot of the given shape, along one axis."""
+    full = shape + (1,)*(base+1)
+    def flat(a):
+        a = np.asarray(a)
+        a = np.broadcast_to(a, np.broadcast_shapes(a.shape, full))
+        return a.reshape((-1,) + a.shape[len(shape):])
+    return _map(flat, v)
+
+def _pick(v, idx: np.ndarray, n: int):
+    """The elements at idx of values along a slot's first n axes, flattened."""
+    def pick(a):
+        a = np.asarray(a)
+        if a.ndim < n:
+            return a
+        return np.take(a.reshape((-1,) + a.shape[n:]), idx, axis=0)
+    return _map(pick, v)
+
+def _over(fn: tp.Callable, v, shape: tp.Tuple[int, ...], base: int, full: bool = False, **kwargs):
+    """Reduces v over the axes of a slot of the given shape opened at base.
+    With full, v is first broadcast along all of them."""
+    a = _trim(np.asarray(v))
+    if full:
+        a = np.broadcast_to(a, np.broadcast_shapes(a.shape, shape + (1,)*(base+1)))
+    k = a.ndim - (base+1)
+    if k <= 0:
+        return a
+    assert k <= len(shape)
+    return _trim(fn(a, axis=tuple(range(k)), **kwargs))
+
+def _key(v):
+    """One int array standing for a scalar or tuple value, equal exactly
+    where the values are."""
+    if isinstance(v, tuple):
+        key, first = None, True
+        for c in v:
+            c = _key(c)
+            if first:
+                key, first = c, False
+                continue
+            lo = c.min() if c.size else 0
+            span = int(c.max() - lo + 1) if c.size else 1
+            key = key*span + (c - lo)
+        return np.int64(0) if key is None else key
+    if isinstance(v, (_BSum, _BFunc, _BDom)) or v is None:
+        raise ValueError("Cannot vectorize distinctness of sums, functions or domains")
+    return np.asarray(v).astype(np.int64)
+
+def _ints(a: np.ndarray) -> np.ndarray:
+    if a.dtype == bool:
+        return a
+    if a.dtype.kind not in "iu":
+        a = a.astype(np.int64)
+    return a if a.dtype.itemsize >= 4 else a.astype(np.int32)
+
+
+## Functions and domains
+
+class _BFunc:
+    """A function value."""
+    __slots__ = ()
+
+    def dom(self, run: _Run) -> _BDom:
+        raise NotImplementedError()
+
+    def at(self, run: _Run, x):
+        raise NotImplementedError()
+
+class _Grid(_BFunc):
+    """A func var: its values over a product of arithmetic progressions, as
+    an array with an axis per factor and the batch last."""
+    __slots__ = ('_dom', 'axes', 'data', 'tag')
+
+    def __init__(self, dom: _BDom, axes: tp.Sequence[tp.Tuple[int, int, int]], data: np.ndarray, tag: tp.Optional[np.ndarray]):
+        self._dom = dom
+        # (lo, step, n) per factor
+        self.axes = axes
+        self.data = data
+        self.tag = tag
+
+    def dom(self, run):
+        return self._dom
+
+    def at(self, run: _Run, x):
+        xs = x if len(self.axes) > 1 else (x,)
+        idx = []
+        for (lo, step, n), xi in zip(self.axes, xs):
+            if lo or step != 1:
+                xi = np.asarray(xi) - lo
+                q = xi // step
+                run.poison(q*step != xi)
+                xi = q
+            idx.append(xi)
+        vals = _gather(run, self.data, idx)
+        if self.tag is None:
+            return vals
+        return _BSum(_gather(run, self.tag, idx), (None, vals))
+
+def _gather(run: _Run, data: np.ndarray, idx: tp.List):
+    """data[*idx] for every candidate, as a view of data where the indices
+    allow it."""
+    shape = np.broadcast_shapes(*(np.shape(i) for i in idx))
+    if not shape or shape[-1] == 1:
+        view = _strided(data, idx, shape)
+        if view is not None:
+            return view
+    out = False
+    clipped = []
+    for i, n in zip(idx, data.shape):
+        i = np.asarray(i)
+        out = out | (i < 0) | (i >= n)
+        clipped.append(np.clip(i, 0, n-1))
+    run.poison(out)
+    lanes = np.arange(data.shape[-1]) if data.shape[-1] > 1 else 0
+    return data[(*clipped, lanes)]
+
+def _strided(data: np.ndarray, idx: tp.List, shape: tp.Tuple[int, ...]) -> tp.Optional[np.ndarray]:
+    """data[*idx] as a view, if every index is in bounds and affine in the
+    slot axes."""
+    if not shape:
+        ii = tuple(int(i) for i in idx)
+        if not all(0 <= i < n for i, n in zip(ii, data.shape)):
+            return None
+        return data[ii]
+    S = shape[:-1]
+    ar = [np.arange(n).reshape((n,) + (1,)*(len(S)-ax-1)) for ax, n in enumerate(S)]
+    offs, strides = [], [0]*len(S)
+    for i, n, st in zip(idx, data.shape, data.strides):
+        a = np.broadcast_to(i, shape)[..., 0]
+        c = int(a[(0,)*len(S)])
+        expect = c
+        for ax, m in enumerate(S):
+            if m > 1:
+                d = int(a[(0,)*ax + (1,) + (0,)*(len(S)-ax-1)]) - c
+                strides[ax] += d*st
+                expect = expect + d*ar[ax]
+        if not (a == expect).all() or a.min() < 0 or a.max() >= n:
+            return None
+        offs.append(c)
+    base = data[tuple(offs)]
+    return as_strided(base, S + base.shape, tuple(strides) + base.strides, writeable=False)
+
+class _Closure(_BFunc):
+    """A LambdaHOAS with the names bound around it."""
+    __slots__ = ('lam', 'env', '_dom')
+
+    def __init__(self, lam: ir.LambdaHOAS, env: tp.Dict[str, tp.Any]):
+        self.lam = lam
+        self.env = env
+        self._dom = None
+
+    def dom(self, run: _Run) -> _BDom:
+        if self._dom is None:
+            self._dom = run.type_dom(self.lam.T.argT, self.env)
+        return self._dom
+
+    def at(self, run: _Run, x):
+        env = dict(self.env)
+        env[self.lam.bv_name] = x
+        return run.ev(self.lam.body, env)
+
+class _Composed(_BFunc):
+    """fs[0] ∘ fs[1] ∘ ...: the last is applied first."""
+    __slots__ = ('fs',)
+
+    def __init__(self, fs: tp.Sequence[_BFunc]):
+        self.fs = fs
+
+    def dom(self, run):
+        return self.fs[-1].dom(run)
+
+    def at(self, run, x):
+        for f in reversed(self.fs):
+            x = f.at(run, x)
+        return x
+
+class _LitFunc(_BFunc):
+    """A FuncLit: values for literal keys."""
+    __slots__ = ('_dom', 'keys', 'vals')
+
+    def __init__(self, dom: _BDom, keys: tp.Sequence, vals: tp.Sequence):
+        self._dom = dom
+        self.keys = keys
+        self.vals = vals
+
+    def dom(self, run):
+        return self._dom
+
+    def at(self, run: _Run, x):
+        res, hit = None, False
+        for k, v in zip(self.keys, self.vals):
+            h = _eq(x, k)
+            res = v if res is None else _select(h, v, res)
+            hit = np.logical_or(hit, h)
+        run.poison(np.logical_not(hit))
+        return res
+
+
+class _BDom:
+    """A domain value. Its elements are laid out along a slot: shape()
+    axes in front of the base+1 already in use."""
+    __slots__ = ('_cache',)
+    # Whether an element may occur more than once
+    dups = False
+
+    def __init__(self):
+        self._cache = {}
+
+    def shape(self, run: _Run) -> tp.Tuple[int, ...]:
+        raise ValueError(f"Cannot enumerate {type(self).__name__[1:]}")
+
+    def elems(self, run: _Run, base: int):
+        v = self._cache.get(base, _MISSING)
+        if v is _MISSING:
+            v = self._cache[base] = self._elems(run, base)
+        return v
+
+    def _elems(self, run: _Run, base: int):
+        raise NotImplementedError()
+
+    def mask(self, run: _Run, base: int):
+        """Where the slot holds an element (None: everywhere)."""
+        return None
+
+    def member(self, run: _Run, x):
+        shape = self.shape(run)
+        with run.slot(shape) as base:
+            hit = _eq(x, self.elems(run, base))
+            mask = self.mask(run, base)
+            if mask is not None:
+                hit = np.logical_and(hit, mask)
+            return _over(np.any, hit, shape, base)
+
+    def first(self, run: _Run, base: int):
+        """mask(), also excluding repeats of an earlier element."""
+        mask = self.mask(run, base)
+        if not self.dups:
+            return mask
+        shape = self.shape(run)
+        key = _flat(_key(self.elems(run, base)), shape, base)
+        m = key.shape[0]
+        same = key[:, None] == key[None, :]
+        earlier = np.tril(np.ones((m, m), dtype=bool), -1).reshape((m, m) + (1,)*(key.ndim-1))
+        rep = (same & earlier).any(axis=1)
+        if not rep.any():
+            return mask
+        keep = np.logical_not(rep).reshape(shape + rep.shape[1:])
+        return keep if mask is None else np.logical_and(mask, keep)
+
+class _RangeDom(_BDom):
+    """lo, lo+step, ... (count of them), masked to each count where the
+    count varies."""
+    __slots__ = ('lo', 'step', 'count', 'n')
+
+    def __init__(self, lo, step, count):
+        super().__init__()
+        self.lo, self.step, self.count = lo, step, count
+        c = np.asarray(count)
+        self.n = max(int(c.max()), 0) if c.size else 0
+        if c.ndim and (c == self.n).all():
+            self.count = self.n
+
+    def shape(self, run):
+        return (self.n,)
+
+    def _elems(self, run, base):
+        ar = _along(np.arange(self.n), base)
+        if isinstance(self.lo, int) and isinstance(self.step, int) and (self.lo, self.step) == (0, 1):
+            return ar
+        return self.lo + self.step*ar
+
+    def mask(self, run, base):
+        if np.ndim(self.count) == 0:
+            return None
+        return _along(np.arange(self.n), base) < self.count
+
+    def member(self, run, x):
+        k = np.asarray(x) - self.lo
+        q = k // self.step
+        return (q*self.step == k) & (q >= 0) & (q < self.count)
+
+class _ProdDom(_BDom):
+    __slots__ = ('doms',)
+
+    def __init__(self, doms: tp.Sequence[_BDom]):
+        super().__init__()
+        self.doms = doms
+
+    def shape(self, run):
+        return sum((d.shape(run) for d in self.doms), ())
+
+    def _place(self, run, base, get):
+        # Each factor's layout, with axes added for the other factors
+        shapes = [d.shape(run) for d in self.doms]
+        out = []
+        for k, d in enumerate(self.doms):
+            before = sum(len(s) for s in shapes[:k])
+            after = sum(len(s) for s in shapes[k+1:])
+            w = len(shapes[k])
+            def place(a):
+                a = _lift(np.asarray(a), w + base + 1)
+                return a.reshape((1,)*before + a.shape[:w] + (1,)*after + a.shape[w:])
+            v = get(d)
+            out.append(None if v is None else _map(place, v))
+        return out
+
+    def _elems(self, run, base):
+        return tuple(self._place(run, base, lambda d: d.elems(run, base)))
+
+    def mask(self, run, base):
+        masks = [m for m in self._place(run, base, lambda d: d.mask(run, base)) if m is not None]
+        return functools.reduce(np.logical_and, masks) if masks else None
+
+    def member(self, run, x):
+        return functools.reduce(np.logical_and, (d.member(run, c) for d, c in zip(self.doms, x)), True)
+
+class _ImageDom(_BDom):
+    __slots__ = ('f',)
+    dups = True
+
+    def __init__(self, f: _BFunc):
+        super().__init__()
+        self.f = f
+
+    def shape(self, run):
+        return self.f.dom(run).shape(run)
+
+    def _elems(self, run, base):
+        dom = self.f.dom(run)
+        with run.guard(dom.mask(run, base)):
+            return self.f.at(run, dom.elems(run, base))
+
+    def mask(self, run, base):
+        return self.f.dom(run).mask(run, base)
+
+class _RestrictDom(_BDom):
+    __slots__ = ('f',)
+
+    def __init__(self, f: _BFunc):
+        super().__init__()
+        self.f = f
+
+    def shape(self, run):
+        return self.f.dom(run).shape(run)
+
+    def _elems(self, run, base):
+        return self.f.dom(run).elems(run, base)
+
+    def mask(self, run, base):
+        key = ('mask', base)
+        m = self._cache.get(key, _MISSING)
+        if m is _MISSING:
+            dom = self.f.dom(run)
+            inner = dom.mask(run, base)
+            with run.guard(inner):
+                m = self.f.at(run, dom.elems(run, base))
+            m = self._cache[key] = m if inner is None else np.logical_and(inner, m)
+        return m
+
+    def member(self, run, x):
+        inside = self.f.dom(run).member(run, x)
+        with run.guard(inside):
+            return np.logical_and(inside, self.f.at(run, x))
+
+class _ValsDom(_BDom):
+    """Listed elements."""
+    __slots__ = ('vals',)
+    dups = True
+
+    def __init__(self, vals: tp.Sequence):
+        super().__init__()
+        self.vals = vals
+
+    def shape(self, run):
+        return (len(self.vals),)
+
+    def _elems(self, run, base):
+        if not self.vals:
+            return np.zeros((0,) + (1,)*(base+1), dtype=np.int64)
+        return _stack(self.vals, base)
+
+class _SumDom(_BDom):
+    """Values of a sum type, each variant from a domain (None: none of it).
+    Only tested for membership."""
+    __slots__ = ('doms',)
+
+    def __init__(self, doms: tp.Sequence[tp.Optional[_BDom]]):
+        super().__init__()
+        self.doms = doms
+
+    def member(self, run, x):
+        ok = False
+        for i, (d, v) in enumerate(zip(self.doms, x.vals)):
+            if d is None:
+                continue
+            hit = np.equal(x.tag, i)
+            if v is not None:
+                with run.guard(hit):
+                    hit = np.logical_and(hit, d.member(run, v))
+            ok = np.logical_or(ok, hit)
+        return ok
+
+class _AllDom(_BDom):
+    """All Ints (or functions, or domains): not enumerable."""
+    __slots__ = ()
+
+    def member(self, run, x):
+        return True
+
+class _SliceDom(_BDom):
+    __slots__ = ('dom', 'idx')
+
+    def __init__(self, dom: _BDom, idx: range):
+        super().__init__()
+        self.dom = dom
+        self.idx = np.asarray(idx, dtype=np.int64)
+
+    def shape(self, run):
+        return (len(self.idx),)
+
+    def _get(self, run, v):
+        return _pick(v, self.idx, len(self.dom.shape(run)))
+
+    def _elems(self, run, base):
+        shape = self.dom.shape(run)
+        return self._get(run, _flat(self.dom.elems(run, base), shape, base))
+
+    def mask(self, run, base):
+        return None
+
+class _UnionDom(_BDom):
+    __slots__ = ('doms',)
+    dups = True
+
+    def __init__(self, doms: tp.Sequence[_BDom]):
+        super().__init__()
+        self.doms = doms
+
+    def shape(self, run):
+        return (sum(math.prod(d.shape(run)) for d in self.doms),)
+
+    def _cat(self, run, base, get):
+        parts = []
+        for d in self.doms:
+            v = get(d)
+            shape = d.shape(run)
+            if v is None:
+                v = np.ones(shape + (1,)*(base+1), dtype=bool)
+            parts.append(_flat(v, shape, base))
+        def cat(*arrs):
+            arrs = [_lift(np.asarray(a), base+2) for a in arrs]
+            rest = np.broadcast_shapes(*(a.shape[1:] for a in arrs))
+            return np.concatenate([np.broadcast_to(a, a.shape[:1] + rest) for a in arrs])
+        return _map(cat, *parts)
+
+    def _elems(self, run, base):
+        return self._cat(run, base, lambda d: d.elems(run, base))
+
+    def mask(self, run, base):
+        if all(d.mask(run, base) is None for d in self.doms):
+            return None
+        return self._cat(run, base, lambda d: d.mask(run, base))
+
+    def member(self, run, x):
+        return functools.reduce(np.logical_or, (d.member(run, x) for d in self.doms), False)
+
+class _InterDom(_BDom):
+    __slots__ = ('doms',)
+
+    def __init__(self, doms: tp.Sequence[_BDom]):
+        super().__init__()
+        self.doms = doms
+
+    def shape(self, run):
+        return self.doms[0].shape(run)
+
+    def _elems(self, run, base):
+        return self.doms[0].elems(run, base)
+
+    def mask(self, run, base):
+        x = self.doms[0].elems(run, base)
+        m = self.doms[0].mask(run, base)
+        for d in self.doms[1:]:
+            inside = d.member(run, x)
+            m = inside if m is None else np.logical_and(m, inside)
+        return m
+
+    def member(self, run, x):
+        return functools.reduce(np.logical_and, (d.member(run, x) for d in self.doms), True)
+
+class _ProjDom(_BDom):
+    __slots__ = ('dom', 'idx')
+    dups = True
+
+    def __init__(self, dom: _BDom, idx: int):
+        super().__init__()
+        self.dom = dom
+        self.idx = idx
+
+    def shape(self, run):
+        return self.dom.shape(run)
+
+    def _elems(self, run, base):
+        return self.dom.elems(run, base)[self.idx]
+
+    def mask(self, run, base):
+        return self.dom.mask(run, base)
+
+
+# Node evaluation, by class: fn(run, node, env) -> value
+_OPS: tp.Dict[type, tp.Callable] = {}
+
+def _op(*classes: type):
+    def deco(fn):
+        for cls in classes:
+            _OPS[cls] = fn
+        return fn
+    return deco
+
+
+class BatchVerifier:
+    """Checks batches of assignments against a spec's rules at once.
+
+        bv = BatchVerifier(spec)
+        ok = bv.verify(color=grids)  # grids: (B, 8, 8); ok: (B,) of bool
+
+    A candidate passes where Evaluator's check() would be ok: every var fits
+    its type, and every top-level constraint and obligation holds.
+    """
+    def __init__(self, spec: tp.Union[PuzzleSpec, ir.Spec]):
+        self.spec = spec
+        root = spec._spec if isinstance(spec, PuzzleSpec) else spec
+        self.rules: tp.Tuple[ir.Node, ...] = root.cons.children + root.obls.children
+        kinds, self._vars = _analyze(root)
+        # (handler, memo kind, obligation) by node
+        self._info: tp.Dict[ir.Node, tp.Tuple[tp.Optional[tp.Callable], int, tp.Optional[ir.Node]]] = {
+            n: (_OPS.get(type(n)), kind, _obl(n)) for n, kind in kinds.items()
+        }
+        self._names = _var_names(spec, self._vars)
+        self._consts: tp.Dict[ir.Node, tp.Any] = {}
+
+    def verify(self, values: tp.Mapping[tp.Union[str, int], tp.Any] = None, **kwargs) -> np.ndarray:
+        """Whether each candidate in the values, by var name, satisfies the
+        spec, as a bool array with one entry per candidate."""
+        run = _Run(self, _by_sid(self._names, {**(values or {}), **kwargs}))
+        for sid in self._vars:
+            run.var(sid)
+        ok = run.lanes(True)
+        for sid in self._vars:
+            ok &= run.lanes(run.var_ok(sid))
+        for rule in self.rules:
+            ok &= run.lanes(run.ev(rule, {}))
+        return ok & np.logical_not(run.lanes(run.bad))
+
+def verify(spec: tp.Union[PuzzleSpec, ir.Spec], values: tp.Mapping[tp.Union[str, int], tp.Any] = None, **kwargs) -> np.ndarray:
+    """Checks the batch of values, by var name, against spec (see
+    BatchVerifier)."""
+    return BatchVerifier(spec).verify(values, **kwargs)
+
+
+class _Run:
+    """The state of one verify(): var values, memoized nodes, the axes in
+    use and the candidates found undefined."""
+    def __init__(self, verifier: BatchVerifier, raw: tp.Mapping[int, tp.Any]):
+        self.info = verifier._info
+        self.consts = verifier._consts
+        self.vars = verifier._vars
+        self.raw = raw
+        self.memo: tp.Dict[ir.Node, tp.Any] = {}
+        self.vals: tp.Dict[int, tp.Any] = {}
+        self.B: tp.Optional[int] = None
+        # Slot axes in use
+        self.nax = 0
+        # Where the value being computed is needed
+        self.care = True
+        self.bad = False
+        self.npoison = 0
+
+    def lanes(self, v) -> np.ndarray:
+        """A value with no slot axes as a bool per candidate."""
+        a = _trim(np.asarray(v, dtype=bool))
+        return np.broadcast_to(a.reshape(-1), (self.B or 1,)).copy()
+
+    def batch(self, n: int):
+        if self.B is None or self.B == 1:
+            self.B = n
+        elif n != 1 and n != self.B:
+            raise ValueError(f"Batches of {self.B} and {n} candidates")
+
+    @contextlib.contextmanager
+    def slot(self, shape: tp.Tuple[int, ...]):
+        base = self.nax
+        self.nax += len(shape)
+        try:
+            yield base
+        finally:
+            self.nax = base
+
+    @contextlib.contextmanager
+    def guard(self, cond):
+        prev = self.care
+        if cond is not None:
+            self.care = cond if prev is True else np.logical_and(prev, cond)
+        try:
+            yield
+        finally:
+            self.care = prev
+
+    def poison(self, fail):
+        """Rejects the candidates where fail is true and the value is needed."""
+        fail = np.logical_and(self.care, fail)
+        if not np.any(fail):
+            return
+        a = np.asarray(fail)
+        self.bad = np.logical_or(self.bad, a.reshape(-1, a.shape[-1]).any(axis=0))
+        self.npoison += 1
+
+    def ev(self, node: ir.Node, env: tp.Dict[str, tp.Any]):
+        fn, kind, obl = self.info[node]
+        if kind:
+            memo = self.consts if kind == _CONST else self.memo
+            v = memo.get(node, _MISSING)
+            if v is not _MISSING:
+                return v
+            npoison = self.npoison
+        if obl is not None:
+            self.poison(np.logical_not(self.ev(obl, env)))
+        if fn is None:
+            raise ValueError(f"Cannot vectorize {type(node).__name__}")
+        v = fn(self, node, env)
+        # A constant that rejected candidates is evaluated again next time
+        if kind and (kind != _CONST or self.npoison == npoison):
+            memo[node] = v
+        return v
+
+    ## Iteration
+
+    def values(self, f, base: int, first: bool = False):
+        """f's values along a slot opened at base for its domain, and the
+        mask of its elements (with first, of their first occurrences)."""
+        if isinstance(f, tuple):
+            return _stack(f, base), None
+        dom = f.dom(self)
+        mask = dom.first(self, base) if first else dom.mask(self, base)
+        with self.guard(mask):
+            return f.at(self, dom.elems(self, base)), mask
+
+    @staticmethod
+    def shape_of(run: _Run, f) -> tp.Tuple[int, ...]:
+        if isinstance(f, tuple):
+            return (len(f),)
+        return f.dom(run).shape(run)
+
+    ## Vars
+
+    def var(self, sid: int):
+        v = self.vals.get(sid, _MISSING)
+        if v is _MISSING:
+            v = self.vals[sid] = self._coerce(self.vars[sid].T, self.raw[sid])
+        return v
+
+    def _coerce(self, T: ir.Type, raw):
+        if isinstance(T, ir.PiTHOAS):
+            return self._grid(T, raw)
+        if isinstance(T, ir.TupleT):
+            return tuple(self._coerce(cT, r) for cT, r in zip(T.children, raw))
+        if isinstance(T, (ir.IntT, ir.BoolT, ir.EnumT)):
+            a = self._scalars(T, raw)
+            if a.ndim > 1:
+                raise ValueError(f"Expected a scalar or a batch of them, got shape {a.shape}")
+            if a.ndim:
+                self.batch(a.shape[0])
+                return a
+            return a[()]
+        if isinstance(T, ir.UnitT):
+            return None
+        raise ValueError(f"Cannot take batched values of type {T}")
+
+    def _scalars(self, T: ir.Type, raw) -> np.ndarray:
+        a = np.asarray(raw)
+        if isinstance(T, ir.EnumT) and a.dtype.kind in "UO":
+            labels = {l: i for i, l in enumerate(T.labels)}
+            a = np.vectorize(lambda l: labels.get(l, -1), otypes=[np.int64])(a) if a.size else a.astype(np.int64)
+        if isinstance(T, ir.BoolT):
+            return a.astype(bool)
+        return _ints(a)
+
+    def _grid(self, T: ir.PiTHOAS, raw) -> _Grid:
+        dom = self.type_dom(T.argT, {})
+        factors = dom.doms if isinstance(dom, _ProdDom) else (dom,)
+        axes = [self._progression(d) for d in factors]
+        dims = tuple(n for _, _, n in axes)
+        keys = lambda: (tuple(lo + step*i for (lo, step, _), i in zip(axes, ix)) if len(axes) > 1 else axes[0][0] + axes[0][1]*ix[0]
+                        for ix in np.ndindex(*dims))
+        resT = T.resT
+        opt = _is_option(resT)
+        valT = resT.elemTs[1] if opt else resT
+        if not isinstance(valT, (ir.IntT, ir.BoolT, ir.EnumT)):
+            raise ValueError(f"Cannot take batched values of type {resT}")
+        if isinstance(raw, tp.Mapping) or callable(raw):
+            get = raw.get if isinstance(raw, tp.Mapping) else (lambda k, d: raw(k))
+            vals = [get(k, None if opt else _MISSING) for k in keys()]
+            if any(v is _MISSING for v in vals):
+                raise ValueError("Missing values for a func var")
+            mask = np.array([v is None for v in vals], dtype=bool).reshape(dims)
+            a = np.ma.masked_array(
+                np.array([0 if v is None else v for v in vals], dtype=object).reshape(dims), mask=mask
+            ) if opt else np.array(vals, dtype=object).reshape(dims)
+        else:
+            a = raw if isinstance(raw, np.ma.MaskedArray) else np.asarray(raw)
+        if a.shape == dims:
+            a = a[None]
+        elif a.shape[1:] != dims:
+            raise ValueError(f"Expected values of shape {dims} or (B, *{dims}), got {a.shape}")
+        self.batch(a.shape[0])
+        mask = np.ma.getmaskarray(a) if opt else None
+        data = self._scalars(valT, np.ma.getdata(a))
+        data = np.ascontiguousarray(np.moveaxis(data, 0, -1))
+        tag = None
+        if opt:
+            tag = np.ascontiguousarray(np.moveaxis(np.logical_not(mask), 0, -1)).astype(np.int8)
+        return _Grid(dom, axes, data, tag)
+
+    def _progression(self, dom: _BDom) -> tp.Tuple[int, int, int]:
+        if isinstance(dom, _RangeDom) and np.ndim(dom.count) == 0:
+            return (_scalar(dom.lo, "A func var's domain"), _scalar(dom.step, "A func var's domain"), dom.n)
+        shape = dom.shape(self)
+        if len(shape) != 1:
+            raise ValueError("A func var's domain must be a product of ranges")
+        with self.slot(shape) as base:
+            e = np.asarray(dom.elems(self, base))
+            if dom.mask(self, base) is not None or e.dtype.kind not in "iub":
+                raise ValueError("A func var's domain must be a product of ranges")
+            e = e.reshape(-1) if e.size == shape[0] else None
+        if e is None:
+            raise ValueError("A func var's domain must be the same for every candidate")
+        n = len(e)
+        lo = int(e[0]) if n else 0
+        step = int(e[1] - e[0]) if n > 1 else 1
+        if step == 0 or (e != lo + step*np.arange(n)).any():
+            raise ValueError("A func var's domain must be a product of ranges")
+        return (lo, step, n)
+
+    def var_ok(self, sid: int):
+        T = self.vars[sid].T
+        v = self.var(sid)
+        if not isinstance(T, ir.PiTHOAS):
+            return self._fits(T, v, {})
+        ok = True if T.obl is None else self.ev(T.obl, {})
+        dom = v.dom(self)
+        shape = dom.shape(self)
+        with self.slot(shape) as base:
+            x = dom.elems(self, base)
+            fits = self._fits(T.resT, v.at(self, x), {T.bv_name: x})
+            return np.logical_and(ok, _over(np.all, fits, shape, base))
+
+    def _fits(self, T: ir.Type, v, env):
+        ok = True
+        if T.obl is not None:
+            ok = np.logical_and(ok, self.ev(T.obl, env))
+        if T.ref is not None:
+            ok = np.logical_and(ok, self.ev(T.ref, env).member(self, v))
+        elif isinstance(T, (ir.BoolT, ir.EnumT)):
+            ok = np.logical_and(ok, self.universe(T, env).member(self, v))
+        if isinstance(T, ir.TupleT):
+            for cT, c in zip(T.children, v):
+                ok = np.logical_and(ok, self._fits(cT, c, env))
+        if isinstance(T, ir.SumT):
+            ok = np.logical_and(ok, (v.tag >= 0) & (v.tag < len(T.elemTs)))
+            for i, (cT, c) in enumerate(zip(T.elemTs, v.vals)):
+                if c is not None:
+                    ok = np.logical_and(ok, (v.tag != i) | self._fits(cT, c, env))
+        return ok
+
+    ## Types as domains
+
+    def type_dom(self, T: ir.Type, env) -> _BDom:
+        if T.ref is not None:
+            return self.ev(T.ref, env)
+        return self.universe(T, env)
+
+    def universe(self, T: ir.Type, env) -> _BDom:
+        if isinstance(T, ir.BoolT):
+            return _ValsDom([False, True])
+        if isinstance(T, ir.EnumT):
+            return _RangeDom(0, 1, len(T.labels))
+        if isinstance(T, ir.UnitT):
+            return _ValsDom([None])
+        if isinstance(T, ir.TupleT):
+            return _ProdDom([self.type_dom(cT, env) for cT in T.children])
+        return _AllDom()
+
+
+## Scalars
+
+@_op(ir.Lit)
+def _(run, node: ir.Lit, env):
+    if isinstance(node.val, str):
+        return node.T.labels.index(node.val)
+    return node.val
+
+@_op(ir.Unit)
+def _(run, node, env):
+    return None
+
+@_op(ir.VarRef)
+def _(run: _Run, node: ir.VarRef, env):
+    return run.var(node.sid)
+
+@_op(ir.BoundVarHOAS)
+def _(run, node: ir.BoundVarHOAS, env):
+    return env[node.name]
+
+@_op(ir.Eq)
+def _(run: _Run, node, env):
+    a, b = node.children
+    return _eq(run.ev(a, env), run.ev(b, env))
+
+@_op(ir.Lt)
+def _(run: _Run, node, env):
+    a, b = node.children
+    return np.less(run.ev(a, env), run.ev(b, env))
+
+@_op(ir.LtEq)
+def _(run: _Run, node, env):
+    a, b = node.children
+    return np.less_equal(run.ev(a, env), run.ev(b, env))
+
+@_op(ir.Not)
+def _(run: _Run, node, env):
+    return np.logical_not(run.ev(node.children[0], env))
+
+@_op(ir.Implies)
+def _(run: _Run, node, env):
+    a, b = node.children
+    a = run.ev(a, env)
+    if np.ndim(a) == 0 and not a:
+        return True
+    with run.guard(a):
+        return np.logical_or(np.logical_not(a), run.ev(b, env))
+
+@_op(ir.Conj, ir.Disj)
+def _(run: _Run, node, env):
+    conj = isinstance(node, ir.Conj)
+    acc = conj
+    for c in node.children:
+        with run.guard(acc if conj else np.logical_not(acc)):
+            v = run.ev(c, env)
+        acc = np.logical_and(acc, v) if conj else np.logical_or(acc, v)
+        if np.ndim(acc) == 0 and bool(acc) != conj:
+            break
+    return acc
+
+@_op(ir.Ite)
+def _(run: _Run, node, env):
+    c, t, f = node.children
+    c = run.ev(c, env)
+    if np.ndim(c) == 0:
+        return run.ev(t if c else f, env)
+    with run.guard(c):
+        t = run.ev(t, env)
+    with run.guard(np.logical_not(c)):
+        f = run.ev(f, env)
+    return _select(c, t, f)
+
+@_op(ir.Neg)
+def _(run: _Run, node, env):
+    return np.negative(run.ev(node.children[0], env))
+
+@_op(ir.Abs)
+def _(run: _Run, node, env):
+    return np.abs(run.ev(node.children[0], env))
+
+@_op(ir.Sum)
+def _(run: _Run, node, env):
+    return functools.reduce(operator.add, (run.ev(c, env) for c in node.children), 0)
+
+@_op(ir.Prod)
+def _(run: _Run, node, env):
+    return functools.reduce(operator.mul, (run.ev(c, env) for c in node.children), 1)
+
+@_op(ir.FloorDiv, ir.Mod, ir.TrueDiv)
+def _(run: _Run, node, env):
+    a, b = (run.ev(c, env) for c in node.children)
+    zero = np.equal(b, 0)
+    run.poison(zero)
+    b = np.where(zero, 1, b)
+    if isinstance(node, ir.Mod):
+        return np.mod(a, b)
+    if isinstance(node, ir.TrueDiv):
+        # Ints only: defined where it is exact
+        run.poison(np.mod(a, b) != 0)
+    return np.floor_divide(a, b)
+
+@_op(ir.Isqrt)
+def _(run: _Run, node, env):
+    a = run.ev(node.children[0], env)
+    neg = np.less(a, 0)
+    run.poison(neg)
+    a = np.where(neg, 0, a)
+    r = np.floor(np.sqrt(a)).astype(np.int64)
+    # Exact for ints beyond the precision of the float sqrt
+    r = r - (r*r > a)
+    return r + ((r+1)*(r+1) <= a)
+
+## Tuples and sums
+
+@_op(ir.TupleLit)
+def _(run: _Run, node, env):
+    return tuple(run.ev(c, env) for c in node.children)
+
+@_op(ir.Proj)
+def _(run: _Run, node: ir.Proj, env):
+    return run.ev(node.children[0], env)[node.idx]
+
+@_op(ir.Inj)
+def _(run: _Run, node: ir.Inj, env):
+    v = run.ev(node.children[0], env)
+    return _BSum(node.idx, (v if i == node.idx else None for i in range(len(node.T.elemTs))))
+
+@_op(ir.SumLit)
+def _(run: _Run, node, env):
+    tag, *elems = node.children
+    tag = run.ev(tag, env)
+    if np.ndim(tag) == 0:
+        return _BSum(tag, (run.ev(e, env) if i == tag else None for i, e in enumerate(elems)))
+    vals = []
+    for i, e in enumerate(elems):
+        with run.guard(np.equal(tag, i)):
+            vals.append(run.ev(e, env))
+    return _BSum(tag, vals)
+
+@_op(ir.Match)
+def _(run: _Run, node, env):
+    scrut, *branches = node.children
+    v = run.ev(scrut, env)
+    if np.ndim(v.tag) == 0:
+        return run.ev(branches[v.tag], env).at(run, v.vals[v.tag])
+    res = None
+    for i in reversed(range(len(branches))):
+        hit = np.equal(v.tag, i)
+        if not hit.any():
+            continue
+        with run.guard(hit):
+            r = run.ev(branches[i], env).at(run, v.vals[i])
+        res = r if res is None else _select(hit, r, res)
+    return res
+
+## Functions
+
+@_op(ir.LambdaHOAS)
+def _(run, node, env):
+    return _Closure(node, env)
+
+@_op(ir.Compose)
+def _(run: _Run, node, env):
+    return _Composed([run.ev(c, env) for c in node.children])
+
+def _lit(node: ir.Node):
+    # The value of a FuncLit layout key
+    if isinstance(node, ir.Lit):
+        return node.T.labels.index(node.val) if isinstance(node.val, str) else node.val
+    if isinstance(node, ir.TupleLit):
+        return tuple(_lit(c) for c in node.children)
+    if isinstance(node, ir.Inj):
+        return _BSum(node.idx, (_lit(node.children[0]) if i == node.idx else None for i in range(len(node.T.elemTs))))
+    if isinstance(node, ir.Unit):
+        return None
+    raise ValueError(f"Cannot vectorize FuncLit key {node}")
+
+@_op(ir.FuncLit)
+def _(run: _Run, node: ir.FuncLit, env):
+    dom = run.ev(node.children[0], env)
+    keys, vals = [], []
+    for key, i in node.layout.val_map.items():
+        keys.append(_lit(_from_key(key)))
+        vals.append(run.ev(node.elems[i], env))
+    return _LitFunc(dom, keys, vals)
+
+@_op(ir.Apply)
+def _(run: _Run, node, env):
+    f, x = node.children
+    f, x = run.ev(f, env), run.ev(x, env)
+    if isinstance(f, tuple):
+        run.poison(np.logical_or(np.less(x, 0), np.greater_equal(x, len(f))))
+        return functools.reduce(lambda acc, i: _select(np.equal(x, i), f[i], acc), range(len(f)-1), f[-1])
+    return f.at(run, x)
+
+@_op(ir.Forall, ir.Exists)
+def _(run: _Run, node, env):
+    forall = isinstance(node, ir.Forall)
+    f = run.ev(node.children[0], env)
+    shape = run.shape_of(run, f)
+    if math.prod(shape) == 0:
+        return forall
+    with run.slot(shape) as base:
+        v, mask = run.values(f, base)
+        if mask is not None:
+            v = np.logical_or(v, np.logical_not(mask)) if forall else np.logical_and(v, mask)
+        return _over(np.all if forall else np.any, v, shape, base)
+
+@_op(ir.AllDistinct)
+def _(run: _Run, node, env):
+    f = run.ev(node.children[0], env)
+    shape = run.shape_of(run, f)
+    if math.prod(shape) <= 1:
+        return True
+    with run.slot(shape) as base:
+        v, mask = run.values(f, base, first=True)
+        v = _flat(v if mask is None else _key(v), shape, base)
+        if isinstance(v, tuple):
+            v = _key(v)
+        if v.dtype == bool:
+            v = v.astype(np.int8)
+        if mask is not None:
+            # Distinct stand-ins below every value where there is no element
+            m = v.shape[0]
+            mask = _flat(mask, shape, base)
+            fill = (v.min() if v.size else 0) - 1 - np.arange(m).reshape((m,) + (1,)*(v.ndim-1))
+            v = np.where(mask, v, fill)
+        v = np.sort(v, axis=0)
+        return _trim(np.all(v[1:] != v[:-1], axis=0))
+
+@_op(ir.AllSame)
+def _(run: _Run, node, env):
+    f = run.ev(node.children[0], env)
+    shape = run.shape_of(run, f)
+    if math.prod(shape) <= 1:
+        return True
+    with run.slot(shape) as base:
+        v, mask = run.values(f, base)
+        def same(a):
+            a = np.asarray(a)
+            if a.dtype == bool:
+                a = a.astype(np.int8)
+            if mask is None:
+                return np.equal(_over(np.min, a, shape, base), _over(np.max, a, shape, base))
+            info = np.iinfo(a.dtype)
+            lo = _over(np.min, np.where(mask, a, info.max), shape, base)
+            hi = _over(np.max, np.where(mask, a, info.min), shape, base)
+            return lo >= hi
+        res = True
+        for a in (v if isinstance(v, tuple) else (v,)):
+            res = np.logical_and(res, same(_key(a) if isinstance(a, tuple) else a))
+        return res
+
+@_op(ir.SumReduce, ir.ProdReduce)
+def _(run: _Run, node, env):
+    f = run.ev(node.children[0], env)
+    shape = run.shape_of(run, f)
+    if math.prod(shape) == 0:
+        return 0 if isinstance(node, ir.SumReduce) else 1
+    with run.slot(shape) as base:
+        v, mask = run.values(f, base, first=True)
+        fn = np.sum if isinstance(node, ir.SumReduce) else np.prod
+        if mask is None:
+            return _over(fn, v, shape, base, full=True)
+        mask = np.broadcast_to(mask, np.broadcast_shapes(np.shape(mask), np.shape(v)))
+        return _over(fn, np.broadcast_to(v, mask.shape), shape, base, full=True, where=mask)
+
+@_op(ir.Fold)
+def _(run: _Run, node, env):
+    func, lam, init = node.children
+    f, step, acc = run.ev(func, env), run.ev(lam, env), run.ev(init, env)
+    shape = run.shape_of(run, f)
+    with run.slot(shape) as base:
+        v, mask = run.values(f, base)
+        v = _flat(v, shape, base)
+        mask = None if mask is None else _flat(mask, shape, base)
+    for i in range(math.prod(shape)):
+        vi = _map(lambda a: a[i], v)
+        if mask is None:
+            acc = step.at(run, (vi, acc))
+        else:
+            with run.guard(mask[i]):
+                acc = _select(mask[i], step.at(run, (vi, acc)), acc)
+    return acc
+
+## Domains
+
+@_op(ir.Fin)
+def _(run: _Run, node, env):
+    return _RangeDom(0, 1, np.maximum(run.ev(node.children[0], env), 0))
+
+@_op(ir.Range)
+def _(run: _Run, node, env):
+    lo, hi, step = (run.ev(c, env) for c in node.children)
+    step = _scalar(step, "A Range's step")
+    if step == 0:
+        run.poison(True)
+        return _ValsDom([])
+    return _RangeDom(lo, step, np.maximum(-((lo - hi) // step), 0))
+
+@_op(ir.Universe)
+def _(run: _Run, node, env):
+    return run.universe(node.T.carT, env)
+
+@_op(ir.Empty)
+def _(run, node, env):
+    return _ValsDom([])
+
+@_op(ir.Singleton)
+def _(run: _Run, node, env):
+    return _ValsDom([run.ev(node.children[0], env)])
+
+@_op(ir.DomLit)
+def _(run: _Run, node, env):
+    return _ValsDom([run.ev(c, env) for c in node.children])
+
+@_op(ir.CartProd)
+def _(run: _Run, node, env):
+    return _ProdDom([run.ev(c, env) for c in node.children])
+
+@_op(ir.DisjUnion)
+def _(run: _Run, node, env):
+    return _SumDom([run.ev(c, env) for c in node.children])
+
+@_op(ir.DomInj)
+def _(run: _Run, node: ir.DomInj, env):
+    return _SumDom([run.ev(node.children[0], env) if i == node.idx else None for i in range(len(node.T.carT.elemTs))])
+
+@_op(ir.DomProj)
+def _(run: _Run, node: ir.DomProj, env):
+    return _ProjDom(run.ev(node.children[0], env), node.idx)
+
+@_op(ir.Union)
+def _(run: _Run, node, env):
+    return _UnionDom([run.ev(c, env) for c in node.children])
+
+@_op(ir.Intersection)
+def _(run: _Run, node, env):
+    return _InterDom([run.ev(c, env) for c in node.children])
+
+@_op(ir.Slice)
+def _(run: _Run, node, env):
+    d, lo, hi, step = (run.ev(c, env) for c in node.children)
+    shape = d.shape(run)
+    if len(shape) != 1:
+        raise ValueError("Cannot vectorize a Slice of a multi-dimensional domain")
+    idx = range(shape[0])[slice(_scalar(lo, "A Slice"), _scalar(hi, "A Slice"), _scalar(step, "A Slice"))]
+    with run.slot(shape) as base:
+        if d.mask(run, base) is not None:
+            raise ValueError("Cannot vectorize a Slice of a masked domain")
+    return _SliceDom(d, idx)
+
+@_op(ir.Image)
+def _(run: _Run, node, env):
+    return _ImageDom(run.ev(node.children[0], env))
+
+@_op(ir.Restrict)
+def _(run: _Run, node, env):
+    return _RestrictDom(run.ev(node.children[0], env))
+
+@_op(ir.IsMember)
+def _(run: _Run, node, env):
+    d, x = node.children
+    return run.ev(d, env).member(run, run.ev(x, env))
+
+@_op(ir.Card)
+def _(run: _Run, node, env):
+    d = run.ev(node.children[0], env)
+    shape = d.shape(run)
+    with run.slot(shape) as base:
+        mask = d.first(run, base)
+        if mask is None:
+            return math.prod(shape)
+        return _over(np.sum, mask, shape, base, full=True)
+
+@_op(ir.Subset, ir.ProperSubset)
+def _(run: _Run, node, env):
+    a, b = (run.ev(c, env) for c in node.children)
+    def within(a, b):
+        shape = a.shape(run)
+        with run.slot(shape) as base:
+            inside = b.member(run, a.elems(run, base))
+            mask = a.mask(run, base)
+            if mask is not None:
+                inside = np.logical_or(inside, np.logical_not(mask))
+            return _over(np.all, inside, shape, base)
+    res = within(a, b)
+    if isinstance(node, ir.ProperSubset):
+        res = np.logical_and(res, np.logical_not(within(b, a)))
+    return res
+
+@_op(ir.Unique, ir.ElemAt)
+def _(run: _Run, node, env):
+    d = run.ev(node.children[0], env)
+    i = 0 if isinstance(node, ir.Unique) else _scalar(run.ev(node.children[1], env), "An ElemAt index")
+    shape = d.shape(run)
+    m = math.prod(shape)
+    with run.slot(shape) as base:
+        if d.first(run, base) is not None:
+            raise ValueError(f"Cannot vectorize {type(node).__name__} of a masked domain")
+        if (m != 1) if isinstance(node, ir.Unique) else not 0 <= i < m:
+            run.poison(True)
+            i = 0
+        if m == 0:
+            raise ValueError(f"Cannot vectorize {type(node).__name__} of an empty domain")
+        e = _flat(d.elems(run, base), shape, base)
+    return _map(lambda a: _trim(a[i]), e)
@@ -0,0 +1,486 @@
+from __future__ import annotations
+
+import collections
+import shutil
+import tempfile
+import typing as tp
+
+from ..dsl import ir
+from ..dsl.envs import SymTable
+from .smtlib import _int_val, _elems, _dom_vals
+
+# Scalar IR -> CNF (DIMACS).
+#
+# Booleans are single literals; finite-domain Ints (and EnumTs) are one-hot,
+# a literal per value with exactly one of them true. Boolean structure is
+# Tseitin encoded, except at the top level, where conjunctions become separate
+# clauses and AllDistinct/AllSame/cardinality constraints get dedicated
+# encodings:
+#   at-most-one over few literals       pairwise
+#   at-most-k for small k               sequential counter (Sinz 2005)
+#   otherwise, and every two-sided k    totalizer (Bailleux & Boufkhad 2003)
+#
+# Clauses are written to a spooled temporary file as they are made, since the
+# DIMACS header needs the final counts; write() then copies them out.
+
+Lits = tp.List[int]
+OneHot = tp.Dict[int, int]
+
+def _floordiv(a: int, b: int) -> tp.Optional[int]:
+    return None if b == 0 else a // b
+
+def _mod(a: int, b: int) -> tp.Optional[int]:
+    return None if b == 0 else a % b
+
+_CMP = {
+    ir.Eq: lambda a, b: a == b,
+    ir.Lt: lambda a, b: a < b,
+    ir.LtEq: lambda a, b: a <= b,
+}
+
+_ARITH = {
+    ir.Sum: lambda a, b: a + b,
+    ir.Prod: lambda a, b: a * b,
+    ir.FloorDiv: _floordiv,
+    ir.Mod: _mod,
+}
+
+
+class CNFEncoder:
+    """Encodes scalar IR constraints as CNF.
+
+    var_map maps the sid of every encoded variable to its literal (Bool) or to
+    a dict from value to literal (Int/EnumT). encodings counts the cardinality
+    encodings used, by name.
+    """
+    def __init__(self, sym: tp.Optional[SymTable] = None, pairwise_max: int = 6, seq_max_k: int = 4):
+        self.sym = sym
+        self.pairwise_max = pairwise_max
+        self.seq_max_k = seq_max_k
+        self.nvars = 0
+        self.nclauses = 0
+        self.var_map: tp.Dict[int, tp.Union[int, OneHot]] = {}
+        self.encodings: tp.Counter[str] = collections.Counter()
+        self._body = tempfile.SpooledTemporaryFile(max_size=1 << 24, mode="w+")
+        self._bools: tp.Dict[ir.Node, int] = {}
+        self._ints: tp.Dict[ir.Node, OneHot] = {}
+        self._gates: tp.Dict[tp.FrozenSet[int], int] = {}
+        # Literal fixed to true; -T is false
+        self.T = self.new_var()
+        self.add([self.T])
+
+    def new_var(self) -> int:
+        self.nvars += 1
+        return self.nvars
+
+    def add(self, clause: tp.Iterable[int]):
+        lits = []
+        for l in clause:
+            if l == self.T:
+                return
+            if l != -self.T:
+                lits.append(l)
+        self._body.write(" ".join(map(str, lits)))
+        self._body.write(" 0\n" if lits else "0\n")
+        self.nclauses += 1
+
+    ## Tseitin gates
+
+    def _or(self, lits: tp.Iterable[int]) -> int:
+        lits = list(dict.fromkeys(l for l in lits if l != -self.T))
+        s = set(lits)
+        if self.T in s or any(-l in s for l in lits):
+            return self.T
+        if not lits:
+            return -self.T
+        if len(lits) == 1:
+            return lits[0]
+        key = frozenset(lits)
+        if key not in self._gates:
+            e = self.new_var()
+            self.add([-e, *lits])
+            for l in lits:
+                self.add([e, -l])
+            self._gates[key] = e
+        return self._gates[key]
+
+    def _and(self, lits: tp.Iterable[int]) -> int:
+        return -self._or(-l for l in lits)
+
+    def _iff(self, a: int, b: int) -> int:
+        return self._or([self._and([a, b]), self._and([-a, -b])])
+
+    def _ite(self, c: int, t: int, f: int) -> int:
+        return self._or([self._and([c, t]), self._and([-c, f])])
+
+    ## Cardinality
+
+    def at_most(self, lits: Lits, k: int):
+        n = len(lits)
+        if k >= n:
+            return
+        if k < 0:
+            self.add([])
+        elif k == 0:
+            for l in lits:
+                self.add([-l])
+        elif k == 1 and n <= self.pairwise_max:
+            self.encodings["pairwise"] += 1
+            for i in range(n):
+                for j in range(i+1, n):
+                    self.add([-lits[i], -lits[j]])
+        elif k <= self.seq_max_k:
+            self.encodings["sequential"] += 1
+            self._sequential(lits, k)
+        else:
+            self.encodings["totalizer"] += 1
+            o = self._totalizer(lits, k+1)
+            self.add([-o[k]])
+
+    def at_least(self, lits: Lits, k: int):
+        self.at_most([-l for l in lits], len(lits)-k)
+
+    def card(self, lits: Lits, lo: int, hi: int):
+        """Asserts lo <= (number of true lits) <= hi."""
+        n = len(lits)
+        lo, hi = max(lo, 0), min(hi, n)
+        if lo > hi:
+            self.add([])
+        elif lo == 0:
+            self.at_most(lits, hi)
+        elif hi == n:
+            self.at_least(lits, lo)
+        elif lo == hi == 1:
+            self.add(lits)
+            self.at_most(lits, 1)
+        else:
+            # One totalizer serves both bounds
+            self.encodings["totalizer"] += 1
+            o = self._totalizer(lits, hi+1)
+            self.add([o[lo-1]])
+            self.add([-o[hi]])
+
+    def _card_lit(self, lits: Lits, lo: int, hi: int) -> int:
+        """A literal for lo <= (number of true lits) <= hi."""
+        n = len(lits)
+        lo, hi = max(lo, 0), min(hi, n)
+        if lo > hi:
+            return -self.T
+        if lo == 0 and hi == n:
+            return self.T
+        self.encodings["totalizer"] += 1
+        o = self._totalizer(lits, min(hi+1, n))
+        return self._and([o[lo-1] if lo > 0 else self.T, -o[hi] if hi < n else self.T])
+
+    def _sequential(self, lits: Lits, k: int):
+        n = len(lits)
+        s = [[self.new_var() for _ in range(k)] for _ in range(n-1)]
+        self.add([-lits[0], s[0][0]])
+        for j in range(1, k):
+            self.add([-s[0][j]])
+        for i in range(1, n-1):
+            self.add([-lits[i], s[i][0]])
+            self.add([-s[i-1][0], s[i][0]])
+            for j in range(1, k):
+                self.add([-lits[i], -s[i-1][j-1], s[i][j]])
+                self.add([-s[i-1][j], s[i][j]])
+            self.add([-lits[i], -s[i-1][k-1]])
+        self.add([-lits[n-1], -s[n-2][k-1]])
+
+    def _totalizer(self, lits: Lits, m: int) -> Lits:
+        """Unary count of lits truncated to m: o[j] <=> at least j+1 are true."""
+        layer = [[l] for l in lits]
+        while len(layer) > 1:
+            nxt = [self._merge(layer[i], layer[i+1], m) for i in range(0, len(layer)-1, 2)]
+            if len(layer) % 2:
+                nxt.append(layer[-1])
+            layer = nxt
+        return layer[0]
+
+    def _merge(self, a: Lits, b: Lits, m: int) -> Lits:
+        size = min(len(a)+len(b), m)
+        o = [self.new_var() for _ in range(size)]
+        for i in range(len(a)+1):
+            for j in range(len(b)+1):
+                s = i+j
+                if 1 <= s <= size:
+                    self.add([o[s-1], *([-a[i-1]] if i else []), *([-b[j-1]] if j else [])])
+                if s < size:
+                    self.add([-o[s], *([a[i]] if i < len(a) else []), *([b[j]] if j < len(b) else [])])
+        return o
+
+    ## Terms
+
+    def _one_hot(self, vals: tp.Iterable[int]) -> OneHot:
+        hot = {v: self.new_var() for v in vals}
+        lits = list(hot.values())
+        self.add(lits)
+        self.at_most(lits, 1)
+        return hot
+
+    def _declare(self, var: ir.VarRef) -> tp.Union[int, OneHot]:
+        if var.sid in self.var_map:
+            return self.var_map[var.sid]
+        T = var.T
+        if isinstance(T, ir.BoolT):
+            enc = self.new_var()
+        elif isinstance(T, ir.EnumT):
+            enc = self._one_hot(range(len(T)))
+        elif isinstance(T, ir.IntT):
+            vals = None if T.ref is None else _dom_vals(T.ref)
+            if vals is None:
+                raise ValueError(f"Cannot encode {var} in CNF, expected a literal finite domain")
+            enc = self._one_hot(vals)
+        else:
+            raise ValueError(f"Cannot encode type {T} in CNF, expected a scalar")
+        self.var_map[var.sid] = enc
+        return enc
+
+    def _unop(self, f: tp.Callable[[int], tp.Optional[int]], a: OneHot) -> OneHot:
+        groups = collections.defaultdict(list)
+        for v, l in a.items():
+            u = f(v)
+            if u is None:
+                self.add([-l])
+            else:
+                groups[u].append(l)
+        return {u: self._or(ls) for u, ls in groups.items()}
+
+    def _binop(self, f: tp.Callable[[int, int], tp.Optional[int]], a: OneHot, b: OneHot) -> OneHot:
+        if len(a) == 1 and a[next(iter(a))] == self.T:
+            (c,) = a
+            return self._unop(lambda w: f(c, w), b)
+        if len(b) == 1 and b[next(iter(b))] == self.T:
+            (c,) = b
+            return self._unop(lambda v: f(v, c), a)
+        # a_v & b_w -> r_f(v,w), and at most one r: since a and b each have
+        # exactly one true value, so does r
+        r: OneHot = {}
+        for v, av in a.items():
+            for w, bw in b.items():
+                u = f(v, w)
+                if u is None:
+                    # Division by zero is excluded by the node's obligation
+                    self.add([-av, -bw])
+                    continue
+                if u not in r:
+                    r[u] = self.new_var()
+                self.add([-av, -bw, r[u]])
+        self.at_most(list(r.values()), 1)
+        return r
+
+    def int_term(self, node: ir.Node) -> OneHot:
+        """One-hot encoding of the Int term node."""
+        if node in self._ints:
+            return self._ints[node]
+        match node:
+            case ir.Lit() if isinstance(node.T, ir.EnumT):
+                enc = {node.T.labels.index(node.val): self.T}
+            case ir.Lit():
+                enc = {node.val: self.T}
+            case ir.VarRef():
+                enc = self._declare(node)
+            case ir.Neg(a):
+                enc = self._unop(lambda v: -v, self.int_term(a))
+            case ir.Abs(a):
+                enc = self._unop(abs, self.int_term(a))
+            case ir.Ite(pred, t, f):
+                c = self.bool_term(pred)
+                tv, fv = self.int_term(t), self.int_term(f)
+                enc = {u: self._ite(c, tv.get(u, -self.T), fv.get(u, -self.T)) for u in dict.fromkeys([*tv, *fv])}
+            case ir.Sum() | ir.Prod() | ir.FloorDiv() | ir.Mod():
+                f = _ARITH[type(node)]
+                args = [self.int_term(c) for c in node.children]
+                enc = args[0] if args else {0 if isinstance(node, ir.Sum) else 1: self.T}
+                for b in args[1:]:
+                    enc = self._binop(f, enc, b)
+            case ir.SumReduce(func):
+                enc = {0: self.T}
+                for e in _elems(func):
+                    enc = self._binop(_ARITH[ir.Sum], enc, self.int_term(e))
+            case _:
+                raise ValueError(f"Cannot encode {type(node).__name__} in CNF")
+        if node.obl is not None:
+            self.assert_(node.obl)
+        self._ints[node] = enc
+        return enc
+
+    def _count(self, node: ir.Node) -> tp.Optional[tp.Tuple[Lits, int]]:
+        """node as (lits, offset) if it is a sum of 0/1 terms, else None."""
+        match node:
+            case ir.Sum():
+                terms = node.children
+            case ir.SumReduce(func) if isinstance(func, (ir.TupleLit, ir.FuncLit)):
+                terms = _elems(func)
+            case _:
+                return None
+        lits, offset = [], 0
+        for t in terms:
+            match t:
+                case ir.Lit() if t.val in (0, 1):
+                    offset += t.val
+                case ir.Ite(pred, ir.Lit(), ir.Lit()) if (t.children[1].val, t.children[2].val) in ((1, 0), (0, 1)):
+                    c = self.bool_term(pred)
+                    lits.append(c if t.children[1].val == 1 else -c)
+                case ir.VarRef() if isinstance(t.T, ir.IntT) and t.T.ref is not None and set(_dom_vals(t.T.ref) or [2]) <= {0, 1}:
+                    lits.append(self._declare(t).get(1, -self.T))
+                case _:
+                    return None
+        return lits, offset
+
+    def _count_bounds(self, node: ir.Node) -> tp.Optional[tp.Tuple[Lits, int, int]]:
+        """A comparison of a 0/1 sum with a constant as (lits, lo, hi)."""
+        if type(node) not in _CMP:
+            return None
+        a, b = node.children
+        if _int_val(b) is not None and (cnt := self._count(a)) is not None:
+            (lits, off), k = cnt, _int_val(b)
+            lo, hi = {ir.Eq: (k, k), ir.Lt: (0, k-1), ir.LtEq: (0, k)}[type(node)]
+        elif _int_val(a) is not None and (cnt := self._count(b)) is not None:
+            (lits, off), k = cnt, _int_val(a)
+            lo, hi = {ir.Eq: (k, k), ir.Lt: (k+1, len(lits)+off), ir.LtEq: (k, len(lits)+off)}[type(node)]
+        else:
+            return None
+        return lits, lo-off, hi-off
+
+    def _cmp(self, op: tp.Callable[[int, int], bool], a: OneHot, b: OneHot) -> int:
+        if len(b) == 1 and b[next(iter(b))] == self.T:
+            (c,) = b
+            return self._or(l for v, l in a.items() if op(v, c))
+        if len(a) == 1 and a[next(iter(a))] == self.T:
+            (c,) = a
+            return self._or(l for w, l in b.items() if op(c, w))
+        e = self.new_var()
+        for v, av in a.items():
+            self.add([-e, -av, *(bw for w, bw in b.items() if op(v, w))])
+            self.add([e, -av, *(bw for w, bw in b.items() if not op(v, w))])
+        return e
+
+    def bool_term(self, node: ir.Node) -> int:
+        """Literal for the Bool term node."""
+        if node in self._bools:
+            return self._bools[node]
+        match node:
+            case ir.Lit():
+                lit = self.T if node.val else -self.T
+            case ir.VarRef():
+                lit = self._declare(node)
+            case ir.Not(a):
+                lit = -self.bool_term(a)
+            case ir.Conj():
+                lit = self._and(self.bool_term(c) for c in node.children)
+            case ir.Disj():
+                lit = self._or(self.bool_term(c) for c in node.children)
+            case ir.Implies(a, b):
+                lit = self._or([-self.bool_term(a), self.bool_term(b)])
+            case ir.Ite(pred, t, f):
+                lit = self._ite(self.bool_term(pred), self.bool_term(t), self.bool_term(f))
+            case ir.Eq(a, b) if isinstance(a.T, ir.BoolT):
+                lit = self._iff(self.bool_term(a), self.bool_term(b))
+            case ir.Eq() | ir.Lt() | ir.LtEq():
+                if (bounds := self._count_bounds(node)) is not None:
+                    lit = self._card_lit(*bounds)
+                else:
+                    a, b = node.children
+                    lit = self._cmp(_CMP[type(node)], self.int_term(a), self.int_term(b))
+            case ir.IsMember(dom, val):
+                vals = _dom_vals(dom)
+                if vals is None:
+                    raise ValueError(f"Cannot encode membership in {dom} in CNF")
+                x = self.int_term(val)
+                lit = self._or(x[v] for v in vals if v in x)
+            case ir.AllDistinct(func):
+                xs = [self.int_term(e) for e in _elems(func)]
+                lit = self._and(-self._cmp(_CMP[ir.Eq], xs[i], xs[j]) for i in range(len(xs)) for j in range(i+1, len(xs)))
+            case ir.AllSame(func):
+                xs = [self.int_term(e) for e in _elems(func)]
+                lit = self._and(self._cmp(_CMP[ir.Eq], x, y) for x, y in zip(xs, xs[1:]))
+            case _:
+                raise ValueError(f"Cannot encode {type(node).__name__} in CNF")
+        if node.obl is not None:
+            self.assert_(node.obl)
+        self._bools[node] = lit
+        return lit
+
+    ## Top level
+
+    def assert_(self, node: ir.Node):
+        """Adds clauses requiring node to hold."""
+        todo = [node]
+        while todo:
+            n = todo.pop()
+            match n:
+                case ir.TupleLit() | ir.Conj():
+                    todo.extend(reversed(n.children))
+                    if n.obl is not None:
+                        todo.append(n.obl)
+                    continue
+                case ir.Lit() if n.val is True:
+                    continue
+                case ir.Disj():
+                    self.add(self.bool_term(c) for c in n.children)
+                case ir.AllDistinct(func):
+                    self._all_distinct([self.int_term(e) for e in _elems(func)])
+                case ir.AllSame(func):
+                    xs = [self.int_term(e) for e in _elems(func)]
+                    for x, y in zip(xs, xs[1:]):
+                        for v in dict.fromkeys([*x, *y]):
+                            self.add([-x.get(v, -self.T), y.get(v, -self.T)])
+                            self.add([x.get(v, -self.T), -y.get(v, -self.T)])
+                case _ if (bounds := self._count_bounds(n)) is not None:
+                    self.card(*bounds)
+                case _:
+                    self.add([self.bool_term(n)])
+                    continue
+            if n.obl is not None:
+                todo.append(n.obl)
+
+    def _all_distinct(self, xs: tp.List[OneHot]):
+        by_val = collections.defaultdict(list)
+        for x in xs:
+            for v, l in x.items():
+                by_val[v].append(l)
+        for lits in by_val.values():
+            self.at_most(lits, 1)
+        if len(by_val) == len(xs):
+            # A permutation: every value is taken, which propagates better
+            for lits in by_val.values():
+                self.add(lits)
+
+    def encode_spec(self, spec: ir.Spec):
+        self.assert_(spec.cons)
+        self.assert_(spec.obls)
+
+    def write(self, out: tp.TextIO):
+        """Writes the DIMACS file: the variable map as comments, then the clauses."""
+        for sid, enc in self.var_map.items():
+            name = self.sym[sid].name if self.sym is not None and sid in self.sym.entries else f"v{sid}"
+            if isinstance(enc, int):
+                out.write(f"c var {sid} {name} {enc}\n")
+            else:
+                out.write(f"c var {sid} {name} {' '.join(f'{v}:{l}' for v, l in enc.items())}\n")
+        out.write(f"p cnf {self.nvars} {self.nclauses}\n")
+        self._body.seek(0)
+        shutil.copyfileobj(self._body, out)
+        self._body.seek(0, 2)
+
+    def decode(self, model: tp.Iterable[int]) -> tp.Dict[int, tp.Union[bool, int]]:
+        """Maps a model (the true literals, as DIMACS ints) back to variable values by sid."""
+        true = set(model) | {self.T}
+        vals = {}
+        for sid, enc in self.var_map.items():
+            if isinstance(enc, int):
+                vals[sid] = enc in true
+            else:
+                vals[sid] = next(v for v, l in enc.items() if l in true)
+        return vals
+
+
+def emit_dimacs(spec: ir.Spec, sym: tp.Optional[SymTable] = None, out: tp.Optional[tp.TextIO] = None, **kwargs) -> CNFEncoder:
+    """Encodes spec and writes it to out (if given) as DIMACS. Returns the
+    encoder, whose var_map/decode map solutions back to sids."""
+    enc = CNFEncoder(sym, **kwargs)
+    enc.encode_spec(spec)
+    if out is not None:
+        enc.write(out)
+    return enc
@@ -0,0 +1,792 @@
+from __future__ import annotations
+
+import itertools as it
+import math
+import operator
+import typing as tp
+from dataclasses import dataclass, field
+
+from ..dsl import ir
+from ..dsl.serialize import _from_key
+from ..dsl.spec import PuzzleSpec
+
+# Concrete evaluation of a spec's rules against an assignment of its vars.
+#
+# Evaluator walks the (HOAS) IR directly, with no solver and no lowering, so
+# it checks a candidate solution, e.g. a puzzle UI submission, as soon as the
+# spec is built. Values are plain Python:
+#   Int/Bool    int/bool
+#   Enum        the label (a str)
+#   Unit        None
+#   Tuple       tuple
+#   Sum         _Inj(idx, val)
+#   Domain      _Dom: its elements in iteration order, computed on first use,
+#               and a membership test, so e.g. Nat or a Restrict of it can be
+#               tested against without being enumerated
+#   Function    _Func: callable, with the domain it is defined on
+# Lambdas evaluate to closures over the names bound around them; quantifiers,
+# Image/Restrict and the reductions iterate the closure's domain, which is
+# its argument type's refinement evaluated in the closure's environment.
+#
+# Obligations are checked where they occur: a node whose obligation is false
+# (a guarded Apply out of its domain, a division by zero, ...) is undefined,
+# and so is the top-level constraint evaluating it, which is then reported as
+# violated. Ite, Implies, Conj and Disj only evaluate what they need.
+#
+# A node with no free bound names has one value per assignment and is
+# memoized; if it has no var either (e.g. Fin(9) once N is substituted, or
+# an enum's Universe) its value is kept across check() calls, together with
+# the elements its domains have enumerated.
+#
+# Values for the vars are given by SymTable name. Func vars take a mapping
+# from domain elements (ints, or tuples for products) to values, a callable,
+# or a NumPy array indexed by the element. Options (Unit + A) take None or
+# the payload, and a func var missing an element of an option codomain reads
+# it as None; other sums take (idx, val). A value outside its var's type
+# (its refinement, a missing element, ...) makes the var invalid.
+
+_MISSING = object()
+
+class _Undefined(Exception):
+    """An obligation failed or a partial operation was applied outside its
+    domain."""
+
+
+class _Inj:
+    """A value of a sum type: the payload of variant idx."""
+    __slots__ = ('idx', 'val')
+
+    def __init__(self, idx: int, val: tp.Any):
+        self.idx = idx
+        self.val = val
+
+    def __eq__(self, other):
+        return isinstance(other, _Inj) and self.idx == other.idx and self.val == other.val
+
+    def __hash__(self):
+        return hash((_Inj, self.idx, self.val))
+
+    def __repr__(self):
+        return f"Inj{self.idx}({self.val!r})"
+
+
+class _Dom:
+    """A domain value."""
+    __slots__ = ('_elems', '_make', '_member', '_set')
+
+    def __init__(self, make: tp.Optional[tp.Callable[[], tp.Sequence]] = None,
+                 member: tp.Optional[tp.Callable[[tp.Any], bool]] = None, elems: tp.Optional[tp.Sequence] = None):
+        self._elems = elems
+        self._make = make
+        self._member = member
+        self._set = None
+
+    def elems(self) -> tp.Sequence:
+        if self._elems is None:
+            if self._make is None:
+                raise ValueError("Cannot enumerate an infinite domain")
+            self._elems = self._make()
+        return self._elems
+
+    def __contains__(self, x) -> bool:
+        if self._member is not None:
+            return self._member(x)
+        if self._set is None:
+            self._set = set(self.elems())
+        return x in self._set
+
+def _range_dom(r: range) -> _Dom:
+    return _Dom(elems=r, member=r.__contains__)
+
+def _unique(vals: tp.Iterable) -> tp.List:
+    return list(dict.fromkeys(vals))
+
+
+class _Func:
+    """A function value."""
+    __slots__ = ()
+
+    @property
+    def dom(self) -> _Dom:
+        raise NotImplementedError()
+
+    def __call__(self, x):
+        raise NotImplementedError()
+
+class _Table(_Func):
+    """A function given by its values."""
+    __slots__ = ('_dom', 'table')
+
+    def __init__(self, dom: _Dom, table: tp.Mapping):
+        self._dom = dom
+        self.table = table
+
+    @property
+    def dom(self) -> _Dom:
+        return self._dom
+
+    def __call__(self, x):
+        try:
+            return self.table[x]
+        except (KeyError, TypeError):
+            raise _Undefined()
+
+class _Closure(_Func):
+    """A LambdaHOAS with the names bound around it."""
+    __slots__ = ('run', 'lam', 'env', '_dom')
+
+    def __init__(self, run: _Run, lam: ir.LambdaHOAS, env: tp.Dict[str, tp.Any]):
+        self.run = run
+        self.lam = lam
+        self.env = env
+        self._dom = None
+
+    @property
+    def dom(self) -> _Dom:
+        if self._dom is None:
+            self._dom = self.run.type_dom(self.lam.T.argT, self.env)
+        return self._dom
+
+    def __call__(self, x):
+        env = dict(self.env)
+        env[self.lam.bv_name] = x
+        return self.run.ev(self.lam.body, env)
+
+class _Composed(_Func):
+    """fs[0] ∘ fs[1] ∘ ...: the last is applied first."""
+    __slots__ = ('fs',)
+
+    def __init__(self, fs: tp.Sequence[_Func]):
+        self.fs = fs
+
+    @property
+    def dom(self) -> _Dom:
+        return self.fs[-1].dom
+
+    def __call__(self, x):
+        for f in reversed(self.fs):
+            x = f(x)
+        return x
+
+
+@dataclass
+class CheckResult:
+    """The outcome of checking an assignment: the top-level constraints and
+    obligations that do not hold, and the vars whose values are outside their
+    types."""
+    violated: tp.List[ir.Node] = field(default_factory=list)
+    invalid: tp.List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.violated and not self.invalid
+
+    def __bool__(self):
+        return self.ok
+
+
+# Node evaluation, by class: fn(run, node, env) -> value
+_OPS: tp.Dict[type, tp.Callable] = {}
+
+def _op(*classes: type):
+    def deco(fn):
+        for cls in classes:
+            _OPS[cls] = fn
+        return fn
+    return deco
+
+# How a node is memoized
+_OPEN, _CALL, _CONST = 0, 1, 2
+
+def _free_names(root: ir.Node) -> tp.Tuple[tp.Dict[ir.Node, tp.FrozenSet[str]], tp.Dict[ir.Node, tp.FrozenSet[int]], tp.Dict[int, ir.VarRef]]:
+    """The free bound names of every node under root, the sids of the vars
+    reachable from it, and the vars by sid."""
+    free: tp.Dict[ir.Node, tp.FrozenSet[str]] = {}
+    sids: tp.Dict[ir.Node, tp.FrozenSet[int]] = {}
+    vars: tp.Dict[int, ir.VarRef] = {}
+    none = frozenset()
+    stack = [(root, False)]
+    while stack:
+        n, ready = stack.pop()
+        if n in free:
+            continue
+        if not ready:
+            stack.append((n, True))
+            stack.extend((c, False) for c in n.all_nodes if c not in free)
+            continue
+        names = set()
+        parts = n.all_nodes
+        if isinstance(n, ir.LambdaHOAS):
+            names |= free[n.T] | (free[n.body] - {n.bv_name})
+            parts = tuple(c for c in parts if c is not n.T and c is not n.body)
+        elif isinstance(n, ir.PiTHOAS):
+            names |= free[n.argT] | (free[n.resT] - {n.bv_name})
+            parts = tuple(c for c in parts if c is not n.argT and c is not n.resT)
+        elif isinstance(n, ir.BoundVarHOAS):
+            names.add(n.name)
+        for c in parts:
+            names |= free[c]
+        free[n] = frozenset(names)
+        reach = none.union(*(sids[c] for c in n.all_nodes))
+        if isinstance(n, ir.VarRef):
+            vars[n.sid] = n
+            reach = reach | {n.sid}
+        sids[n] = reach or none
+    return free, sids, vars
+
+def _analyze(root: ir.Node) -> tp.Tuple[tp.Dict[ir.Node, int], tp.Dict[int, ir.VarRef]]:
+    """The memo kind of every node under root, and the vars by sid."""
+    free, sids, vars = _free_names(root)
+    return {n: _OPEN if names else _CALL if sids[n] else _CONST for n, names in free.items()}, vars
+
+def _obl(n: ir.Node) -> tp.Optional[ir.Node]:
+    return n._key[3][1] if isinstance(n, ir.Value) else None
+
+def _var_names(spec: tp.Union[PuzzleSpec, ir.Spec], vars: tp.Mapping[int, ir.VarRef]) -> tp.Dict[tp.Union[str, int], int]:
+    if isinstance(spec, PuzzleSpec):
+        return {spec.sym.get_name(sid): sid for sid in vars}
+    return {sid: sid for sid in sorted(vars)}
+
+def _by_sid(names: tp.Mapping[tp.Union[str, int], int], values: tp.Mapping[tp.Union[str, int], tp.Any]) -> tp.Dict[int, tp.Any]:
+    unknown = [name for name in values if name not in names]
+    if unknown:
+        raise ValueError(f"{', '.join(map(str, unknown))} not a var of the spec")
+    missing = [name for name in names if name not in values]
+    if missing:
+        raise ValueError(f"No value for {', '.join(map(str, missing))}")
+    return {names[name]: v for name, v in values.items()}
+
+
+class Evaluator:
+    """Checks assignments against a spec's rules.
+
+        ev = Evaluator(spec)
+        res = ev.check({"N": 4, "cell_digits": grid, "givens": clues})
+        res.ok, res.violated, res.invalid
+
+    A bare ir.Spec, such as a scalarized one, takes its values by sid.
+    """
+    def __init__(self, spec: tp.Union[PuzzleSpec, ir.Spec]):
+        self.spec = spec
+        root = spec._spec if isinstance(spec, PuzzleSpec) else spec
+        self.rules: tp.Tuple[ir.Node, ...] = root.cons.children + root.obls.children
+        kinds, self._vars = _analyze(root)
+        # (handler, memo kind, obligation) by node
+        self._info: tp.Dict[ir.Node, tp.Tuple[tp.Optional[tp.Callable], int, tp.Optional[ir.Node]]] = {
+            n: (_OPS.get(type(n)), kind, _obl(n)) for n, kind in kinds.items()
+        }
+        self._names = _var_names(spec, self._vars)
+        self._consts: tp.Dict[ir.Node, tp.Any] = {}
+
+    def check(self, values: tp.Mapping[tp.Union[str, int], tp.Any] = None, **kwargs) -> CheckResult:
+        """Evaluates every top-level constraint and obligation under the
+        values, by var name, of every var of the spec."""
+        run = _Run(self, _by_sid(self._names, {**(values or {}), **kwargs}))
+        res = CheckResult()
+        try:
+            for name, sid in self._names.items():
+                if not run.var_ok(sid):
+                    res.invalid.append(name)
+            for rule in self.rules:
+                if not run.holds(rule):
+                    res.violated.append(rule)
+        finally:
+            # Closures kept with the constants still refer to run
+            run.release()
+        return res
+
+def check(spec: tp.Union[PuzzleSpec, ir.Spec], values: tp.Mapping[tp.Union[str, int], tp.Any] = None, **kwargs) -> CheckResult:
+    """Checks the values, by var name, against spec (see Evaluator)."""
+    return Evaluator(spec).check(values, **kwargs)
+
+
+class _Run:
+    """The state of one check(): var values and memoized nodes."""
+    def __init__(self, evaluator: Evaluator, raw: tp.Mapping[int, tp.Any]):
+        self.info = evaluator._info
+        self.consts = evaluator._consts
+        self.vars = evaluator._vars
+        self.raw = raw
+        self.memo: tp.Dict[ir.Node, tp.Any] = {}
+        # sid -> value, or _Undefined for a value that does not fit its type
+        self.vals: tp.Dict[int, tp.Any] = {}
+
+    def release(self):
+        self.raw, self.memo, self.vals = {}, {}, {}
+
+    def holds(self, rule: ir.Node) -> bool:
+        try:
+            return bool(self.ev(rule, {}))
+        except _Undefined:
+            return False
+
+    def ev(self, node: ir.Node, env: tp.Dict[str, tp.Any]):
+        fn, kind, obl = self.info[node]
+        if kind:
+            memo = self.consts if kind == _CONST else self.memo
+            v = memo.get(node, _MISSING)
+            if v is not _MISSING:
+                return v
+        if obl is not None and not self.ev(obl, env):
+            raise _Undefined()
+        if fn is None:
+            raise ValueError(f"Cannot evaluate {type(node).__name__}")
+        v = fn(self, node, env)
+        if kind:
+            memo[node] = v
+        return v
+
+    ## Vars
+
+    def var(self, sid: int):
+        v = self.vals.get(sid, _MISSING)
+        if v is _MISSING:
+            v = self.vals[sid] = self._coerce(self.vars[sid].T, self.raw[sid], {})
+        if v is _Undefined:
+            raise _Undefined()
+        return v
+
+    def var_ok(self, sid: int) -> bool:
+        try:
+            return self._fits(self.vars[sid].T, self.var(sid), {})
+        except _Undefined:
+            return False
+
+    def _coerce(self, T: ir.Type, raw, env):
+        """raw as a value of type T, or _Undefined if it is not one."""
+        try:
+            return self._coerce1(T, raw, env)
+        except (_Undefined, ValueError, TypeError, KeyError, IndexError):
+            return _Undefined
+
+    def _coerce1(self, T: ir.Type, raw, env):
+        if isinstance(T, ir.BoolT):
+            if raw not in (True, False):
+                raise ValueError()
+            return bool(raw)
+        if isinstance(T, ir.IntT):
+            return operator.index(raw)
+        if isinstance(T, ir.EnumT):
+            if isinstance(raw, str):
+                if raw not in T.labels:
+                    raise ValueError()
+                return raw
+            return T.labels[operator.index(raw)]
+        if isinstance(T, ir.UnitT):
+            return None
+        if isinstance(T, ir.TupleT):
+            if len(raw) != len(T):
+                raise ValueError()
+            return tuple(self._coerce1(cT, r, env) for cT, r in zip(T.children, raw))
+        if isinstance(T, ir.SumT):
+            if isinstance(raw, _Inj):
+                idx, val = raw.idx, raw.val
+            elif _is_option(T):
+                idx, val = (0, None) if raw is None else (1, raw)
+            else:
+                idx, val = raw
+            return _Inj(idx, self._coerce1(T.elemTs[idx], val, env))
+        if isinstance(T, ir.DomT):
+            elems = _unique(self._coerce1(T.carT, r, env) for r in raw)
+            return _Dom(elems=elems)
+        if isinstance(T, ir.PiTHOAS):
+            dom = self.type_dom(T.argT, env)
+            table = {}
+            for x in dom.elems():
+                if isinstance(raw, tp.Mapping):
+                    r = raw.get(x, _MISSING)
+                    if r is _MISSING:
+                        if not _is_option(T.resT):
+                            raise KeyError(x)
+                        r = None
+                elif callable(raw):
+                    r = raw(x)
+                else:
+                    r = raw[x]
+                table[x] = self._coerce1(T.resT, r, {**env, T.bv_name: x})
+            return _Table(dom, table)
+        raise ValueError(f"Cannot take a value of type {T}")
+
+    def _fits(self, T: ir.Type, v, env) -> bool:
+        """Whether v lies in T's refinements."""
+        if T.obl is not None and not self.ev(T.obl, env):
+            return False
+        if T.ref is not None and not isinstance(T, ir.PiTHOAS) and v not in self.ev(T.ref, env):
+            return False
+        if isinstance(T, ir.TupleT):
+            return all(self._fits(cT, c, env) for cT, c in zip(T.children, v))
+        if isinstance(T, ir.SumT):
+            return self._fits(T.elemTs[v.idx], v.val, env)
+        if isinstance(T, ir.DomT):
+            return all(self._fits(T.carT, e, env) for e in v.elems())
+        if isinstance(T, ir.PiTHOAS):
+            return all(self._fits(T.resT, y, {**env, T.bv_name: x}) for x, y in v.table.items())
+        return True
+
+    ## Types as domains
+
+    def type_dom(self, T: ir.Type, env) -> _Dom:
+        """The values of T: its refinement, or all of them."""
+        if T.ref is not None:
+            return self.ev(T.ref, env)
+        return self.universe(T, env)
+
+    def universe(self, T: ir.Type, env) -> _Dom:
+        if isinstance(T, ir.BoolT):
+            return _Dom(elems=[False, True])
+        if isinstance(T, ir.EnumT):
+            return _Dom(elems=list(T.labels))
+        if isinstance(T, ir.UnitT):
+            return _Dom(elems=[None])
+        if isinstance(T, ir.TupleT):
+            doms = [self.type_dom(cT, env) for cT in T.children]
+            return _cartprod(doms)
+        if isinstance(T, ir.SumT):
+            doms = [self.type_dom(cT, env) for cT in T.elemTs]
+            return _disj_union(doms)
+        # Ints, domains, functions
+        return _Dom(member=lambda x: True)
+
+
+def _is_option(T: ir.Type) -> bool:
+    return isinstance(T, ir.SumT) and len(T) == 2 and isinstance(T.elemTs[0], ir.UnitT)
+
+def _cartprod(doms: tp.Sequence[_Dom]) -> _Dom:
+    n = len(doms)
+    return _Dom(
+        make=lambda: list(it.product(*(d.elems() for d in doms))),
+        member=lambda x: len(x) == n and all(c in d for c, d in zip(x, doms)),
+    )
+
+def _disj_union(doms: tp.Sequence[_Dom]) -> _Dom:
+    return _Dom(
+        make=lambda: [_Inj(i, e) for i, d in enumerate(doms) for e in d.elems()],
+        member=lambda x: isinstance(x, _Inj) and x.idx < len(doms) and x.val in doms[x.idx],
+    )
+
+
+## Scalars
+
+@_op(ir.Lit)
+def _(run: _Run, node: ir.Lit, env):
+    return node.val
+
+@_op(ir.Unit)
+def _(run, node, env):
+    return None
+
+@_op(ir.VarRef)
+def _(run: _Run, node: ir.VarRef, env):
+    return run.var(node.sid)
+
+@_op(ir.BoundVarHOAS)
+def _(run, node: ir.BoundVarHOAS, env):
+    return env[node.name]
+
+@_op(ir.Eq)
+def _(run: _Run, node, env):
+    a, b = node.children
+    return run.ev(a, env) == run.ev(b, env)
+
+@_op(ir.Lt)
+def _(run: _Run, node, env):
+    a, b = node.children
+    return run.ev(a, env) < run.ev(b, env)
+
+@_op(ir.LtEq)
+def _(run: _Run, node, env):
+    a, b = node.children
+    return run.ev(a, env) <= run.ev(b, env)
+
+@_op(ir.Not)
+def _(run: _Run, node, env):
+    return not run.ev(node.children[0], env)
+
+@_op(ir.Implies)
+def _(run: _Run, node, env):
+    a, b = node.children
+    return not run.ev(a, env) or bool(run.ev(b, env))
+
+@_op(ir.Conj)
+def _(run: _Run, node, env):
+    for c in node.children:
+        if not run.ev(c, env):
+            return False
+    return True
+
+@_op(ir.Disj)
+def _(run: _Run, node, env):
+    for c in node.children:
+        if run.ev(c, env):
+            return True
+    return False
+
+@_op(ir.Ite)
+def _(run: _Run, node, env):
+    c, t, f = node.children
+    return run.ev(t, env) if run.ev(c, env) else run.ev(f, env)
+
+@_op(ir.Neg)
+def _(run: _Run, node, env):
+    return -run.ev(node.children[0], env)
+
+@_op(ir.Abs)
+def _(run: _Run, node, env):
+    return abs(run.ev(node.children[0], env))
+
+@_op(ir.Sum)
+def _(run: _Run, node, env):
+    return sum(run.ev(c, env) for c in node.children)
+
+@_op(ir.Prod)
+def _(run: _Run, node, env):
+    return math.prod(run.ev(c, env) for c in node.children)
+
+@_op(ir.FloorDiv, ir.Mod, ir.TrueDiv)
+def _(run: _Run, node, env):
+    a, b = (run.ev(c, env) for c in node.children)
+    if b == 0:
+        raise _Undefined()
+    if isinstance(node, ir.Mod):
+        return a % b
+    if isinstance(node, ir.TrueDiv) and a % b:
+        # Ints only: defined where it is exact
+        raise _Undefined()
+    return a // b
+
+@_op(ir.Isqrt)
+def _(run: _Run, node, env):
+    a = run.ev(node.children[0], env)
+    if a < 0:
+        raise _Undefined()
+    return math.isqrt(a)
+
+## Tuples and sums
+
+@_op(ir.TupleLit)
+def _(run: _Run, node, env):
+    return tuple(run.ev(c, env) for c in node.children)
+
+@_op(ir.Proj)
+def _(run: _Run, node: ir.Proj, env):
+    return run.ev(node.children[0], env)[node.idx]
+
+@_op(ir.Inj)
+def _(run: _Run, node: ir.Inj, env):
+    return _Inj(node.idx, run.ev(node.children[0], env))
+
+@_op(ir.SumLit)
+def _(run: _Run, node, env):
+    tag, *elems = node.children
+    idx = run.ev(tag, env)
+    return _Inj(idx, run.ev(elems[idx], env))
+
+@_op(ir.Match)
+def _(run: _Run, node, env):
+    scrut, *branches = node.children
+    v = run.ev(scrut, env)
+    return run.ev(branches[v.idx], env)(v.val)
+
+## Functions
+
+@_op(ir.LambdaHOAS)
+def _(run: _Run, node, env):
+    return _Closure(run, node, env)
+
+@_op(ir.Compose)
+def _(run: _Run, node, env):
+    return _Composed([run.ev(c, env) for c in node.children])
+
+def _lit(node: ir.Node):
+    # The value of a FuncLit layout key
+    if isinstance(node, ir.Lit):
+        return node.val
+    if isinstance(node, ir.TupleLit):
+        return tuple(_lit(c) for c in node.children)
+    if isinstance(node, ir.Inj):
+        return _Inj(node.idx, _lit(node.children[0]))
+    if isinstance(node, ir.Unit):
+        return None
+    raise ValueError(f"Cannot evaluate FuncLit key {node}")
+
+@_op(ir.FuncLit)
+def _(run: _Run, node: ir.FuncLit, env):
+    dom = run.ev(node.children[0], env)
+    elems = node.elems
+    table = {}
+    for key, i in node.layout.val_map.items():
+        table[_lit(_from_key(key))] = run.ev(elems[i], env)
+    return _Table(dom, table)
+
+def _vals(f) -> tp.Iterator:
+    """The values of a function (or a tuple, as one over its positions) in
+    the order of its domain."""
+    if isinstance(f, tuple):
+        return iter(f)
+    return map(f, f.dom.elems())
+
+@_op(ir.Apply)
+def _(run: _Run, node, env):
+    f, x = node.children
+    f, x = run.ev(f, env), run.ev(x, env)
+    if isinstance(f, tuple):
+        if not 0 <= x < len(f):
+            raise _Undefined()
+        return f[x]
+    return f(x)
+
+@_op(ir.Forall)
+def _(run: _Run, node, env):
+    for v in _vals(run.ev(node.children[0], env)):
+        if not v:
+            return False
+    return True
+
+@_op(ir.Exists)
+def _(run: _Run, node, env):
+    for v in _vals(run.ev(node.children[0], env)):
+        if v:
+            return True
+    return False
+
+@_op(ir.AllDistinct)
+def _(run: _Run, node, env):
+    vals = list(_vals(run.ev(node.children[0], env)))
+    return len(set(vals)) == len(vals)
+
+@_op(ir.AllSame)
+def _(run: _Run, node, env):
+    return len(set(_vals(run.ev(node.children[0], env)))) <= 1
+
+@_op(ir.SumReduce)
+def _(run: _Run, node, env):
+    return sum(_vals(run.ev(node.children[0], env)))
+
+@_op(ir.ProdReduce)
+def _(run: _Run, node, env):
+    return math.prod(_vals(run.ev(node.children[0], env)))
+
+@_op(ir.Fold)
+def _(run: _Run, node, env):
+    func, lam, init = node.children
+    step, acc = run.ev(lam, env), run.ev(init, env)
+    for v in _vals(run.ev(func, env)):
+        acc = step((v, acc))
+    return acc
+
+## Domains
+
+@_op(ir.Fin)
+def _(run: _Run, node, env):
+    return _range_dom(range(max(run.ev(node.children[0], env), 0)))
+
+@_op(ir.Range)
+def _(run: _Run, node, env):
+    lo, hi, step = (run.ev(c, env) for c in node.children)
+    if step == 0:
+        raise _Undefined()
+    return _range_dom(range(lo, hi, step))
+
+@_op(ir.Universe)
+def _(run: _Run, node, env):
+    return run.universe(node.T.carT, env)
+
+@_op(ir.Empty)
+def _(run, node, env):
+    return _Dom(elems=[])
+
+@_op(ir.Singleton)
+def _(run: _Run, node, env):
+    return _Dom(elems=[run.ev(node.children[0], env)])
+
+@_op(ir.DomLit)
+def _(run: _Run, node, env):
+    return _Dom(elems=_unique(run.ev(c, env) for c in node.children))
+
+@_op(ir.CartProd)
+def _(run: _Run, node, env):
+    return _cartprod([run.ev(c, env) for c in node.children])
+
+@_op(ir.DisjUnion)
+def _(run: _Run, node, env):
+    return _disj_union([run.ev(c, env) for c in node.children])
+
+@_op(ir.DomProj)
+def _(run: _Run, node: ir.DomProj, env):
+    d, i = run.ev(node.children[0], env), node.idx
+    return _Dom(make=lambda: _unique(e[i] for e in d.elems()))
+
+@_op(ir.DomInj)
+def _(run: _Run, node: ir.DomInj, env):
+    d, i = run.ev(node.children[0], env), node.idx
+    return _Dom(
+        make=lambda: [_Inj(i, e) for e in d.elems()],
+        member=lambda x: isinstance(x, _Inj) and x.idx == i and x.val in d,
+    )
+
+@_op(ir.Union)
+def _(run: _Run, node, env):
+    doms = [run.ev(c, env) for c in node.children]
+    return _Dom(
+        make=lambda: _unique(e for d in doms for e in d.elems()),
+        member=lambda x: any(x in d for d in doms),
+    )
+
+@_op(ir.Intersection)
+def _(run: _Run, node, env):
+    doms = [run.ev(c, env) for c in node.children]
+    return _Dom(
+        make=lambda: [e for e in doms[0].elems() if all(e in d for d in doms[1:])],
+        member=lambda x: all(x in d for d in doms),
+    )
+
+@_op(ir.Slice)
+def _(run: _Run, node, env):
+    d, lo, hi, step = (run.ev(c, env) for c in node.children)
+    if step == 0:
+        raise _Undefined()
+    return _Dom(make=lambda: d.elems()[lo:hi:step])
+
+@_op(ir.Image)
+def _(run: _Run, node, env):
+    f = run.ev(node.children[0], env)
+    return _Dom(make=lambda: _unique(_vals(f)))
+
+@_op(ir.Restrict)
+def _(run: _Run, node, env):
+    f = run.ev(node.children[0], env)
+    return _Dom(
+        make=lambda: [x for x in f.dom.elems() if f(x)],
+        member=lambda x: x in f.dom and bool(f(x)),
+    )
+
+@_op(ir.IsMember)
+def _(run: _Run, node, env):
+    d, x = node.children
+    return run.ev(x, env) in run.ev(d, env)
+
+@_op(ir.Card)
+def _(run: _Run, node, env):
+    return len(run.ev(node.children[0], env).elems())
+
+@_op(ir.Subset, ir.ProperSubset)
+def _(run: _Run, node, env):
+    a, b = (run.ev(c, env) for c in node.children)
+    if not all(x in b for x in a.elems()):
+        return False
+    return isinstance(node, ir.Subset) or any(x not in a for x in b.elems())
+
+@_op(ir.Unique)
+def _(run: _Run, node, env):
+    elems = run.ev(node.children[0], env).elems()
+    if len(elems) != 1:
+        raise _Undefined()
+    return elems[0]
+
+@_op(ir.ElemAt)
+def _(run: _Run, node, env):
+    d, i = (run.ev(c, env) for c in node.children)
+    elems = d.elems()
+    if not 0 <= i < len(elems):
+        raise _Undefined()
+    return elems[i]
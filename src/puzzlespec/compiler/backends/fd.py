@@ -0,0 +1,765 @@
+from __future__ import annotations
+
+import collections
+import itertools
+import random
+import typing as tp
+
+import numpy as np
+
+from ..dsl import ir
+from ..dsl.envs import SymTable
+from .smtlib import _elems, _dom_vals
+
+# Finite-domain propagation solver for scalar IR (the output of Scalarize).
+#
+# Every variable's domain is a row of a (nvars, W) uint64 bitset, bit j of a
+# row standing for the value base+j. Constraints are propagators that watch
+# their variables: when a domain shrinks, the watchers are queued and run
+# until nothing changes or a domain empties. Search copies the whole bitset
+# at each decision (cheap next to propagation) and branches x=v / x!=v on
+# the variable with the smallest domain per unit of failure weight (dom/wdeg),
+# restarting on a Luby schedule so the weights learned on one run steer the
+# next.
+
+def _lo(m: int) -> int:
+    return (m & -m).bit_length() - 1
+
+def _hi(m: int) -> int:
+    return m.bit_length() - 1
+
+# Bits set in each byte, for NumPy < 2.0 (no np.bitwise_count)
+_BYTE_BITS = np.array([bin(b).count("1") for b in range(256)], dtype=np.int64)
+
+def _popcount_bytes(rows: np.ndarray) -> np.ndarray:
+    rows = np.ascontiguousarray(rows, dtype=np.uint64)
+    return _BYTE_BITS[rows.view(np.uint8).reshape(*rows.shape[:-1], -1)].sum(axis=-1)
+
+def _popcount(rows: np.ndarray) -> np.ndarray:
+    return np.bitwise_count(rows).sum(axis=-1, dtype=np.int64)
+
+if not hasattr(np, "bitwise_count"):
+    _popcount = _popcount_bytes
+
+def _luby(i: int) -> int:
+    """The i-th (1-based) term of the Luby sequence 1 1 2 1 1 2 4 1 ..."""
+    while True:
+        k = i.bit_length()
+        if i == (1 << k) - 1:
+            return 1 << (k-1)
+        i -= (1 << (k-1)) - 1
+
+class _Constraint:
+    vars: tp.Tuple[int, ...] = ()
+    weight = 1.0
+    _queued = False
+
+    def status(self, s: 'FDSolver') -> tp.Optional[bool]:
+        """True if entailed, False if disentailed, None if undecided."""
+        return None
+
+    def propagate(self, s: 'FDSolver') -> bool:
+        """Narrows domains; False on failure."""
+        raise NotImplementedError()
+
+    def negate(self) -> '_Constraint':
+        raise ValueError(f"Cannot negate {type(self).__name__}")
+
+    def culprits(self) -> tp.Sequence[int]:
+        """The variables to blame for the last failure of propagate."""
+        return self.vars
+
+
+class _Linear(_Constraint):
+    """sum(a*x) + c  op  0, for op in '<=', '==', '!='."""
+    def __init__(self, terms: tp.Dict[int, int], c: int, op: str):
+        self.terms = tuple((x, a) for x, a in terms.items() if a != 0)
+        self.vars = tuple(x for x, _ in self.terms)
+        self.c = c
+        self.op = op
+
+    def negate(self):
+        terms = dict(self.terms)
+        if self.op == "<=":
+            return _Linear({x: -a for x, a in terms.items()}, 1 - self.c, "<=")
+        return _Linear(terms, self.c, "!=" if self.op == "==" else "==")
+
+    def _bounds(self, s):
+        lo = hi = self.c
+        for x, a in self.terms:
+            m = s.get(x)
+            if a > 0:
+                lo += a*(_lo(m) + s.base)
+                hi += a*(_hi(m) + s.base)
+            else:
+                lo += a*(_hi(m) + s.base)
+                hi += a*(_lo(m) + s.base)
+        return lo, hi
+
+    def status(self, s):
+        lo, hi = self._bounds(s)
+        if self.op == "<=":
+            return True if hi <= 0 else (False if lo > 0 else None)
+        eq = True if lo == hi == 0 else (False if lo > 0 or hi < 0 else None)
+        if self.op == "==" or eq is None:
+            return eq
+        return not eq
+
+    def propagate(self, s):
+        if self.op == "!=":
+            free = [(x, a) for x, a in self.terms if s.fixed(x) is None]
+            if len(free) > 1:
+                return True
+            rest = self.c + sum(a*s.fixed(x) for x, a in self.terms if s.fixed(x) is not None)
+            if not free:
+                return rest != 0
+            x, a = free[0]
+            if rest % a:
+                return True
+            return s.remove(x, -rest // a)
+        if len(self.terms) == 2 and self.op == "==":
+            (x, a), (y, b) = self.terms
+            if a == -b and abs(a) == 1:
+                # x - y + c/a == 0: domain consistent by shifting bitsets
+                d = self.c // a
+                if self.c % a == 0:
+                    return s.shift_eq(x, y, -d)
+        lo, hi = self._bounds(s)
+        if lo > 0 or (self.op == "==" and hi < 0):
+            return False
+        for x, a in self.terms:
+            m = s.get(x)
+            xlo, xhi = _lo(m) + s.base, _hi(m) + s.base
+            tlo, thi = (a*xlo, a*xhi) if a > 0 else (a*xhi, a*xlo)
+            # a*x <= -(lo - tlo), and for == also a*x >= -(hi - thi)
+            ub = thi - hi if self.op == "==" else None
+            rhs = tlo - lo
+            if a > 0:
+                new_hi = rhs // a
+                new_lo = -((-ub) // a) if ub is not None else xlo
+            else:
+                new_lo = -(rhs // -a)
+                new_hi = (-ub) // -a if ub is not None else xhi
+            if new_lo > xlo or new_hi < xhi:
+                if not s.restrict(x, new_lo, new_hi):
+                    return False
+                lo, hi = self._bounds(s)
+        return True
+
+
+class _Member(_Constraint):
+    """x in vals (or not in vals, if neg). mask is set once the solver has
+    packed its domains."""
+    mask = 0
+
+    def __init__(self, x: int, vals: tp.Iterable[int], neg: bool = False):
+        self.vars = (x,)
+        self.vals = tuple(vals)
+        self.neg = neg
+
+    def negate(self):
+        return _Member(self.vars[0], self.vals, not self.neg)
+
+    def status(self, s):
+        m = s.get(self.vars[0])
+        return True if m & ~self.mask == 0 else (False if m & self.mask == 0 else None)
+
+    def propagate(self, s):
+        return s.set(self.vars[0], s.get(self.vars[0]) & self.mask)
+
+
+class _AllDistinct(_Constraint):
+    """A batch of AllDistinct constraints of equal arity, one per row of xs,
+    filtered together in (m, k, W) arrays."""
+    def __init__(self, xs: tp.Sequence[tp.Sequence[int]]):
+        self.idx = np.array(xs, dtype=np.intp).reshape(len(xs), -1)
+        self.vars = tuple(dict.fromkeys(self.idx.ravel().tolist()))
+        k = self.idx.shape[1]
+        self._offdiag = ~np.eye(k, dtype=bool)[None, :, :, None]
+        self._failed = self.idx
+
+    def culprits(self):
+        return self._failed.ravel().tolist()
+
+    @staticmethod
+    def merge(cs: tp.Sequence['_AllDistinct']) -> '_AllDistinct':
+        return _AllDistinct(np.concatenate([c.idx for c in cs]))
+
+    def status(self, s):
+        result = True
+        for xs in self.idx.tolist():
+            fixed = [s.fixed(x) for x in xs]
+            vals = [v for v in fixed if v is not None]
+            if len(set(vals)) < len(vals):
+                return False
+            if len(vals) < len(fixed):
+                result = None
+        return result
+
+    def _narrow(self, rows: np.ndarray) -> tp.Optional[np.ndarray]:
+        """One round of filtering on the (m, k, W) rows, or None on failure,
+        recording which of the m constraints failed."""
+        k = rows.shape[1]
+        cnt = _popcount(rows)
+        # Hall sets among the variables' own domains: if the domains of p
+        # variables lie within a domain of p values, the others avoid it.
+        # sub[:, a, b]: the domain of b is within that of a
+        sub = ((rows[:, None, :, :] & ~rows[:, :, None, :]) == 0).all(axis=3)
+        nsub = sub.sum(axis=2)
+        if (bad := (nsub > cnt).any(axis=1)).any():
+            return self._fail(bad)
+        hall = (nsub == cnt) & (cnt < k)
+        if hall.any():
+            drop = (hall[:, :, None] & ~sub)[:, :, :, None]
+            rows = rows & ~np.bitwise_or.reduce(np.where(drop, rows[:, :, None, :], np.uint64(0)), axis=1)
+        union = np.bitwise_or.reduce(rows, axis=1)
+        nvals = _popcount(union)
+        if (bad := nvals < k).any():
+            return self._fail(bad)
+        perm = nvals == k
+        if perm.any():
+            # Every value is taken, so a value only one variable allows is its
+            pairs = np.where(self._offdiag, rows[:, :, None, :] & rows[:, None, :, :], np.uint64(0))
+            twice = np.bitwise_or.reduce(pairs, axis=(1, 2))
+            hits = rows & (union & ~twice)[:, None, :]
+            nhits = np.where(perm[:, None], _popcount(hits), 0)
+            if (bad := (nhits > 1).any(axis=1)).any():
+                return self._fail(bad)
+            rows = np.where((nhits == 1)[:, :, None], hits, rows)
+        if (bad := (_popcount(rows) == 0).any(axis=1)).any():
+            return self._fail(bad)
+        return rows
+
+    def _fail(self, bad: np.ndarray) -> None:
+        self._failed = self.idx[bad]
+        return None
+
+    def propagate(self, s):
+        xs = np.array(self.vars, dtype=np.intp)
+        old = s.dom[xs]
+        dom = s.dom
+        while True:
+            rows = dom[self.idx]
+            new = self._narrow(rows)
+            if new is None:
+                return False
+            if (new == rows).all():
+                break
+            # A variable in several constraints keeps what all of them allow
+            dom = dom.copy()
+            np.bitwise_and.at(dom, self.idx.ravel(), new.reshape(-1, new.shape[-1]))
+        changed = (dom[xs] != old).any(axis=1)
+        if changed.any():
+            s.write_rows(xs[changed], dom[xs[changed]], exclude=self)
+        return True
+
+
+class _AllSame(_Constraint):
+    def __init__(self, xs: tp.Sequence[int]):
+        self.vars = tuple(xs)
+
+    def status(self, s):
+        m = -1
+        for x in self.vars:
+            m &= s.get(x)
+        if m == 0:
+            return False
+        return True if all(s.fixed(x) is not None for x in self.vars) else None
+
+    def propagate(self, s):
+        m = -1
+        for x in self.vars:
+            m &= s.get(x)
+        return all(s.set(x, m) for x in self.vars)
+
+
+class _Clause(_Constraint):
+    def __init__(self, cs: tp.Sequence[_Constraint]):
+        self.cs = tuple(cs)
+        self.vars = tuple(dict.fromkeys(x for c in cs for x in c.vars))
+
+    def negate(self):
+        return _And([c.negate() for c in self.cs])
+
+    def status(self, s):
+        st = [c.status(s) for c in self.cs]
+        return True if True in st else (False if all(v is False for v in st) else None)
+
+    def propagate(self, s):
+        open_ = []
+        for c in self.cs:
+            st = c.status(s)
+            if st is True:
+                return True
+            if st is None:
+                open_.append(c)
+                if len(open_) > 1:
+                    return True
+        if not open_:
+            return False
+        return open_[0].propagate(s)
+
+
+class _And(_Constraint):
+    def __init__(self, cs: tp.Sequence[_Constraint]):
+        self.cs = tuple(cs)
+        self.vars = tuple(dict.fromkeys(x for c in cs for x in c.vars))
+
+    def negate(self):
+        return _Clause([c.negate() for c in self.cs])
+
+    def status(self, s):
+        st = [c.status(s) for c in self.cs]
+        return False if False in st else (True if all(st) else None)
+
+    def propagate(self, s):
+        return all(c.propagate(s) for c in self.cs)
+
+
+class FDSolver:
+    """Propagation + search solver for scalar constraints.
+
+    Variables must be Bools or Ints/EnumTs with a literal finite domain.
+    solve() returns a dict from sid to value (bool for Bools, the label index
+    for EnumTs), or None if the constraints are unsatisfiable.
+
+    The solver is incremental: solve() takes assumptions, and constraints
+    added by block() between push() and pop() are dropped again by pop().
+    With a seed, search tries the values of a variable in random order
+    rather than lowest first.
+    """
+    def __init__(self, spec: ir.Spec, sym: tp.Optional[SymTable] = None, restart_base: int = 64, seed: tp.Optional[int] = None):
+        self.sym = sym
+        self.restart_base = restart_base
+        self._rng = random.Random(seed) if seed is not None else None
+        self._levels: tp.List[int] = []
+        self.nodes = self.fails = self.restarts = 0
+        self._masks: tp.List[int] = []   # initial domains, as value sets until packed
+        self._vals: tp.List[tp.Set[int]] = []
+        self._sids: tp.Dict[int, int] = {}
+        self._bool_sids: tp.Set[int] = set()
+        self._terms: tp.Dict[ir.Node, tp.Tuple[tp.Dict[int, int], int]] = {}
+        self.constraints: tp.List[_Constraint] = []
+        self._unsat = False
+        self._post(spec.cons)
+        self._post(spec.obls)
+        self._pack()
+
+    ## Compilation
+
+    def _new_var(self, vals: tp.Iterable[int]) -> int:
+        self._vals.append(set(vals))
+        return len(self._vals) - 1
+
+    def _var(self, var: ir.VarRef) -> int:
+        if var.sid in self._sids:
+            return self._sids[var.sid]
+        T = var.T
+        if isinstance(T, ir.BoolT):
+            vals = (0, 1)
+            self._bool_sids.add(var.sid)
+        elif isinstance(T, ir.EnumT):
+            vals = range(len(T))
+        elif isinstance(T, ir.IntT) and T.ref is not None and (vals := _dom_vals(T.ref)) is not None:
+            pass
+        else:
+            raise ValueError(f"FDSolver needs a literal finite domain for {var}")
+        x = self._sids[var.sid] = self._new_var(vals)
+        return x
+
+    def _range(self, lin) -> tp.Tuple[int, int]:
+        terms, c = lin
+        lo = hi = c
+        for x, a in terms.items():
+            vlo, vhi = min(self._vals[x]), max(self._vals[x])
+            lo += min(a*vlo, a*vhi)
+            hi += max(a*vlo, a*vhi)
+        return lo, hi
+
+    def _aux(self, lin) -> int:
+        """A variable equal to the linear term lin."""
+        terms, c = lin
+        if c == 0 and len(terms) == 1 and next(iter(terms.values())) == 1:
+            return next(iter(terms))
+        lo, hi = self._range(lin)
+        z = self._new_var(range(lo, hi+1))
+        t = dict(terms)
+        t[z] = t.get(z, 0) - 1
+        self._add(_Linear(t, c, "=="))
+        return z
+
+    def linear(self, node: ir.Node) -> tp.Tuple[tp.Dict[int, int], int]:
+        """node as ({var: coef}, const)."""
+        if node in self._terms:
+            return self._terms[node]
+        match node:
+            case ir.Lit() if isinstance(node.T, ir.EnumT):
+                lin = ({}, node.T.labels.index(node.val))
+            case ir.Lit():
+                lin = ({}, int(node.val))
+            case ir.VarRef():
+                lin = ({self._var(node): 1}, 0)
+            case ir.Neg(a):
+                t, c = self.linear(a)
+                lin = ({x: -k for x, k in t.items()}, -c)
+            case ir.Sum() | ir.SumReduce():
+                elems = node.children if isinstance(node, ir.Sum) else _elems(node.children[0])
+                terms, c = collections.Counter(), 0
+                for e in elems:
+                    t, ec = self.linear(e)
+                    terms.update(t)
+                    c += ec
+                lin = (dict(terms), c)
+            case ir.Prod():
+                lin = ({}, 1)
+                for e in node.children:
+                    t, c = self.linear(e)
+                    if t and lin[0]:
+                        raise ValueError("FDSolver only supports products by constants")
+                    if t:
+                        lin = ({x: k*lin[1] for x, k in t.items()}, c*lin[1])
+                    else:
+                        lin = ({x: k*c for x, k in lin[0].items()}, lin[1]*c)
+            case ir.Ite(pred, t, f):
+                # z = t if pred else f
+                tl, fl = self.linear(t), self.linear(f)
+                (tlo, thi), (flo, fhi) = self._range(tl), self._range(fl)
+                z = self._new_var(range(min(tlo, flo), max(thi, fhi)+1))
+                cond = self.constraint(pred)
+                self._add(self._clause(cond.negate(), self._eq_var(z, tl)))
+                self._add(self._clause(cond, self._eq_var(z, fl)))
+                lin = ({z: 1}, 0)
+            case _ if isinstance(node.T, ir.BoolT):
+                # Reify as a 0/1 variable
+                b = self._new_var((0, 1))
+                cond = self.constraint(node)
+                self._add(self._clause(_Linear({b: 1}, -1, "=="), cond.negate()))
+                self._add(self._clause(_Linear({b: 1}, 0, "=="), cond))
+                lin = ({b: 1}, 0)
+            case _:
+                raise ValueError(f"FDSolver cannot encode {type(node).__name__}")
+        if node.obl is not None:
+            self._post(node.obl)
+        self._terms[node] = lin
+        return lin
+
+    def _eq_var(self, z: int, lin) -> _Linear:
+        t, c = lin
+        t = dict(t)
+        t[z] = t.get(z, 0) - 1
+        return _Linear(t, c, "==")
+
+    @staticmethod
+    def _clause(*cs) -> _Constraint:
+        return _Clause(cs)
+
+    def _cmp(self, op: str, a: ir.Node, b: ir.Node, strict: bool = False) -> _Linear:
+        (ta, ca), (tb, cb) = self.linear(a), self.linear(b)
+        terms = collections.Counter(ta)
+        terms.subtract(tb)
+        return _Linear(dict(terms), ca - cb + (1 if strict else 0), op)
+
+    def constraint(self, node: ir.Node) -> tp.Union[_Constraint, bool]:
+        match node:
+            case ir.Lit():
+                return _And([]) if node.val else _Clause([])
+            case ir.VarRef():
+                return _Linear({self._var(node): 1}, -1, "==")
+            case ir.Not(a):
+                return self.constraint(a).negate()
+            case ir.Conj():
+                return _And([self.constraint(c) for c in node.children])
+            case ir.Disj():
+                return _Clause([self.constraint(c) for c in node.children])
+            case ir.Implies(a, b):
+                return _Clause([self.constraint(a).negate(), self.constraint(b)])
+            case ir.Ite(pred, t, f):
+                c = self.constraint(pred)
+                return _And([_Clause([c.negate(), self.constraint(t)]), _Clause([c, self.constraint(f)])])
+            case ir.Eq(a, b):
+                return self._cmp("==", a, b)
+            case ir.Lt(a, b):
+                return self._cmp("<=", a, b, strict=True)
+            case ir.LtEq(a, b):
+                return self._cmp("<=", a, b)
+            case ir.IsMember(dom, val):
+                vals = _dom_vals(dom)
+                if vals is None:
+                    raise ValueError(f"FDSolver needs a literal domain, got {dom}")
+                return _Member(self._aux(self.linear(val)), vals)
+            case ir.AllDistinct(func):
+                return _AllDistinct([[self._aux(self.linear(e)) for e in _elems(func)]])
+            case ir.AllSame(func):
+                return _AllSame([self._aux(self.linear(e)) for e in _elems(func)])
+        raise ValueError(f"FDSolver cannot encode {type(node).__name__}")
+
+    def _add(self, c: _Constraint):
+        if isinstance(c, _And):
+            for sub in c.cs:
+                self._add(sub)
+        elif isinstance(c, _Clause) and len(c.cs) == 1:
+            self._add(c.cs[0])
+        elif isinstance(c, _Clause) and not c.cs:
+            self._unsat = True
+        else:
+            self.constraints.append(c)
+
+    def _post(self, node: ir.Node):
+        if isinstance(node, ir.TupleLit):
+            for c in node.children:
+                self._post(c)
+            return
+        self._add(self.constraint(node))
+
+    def _pack(self):
+        allv = set().union(*self._vals) if self._vals else {0}
+        self.base = min(allv)
+        self.W = max(1, -(-(max(allv) - self.base + 1) // 64))
+        n = len(self._vals)
+        self.dom = np.zeros((n, self.W), dtype=np.uint64)
+        for x, vals in enumerate(self._vals):
+            self._write(x, sum(1 << (v - self.base) for v in vals))
+        # Member masks need the base
+        for c in self._walk():
+            if isinstance(c, _Member):
+                mask = sum(1 << (v - self.base) for v in set(c.vals) if v >= self.base)
+                c.mask = ~mask if c.neg else mask
+        # Top-level AllDistincts of equal arity are filtered as one batch
+        by_arity = collections.defaultdict(list)
+        for c in self.constraints:
+            if isinstance(c, _AllDistinct):
+                by_arity[c.idx.shape[1]].append(c)
+        self.constraints = [c for c in self.constraints if not isinstance(c, _AllDistinct)]
+        self.constraints += [_AllDistinct.merge(cs) for cs in by_arity.values()]
+        self.watch: tp.List[tp.List[_Constraint]] = [[] for _ in range(n)]
+        for c in self.constraints:
+            for x in c.vars:
+                self.watch[x].append(c)
+        self.wdeg = np.ones(n)
+        self._queue: tp.Deque[_Constraint] = collections.deque()
+
+    def _walk(self):
+        todo = list(self.constraints)
+        while todo:
+            c = todo.pop()
+            yield c
+            if isinstance(c, (_Clause, _And)):
+                todo.extend(c.cs)
+
+    ## Domain store
+
+    def get(self, x: int) -> int:
+        if self.W == 1:
+            return int(self.dom[x, 0])
+        return int.from_bytes(self.dom[x].tobytes(), "little")
+
+    def _write(self, x: int, m: int):
+        if self.W == 1:
+            self.dom[x, 0] = m
+        else:
+            self.dom[x] = np.frombuffer(m.to_bytes(8*self.W, "little"), dtype=np.uint64)
+
+    def _changed(self, x: int):
+        for c in self.watch[x]:
+            if not c._queued:
+                c._queued = True
+                self._queue.append(c)
+
+    def set(self, x: int, m: int) -> bool:
+        """Narrows the domain of x to m (within its current domain)."""
+        old = self.get(x)
+        m &= old
+        if m == 0:
+            return False
+        if m != old:
+            self._write(x, m)
+            self._changed(x)
+        return True
+
+    def write_rows(self, xs: np.ndarray, rows: np.ndarray, exclude: tp.Optional[_Constraint] = None):
+        """Writes rows to the domains of xs. exclude, being at a fixed point
+        already, is not queued."""
+        self.dom[xs] = rows
+        for x in xs.tolist():
+            for c in self.watch[x]:
+                if not c._queued and c is not exclude:
+                    c._queued = True
+                    self._queue.append(c)
+
+    def fixed(self, x: int) -> tp.Optional[int]:
+        m = self.get(x)
+        return _lo(m) + self.base if m & (m - 1) == 0 else None
+
+    def restrict(self, x: int, lo: int, hi: int) -> bool:
+        lo, hi = lo - self.base, hi - self.base
+        if hi < 0 or hi < lo:
+            return False
+        return self.set(x, ((1 << (hi+1)) - 1) & ~((1 << max(lo, 0)) - 1))
+
+    def remove(self, x: int, v: int) -> bool:
+        if v < self.base:
+            return True
+        return self.set(x, ~(1 << (v - self.base)))
+
+    def shift_eq(self, x: int, y: int, d: int) -> bool:
+        """Domain consistency for x == y + d."""
+        my = self.get(y)
+        if not self.set(x, my << d if d >= 0 else my >> -d):
+            return False
+        mx = self.get(x)
+        return self.set(y, mx >> d if d >= 0 else mx << -d)
+
+    ## Search
+
+    def propagate(self) -> bool:
+        q = self._queue
+        while q:
+            c = q.popleft()
+            c._queued = False
+            if not c.propagate(self):
+                c.weight += 1
+                self.wdeg[list(c.culprits())] += 1
+                for c2 in q:
+                    c2._queued = False
+                q.clear()
+                return False
+        return True
+
+    def _select(self) -> tp.Optional[int]:
+        cnt = _popcount(self.dom)
+        free = cnt > 1
+        if not free.any():
+            return None
+        score = np.where(free, cnt / self.wdeg, np.inf)
+        return int(np.argmin(score))
+
+    def _value(self, x: int) -> int:
+        m = self.get(x)
+        if self._rng is None:
+            return _lo(m) + self.base
+        bits = [i for i in range(m.bit_length()) if m >> i & 1]
+        return self._rng.choice(bits) + self.base
+
+    def _search(self, fail_limit: int):
+        """DFS to a solution (True), exhaustion (False) or fail_limit fails (None)."""
+        stack = []
+        fails = 0
+        while True:
+            x = self._select()
+            if x is None:
+                return True
+            v = self._value(x)
+            self.nodes += 1
+            stack.append((self.dom.copy(), x, v))
+            self._write(x, 1 << (v - self.base))
+            self._changed(x)
+            ok = self.propagate()
+            while not ok:
+                self.fails += 1
+                fails += 1
+                if not stack:
+                    return False
+                if fails >= fail_limit:
+                    return None
+                self.dom, x, v = stack.pop()
+                ok = self.remove(x, v) and self.propagate()
+
+    def _root(self) -> tp.Optional[np.ndarray]:
+        """The domains after propagating every constraint once, computed on
+        the first solve and shared by all later ones."""
+        if not hasattr(self, "_root_dom"):
+            self._root_dom = None
+            if not self._unsat:
+                for c in self.constraints:
+                    c._queued = True
+                    self._queue.append(c)
+                if self.propagate():
+                    self._root_dom = self.dom.copy()
+            self._n_root = len(self.constraints)
+        return self._root_dom
+
+    def solve(self, assume: tp.Optional[tp.Mapping[int, tp.Union[int, bool]]] = None) -> tp.Optional[tp.Dict[int, tp.Union[int, bool]]]:
+        """Solves under assume, a mapping from sid to value. The solver is
+        reusable: each call starts again from the root domains, so only the
+        constraints watching the assumed variables are propagated anew."""
+        root = self._root()
+        if root is None:
+            return None
+        self.dom = root.copy()
+        # Constraints added since the root domains were propagated
+        for c in self.constraints[self._n_root:]:
+            if not c._queued:
+                c._queued = True
+                self._queue.append(c)
+        for sid, v in (assume or {}).items():
+            x = self._sids.get(sid)
+            if x is None:
+                # Not mentioned by any constraint
+                continue
+            if not self.restrict(x, int(v), int(v)):
+                self._queue_reset()
+                return None
+        if not self.propagate():
+            return None
+        root = self.dom.copy()
+        for i in itertools.count(1):
+            res = self._search(self.restart_base * _luby(i))
+            if res is not None:
+                break
+            self.restarts += 1
+            self.dom = root.copy()
+        if not res:
+            return None
+        vals = {}
+        for sid, x in self._sids.items():
+            v = self.fixed(x)
+            vals[sid] = bool(v) if sid in self._bool_sids else v
+        return vals
+
+    def _queue_reset(self):
+        for c in self._queue:
+            c._queued = False
+        self._queue.clear()
+
+    ## Incremental solving
+
+    def push(self):
+        """Opens a level: pop() drops the constraints added after it."""
+        self._root()
+        self._levels.append(len(self.constraints))
+
+    def pop(self):
+        n = self._levels.pop()
+        for c in self.constraints[n:]:
+            for x in c.vars:
+                self.watch[x].remove(c)
+        del self.constraints[n:]
+
+    def block(self, vals: tp.Mapping[int, tp.Union[int, bool]]):
+        """Adds a clause ruling out the assignment vals (by sid)."""
+        self._root()
+        lits = [_Linear({self._sids[sid]: 1}, -int(v), "!=") for sid, v in vals.items() if sid in self._sids]
+        c = _Clause(lits) if len(lits) != 1 else lits[0]
+        self.constraints.append(c)
+        for x in c.vars:
+            self.watch[x].append(c)
+
+    def count_solutions(self, assume: tp.Optional[tp.Mapping[int, tp.Union[int, bool]]] = None, limit: int = 2,
+                        over: tp.Optional[tp.Iterable[int]] = None) -> int:
+        """The number of solutions under assume, distinct on the sids in over
+        (all by default), counting up to limit. Each solution found is
+        blocked within a push()/pop(), so the solver is left as it was."""
+        over = list(self._sids) if over is None else list(over)
+        count = 0
+        self.push()
+        try:
+            while count < limit and (sol := self.solve(assume)) is not None:
+                count += 1
+                self.block({sid: sol[sid] for sid in over if sid in sol})
+        finally:
+            self.pop()
+        return count
+
+def solve(spec: ir.Spec, sym: tp.Optional[SymTable] = None, **kwargs) -> tp.Optional[tp.Dict[int, tp.Union[int, bool]]]:
+    """Solves the scalar spec, returning values by sid or None if unsatisfiable."""
+    return FDSolver(spec, sym, **kwargs).solve()
@@ -2,10 +2,10 @@ from __future__ import annotations
 
 import typing as tp
 
-from ..pass_base import Transform, Context, handles
+from ...passes.pass_base import Transform, Context, handles
 from ...dsl import ir, ast
 from ....libs import var_def, std
-from ..envobj import EnvsObj, SymTable
+from ...passes.envobj import EnvsObj, SymTable
 
 class EncodeEnums(Transform):
     """Encode enums Ints or Bools
@@ -35,11 +35,12 @@ class EncodeEnums(Transform):
             T = vc.T
             assert isinstance(enumT, ir.EnumT)
             n = len(enumT)
-            i = enumT.labels.index(node.label)
+            i = enumT.labels.index(node.val)
             if n==2:
                 return ir.Lit(T, val=bool(i))
             else:
                 return ir.Lit(T, val=i)
+        return super().visit(node)
 
     @handles(ir.EnumT)
     def _(self, node: ir.EnumT) -> ir.Node:
@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import typing as tp
+
+import numpy as np
+
+from ...dsl import ir, utils
+from ...passes.transforms.nbe import normalize
+
+# Batched grounding of a lambda over a finite domain of Ints or Int tuples.
+#
+# Instead of instantiating the body once per element (build an Apply,
+# normalize it, visit the result), the body is walked once with the bound
+# variable standing for the whole domain as NumPy index arrays. Index
+# arithmetic, comparisons and lookups into FuncLits are evaluated as array
+# operations; only the nodes that still differ per element are built, one
+# list per node. Subterms the walk cannot batch (binders over the variable,
+# dependent types) are instantiated per element as before.
+
+def _lit_val(node: ir.Node):
+    if isinstance(node, ir.Lit) and isinstance(node.T, (ir.IntT, ir.BoolT)):
+        return node.val
+    return None
+
+
+class DomIndex:
+    """The elements of a domain in iteration order, as one index array per
+    coordinate."""
+    def __init__(self, dom: ir.Node, arrays: tp.List[np.ndarray], is_tuple: bool):
+        self.dom = dom
+        self.arrays = arrays
+        self.is_tuple = is_tuple
+        self.size = len(arrays[0]) if arrays else 0
+        self._elems = None
+
+    @property
+    def carT(self) -> ir.Type:
+        return self.dom.T.carT
+
+    def elems(self) -> tp.List[ir.Node]:
+        """The element nodes, as domain iteration yields them."""
+        if self._elems is None:
+            self._elems = list(utils._iterate(self.dom))
+        return self._elems
+
+    def table(self) -> tp.Tuple[tp.List[int], np.ndarray]:
+        """(lo, table): table[c - lo] is the position of the element with
+        coordinates c, or -1 if c is in the bounding box but not an element."""
+        return utils._lookup_table(self.dom)
+
+    def positions(self, coords: tp.Sequence[np.ndarray]) -> np.ndarray:
+        """Position in iteration order of each coordinate tuple, -1 for those
+        that are not elements."""
+        return utils._positions(self.dom, coords)
+
+def index_domain(dom: ir.Node) -> tp.Optional[DomIndex]:
+    """Index arrays for dom if it is a concrete domain of Ints or flat Int
+    tuples (see utils._dom_arrays); None otherwise."""
+    arrays = utils._dom_arrays(dom)
+    if arrays is None:
+        return None
+    return DomIndex(dom, list(arrays), utils._is_kind(dom.T.carT, ir.TupleT))
+
+
+class _Num:
+    """A per-element Int or Bool, as an array."""
+    __slots__ = ("T", "arr")
+    def __init__(self, T: ir.Type, arr: np.ndarray):
+        self.T = T
+        self.arr = arr
+
+class _Tup:
+    """A per-element tuple, one batch per component."""
+    __slots__ = ("T", "items")
+    def __init__(self, T: ir.Type, items: tp.List[tp.Any]):
+        self.T = T
+        self.items = items
+
+class _Nodes:
+    """Per-element nodes."""
+    __slots__ = ("nodes",)
+    def __init__(self, nodes: tp.List[ir.Node]):
+        self.nodes = nodes
+
+_NARY = {
+    ir.Sum: np.add,
+    ir.Prod: np.multiply,
+    ir.Conj: np.logical_and,
+    ir.Disj: np.logical_or,
+}
+
+_BINARY = {
+    ir.Eq: np.equal,
+    ir.Lt: np.less,
+    ir.LtEq: np.less_equal,
+    ir.Implies: lambda a, b: np.logical_or(np.logical_not(a), b),
+}
+
+_UNARY = {
+    ir.Neg: np.negative,
+    ir.Not: np.logical_not,
+    ir.Abs: np.abs,
+}
+
+
+class BatchGround:
+    """Instantiates lam at every element of dom in one walk of its body.
+    funclit_index returns the DomIndex of a FuncLit's domain (or None), so
+    lookups into function literals can be batched."""
+    def __init__(self, lam: ir.LambdaHOAS, dom: DomIndex, funclit_index: tp.Callable[[ir.Node], tp.Optional[DomIndex]] = index_domain):
+        self.lam = lam
+        self.dom = dom
+        self.bv_name = lam.bv_name
+        self.funclit_index = funclit_index
+        self._mentions: tp.Dict[ir.Node, bool] = {}
+        self._orders: tp.Dict[ir.FuncLit, tp.Optional[np.ndarray]] = {}
+
+    def run(self) -> tp.List[ir.Node]:
+        return self.nodes(self.eval(self.lam.body), self.dom.size)
+
+    def mentions(self, root: ir.Node) -> bool:
+        """Whether root contains the lambda's bound variable."""
+        memo = self._mentions
+        stack = [(root, False)]
+        while stack:
+            n, expanded = stack.pop()
+            if n in memo:
+                continue
+            if isinstance(n, ir.BoundVarHOAS):
+                memo[n] = n.name == self.bv_name
+            elif not expanded:
+                stack.append((n, True))
+                stack.extend((c, False) for c in n.all_nodes if c not in memo)
+            else:
+                memo[n] = any(memo[c] for c in n.all_nodes)
+        return memo[root]
+
+    def _var(self):
+        d = self.dom
+        if d.is_tuple:
+            return _Tup(d.carT, [_Num(T, a) for T, a in zip(d.carT.children, d.arrays)])
+        return _Num(d.carT, d.arrays[0])
+
+    def eval(self, root: ir.Node):
+        """Batch value of root: a node if it does not depend on the element,
+        else a _Num, _Tup or _Nodes."""
+        vals: tp.Dict[ir.Node, tp.Any] = {}
+        stack = [(root, False)]
+        while stack:
+            n, expanded = stack.pop()
+            if n in vals:
+                continue
+            if not self.mentions(n):
+                vals[n] = n
+                continue
+            if isinstance(n, ir.BoundVarHOAS):
+                vals[n] = self._var()
+                continue
+            if self._per_elem(n):
+                vals[n] = _Nodes(self._instantiate(n))
+                continue
+            if not expanded:
+                stack.append((n, True))
+                stack.extend((c, False) for c in n.children if c not in vals)
+                continue
+            args = [vals[c] for c in n.children]
+            if n.obl is not None and self.mentions(n.obl):
+                vals[n] = self._with_obl(n, args, self.eval(n.obl))
+            else:
+                vals[n] = self._eval(n, args)
+        return vals[root]
+
+    def _per_elem(self, n: ir.Node) -> bool:
+        # Binders and dependent types are instantiated per element
+        if isinstance(n, (ir._Lambda, ir._PiT)):
+            return True
+        return self.mentions(n.T)
+
+    def _with_obl(self, n: ir.Node, args: tp.List[tp.Any], obl) -> _Nodes:
+        # An element-dependent obligation is grounded like any other value
+        size = self.dom.size
+        cols = [self.nodes(a, size) for a in args]
+        obls = self.nodes(obl, size)
+        return _Nodes([n.replace(*cs, T=n.T, obl=o) for cs, o in zip(zip(*cols), obls)])
+
+    def _instantiate(self, n: ir.Node) -> tp.List[ir.Node]:
+        lam = self.lam
+        argT = lam.T.argT
+        wrap = ir.LambdaHOAS(ir.PiTHOAS(argT, n.T, self.bv_name), n, self.bv_name)
+        return [normalize(ir.Apply(n.T, wrap, e)) for e in self.dom.elems()]
+
+    def _eval(self, n: ir.Node, args: tp.List[tp.Any]):
+        cls = type(n)
+        if n.obl is None:
+            if cls is ir.TupleLit:
+                return _Tup(n.T, args)
+            if cls is ir.Proj and isinstance(args[0], _Tup):
+                return args[0].items[n.idx]
+            nums = self._numeric(args)
+            if nums is not None:
+                res = self._fold(n, nums)
+                if res is not None:
+                    return _Num(n.T, res)
+            if cls is ir.Apply and isinstance(args[0], ir.FuncLit):
+                res = self._lookup(args[0], args[1])
+                if res is not None:
+                    return res
+            if cls is ir.IsMember and not self.mentions(n.children[0]):
+                res = self._member(n.children[0], args[1])
+                if res is not None:
+                    return _Num(n.T, res)
+        # Build the node per element from its children's per-element values
+        size = self.dom.size
+        cols = [self.nodes(a, size) for a in args]
+        return _Nodes([n.replace(*cs, T=n.T, obl=n.obl) for cs in zip(*cols)])
+
+    def _numeric(self, args) -> tp.Optional[tp.List[tp.Any]]:
+        out = []
+        for a in args:
+            if isinstance(a, _Num):
+                out.append(a.arr)
+            elif (v := _lit_val(a)) is not None:
+                out.append(v)
+            else:
+                return None
+        return out
+
+    def _fold(self, n: ir.Node, nums: tp.List[tp.Any]) -> tp.Optional[np.ndarray]:
+        cls = type(n)
+        if cls in _NARY:
+            if not nums:
+                return None
+            res = nums[0]
+            for v in nums[1:]:
+                res = _NARY[cls](res, v)
+            return np.broadcast_to(res, (self.dom.size,))
+        if cls in _BINARY:
+            return np.broadcast_to(_BINARY[cls](*nums), (self.dom.size,))
+        if cls in _UNARY:
+            return np.broadcast_to(_UNARY[cls](*nums), (self.dom.size,))
+        if cls in (ir.FloorDiv, ir.Mod):
+            a, b = nums
+            if (np.asarray(b) == 0).any():
+                # Left to the obligations and simplifier
+                return None
+            op = np.floor_divide if cls is ir.FloorDiv else np.mod
+            return np.broadcast_to(op(a, b), (self.dom.size,))
+        if cls is ir.Ite:
+            c, t, f = nums
+            return np.broadcast_to(np.where(c, t, f), (self.dom.size,))
+        return None
+
+    def _coords(self, arg) -> tp.Optional[tp.List[np.ndarray]]:
+        size = self.dom.size
+        items = arg.items if isinstance(arg, _Tup) else [arg]
+        coords = []
+        for it in items:
+            if isinstance(it, _Num):
+                coords.append(np.asarray(it.arr, dtype=np.int64))
+            elif isinstance(v := _lit_val(it), int):
+                coords.append(np.full(size, v, dtype=np.int64))
+            else:
+                return None
+        return coords
+
+    def _lookup(self, func: ir.FuncLit, arg) -> tp.Optional[_Nodes]:
+        index = self.funclit_index(func.children[0])
+        coords = self._coords(arg)
+        if index is None or coords is None or len(coords) != len(index.arrays):
+            return None
+        pos = index.positions(coords)
+        if (pos < 0).any():
+            return None
+        if func not in self._orders:
+            # Iteration order to the FuncLit's layout, once per FuncLit
+            order = [func.layout.index(e) for e in index.elems()]
+            self._orders[func] = None if None in order else np.asarray(order, dtype=np.int64)
+        order = self._orders[func]
+        if order is None:
+            return None
+        elems = func.elems
+        return _Nodes([elems[i] for i in order[pos].tolist()])
+
+    def _member(self, dom: ir.Node, val) -> tp.Optional[np.ndarray]:
+        index = self.funclit_index(dom)
+        coords = self._coords(val)
+        if index is None or coords is None or len(coords) != len(index.arrays):
+            return None
+        return index.positions(coords) >= 0
+
+    def nodes(self, batch, size: int) -> tp.List[ir.Node]:
+        """Per-element nodes of a batch value."""
+        if isinstance(batch, ir.Node):
+            return [batch] * size
+        if isinstance(batch, _Nodes):
+            return batch.nodes
+        if isinstance(batch, _Num):
+            T = batch.T
+            conv = bool if isinstance(T, ir.BoolT) else int
+            cache = {}
+            out = []
+            for v in np.broadcast_to(batch.arr, (size,)).tolist():
+                if v not in cache:
+                    cache[v] = ir.Lit(T, conv(v))
+                out.append(cache[v])
+            return out
+        if isinstance(batch, _Tup):
+            cols = [self.nodes(it, size) for it in batch.items]
+            return [ir.TupleLit(batch.T, *vals) for vals in zip(*cols)]
+        raise TypeError(f"Not a batch value: {batch!r}")
+
+
+def ground(lam: ir.LambdaHOAS, dom: DomIndex, funclit_index: tp.Callable[[ir.Node], tp.Optional[DomIndex]] = index_domain) -> tp.List[ir.Node]:
+    """lam applied to every element of dom, in iteration order."""
+    return BatchGround(lam, dom, funclit_index).run()
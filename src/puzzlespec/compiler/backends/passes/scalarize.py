@@ -2,60 +2,84 @@ from __future__ import annotations
 
 import typing as tp
 
-from ..pass_base import Transform, Context, handles
-from ..transforms.beta_reduction import beta_reduce
+from ...passes.pass_base import Transform, Context, AnalysisObject, handles
+from ...passes.transforms.beta_reduction import applyT
+from ...passes.transforms.nbe import normalize
 from ...dsl import ir, utils
-from ..envobj import EnvsObj, SymTable, OblsObj
+from ...passes.envobj import EnvsObj, SymTable, OblsObj
 from ...dsl.envs import SymEntry
+from .ground import index_domain, ground
+
+class ScalarVarsObj(AnalysisObject):
+    """The scalar structure (a VarRef, or a TupleLit/SumLit/FuncLit of them)
+    Scalarize replaced each non-scalar variable with, by the variable's sid."""
+    def __init__(self, vars: tp.Mapping[int, ir.Node]):
+        self.vars = vars
 
 class Scalarize(Transform):
     """Scalarize everything
+
+    With batch=True, lambdas over domains of Ints or Int tuples are
+    grounded in one walk of their body over NumPy index arrays (ground.py)
+    rather than once per element.
     """
     name = "scalarize"
 
     requires: tp.Tuple[type, ...] = (EnvsObj,)
-    produces: tp.Tuple[type, ...] = (EnvsObj, OblsObj)
+    produces: tp.Tuple[type, ...] = (EnvsObj, OblsObj, ScalarVarsObj)
 
-    def __init__(self, max_dom_size: int = 100, aggressive: bool = False):
+    def __init__(self, max_dom_size: int = 100, aggressive: bool = False, batch: bool = True):
         self.max_dom_size = max_dom_size
         self.aggressive = aggressive
+        self.batch = batch
+        super().__init__()
 
     def run(self, root: ir.Node, ctx: Context) -> ir.Node:
         self.sym: SymTable = ctx.get(EnvsObj).sym.copy()
         self.obls: tp.Mapping[int, ir.Node] = {}
+        self._index: tp.Dict[ir.Node, tp.Any] = {}
+        self.vars: tp.Dict[int, ir.Node] = {}
         new_root = self.visit(root)
-        return new_root, EnvsObj(self.sym, self.tenv), OblsObj(self.obls)
+        return new_root, EnvsObj(self.sym), OblsObj(self.obls), ScalarVarsObj(self.vars)
 
     def make_var(self, T: ir.Type, prefix: str, e: SymEntry):
+        if isinstance(T, ir.UnitT):
+            return ir.Unit(T)
         if isinstance(T, (ir.EnumT, ir.IntT, ir.BoolT)):
             char = "E" if isinstance(T, ir.EnumT) else "I" if isinstance(T, ir.IntT) else "B"
             new_name = f"{prefix}_{char}"
-            new_sid = self.sym.new_var(new_name, e.role, e.public)
-            return ir.VarRef(new_sid)
+            new_sid = self.sym.new_var(new_name, e.kind, tuple(e._metadata.items()))
+            return ir.VarRef(T, new_sid)
         if isinstance(T, ir.TupleT):
             elems = []
             for i, elemT in enumerate(T.children):
                 elems.append(self.make_var(elemT, f"{prefix}_T{i}", e))
             return ir.TupleLit(T, *elems)
         if isinstance(T, ir.SumT):
-            # Create tag variable (IntT) with obligation that it's in Fin(len(elemTs))
-            tag_var = self.make_var(ir.IntT(), f"{prefix}_Stag", e)
-            # Add obligation: tag ∈ Fin(len(elemTs))
+            # Create tag variable (IntT refined by Fin(len(elemTs)))
             n = len(T.elemTs)
-            fin_dom = ir.Fin(ir.DomT.make(ir.IntT(), fin=True, ord=True), ir.Lit(ir.IntT(), val=n))
+            fin_dom = ir.Fin(ir.DomT(ir.IntT()), ir.Lit(ir.IntT(), val=n))
+            tag_var = self.make_var(ir.IntT(ref=fin_dom), f"{prefix}_Stag", e)
+            # Add obligation: tag ∈ Fin(len(elemTs))
             # tag_var should be a VarRef from make_var
             assert isinstance(tag_var, ir.VarRef)
             obl = ir.IsMember(ir.BoolT(), fin_dom, tag_var)
             self.obls[tag_var.sid] = obl
             # Recursively create variables for each variant
+            # A DisjUnion refinement refines each variant
+            doms = T.ref.children if isinstance(T.ref, ir.DisjUnion) else (None,)*n
             elems = []
-            for i, elemT in enumerate(T.elemTs):
+            for i, (elemT, dom) in enumerate(zip(T.elemTs, doms)):
+                if isinstance(elemT, ir.IntT) and elemT.ref is None and dom is not None:
+                    elemT = ir.IntT(ref=dom)
                 elems.append(self.make_var(elemT, f"{prefix}_S{i}", e))
             return ir.SumLit(T, tag_var, *elems)
-        if isinstance(T, ir.FuncT):
-            dom, lamT = T.children
-            dom_size = utils._dom_size(dom)
-            if dom_size is None:
+        if isinstance(T, ir._PiT):
+            lamT = T
+            dom = T.argT.ref
+            if dom is None:
+                raise ValueError(f"Expected a domain-refined argument type, got {T.argT}")
+            if utils._dom_size(dom) is None:
                 raise ValueError(f"Expected finite domain, got {dom}")
             val_map = {}
             terms = []
@@ -63,8 +87,7 @@ class Scalarize(Transform):
                 if dval is None:
                     raise ValueError(f"Expected domain element, got {dval}")
 
-                appT = ir.ApplyT(lamT, dval)
-                resT = beta_reduce(appT)
+                resT = applyT(lamT, dval)
                 new_var = self.make_var(resT, f"{prefix}_F{i}", e)
                 val_map[dval._key] = i
                 terms.append(new_var)
@@ -79,29 +102,38 @@ class Scalarize(Transform):
         # Base case (enum, bool, int)
         if isinstance(T, (ir.EnumT, ir.IntT, ir.BoolT)):
             return node
-        return self.make_var(T, e.name, e)
+        if node.sid not in self.vars:
+            self.vars[node.sid] = self.make_var(T, e.name, e)
+        return self.vars[node.sid]
 
-    @handles(ir.Map)
-    def _(self, node: ir.Map):
+    @handles(ir.LambdaHOAS)
+    def _(self, node: ir.LambdaHOAS):
         vc = self.visit_children(node)
         T = vc.T
-        dom, lam = vc.children
-        dom_size = utils._dom_size(dom)
+        lam = node.replace(*vc.children, T=T, obl=vc.obl)
+        dom = T.argT.ref
+        dom_size = utils._dom_size(dom) if dom is not None else None
         doit = self.aggressive or not utils._has_freevar(lam)
         if dom_size is not None and dom_size <= self.max_dom_size and doit:
-            # Convert Map to FuncLit by evaluating lambda for each domain element
-            elems = []
-            val_map = {}
-            for i, v in enumerate(utils._iterate(dom)):
-                assert v is not None
-                # Apply lambda and visit to simplify
-                val = ir.Apply(T.piT.resT, lam, v)
-                val = self.visit(val)
-                elems.append(val)
-                val_map[v._key] = i
+            # Convert the lambda to a FuncLit by evaluating it for each domain element
+            dom_vals = list(utils._iterate(dom))
+            index = self._index_domain(dom) if self.batch else None
+            if index is not None:
+                vals = ground(lam, index, self._index_domain)
+            else:
+                # Apply lambda and normalize, one element at a time
+                vals = [normalize(ir.Apply(applyT(T, v), lam, v)) for v in dom_vals]
+            # Visit to ground what the body still binds
+            elems = [self.visit(val) for val in vals]
+            val_map = {v._key: i for i, v in enumerate(dom_vals)}
             layout = ir._DenseLayout(val_map=val_map)
             return ir.FuncLit(T, dom, *elems, layout=layout)
-        return node.replace(dom, lam, T=T, obl=vc.obl)
+        return lam
+
+    def _index_domain(self, dom: ir.Node):
+        if dom not in self._index:
+            self._index[dom] = index_domain(dom)
+        return self._index[dom]
 
 
     @handles(ir.Forall)
@@ -111,16 +143,10 @@ class Scalarize(Transform):
         func, = vc.children
         # Extract domain and lambda from func if it's a Map
         if isinstance(func, ir.FuncLit):
+            # Every element is in the FuncLit, and a Conj is unordered
             dom, *vals = func.children
-            dom_size = utils._dom_size(dom)
-            if dom_size is not None and dom_size <= self.max_dom_size:
-                conj_vals = []
-                for v in utils._iterate(dom):
-                    assert v is not None
-                    i = func.layout.index(v)
-                    assert i is not None and 0 <= i < len(vals)
-                    conj_vals.append(vals[i])
-                return ir.Conj(T, *conj_vals)
+            if len(vals) <= self.max_dom_size:
+                return ir.Conj(T, *vals)
 
         return node.replace(func, T=T, obl=vc.obl)
 
@@ -132,13 +158,7 @@ class Scalarize(Transform):
         # Extract domain and lambda from func if it's a Map
         if isinstance(func, ir.FuncLit):
             dom, *vals = func.children
-            disj_vals = []
-            for v in utils._iterate(dom):
-                assert v is not None
-                i = func.layout.index(v)
-                assert i is not None and 0 <= i < len(vals)
-                disj_vals.append(vals[i])
-            return ir.Disj(T, *disj_vals)
+            return ir.Disj(T, *vals)
         return node.replace(func, T=T, obl=vc.obl)
 
     @handles(ir.Restrict)
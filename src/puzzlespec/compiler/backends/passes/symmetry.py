@@ -0,0 +1,389 @@
+from __future__ import annotations
+
+import collections
+import random
+import typing as tp
+from dataclasses import dataclass
+
+from ...passes.pass_base import Analysis, AnalysisObject, Context, Transform
+from ...dsl import ir, utils
+from .scalarize import ScalarVarsObj
+
+# Symmetry detection and lex-leader symmetry breaking for scalarized specs.
+#
+# SymmetryAnalysis runs on a spec after Scalarize (and optimize). It finds
+# two kinds of symmetry.
+#
+#   Value symmetries. Take vars whose only uses are Eq between two of them
+#   and AllDistinct/AllSame over literal functions of them (e.g. Sudoku
+#   digits, or the labels of a std.make_enum enum after EncodeEnums). If a
+#   connected group of such vars shares one finite set of values, any
+#   permutation of those values maps solutions to solutions.
+#
+#   Grid symmetries. Every var Scalarize turned into a FuncLit over
+#   Fin(a) x Fin(b) is a grid: Grid2D.cells(), nd.fin(a)*nd.fin(b), or the
+#   index domain nd.rows/nd.cols slice. Each flip, rotation and transpose of
+#   the board (transposes only if every grid is square) is a candidate that
+#   moves the scalar vars of all grids at once. A candidate is kept if it
+#   maps the spec's constraints onto themselves, as a multiset, up to the
+#   order of the operands of Conj/Disj/Eq/Sum/Prod and of the values in
+#   AllDistinct/AllSame. Keeping a candidate is therefore a proof.
+#
+# BreakSymmetries adds the lex-leader constraint X <=lex X∘g for each grid
+# symmetry g, with X the spec's vars in sid order. For each value symmetry
+# and each pair of adjacent values a < b it adds the same constraint for the
+# transposition (a b), which says the first occurrence of a comes before
+# that of b ("value precedence"). The lex-least member of every orbit
+# satisfies all of these, so at least one solution per class of symmetric
+# solutions survives. Each lex constraint is written as flat clauses over a
+# prefix of X, of at most max_lex positions. Cutting the prefix is sound;
+# the clauses grow quadratically in its length, and on grids the first row or
+# two already decide most comparisons.
+#
+# Breaking is only sound while nothing outside the spec distinguishes
+# symmetric solutions. Assumptions on the vars (e.g. the clues of a
+# template instance) usually do, so SpecTemplate uses the broken spec only
+# for instances that bind no gen var.
+
+# (name, square only, (r, c) -> image on an a x b grid)
+_GRID_OPS: tp.Tuple[tp.Tuple[str, bool, tp.Callable], ...] = (
+    ("flip_rows", False, lambda r, c, a, b: (a-1-r, c)),
+    ("flip_cols", False, lambda r, c, a, b: (r, b-1-c)),
+    ("rot180", False, lambda r, c, a, b: (a-1-r, b-1-c)),
+    ("transpose", True, lambda r, c, a, b: (c, r)),
+    ("anti_transpose", True, lambda r, c, a, b: (b-1-c, a-1-r)),
+    ("rot90", True, lambda r, c, a, b: (c, a-1-r)),
+    ("rot270", True, lambda r, c, a, b: (b-1-c, r)),
+)
+
+@dataclass
+class ValueSymmetry:
+    """Vars (in sid order) whose values can be permuted together."""
+    vars: tp.Tuple[ir.VarRef, ...]
+    # In value order: ints ascending, False < True, enum labels in order
+    values: tp.Tuple[ir.Lit, ...]
+
+@dataclass
+class GridSymmetry:
+    """A flip, rotation or transpose of the grids that leaves the spec
+    unchanged. perm maps each moved var to the var taking its place, so a
+    solution read through perm is again a solution."""
+    name: str
+    perm: tp.Dict[ir.VarRef, ir.VarRef]
+
+
+class Symmetries(AnalysisObject):
+    def __init__(self, values: tp.List[ValueSymmetry], grid: tp.List[GridSymmetry]):
+        self.values = values
+        self.grid = grid
+
+    def __bool__(self):
+        return bool(self.values or self.grid)
+
+    def shuffle(self, vals: tp.Mapping[int, tp.Any], rng: random.Random) -> tp.Dict[int, tp.Any]:
+        """A solution (values by sid) mapped by a random symmetry: one of the
+        grid symmetries or none, and a random permutation of each value
+        symmetry's values."""
+        out = dict(vals)
+        g = rng.choice([None, *self.grid])
+        if g is not None:
+            for x, y in g.perm.items():
+                if y.sid in vals:
+                    out[x.sid] = vals[y.sid]
+        for vs in self.values:
+            old = [_val(l) for l in vs.values]
+            new = rng.sample(old, len(old))
+            pi = dict(zip(old, new))
+            for v in vs.vars:
+                if v.sid in out:
+                    out[v.sid] = pi.get(out[v.sid], out[v.sid])
+        return out
+
+def _val(lit: ir.Lit):
+    # As FDSolver reports it
+    if isinstance(lit.T, ir.EnumT):
+        return lit.T.labels.index(lit.val)
+    return lit.val
+
+def _values(T: ir.Type) -> tp.Optional[tp.List[ir.Lit]]:
+    """The values of a scalar type, in value order, or None if unbounded."""
+    if isinstance(T, ir.BoolT):
+        return [ir.Lit(ir.BoolT(), False), ir.Lit(ir.BoolT(), True)]
+    if isinstance(T, ir.EnumT) and (T.ref is None or isinstance(T.ref, ir.Universe)):
+        E = ir.EnumT(T.name, T.labels)
+        return [ir.Lit(E, l) for l in T.labels]
+    if isinstance(T, ir.IntT) and T.ref is not None:
+        return _dom_lits(T.ref)
+    return None
+
+def _dom_lits(dom: ir.Node) -> tp.Optional[tp.List[ir.Lit]]:
+    if utils._dom_size(dom) is None:
+        return None
+    lits = list(utils._iterate(dom))
+    if not all(isinstance(l, ir.Lit) for l in lits):
+        return None
+    return sorted(lits, key=lambda l: l.val)
+
+def _leaves(node: ir.Node) -> tp.Iterator[ir.Node]:
+    """The scalar parts of a Scalarize structure, in order."""
+    if isinstance(node, (ir.TupleLit, ir.SumLit)):
+        for c in node.children:
+            yield from _leaves(c)
+    elif isinstance(node, ir.FuncLit):
+        for c in node.elems:
+            yield from _leaves(c)
+    else:
+        yield node
+
+def _grid_shape(node: ir.Node) -> tp.Optional[tp.Tuple[int, int]]:
+    if not isinstance(node, ir.FuncLit):
+        return None
+    dom = node.children[0]
+    if isinstance(dom, ir.CartProd) and len(dom.children) == 2 and all(isinstance(d, ir.Fin) for d in dom.children):
+        a, b = (utils._int(d.children[0]) for d in dom.children)
+        if a is not None and b is not None:
+            return a, b
+    return None
+
+def _conjuncts(spec: ir.Spec) -> tp.List[ir.Node]:
+    out, todo = [], [spec.obls, spec.cons]
+    while todo:
+        n = todo.pop()
+        if isinstance(n, (ir.TupleLit, ir.Conj)):
+            todo.extend(n.children)
+        else:
+            out.append(n)
+    return out
+
+_COMMUTATIVE = (ir.Conj, ir.Disj, ir.Eq, ir.Sum, ir.Prod)
+
+def _bag(keys) -> frozenset:
+    return frozenset(collections.Counter(keys).items())
+
+
+class SymmetryAnalysis(Analysis):
+    requires = (ScalarVarsObj,)
+    produces = (Symmetries,)
+    name = "symmetry"
+
+    def run(self, root: ir.Node, ctx: Context) -> Symmetries:
+        if not isinstance(root, ir.Spec):
+            raise ValueError(f"Expected a Spec, got {type(root).__name__}")
+        self.parents: tp.Dict[ir.Node, tp.List[ir.Node]] = collections.defaultdict(list)
+        # Nodes with a var under them
+        self.has_var: tp.Set[ir.Node] = set()
+        self.vars: tp.Dict[int, ir.VarRef] = {}
+        self._walk(root)
+        scalar_vars = ctx.get(ScalarVarsObj).vars
+        return Symmetries(self._value_syms(), self._grid_syms(root, scalar_vars))
+
+    def _walk(self, root: ir.Node):
+        seen = set()
+        stack = [(root, False)]
+        while stack:
+            node, done = stack.pop()
+            if done:
+                if isinstance(node, ir.VarRef):
+                    self.vars[node.sid] = node
+                    self.has_var.add(node)
+                elif any(c in self.has_var for c in node.all_nodes):
+                    self.has_var.add(node)
+                continue
+            if node in seen:
+                continue
+            seen.add(node)
+            stack.append((node, True))
+            for c in node.all_nodes:
+                self.parents[c].append(node)
+                stack.append((c, False))
+
+    ## Value symmetries
+
+    def _value_syms(self) -> tp.List[ValueSymmetry]:
+        uf = {sid: sid for sid in self.vars}
+        def find(s):
+            while uf[s] != s:
+                uf[s] = uf[uf[s]]
+                s = uf[s]
+            return s
+        ok = {}
+        vals = {sid: _values(v.T) for sid, v in self.vars.items()}
+        for sid, v in self.vars.items():
+            ok[sid] = vals[sid] is not None and len(vals[sid]) > 1
+            for p in self.parents[v]:
+                if not ok[sid]:
+                    break
+                group = self._symmetric_use(v, p, vals[sid])
+                if group is None:
+                    ok[sid] = False
+                for w in group or ():
+                    uf[find(w.sid)] = find(sid)
+        groups = collections.defaultdict(list)
+        for sid in sorted(self.vars):
+            groups[find(sid)].append(sid)
+        out = []
+        for sids in groups.values():
+            if all(ok[s] for s in sids) and all(vals[s] == vals[sids[0]] for s in sids):
+                out.append(ValueSymmetry(tuple(self.vars[s] for s in sids), tuple(vals[sids[0]])))
+        return out
+
+    def _symmetric_use(self, v: ir.VarRef, p: ir.Node, vals) -> tp.Optional[tp.Sequence[ir.VarRef]]:
+        """The vars v is tied to by its use in p, or None if permuting the
+        values of v could change p."""
+        if v in p._key[3]:
+            # e.g. a type refined by v
+            return None
+        if isinstance(p, ir.Eq):
+            if all(isinstance(c, ir.VarRef) for c in p.children):
+                return p.children
+            return None
+        if isinstance(p, ir.IsMember):
+            dom, x = p.children
+            return (v,) if x is v and dom is not v and _dom_lits(dom) == vals else None
+        if isinstance(p, (ir.FuncLit, ir.TupleLit)):
+            elems = p.elems if isinstance(p, ir.FuncLit) else p.children
+            if isinstance(p, ir.FuncLit) and p.children[0] is v:
+                return None
+            if not all(isinstance(e, ir.VarRef) for e in elems):
+                return None
+            if not all(isinstance(q, (ir.AllDistinct, ir.AllSame)) for q in self.parents[p]):
+                return None
+            return elems
+        return None
+
+    ## Grid symmetries
+
+    def _grid_syms(self, spec: ir.Spec, scalar_vars: tp.Mapping[int, ir.Node]) -> tp.List[GridSymmetry]:
+        grids = [(s, shape) for s in scalar_vars.values() if (shape := _grid_shape(s)) is not None]
+        if not grids:
+            return []
+        conjuncts = _conjuncts(spec)
+        base = self._canon(conjuncts, {})
+        out = []
+        for name, square, op in _GRID_OPS:
+            if square and any(a != b for _, (a, b) in grids):
+                continue
+            perm = self._grid_perm(grids, op)
+            if perm and self._canon(conjuncts, perm) == base:
+                out.append(GridSymmetry(name, perm))
+        return out
+
+    def _grid_perm(self, grids, op) -> tp.Optional[tp.Dict[ir.VarRef, ir.VarRef]]:
+        perm = {}
+        for func, (a, b) in grids:
+            keys = [utils._unpack(e) for e in utils._iterate(func.children[0])]
+            at = dict(zip(keys, func.elems))
+            for (r, c), elem in at.items():
+                src, dst = list(_leaves(elem)), list(_leaves(at[op(r, c, a, b)]))
+                if len(src) != len(dst):
+                    return None
+                for x, y in zip(src, dst):
+                    if isinstance(x, ir.VarRef) and isinstance(y, ir.VarRef):
+                        if x is not y and x.sid in self.vars:
+                            perm[x] = y
+                    elif x is not y:
+                        return None
+        return perm
+
+    def _canon(self, roots: tp.Sequence[ir.Node], perm: tp.Mapping[ir.VarRef, ir.VarRef]) -> frozenset:
+        """The multiset of roots with perm applied to their vars, up to the
+        order of commutative operands."""
+        memo: tp.Dict[ir.Node, tp.Any] = {}
+        stack = list(roots)
+        while stack:
+            node = stack[-1]
+            if node in memo:
+                stack.pop()
+                continue
+            if node not in self.has_var:
+                memo[node] = node
+                stack.pop()
+                continue
+            todo = [c for c in node.all_nodes if c not in memo]
+            if todo:
+                stack.extend(todo)
+                continue
+            stack.pop()
+            memo[node] = self._key(node, memo, perm)
+        return _bag(memo[r] for r in roots)
+
+    @staticmethod
+    def _key(node: ir.Node, memo, perm):
+        if isinstance(node, ir.VarRef):
+            return ("var", perm.get(node, node).sid)
+        named = tuple(None if n is None else memo[n] for n in node._key[3])
+        if isinstance(node, (ir.AllDistinct, ir.AllSame)) and isinstance(f := node.children[0], (ir.FuncLit, ir.TupleLit)):
+            elems = f.elems if isinstance(f, ir.FuncLit) else f.children
+            return (type(node), _bag(memo[e] for e in elems), named)
+        children = tuple(memo[c] for c in node.children)
+        if isinstance(node, _COMMUTATIVE):
+            children = _bag(children)
+        return (type(node), node.field_vals, children, named)
+
+
+def get_symmetries(spec: ir.Spec, scalar_vars: tp.Mapping[int, ir.Node]) -> Symmetries:
+    return SymmetryAnalysis()(spec, Context(ScalarVarsObj(scalar_vars)))
+
+
+## Lex-leader constraints
+
+_B = ir.BoolT()
+
+def _eq(x: ir.Node, y: ir.Node) -> ir.Node:
+    return ir.Eq(_B, x, y)
+
+def _not(x: ir.Node) -> ir.Node:
+    return ir.Not(_B, x)
+
+def _or(*cs: ir.Node) -> ir.Node:
+    return cs[0] if len(cs) == 1 else ir.Disj(_B, *cs)
+
+def _le(x: ir.VarRef, y: ir.VarRef) -> ir.Node:
+    """x <= y in value order."""
+    if isinstance(x.T, ir.BoolT):
+        return _or(_not(x), y)
+    if isinstance(x.T, ir.EnumT):
+        lits = _values(x.T)
+        return _or(*(ir.Conj(_B, _eq(x, a), _or(*(_eq(y, b) for b in lits[i:]))) for i, a in enumerate(lits)))
+    return ir.LtEq(_B, x, y)
+
+def lex_leq(xs: tp.Sequence[ir.VarRef], ys: tp.Sequence[ir.VarRef]) -> tp.List[ir.Node]:
+    """Clauses for xs <=lex ys: if the first i positions are equal, x_i <= y_i."""
+    out = []
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        out.append(_or(*(_not(_eq(a, b)) for a, b in zip(xs[:i], ys[:i])), _le(x, y)))
+    return out
+
+def precedes(xs: tp.Sequence[ir.VarRef], a: ir.Lit, b: ir.Lit) -> tp.List[ir.Node]:
+    """Clauses for: the first x = b, if any, comes after some x = a."""
+    return [_or(_not(_eq(x, b)), *(_eq(w, a) for w in xs[:i])) for i, x in enumerate(xs)]
+
+
+class BreakSymmetries(Transform):
+    """Adds lex-leader constraints for the Symmetries of a spec."""
+    name = "break_symmetries"
+
+    requires: tp.Tuple[type, ...] = (Symmetries,)
+    produces: tp.Tuple[type, ...] = ()
+
+    def __init__(self, max_lex: int = 16):
+        self.max_lex = max_lex
+        super().__init__()
+
+    def run(self, root: ir.Node, ctx: Context) -> ir.Node:
+        if not isinstance(root, ir.Spec):
+            raise ValueError(f"Expected a Spec, got {type(root).__name__}")
+        syms: Symmetries = ctx.get(Symmetries)
+        new = []
+        for g in syms.grid:
+            xs = sorted(g.perm, key=lambda x: x.sid)[:self.max_lex]
+            new += lex_leq(xs, [g.perm[x] for x in xs])
+        for vs in syms.values:
+            xs = vs.vars[:self.max_lex]
+            for a, b in zip(vs.values, vs.values[1:]):
+                new += precedes(xs, a, b)
+        if not new:
+            return root
+        cons = root.cons
+        cons = ir.TupleLit(ir.TupleT(*(c.T for c in cons.children), *(c.T for c in new)), *cons.children, *new)
+        return ir.Spec(cons, root.obls)
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import functools
+import io
+import multiprocessing
+import typing as tp
+from dataclasses import dataclass
+from multiprocessing.connection import wait
+
+from ..dsl import ir, serialize
+from ..dsl.spec import PuzzleSpec
+from ..dsl.template import CompiledTemplate, SpecTemplate
+from .cnf import CNFEncoder
+from .fd import FDSolver
+from .smtlib import BVEmitter, SMTLibEmitter
+from ..passes.analyses.intervals import IntervalAnalysis
+from ..passes.pass_base import Context
+
+# Portfolio solving: race diverse solver configurations on one spec.
+#
+# The spec is lowered once in the calling process (as a CompiledTemplate, so
+# gen vars can still be bound per instance) and handed to one worker process
+# per configuration as serialized IR (dsl/serialize.py), so no worker re-runs
+# the DSL build or the lowering passes. Each worker encodes it its own way:
+#   fd      FDSolver, varying the value order (seed) and restart schedule
+#   cnf     CNFEncoder, varying the cardinality encodings, solved by z3's
+#           SAT solver with its own seed and phase heuristic
+#   smt     SMTLibEmitter, solved by z3 with its own seed and phase heuristic
+#   bv      as smt, but with Ints as minimal-width bitvectors (BVEmitter)
+# The first configuration to finish decides the instance (every one of them
+# is complete, so an unsat answer is as good as a model) and the other
+# workers are terminated. A configuration that fails (e.g. a spec CNF cannot
+# encode, or z3 gives up with unknown) drops out of the race.
+#
+# z3 is only needed by the cnf/smt configurations; without it the default
+# portfolio is all fd.
+
+@dataclass(frozen=True)
+class PortfolioConfig:
+    """One entrant of a portfolio."""
+    encoding: str = "fd"
+    seed: tp.Optional[int] = None
+    # fd: FDSolver's Luby restart unit
+    restart_base: int = 64
+    # cnf: see CNFEncoder.at_most
+    pairwise_max: int = 6
+    seq_max_k: int = 4
+    # cnf/smt/bv: z3 solver params, e.g. (("phase", "random"),)
+    params: tp.Tuple[tp.Tuple[str, tp.Any], ...] = ()
+
+# One of each kind of configuration, in the order default_configs uses them
+_VARIANTS = (
+    dict(encoding="fd"),
+    dict(encoding="cnf"),
+    dict(encoding="smt"),
+    dict(encoding="bv"),
+    dict(encoding="fd", restart_base=16),
+    # Totalizers only
+    dict(encoding="cnf", pairwise_max=0, seq_max_k=0, params=(("phase", "random"),)),
+    dict(encoding="smt", params=(("phase_selection", 5),)),
+    dict(encoding="fd", restart_base=256),
+    # Pairwise/sequential wherever they apply
+    dict(encoding="cnf", pairwise_max=64, seq_max_k=64, params=(("phase", "always_false"),)),
+)
+
+def default_configs(n: tp.Optional[int] = None) -> tp.List[PortfolioConfig]:
+    """n configurations (by default, one of each kind), cycling through the
+    variants with a distinct seed each."""
+    try:
+        import z3  # noqa: F401
+        variants = _VARIANTS
+    except ImportError:
+        variants = tuple(v for v in _VARIANTS if v["encoding"] == "fd")
+    n = len(variants) if n is None else n
+    return [PortfolioConfig(seed=i, **variants[i % len(variants)]) for i in range(n)]
+
+
+## Worker side
+
+@functools.lru_cache(maxsize=1)
+def _load(data: bytes) -> tp.Tuple[ir.Spec, tp.Dict[int, ir.VarRef]]:
+    spec = serialize.loads(data)
+    vars = {}
+    seen = set()
+    stack = [spec]
+    while stack:
+        n = stack.pop()
+        if n in seen:
+            continue
+        seen.add(n)
+        if isinstance(n, ir.VarRef):
+            vars[n.sid] = n
+        stack.extend(n.all_nodes)
+    return spec, vars
+
+def _assume(spec: ir.Spec, vars: tp.Mapping[int, ir.VarRef], assume: tp.Mapping[int, int]) -> ir.Spec:
+    """spec with the assumptions on its vars added as constraints."""
+    eqs = []
+    for sid, v in assume.items():
+        if (var := vars.get(sid)) is not None:
+            val = ir.Lit(ir.BoolT(), bool(v)) if isinstance(var.T, ir.BoolT) else ir.Lit(ir.IntT(), int(v))
+            eqs.append(ir.Eq(ir.BoolT(), var, val))
+    if not eqs:
+        return spec
+    cons = ir.TupleLit(ir.TupleT(spec.cons.T, *(e.T for e in eqs)), spec.cons, *eqs)
+    return ir.Spec(cons, spec.obls)
+
+def _z3_solver(logic: tp.Optional[str], config: PortfolioConfig):
+    import z3
+    s = z3.SolverFor(logic) if logic else z3.Solver()
+    s.set("random_seed", config.seed or 0)
+    for k, v in config.params:
+        s.set(k, v)
+    return s
+
+def _check(s) -> bool:
+    """Whether z3 finds s satisfiable; raises if it gives up."""
+    import z3
+    res = s.check()
+    if res == z3.unknown:
+        raise RuntimeError(f"z3 gave up: {s.reason_unknown()}")
+    return res == z3.sat
+
+def _run(data: bytes, config: PortfolioConfig, assume: tp.Mapping[int, int]) -> tp.Optional[tp.Dict[int, tp.Union[int, bool]]]:
+    """Solves the serialized spec under assume with config: values by sid,
+    or None if unsatisfiable."""
+    spec, vars = _load(data)
+    if config.encoding == "fd":
+        return FDSolver(spec, seed=config.seed, restart_base=config.restart_base).solve(assume)
+    import z3
+    spec = _assume(spec, vars, assume)
+    if config.encoding == "cnf":
+        enc = CNFEncoder(pairwise_max=config.pairwise_max, seq_max_k=config.seq_max_k)
+        enc.encode_spec(spec)
+        buf = io.StringIO()
+        enc.write(buf)
+        s = _z3_solver("QF_FD", config)
+        # z3 only recognizes DIMACS that starts at the header
+        text = buf.getvalue()
+        s.from_string(text[text.index("p cnf"):])
+        if not _check(s):
+            return None
+        m = s.model()
+        # z3 names DIMACS variable i k!i
+        return enc.decode(int(d.name()[2:]) for d in m.decls() if z3.is_true(m[d]))
+    if config.encoding in ("smt", "bv"):
+        buf = io.StringIO()
+        if config.encoding == "bv":
+            em = BVEmitter(buf, IntervalAnalysis()(spec, Context()))
+        else:
+            em = SMTLibEmitter(buf)
+        em.emit_spec(spec)
+        s = _z3_solver(None, config)
+        s.from_string(buf.getvalue())
+        if not _check(s):
+            return None
+        m = s.model()
+        vals = {}
+        for sid, name in em._vars.items():
+            if isinstance(vars[sid].T, ir.BoolT):
+                vals[sid] = z3.is_true(m.eval(z3.Bool(name), model_completion=True))
+            elif config.encoding == "bv":
+                vals[sid] = m.eval(z3.BitVec(name, em.width), model_completion=True).as_signed_long()
+            else:
+                vals[sid] = m.eval(z3.Int(name), model_completion=True).as_long()
+        return vals
+    raise ValueError(f"Unknown encoding {config.encoding}")
+
+def _worker(conn, data: bytes, config: PortfolioConfig, assume: tp.Mapping[int, int]):
+    """Sends (values, None), or (None, error) if config failed."""
+    try:
+        out = (_run(data, config, assume), None)
+    except Exception as e:
+        out = (None, e)
+    try:
+        conn.send(out)
+    except Exception:
+        # The error does not pickle
+        conn.send((None, RuntimeError(repr(out[1]))))
+    conn.close()
+
+
+## Caller side
+
+class PortfolioSolver:
+    """Solves a spec (or an instance of a compiled template) with the first
+    of several solver configurations to finish.
+
+        portfolio = PortfolioSolver(spec, N=9)     # params as for SpecTemplate.compile
+        sol, config = portfolio.solve()            # sol by var name, or None if unsat
+    """
+    def __init__(self, spec: tp.Union[PuzzleSpec, CompiledTemplate],
+                 configs: tp.Optional[tp.Sequence[PortfolioConfig]] = None,
+                 max_workers: tp.Optional[int] = None, mp_context=None, **params):
+        if isinstance(spec, PuzzleSpec):
+            spec = SpecTemplate(spec, gen_vars=()).compile(**params)
+        elif params:
+            raise ValueError("A compiled template already has its params")
+        self.compiled = spec
+        self.configs = list(default_configs() if configs is None else configs)
+        if not self.configs:
+            raise ValueError("A portfolio needs at least one config")
+        self.max_workers = max_workers or len(self.configs)
+        # e.g. multiprocessing.get_context("spawn"); the workers only need the data
+        self.mp_context = mp_context
+        self.data = serialize.dumps(spec.spec._spec)
+
+    def solve(self, **gen_vals) -> tp.Tuple[tp.Optional[tp.Dict[str, tp.Any]], PortfolioConfig]:
+        """Solves the instance given by gen_vals (see CompiledTemplate.solve).
+        Returns the solution, by var name, or None if there is none, and the
+        config that found it."""
+        compiled = self.compiled
+        assume = compiled.assumptions(**gen_vals)
+        mp = self.mp_context or multiprocessing.get_context()
+        todo = list(self.configs)
+        # Receiving end of each running worker's pipe -> (process, config)
+        running = {}
+        error = None
+        try:
+            while todo or running:
+                while todo and len(running) < self.max_workers:
+                    config = todo.pop(0)
+                    recv, send = mp.Pipe(duplex=False)
+                    p = mp.Process(target=_worker, args=(send, self.data, config, assume), daemon=True)
+                    p.start()
+                    send.close()
+                    running[recv] = (p, config)
+                for conn in wait(list(running)):
+                    p, config = running.pop(conn)
+                    try:
+                        vals, exc = conn.recv()
+                    except EOFError:
+                        p.join()
+                        vals, exc = None, RuntimeError(f"Worker for {config} exited with code {p.exitcode}")
+                    conn.close()
+                    p.join()
+                    if exc is not None:
+                        error = exc
+                        continue
+                    if vals is None:
+                        return None, config
+                    return {name: compiled._read(slot, vals) for name, slot in compiled.outputs.items()}, config
+            raise error
+        finally:
+            # The configs still running lost the race
+            for p, _ in running.values():
+                p.terminate()
+            for conn, (p, _) in running.items():
+                p.join()
+                conn.close()
+
+def solve(spec: PuzzleSpec, configs: tp.Optional[tp.Sequence[PortfolioConfig]] = None, **params) -> tp.Optional[tp.Dict[str, tp.Any]]:
+    """Solves spec (with params bound) with a portfolio, returning the values
+    of its vars by name or None if unsatisfiable."""
+    return PortfolioSolver(spec, configs, **params).solve()[0]
@@ -0,0 +1,440 @@
+from __future__ import annotations
+
+import io
+import re
+import typing as tp
+
+from ..dsl import ir, utils
+from ..dsl.envs import SymTable
+from ..passes.pass_base import Context
+from ..passes.analyses.intervals import IntervalAnalysis, Intervals
+
+# Scalar IR -> SMT-LIB2 (QF_LIA, or QF_BV with BVEmitter).
+#
+# Terms are printed bottom-up with an explicit stack and written to the output
+# stream as soon as an assertion is complete, so only the text of the
+# assertion being printed is held in memory. A node that is used more than
+# once in the DAG (or whose text grows past max_inline characters) is written
+# once as a define-fun and referenced by name afterwards.
+
+_SIMPLE_SYMBOL = re.compile(r"[A-Za-z~!@$%^&*_+=<>.?/\-][0-9A-Za-z~!@$%^&*_+=<>.?/\-]*")
+
+_NARY = {
+    ir.Sum: ("+", "0"),
+    ir.Prod: ("*", "1"),
+    ir.Conj: ("and", "true"),
+    ir.Disj: ("or", "false"),
+}
+
+_OPS = {
+    ir.Neg: "-",
+    ir.Not: "not",
+    ir.Abs: "abs",
+    ir.Eq: "=",
+    ir.Lt: "<",
+    ir.LtEq: "<=",
+    ir.Implies: "=>",
+    ir.Ite: "ite",
+}
+
+# Nodes over the elements of a TupleLit/FuncLit
+_REDUCE = {
+    ir.AllDistinct: ("distinct", "true"),
+    ir.AllSame: ("=", "true"),
+    ir.SumReduce: ("+", "0"),
+    ir.ProdReduce: ("*", "1"),
+}
+
+def _sort(T: ir.Type) -> str:
+    if isinstance(T, ir.IntT):
+        return "Int"
+    if isinstance(T, ir.BoolT):
+        return "Bool"
+    raise ValueError(f"Cannot encode type {T} in SMT-LIB, expected a scalar")
+
+def _lit(node: ir.Lit) -> str:
+    if isinstance(node.T, ir.BoolT):
+        return "true" if node.val else "false"
+    if isinstance(node.T, ir.IntT):
+        return str(node.val) if node.val >= 0 else f"(- {-node.val})"
+    raise ValueError(f"Cannot encode literal {node} in SMT-LIB")
+
+def _int_val(node: ir.Node) -> tp.Optional[int]:
+    if isinstance(node, ir.Lit) and isinstance(node.T, ir.IntT):
+        return node.val
+    return None
+
+def _dom_vals(dom: ir.Node) -> tp.Optional[tp.List[int]]:
+    """The values of a literal Fin/Range/DomLit, or None if dom is not literal."""
+    match dom:
+        case ir.Fin(n) if _int_val(n) is not None:
+            return list(range(_int_val(n)))
+        case ir.Range(lo, hi, step) if None not in (_int_val(lo), _int_val(hi), _int_val(step)):
+            return list(range(_int_val(lo), _int_val(hi), _int_val(step)))
+        case ir.DomLit():
+            vals = [_int_val(e) for e in dom.children]
+            if None in vals:
+                return None
+            return list(dict.fromkeys(vals))
+        case ir.Image() | ir.Restrict() if isinstance(dom.T.carT, ir.IntT):
+            # e.g. nd.range, an Image of a FuncLit over Fin
+            arrays = utils._dom_arrays(dom)
+            if arrays is not None and len(arrays) == 1:
+                return arrays[0].tolist()
+    return None
+
+def _member(dom: ir.Node, x: str) -> tp.Optional[str]:
+    """Membership of the term x in a literal domain, or None if dom is not literal."""
+    match dom:
+        case ir.Fin(n) if _int_val(n) is not None:
+            return f"(and (<= 0 {x}) (< {x} {_int_val(n)}))"
+        case ir.Range(lo, hi, step) if None not in (_int_val(lo), _int_val(hi), _int_val(step)):
+            lo, hi, step = _int_val(lo), _int_val(hi), _int_val(step)
+            if step == 1:
+                return f"(and (<= {lo} {x}) (< {x} {hi}))"
+            return _one_of(x, range(lo, hi, step))
+        case ir.DomLit():
+            vals = [_int_val(e) for e in dom.children]
+            if None in vals:
+                return None
+            return _one_of(x, vals)
+        case ir.Image() | ir.Restrict():
+            if (vals := _dom_vals(dom)) is None:
+                return None
+            vals = sorted(set(vals))
+            if vals and vals[-1] - vals[0] + 1 == len(vals):
+                return f"(and (<= {_num(vals[0])} {x}) (<= {x} {_num(vals[-1])}))"
+            return _one_of(x, vals)
+    return None
+
+def _num(v: int) -> str:
+    return str(v) if v >= 0 else f"(- {-v})"
+
+def _one_of(x: str, vals: tp.Iterable[int]) -> str:
+    eqs = [f"(= {x} {_num(v)})" for v in vals]
+    if not eqs:
+        return "false"
+    return eqs[0] if len(eqs) == 1 else f"(or {' '.join(eqs)})"
+
+
+class SMTLibEmitter:
+    """Streams scalar IR to out as SMT-LIB2 commands.
+
+    Variables are declared on first use (with their refinement domain asserted
+    when it is a literal Fin/Range/DomLit). Obligations attached to nodes are
+    asserted alongside the term they guard.
+    """
+    def __init__(self, out: tp.TextIO, sym: tp.Optional[SymTable] = None, logic: tp.Optional[str] = None, max_inline: int = 4096):
+        self.out = out
+        self.sym = sym
+        self.logic = logic
+        self.max_inline = max_inline
+        self._refs: tp.Dict[ir.Node, int] = {}
+        self._names: tp.Dict[ir.Node, str] = {}
+        self._vars: tp.Dict[int, str] = {}
+        self._symbols: tp.Set[str] = set()
+        self._pending: tp.List[ir.Node] = []
+        self._ndefs = 0
+        self.nonlinear = False
+
+    def write(self, line: str):
+        self.out.write(line)
+        self.out.write("\n")
+
+    def count_refs(self, *roots: ir.Node):
+        """Counts the parents of every node under roots. A node with several
+        is defined once."""
+        refs = self._refs
+        stack = list(roots)
+        while stack:
+            n = stack.pop()
+            first = n not in refs
+            refs[n] = refs.get(n, 0) + 1
+            if first and not isinstance(n, (ir.Lit, ir.VarRef)):
+                parts = self._parts(n)
+                if isinstance(n, (ir.Prod, ir.FloorDiv, ir.Mod, ir.ProdReduce)):
+                    # Only products by (and division by) constants are linear
+                    nonconst = [p for p in parts if not isinstance(p, ir.Lit)]
+                    if len(nonconst) > 1 or (not isinstance(n, ir.Prod) and not isinstance(parts[-1], ir.Lit)):
+                        self.nonlinear = True
+                stack.extend(parts)
+
+    def _parts(self, n: ir.Node) -> tp.Sequence[ir.Node]:
+        # Types are not printed; literal domains are printed by _member
+        if isinstance(n, ir.IsMember):
+            return n.children[1:]
+        if isinstance(n, tuple(_REDUCE)):
+            return _elems(n.children[0])
+        return n.children
+
+    # How Ints are printed; BVEmitter overrides these
+    def _sort_of(self, T: ir.Type) -> str:
+        return _sort(T)
+
+    def _lit_of(self, node: ir.Lit) -> str:
+        return _lit(node)
+
+    def _member_of(self, dom: ir.Node, x: str) -> tp.Optional[str]:
+        return _member(dom, x)
+
+    def _fresh(self, base: str) -> str:
+        sym = base if _SIMPLE_SYMBOL.fullmatch(base) else f"|{base.replace('|', '_')}|"
+        i = 0
+        while sym in self._symbols:
+            i += 1
+            sym = f"|{base.replace('|', '_')}!{i}|"
+        self._symbols.add(sym)
+        return sym
+
+    def _declare(self, var: ir.VarRef) -> str:
+        if var.sid in self._vars:
+            return self._vars[var.sid]
+        base = f"v{var.sid}"
+        if self.sym is not None and var.sid in self.sym.entries:
+            base = self.sym[var.sid].name
+        name = self._fresh(base)
+        self.write(f"(declare-fun {name} () {self._sort_of(var.T)})")
+        if var.T.ref is not None:
+            mem = self._member_of(var.T.ref, name)
+            if mem is None:
+                raise ValueError(f"Cannot encode refinement {var.T.ref} of {name} in SMT-LIB")
+            self.write(f"(assert {mem})")
+        self._vars[var.sid] = name
+        return name
+
+    def term(self, root: ir.Node) -> str:
+        """Prints root, writing any declarations and define-funs it needs first."""
+        if root not in self._refs:
+            self.count_refs(root)
+        names = self._names
+        text: tp.Dict[ir.Node, str] = {}
+        stack = [(root, False)]
+        while stack:
+            n, expanded = stack.pop()
+            if n in names or n in text:
+                continue
+            if isinstance(n, ir.VarRef):
+                names[n] = self._declare(n)
+                continue
+            if isinstance(n, ir.Lit):
+                text[n] = self._lit_of(n)
+                continue
+            parts = self._parts(n)
+            if not expanded:
+                stack.append((n, True))
+                stack.extend((c, False) for c in parts)
+                continue
+            args = [names[c] if c in names else text[c] for c in parts]
+            t = self._print(n, args)
+            if n.obl is not None:
+                self._pending.append(n.obl)
+            if n is not root and (self._refs.get(n, 0) > 1 or len(t) > self.max_inline):
+                name = self._fresh(f"_t{self._ndefs}")
+                self._ndefs += 1
+                self.write(f"(define-fun {name} () {self._sort_of(n.T)} {t})")
+                names[n] = name
+            else:
+                text[n] = t
+            # Single-use children are only needed by this node
+            for c in parts:
+                if self._refs.get(c, 0) <= 1:
+                    text.pop(c, None)
+        return names[root] if root in names else text[root]
+
+    def _print(self, n: ir.Node, args: tp.List[str]) -> str:
+        cls = type(n)
+        if cls in _NARY:
+            op, unit = _NARY[cls]
+            if not args:
+                return unit
+            if len(args) == 1:
+                return args[0]
+            return f"({op} {' '.join(args)})"
+        if cls in _OPS:
+            return f"({_OPS[cls]} {' '.join(args)})"
+        if cls in (ir.FloorDiv, ir.Mod):
+            return self._floor_op(n, *args)
+        if cls in _REDUCE:
+            op, unit = _REDUCE[cls]
+            if len(args) < 2 and op in ("distinct", "="):
+                return "true"
+            if not args:
+                return unit
+            if len(args) == 1:
+                return args[0]
+            return f"({op} {' '.join(args)})"
+        if cls is ir.IsMember:
+            mem = self._member_of(n.children[0], args[0])
+            if mem is None:
+                raise ValueError(f"Cannot encode membership in {n.children[0]} in SMT-LIB")
+            return mem
+        raise ValueError(f"Cannot encode {cls.__name__} in SMT-LIB")
+
+    def _floor_op(self, n: ir.Node, a: str, b: str) -> str:
+        # SMT-LIB div/mod are Euclidean; the IR's are Python's floor division
+        # and modulus. The two agree for positive divisors, and for negative
+        # ones a // b == -a // -b and a % b == -(-a % -b).
+        op = "div" if isinstance(n, ir.FloorDiv) else "mod"
+        pos = f"({op} {a} {b})"
+        neg = f"({op} (- {a}) (- {b}))" if op == "div" else f"(- (mod (- {a}) (- {b})))"
+        d = _int_val(n.children[1])
+        if d is not None:
+            return pos if d > 0 else neg
+        return f"(ite (< {b} 0) {neg} {pos})"
+
+    def assert_(self, node: ir.Node):
+        """Writes (assert node), then asserts the obligations met while printing it."""
+        todo = [node]
+        while todo:
+            n = todo.pop()
+            if isinstance(n, ir.TupleLit):
+                todo.extend(reversed(n.children))
+                continue
+            if isinstance(n, ir.Lit) and n.val is True:
+                continue
+            self.write(f"(assert {self.term(n)})")
+            todo.extend(reversed(self._pending))
+            self._pending = []
+
+    def emit_spec(self, spec: ir.Spec):
+        """Asserts every constraint and obligation of spec, then (check-sat).
+
+        Without an explicit logic, QF_LIA is declared unless the spec has
+        nonlinear arithmetic (QF_NIA).
+        """
+        self.count_refs(spec.cons, spec.obls)
+        self.write(f"(set-logic {self.logic or ('QF_NIA' if self.nonlinear else 'QF_LIA')})")
+        self.assert_(spec.cons)
+        self.assert_(spec.obls)
+        self.write("(check-sat)")
+
+
+# Int ops over bitvectors. Comparisons are signed; bvsmod takes the sign of
+# the divisor, like floor modulus.
+_BV_OPS = {
+    ir.Neg: "bvneg",
+    ir.Lt: "bvslt",
+    ir.LtEq: "bvsle",
+    ir.Mod: "bvsmod",
+}
+
+_BV_NARY = {
+    ir.Sum: "bvadd",
+    ir.Prod: "bvmul",
+    ir.SumReduce: "bvadd",
+    ir.ProdReduce: "bvmul",
+}
+
+class BVEmitter(SMTLibEmitter):
+    """Streams scalar IR to out as SMT-LIB2 over bitvectors (QF_BV), with
+    every Int lowered to a two's complement bitvector of one width (IntToBV).
+
+    The width is the smallest that holds every Int term printed, by the
+    bounds in intervals (see IntervalAnalysis), plus a bit when there is a
+    floor division: that is printed as the exact division of a - a mod b by
+    b, which needs the headroom. Sums and products are computed modulo
+    2**width, which is exact because their results fit. Without a width,
+    emit_spec works it out from the spec.
+    """
+    def __init__(self, out: tp.TextIO, intervals: Intervals, sym: tp.Optional[SymTable] = None, logic: tp.Optional[str] = None,
+                 max_inline: int = 4096, width: tp.Optional[int] = None):
+        super().__init__(out, sym, logic=logic, max_inline=max_inline)
+        self.intervals = intervals
+        self.width = width
+
+    def fit_width(self, nodes: tp.Iterable[ir.Node]) -> int:
+        """The width needed by the Int terms among nodes."""
+        width = 1
+        for n in nodes:
+            if isinstance(n, ir.Value) and isinstance(n.T, ir.IntT):
+                ws = [self.intervals.width(c) for c in (n, *n.children)] if isinstance(n, ir.FloorDiv) else [self.intervals.width(n)]
+                if None in ws:
+                    raise ValueError(f"Cannot bound {n} for a bitvector encoding")
+                width = max(width, max(ws) + isinstance(n, ir.FloorDiv))
+        return width
+
+    def emit_spec(self, spec: ir.Spec):
+        """Asserts every constraint and obligation of spec, then (check-sat)."""
+        self.count_refs(spec.cons, spec.obls)
+        if self.width is None:
+            self.width = self.fit_width(self._refs)
+        self.write(f"(set-logic {self.logic or 'QF_BV'})")
+        self.assert_(spec.cons)
+        self.assert_(spec.obls)
+        self.write("(check-sat)")
+
+    def _bv(self, v: int) -> str:
+        return f"(_ bv{v % (1 << self.width)} {self.width})"
+
+    def _sort_of(self, T: ir.Type) -> str:
+        if isinstance(T, ir.IntT):
+            if self.width is None:
+                raise ValueError("BVEmitter needs a width before printing Ints")
+            return f"(_ BitVec {self.width})"
+        return _sort(T)
+
+    def _lit_of(self, node: ir.Lit) -> str:
+        if isinstance(node.T, ir.IntT):
+            return self._bv(node.val)
+        return _lit(node)
+
+    def _member_of(self, dom: ir.Node, x: str) -> tp.Optional[str]:
+        match dom:
+            case ir.Fin(n) if _int_val(n) is not None:
+                lo, hi = 0, _int_val(n) - 1
+            case ir.Range(lo, hi, step) if _int_val(step) == 1 and None not in (_int_val(lo), _int_val(hi)):
+                lo, hi = _int_val(lo), _int_val(hi) - 1
+            case _:
+                if (vals := _dom_vals(dom)) is None:
+                    return None
+                vals = sorted(set(vals))
+                if not vals or vals[-1] - vals[0] + 1 != len(vals):
+                    # Values that do not fit cannot equal x
+                    vals = [v for v in vals if -(1 << (self.width-1)) <= v < (1 << (self.width-1))]
+                    eqs = [f"(= {x} {self._bv(v)})" for v in vals]
+                    if not eqs:
+                        return "false"
+                    return eqs[0] if len(eqs) == 1 else f"(or {' '.join(eqs)})"
+                lo, hi = vals[0], vals[-1]
+        lo, hi = max(lo, -(1 << (self.width-1))), min(hi, (1 << (self.width-1)) - 1)
+        if lo > hi:
+            return "false"
+        return f"(and (bvsle {self._bv(lo)} {x}) (bvsle {x} {self._bv(hi)}))"
+
+    def _print(self, n: ir.Node, args: tp.List[str]) -> str:
+        cls = type(n)
+        if cls in _BV_NARY:
+            if not args:
+                return self._bv(0 if cls in (ir.Sum, ir.SumReduce) else 1)
+            if len(args) == 1:
+                return args[0]
+            return f"({_BV_NARY[cls]} {' '.join(args)})"
+        if cls in _BV_OPS:
+            return f"({_BV_OPS[cls]} {' '.join(args)})"
+        if cls is ir.FloorDiv:
+            a, b = args
+            return f"(bvsdiv (bvsub {a} (bvsmod {a} {b})) {b})"
+        if cls is ir.Abs:
+            a, = args
+            return f"(ite (bvslt {a} {self._bv(0)}) (bvneg {a}) {a})"
+        return super()._print(n, args)
+
+def _elems(func: ir.Node) -> tp.Sequence[ir.Node]:
+    if isinstance(func, ir.TupleLit):
+        return func.children
+    if isinstance(func, ir.FuncLit):
+        return func.elems
+    raise ValueError(f"Expected a TupleLit or FuncLit, got {type(func).__name__}")
+
+def emit_smtlib(spec: ir.Spec, sym: tp.Optional[SymTable] = None, out: tp.Optional[tp.TextIO] = None,
+                bitvectors: bool = False, **kwargs) -> tp.Optional[str]:
+    """Writes spec to out as SMT-LIB2; returns the text if out is None. With
+    bitvectors, Ints become minimal-width bitvectors (see BVEmitter)."""
+    buf = io.StringIO() if out is None else out
+    if bitvectors:
+        BVEmitter(buf, IntervalAnalysis()(spec, Context()), sym, **kwargs).emit_spec(spec)
+    else:
+        SMTLibEmitter(buf, sym, **kwargs).emit_spec(spec)
+    if out is None:
+        return buf.getvalue()
+    return None
@@ -0,0 +1,722 @@
+from __future__ import annotations
+
+import itertools as it
+import math
+import operator
+import typing as tp
+
+from ..dsl import ir
+from ..dsl.spec import PuzzleSpec
+from ..passes.analyses.ssa_printer import Uses
+from ..passes.pass_base import Context
+from .evaluator import (
+    _CALL, _CONST, _MISSING, _OPEN, _OPS, CheckResult, _Composed, _Dom, _Func, _Inj, _Table, _Undefined, _by_sid,
+    _cartprod, _disj_union, _free_names, _is_option, _obl, _range_dom, _unique, _vals, _var_names,
+)
+
+# Staged evaluation: a spec's rules compiled to Python source.
+#
+# StagedEvaluator checks assignments like Evaluator, but first turns the
+# spec into one Python function per scope, so a check runs compiled code
+# instead of dispatching on every node:
+#
+#   ∀ b5 ∈ Fin(N)×Fin(N): givens(b5).match(...)
+#
+#   def _check(C, P, r1, r2):
+#       ...
+#       def f4(x0):
+#           return _match(v2.table.get(x0, _FAILED), f5, f6)
+#       ...
+#       if not all(map(f4, t3.elems())): failed.append(3)
+#
+# Lambdas become nested defs, and a quantifier or reduction over a lambda
+# maps its def over the domain. Every node is placed in the scope that
+# binds the last of its free names. One without any is evaluated once per
+# check in _check(); or, if its vars are all static (scalars, like N), once
+# per value of them in _params(), which is kept between checks; or, without
+# vars, once for good in _consts(). A node used more than once (by
+# ssa_printer.Uses) or hoisted out of the scope that uses it is bound to a
+# local there, so shared subterms and loop invariants are evaluated once per
+# entry to their scope. Nodes with no staged form (most domain operations)
+# call Evaluator's handler on their children's values.
+#
+# A bound local is evaluated eagerly, which may be where Evaluator would not
+# evaluate it at all. So an undefined one (a failed obligation, an invalid
+# var, ...) is not an error until it is used: it holds _FAILED, which raises
+# _Undefined on any use, and the rule using it is violated.
+#
+# The values given for the vars are coerced as Evaluator does, by functions
+# built for each var's type, and checked against the type by staged code.
+
+class _Failed:
+    """The value of an undefined local: using it raises _Undefined."""
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        raise _Undefined()
+
+def _undef(*args):
+    raise _Undefined()
+
+for _m in ('__bool__', '__eq__', '__ne__', '__lt__', '__le__', '__gt__', '__ge__', '__hash__', '__call__',
+           '__getitem__', '__iter__', '__len__', '__contains__', '__index__', '__int__', '__neg__', '__abs__',
+           '__add__', '__radd__', '__sub__', '__rsub__', '__mul__', '__rmul__', '__floordiv__', '__rfloordiv__',
+           '__mod__', '__rmod__'):
+    setattr(_Failed, _m, _undef)
+
+_FAILED = _Failed()
+
+
+class _Fn(_Func):
+    """A staged LambdaHOAS: its def, and its domain, evaluated on first use."""
+    __slots__ = ('fn', '_domf', '_dom')
+
+    def __init__(self, fn: tp.Callable, domf: tp.Callable[[], _Dom]):
+        self.fn = fn
+        self._domf = domf
+        self._dom = None
+
+    @property
+    def dom(self) -> _Dom:
+        if self._dom is None:
+            self._dom = self._domf()
+        return self._dom
+
+    def __call__(self, x):
+        return self.fn(x)
+
+
+class _Given:
+    """Stands in for the _Run of an Evaluator handler: the values of the
+    node's children, already computed."""
+    __slots__ = ('vals',)
+
+    def __init__(self, node: ir.Node, vals: tp.Sequence):
+        self.vals = dict(zip(node.children, vals))
+
+    def ev(self, node: ir.Node, env):
+        return self.vals[node]
+
+def _via(fn: tp.Callable, node: ir.Node, *vals):
+    return fn(_Given(node, vals), node, None)
+
+## Helpers of the staged code
+
+def _fin(n):
+    return _range_dom(range(max(n, 0)))
+
+def _floordiv(a, b):
+    if b == 0:
+        raise _Undefined()
+    return a // b
+
+def _mod(a, b):
+    if b == 0:
+        raise _Undefined()
+    return a % b
+
+def _truediv(a, b):
+    # Ints only: defined where it is exact
+    if b == 0 or a % b:
+        raise _Undefined()
+    return a // b
+
+def _isqrt(a):
+    if a < 0:
+        raise _Undefined()
+    return math.isqrt(a)
+
+def _at(f: tuple, i):
+    if not 0 <= i < len(f):
+        raise _Undefined()
+    return f[i]
+
+def _sumlit(idx, elems: tp.Sequence[tp.Callable]):
+    return _Inj(idx, elems[idx]())
+
+def _match(v: _Inj, *branches):
+    return branches[v.idx](v.val)
+
+def _fvals(f) -> tp.Iterator:
+    if type(f) is _Fn:
+        return map(f.fn, f.dom.elems())
+    return _vals(f)
+
+def _distinct(vals: tp.List) -> bool:
+    return len(set(vals)) == len(vals)
+
+## Coercion of var values, as Evaluator's _Run._coerce1
+
+def _coercer(T: ir.Type) -> tp.Callable:
+    """A function from a value given for a var of type T to the value, not
+    yet checked against T's refinements."""
+    if isinstance(T, ir.BoolT):
+        def coerce(raw):
+            if raw not in (True, False):
+                raise ValueError()
+            return bool(raw)
+        return coerce
+    if isinstance(T, ir.IntT):
+        return operator.index
+    if isinstance(T, ir.EnumT):
+        labels = tuple(T.labels)
+        def coerce(raw):
+            if isinstance(raw, str):
+                if raw not in labels:
+                    raise ValueError()
+                return raw
+            return labels[operator.index(raw)]
+        return coerce
+    if isinstance(T, ir.UnitT):
+        return lambda raw: None
+    if isinstance(T, ir.TupleT):
+        cs = tuple(_coercer(cT) for cT in T.children)
+        def coerce(raw):
+            if len(raw) != len(cs):
+                raise ValueError()
+            return tuple(c(r) for c, r in zip(cs, raw))
+        return coerce
+    if isinstance(T, ir.SumT):
+        cs = tuple(_coercer(cT) for cT in T.elemTs)
+        opt = _is_option(T)
+        def coerce(raw):
+            if isinstance(raw, _Inj):
+                idx, val = raw.idx, raw.val
+            elif opt:
+                idx, val = (0, None) if raw is None else (1, raw)
+            else:
+                idx, val = raw
+            return _Inj(idx, cs[idx](val))
+        return coerce
+    if isinstance(T, ir.DomT):
+        c = _coercer(T.carT)
+        return lambda raw: _Dom(elems=_unique(c(r) for r in raw))
+    raise ValueError(f"Cannot stage a var of type {T}")
+
+def _table_coercer(T: ir.PiTHOAS) -> tp.Callable:
+    """A function from a value given for a func var of type T, and its
+    domain, to the value."""
+    c = _coercer(T.resT)
+    opt = _is_option(T.resT)
+    def coerce(raw, dom: _Dom):
+        table = {}
+        if isinstance(raw, tp.Mapping):
+            for x in dom.elems():
+                r = raw.get(x, _MISSING)
+                if r is _MISSING:
+                    if not opt:
+                        raise KeyError(x)
+                    r = None
+                table[x] = c(r)
+        elif callable(raw):
+            for x in dom.elems():
+                table[x] = c(raw(x))
+        else:
+            for x in dom.elems():
+                table[x] = c(raw[x])
+        return _Table(dom, table)
+    return coerce
+
+# What a value that is not of a var's type raises while coerced
+_BAD_VALUE = (_Undefined, ValueError, TypeError, KeyError, IndexError)
+
+_GLOBALS = dict(
+    _Undefined=_Undefined, _BAD_VALUE=_BAD_VALUE, _FAILED=_FAILED, _undef=_undef, _Fn=_Fn, _via=_via, _Inj=_Inj, _Composed=_Composed,
+    _vals=_vals, _fvals=_fvals, _cartprod=_cartprod, _disj_union=_disj_union, _fin=_fin, _floordiv=_floordiv, _mod=_mod,
+    _truediv=_truediv, _isqrt=_isqrt, _at=_at, _sumlit=_sumlit, _match=_match, _distinct=_distinct,
+    _prod=math.prod,
+)
+
+
+class StagedEvaluator:
+    """Checks assignments against a spec's rules, compiled to Python.
+
+        ev = StagedEvaluator(spec.optimize())
+        res = ev.check({"N": 4, "cell_digits": grid, "givens": clues})
+
+    The results are Evaluator's. ev.source is the generated code.
+    """
+    def __init__(self, spec: tp.Union[PuzzleSpec, ir.Spec]):
+        self.spec = spec
+        root = spec._spec if isinstance(spec, PuzzleSpec) else spec
+        self.rules: tp.Tuple[ir.Node, ...] = root.cons.children + root.obls.children
+        stager = _Stager(root, self.rules)
+        self._names = _var_names(spec, stager.vars)
+        self.source, ns = stager.stage(list(self._names.values()))
+        exec(compile(self.source, f"<staged {getattr(spec, 'name', 'spec')}>", "exec"), ns)
+        self._make_consts = ns["_consts"]
+        self._make_params = ns["_params"]
+        self._check = ns["_check"]
+        self._static = sorted(stager.static)
+        self._dynamic = sorted(sid for sid in stager.vars if sid not in stager.static)
+        self._consts = None
+        # The params of the last check, and the static values they are of
+        self._params = self._key = None
+
+    def check(self, values: tp.Mapping[tp.Union[str, int], tp.Any] = None, **kwargs) -> CheckResult:
+        """Evaluates every top-level constraint and obligation under the
+        values, by var name, of every var of the spec."""
+        raw = _by_sid(self._names, {**(values or {}), **kwargs})
+        if self._consts is None:
+            self._consts = self._make_consts()
+        key = [(type(raw[sid]), raw[sid]) for sid in self._static]
+        if key != self._key:
+            self._params = self._make_params(self._consts, *(raw[sid] for sid in self._static))
+            self._key = key
+        invalid, violated = self._check(self._consts, self._params, *(raw[sid] for sid in self._dynamic))
+        names = list(self._names)
+        return CheckResult([self.rules[i] for i in violated], [names[i] for i in invalid])
+
+
+class _Scope:
+    """A generated function body: the const, param or check scope, or a
+    lambda's def, which binds one name."""
+    __slots__ = ('parent', 'binder', 'param', 'lines', 'names', 'exports')
+
+    def __init__(self, parent: tp.Optional[_Scope], binder: tp.Optional[str] = None, param: tp.Optional[str] = None,
+                 exports: tp.Optional[tp.List[str]] = None):
+        self.parent = parent
+        self.binder = binder
+        self.param = param
+        self.lines: tp.List[str] = []
+        # The locals bound to nodes
+        self.names: tp.Dict[ir.Node, str] = {}
+        # The locals returned for the scopes called later
+        self.exports = exports
+
+def _indent(lines: tp.Iterable[str]) -> tp.List[str]:
+    return ["    " + l for l in lines]
+
+def _unpack(arg: str, names: tp.Sequence[str]) -> tp.List[str]:
+    return [f"({', '.join(names)},) = {arg}"] if names else []
+
+# Nodes not worth a local
+_TRIVIAL = (ir.Lit, ir.Unit, ir.BoundVarHOAS, ir.VarRef)
+
+# Staged forms, by class: fn(stager, node, scope) -> Python expression
+_STAGE: tp.Dict[type, tp.Callable] = {}
+
+def _stage(*classes: type):
+    def deco(fn):
+        for cls in classes:
+            _STAGE[cls] = fn
+        return fn
+    return deco
+
+
+def _var_sids(T: ir.Type) -> tp.Set[int]:
+    """The vars a type refers to."""
+    sids, seen, stack = set(), set(), [T]
+    while stack:
+        n = stack.pop()
+        if n in seen:
+            continue
+        seen.add(n)
+        if isinstance(n, ir.VarRef):
+            sids.add(n.sid)
+        stack.extend(n.all_nodes)
+    return sids
+
+
+def _static_vars(vars: tp.Mapping[int, ir.VarRef]) -> tp.FrozenSet[int]:
+    """The vars whose values are scalars, with types that refer only to such
+    vars: what is computed from them alone is kept between checks."""
+    scalar = {sid for sid, v in vars.items() if isinstance(v.T, (ir.BoolT, ir.IntT, ir.EnumT, ir.UnitT))}
+    while True:
+        static = {sid for sid in scalar if _var_sids(vars[sid].T) <= scalar}
+        if static == scalar:
+            return frozenset(static)
+        scalar = static
+
+
+class _Stager:
+    def __init__(self, root: ir.Spec, rules: tp.Sequence[ir.Node]):
+        self.rules = rules
+        self.free, self.sids, self.vars = _free_names(root)
+        self.kinds = {n: _OPEN if names else _CALL if self.sids[n] else _CONST for n, names in self.free.items()}
+        self.uses = Uses()(root, Context()).use_cnt
+        self.static = _static_vars(self.vars)
+        self.consts = _Scope(None, exports=[])
+        self.params = _Scope(self.consts, exports=[])
+        self.call = _Scope(self.params)
+        self.ns = dict(_GLOBALS)
+        self.ids = it.count()
+        # The def behind each function value's expression or local
+        self.defs: tp.Dict[str, str] = {}
+
+    def fresh(self, prefix: str) -> str:
+        return f"{prefix}{next(self.ids)}"
+
+    def const(self, val) -> str:
+        """A global holding val."""
+        name = self.fresh("k")
+        self.ns[name] = val
+        return name
+
+    def stage(self, order: tp.Sequence[int]) -> tp.Tuple[str, tp.Dict[str, tp.Any]]:
+        """The source of _consts(), _params() and _check(), and its globals.
+        _params() takes the constants and the raw values of the static vars,
+        and _check() both results and the raw values of the others, by sid.
+        _check() returns the positions in order of the invalid vars, and of
+        the violated rules."""
+        call = self.call
+        done: tp.Set[int] = set()
+        for sid in self.vars:
+            self.coerce(sid, done)
+        call.lines.append("invalid = []")
+        for i, sid in enumerate(order):
+            ok = self.fits(self.vars[sid].T, f"v{sid}", call)
+            call.lines += [
+                "try:",
+                f"    if v{sid} is _FAILED or not {ok}: invalid.append({i})",
+                "except _Undefined:",
+                f"    invalid.append({i})",
+            ]
+        call.lines.append("failed = []")
+        for i, rule in enumerate(self.rules):
+            e = self.ev(rule, call)
+            call.lines += ["try:", f"    if not {e}: failed.append({i})", "except _Undefined:", f"    failed.append({i})"]
+        call.lines.append("return invalid, failed")
+        consts, params = self.consts.exports, self.params.exports
+        static = [f"r{sid}" for sid in sorted(self.static)]
+        dynamic = [f"r{sid}" for sid in sorted(self.vars) if sid not in self.static]
+        lines = [
+            "def _consts():",
+            *_indent(self.consts.lines + [f"return ({''.join(c + ', ' for c in consts)})"]),
+            f"def _params({', '.join(['C'] + static)}):",
+            *_indent(_unpack("C", consts) + self.params.lines + [f"return ({''.join(c + ', ' for c in params)})"]),
+            f"def _check({', '.join(['C', 'P'] + dynamic)}):",
+            *_indent(_unpack("C", consts) + _unpack("P", params) + call.lines),
+        ]
+        return "\n".join(lines) + "\n", self.ns
+
+    def coerce(self, sid: int, done: tp.Set[int]):
+        """Binds v<sid>, after the vars its type refers to."""
+        if sid in done:
+            return
+        done.add(sid)
+        T = self.vars[sid].T
+        for dep in _var_sids(T):
+            if dep != sid:
+                self.coerce(dep, done)
+        scope = self.params if sid in self.static else self.call
+        if isinstance(T, ir.PiTHOAS):
+            e = f"{self.const(_table_coercer(T))}(r{sid}, {self.type_dom(T.argT, scope)})"
+        else:
+            e = f"{self.const(_coercer(T))}(r{sid})"
+        scope.lines += [f"try: v{sid} = {e}", f"except _BAD_VALUE: v{sid} = _FAILED"]
+        if scope.exports is not None:
+            scope.exports.append(f"v{sid}")
+
+    def fits(self, T: ir.Type, v: str, scope: _Scope) -> str:
+        """A Python expression for whether the value v lies in T's
+        refinements, as Evaluator's _Run._fits."""
+        parts = []
+        if T.obl is not None:
+            parts.append(self.ev(T.obl, scope))
+        if T.ref is not None and not isinstance(T, ir.PiTHOAS):
+            parts.append(self.member(T.ref, v, scope))
+        if isinstance(T, ir.TupleT):
+            parts += [self.fits(cT, f"{v}[{i}]", scope) for i, cT in enumerate(T.children)]
+        elif isinstance(T, ir.SumT):
+            parts += [f"({v}.idx != {i} or {self.fits(cT, f'{v}.val', scope)})" for i, cT in enumerate(T.elemTs)]
+        elif isinstance(T, ir.DomT):
+            e = self.fresh("e")
+            parts.append(f"all({self.fits(T.carT, e, scope)} for {e} in {v}.elems())")
+        elif isinstance(T, ir.PiTHOAS):
+            fn = self.fresh("f")
+            body = _Scope(scope, T.bv_name, self.fresh("x"))
+            ok = self.fits(T.resT, f"{v}.table[{body.param}]", body)
+            if ok != "True":
+                scope.lines += [f"def {fn}({body.param}):", *_indent(body.lines), f"    return {ok}"]
+                parts.append(f"all(map({fn}, {v}.table))")
+        parts = [p for p in parts if p != "True"]
+        return f"({' and '.join(parts)})" if parts else "True"
+
+    def member(self, d: ir.Node, x: str, scope: _Scope) -> str:
+        """A Python expression for whether x is in the domain d."""
+        if isinstance(d, ir.Fin) and _obl(d) is None:
+            return f"(0 <= {x} < {self.ev(d.children[0], scope)})"
+        return f"({x} in {self.ev(d, scope)})"
+
+    def bind(self, scope: _Scope, e: str, prefix: str = "t") -> str:
+        """A local of scope holding e."""
+        name = self.fresh(prefix)
+        if scope.exports is not None:
+            scope.exports.append(name)
+        scope.lines += [f"try: {name} = {e}", f"except _Undefined: {name} = _FAILED"]
+        return name
+
+    def home(self, n: ir.Node, scope: _Scope) -> _Scope:
+        """The scope n is evaluated in."""
+        kind = self.kinds[n]
+        if kind == _CONST:
+            return self.consts
+        if kind == _CALL:
+            return self.params if self.sids[n] <= self.static else self.call
+        names = self.free[n]
+        while scope.binder not in names:
+            scope = scope.parent
+        return scope
+
+    def ev(self, n: ir.Node, scope: _Scope) -> str:
+        """A Python expression for n's value, in scope."""
+        home = self.home(n, scope)
+        name = home.names.get(n)
+        if name is not None:
+            return name
+        fn = _STAGE.get(type(n))
+        if fn is None:
+            if type(n) not in _OPS:
+                raise ValueError(f"Cannot stage {type(n).__name__}")
+            args = "".join(", " + self.ev(c, home) for c in n.children)
+            e = f"_via({self.const(_OPS[type(n)])}, {self.const(n)}{args})"
+        else:
+            e = fn(self, n, home)
+        obl = _obl(n)
+        if obl is not None:
+            e = f"({e} if {self.ev(obl, home)} else _undef())"
+        if isinstance(n, ir.LambdaHOAS) or not isinstance(n, _TRIVIAL) and (self.uses.get(n, 0) > 1 or home is not scope):
+            name = home.names[n] = self.bind(home, e, "l" if isinstance(n, ir.LambdaHOAS) else "t")
+            if e in self.defs:
+                self.defs[name] = self.defs[e]
+            return name
+        return e
+
+    def call_of(self, f: ir.Node, scope: _Scope) -> str:
+        """A callable for the function value f."""
+        e = self.ev(f, scope)
+        return self.defs.get(e, e)
+
+    def vals(self, f: ir.Node, scope: _Scope, dups: bool = False) -> str:
+        """An iterable of f's values, in the order of its domain. With dups,
+        the consumer does not mind repeats, so a domain that is an Image is
+        iterated as its function's values."""
+        if isinstance(f, ir.Compose) and self.home(f, scope).exports is None:
+            # The values of a tail of the composition that is constant, or
+            # static, once for good, or once per static values
+            homes = [self.home(c, scope) for c in f.children]
+            k = len(f.children)
+            while k > 1 and homes[k-1].exports is not None:
+                k -= 1
+            if k < len(f.children):
+                home = self.params if self.params in homes[k:] else self.consts
+                tail = ", ".join(self.ev(c, home) for c in f.children[k:])
+                vals = self.bind(home, f"list(_fvals(_Composed([{tail}])))")
+                return f"map({self.compose(self.locals(f.children[:k], scope), scope)}, {vals})"
+        e = self.ev(f, scope)
+        fn = self.defs.get(e)
+        if fn is not None:
+            ref = f.T.argT.ref
+            if dups and isinstance(f, ir.LambdaHOAS) and isinstance(ref, ir.Image):
+                return f"map({fn}, {self.vals(ref.children[0], scope, dups)})"
+            return f"map({fn}, {e}.dom.elems())"
+        return f"_fvals({self.ev(f, scope)})"
+
+    def locals(self, fs: tp.Sequence[ir.Node], scope: _Scope) -> tp.List[str]:
+        """Names in scope holding the values fs."""
+        names = []
+        for f in fs:
+            e = self.ev(f, scope)
+            if not e.isidentifier():
+                name = self.bind(scope, e)
+                if e in self.defs:
+                    self.defs[name] = self.defs[e]
+                e = name
+            names.append(e)
+        return names
+
+    def compose(self, fs: tp.Sequence[str], scope: _Scope) -> str:
+        """A callable applying the last of the function values fs first."""
+        calls = [self.defs.get(f, f) for f in fs]
+        if len(calls) == 1:
+            return calls[0]
+        fn, x = self.fresh("f"), self.fresh("x")
+        scope.lines += [f"def {fn}({x}):", f"    return {'('.join(calls)}({x}{')'*len(calls)}"]
+        if scope.exports is not None:
+            scope.exports.append(fn)
+        return fn
+
+    def type_dom(self, T: ir.Type, scope: _Scope) -> str:
+        if T.ref is not None:
+            return self.ev(T.ref, scope)
+        return self.universe(T, scope)
+
+    def universe(self, T: ir.Type, scope: _Scope) -> str:
+        if isinstance(T, ir.BoolT):
+            return self.const(_Dom(elems=[False, True]))
+        if isinstance(T, ir.EnumT):
+            return self.const(_Dom(elems=list(T.labels)))
+        if isinstance(T, ir.UnitT):
+            return self.const(_Dom(elems=[None]))
+        if isinstance(T, ir.TupleT):
+            return f"_cartprod([{', '.join(self.type_dom(cT, scope) for cT in T.children)}])"
+        if isinstance(T, ir.SumT):
+            return f"_disj_union([{', '.join(self.type_dom(cT, scope) for cT in T.elemTs)}])"
+        # Ints, domains, functions
+        return self.const(_Dom(member=lambda x: True))
+
+
+## Scalars
+
+@_stage(ir.Lit)
+def _(st: _Stager, n: ir.Lit, scope):
+    if type(n.val) in (int, bool, str):
+        return repr(n.val)
+    return st.const(n.val)
+
+@_stage(ir.Unit)
+def _(st, n, scope):
+    return "None"
+
+@_stage(ir.VarRef)
+def _(st, n: ir.VarRef, scope):
+    return f"v{n.sid}"
+
+@_stage(ir.BoundVarHOAS)
+def _(st, n: ir.BoundVarHOAS, scope: _Scope):
+    while scope.binder != n.name:
+        scope = scope.parent
+    return scope.param
+
+def _binop(sym: str):
+    def stage(st: _Stager, n, scope):
+        a, b = (st.ev(c, scope) for c in n.children)
+        return f"({a} {sym} {b})"
+    return stage
+
+_stage(ir.Eq)(_binop("=="))
+_stage(ir.Lt)(_binop("<"))
+_stage(ir.LtEq)(_binop("<="))
+
+@_stage(ir.Not)
+def _(st: _Stager, n, scope):
+    return f"(not {st.ev(n.children[0], scope)})"
+
+@_stage(ir.Implies)
+def _(st: _Stager, n, scope):
+    a, b = (st.ev(c, scope) for c in n.children)
+    return f"(not {a} or bool({b}))"
+
+@_stage(ir.Conj)
+def _(st: _Stager, n, scope):
+    if not n.children:
+        return "True"
+    return f"bool({' and '.join(st.ev(c, scope) for c in n.children)})"
+
+@_stage(ir.Disj)
+def _(st: _Stager, n, scope):
+    if not n.children:
+        return "False"
+    return f"bool({' or '.join(st.ev(c, scope) for c in n.children)})"
+
+@_stage(ir.Ite)
+def _(st: _Stager, n, scope):
+    c, t, f = (st.ev(c, scope) for c in n.children)
+    return f"({t} if {c} else {f})"
+
+@_stage(ir.Neg)
+def _(st: _Stager, n, scope):
+    return f"(-{st.ev(n.children[0], scope)})"
+
+@_stage(ir.Abs)
+def _(st: _Stager, n, scope):
+    return f"abs({st.ev(n.children[0], scope)})"
+
+@_stage(ir.Sum)
+def _(st: _Stager, n, scope):
+    return f"({' + '.join(st.ev(c, scope) for c in n.children) or '0'})"
+
+@_stage(ir.Prod)
+def _(st: _Stager, n, scope):
+    return f"({' * '.join(st.ev(c, scope) for c in n.children) or '1'})"
+
+def _call(helper: str):
+    def stage(st: _Stager, n, scope):
+        return f"{helper}({', '.join(st.ev(c, scope) for c in n.children)})"
+    return stage
+
+_stage(ir.FloorDiv)(_call("_floordiv"))
+_stage(ir.Mod)(_call("_mod"))
+_stage(ir.TrueDiv)(_call("_truediv"))
+_stage(ir.Isqrt)(_call("_isqrt"))
+_stage(ir.Fin)(_call("_fin"))
+
+## Tuples and sums
+
+@_stage(ir.TupleLit)
+def _(st: _Stager, n, scope):
+    return f"({''.join(st.ev(c, scope) + ', ' for c in n.children)})"
+
+@_stage(ir.Proj)
+def _(st: _Stager, n: ir.Proj, scope):
+    return f"{st.ev(n.children[0], scope)}[{n.idx}]"
+
+@_stage(ir.Inj)
+def _(st: _Stager, n: ir.Inj, scope):
+    return f"_Inj({n.idx}, {st.ev(n.children[0], scope)})"
+
+@_stage(ir.SumLit)
+def _(st: _Stager, n, scope):
+    tag, *elems = n.children
+    return f"_sumlit({st.ev(tag, scope)}, ({''.join(f'lambda: {st.ev(e, scope)}, ' for e in elems)}))"
+
+@_stage(ir.Match)
+def _(st: _Stager, n, scope):
+    scrut, *branches = n.children
+    return f"_match({st.ev(scrut, scope)}{''.join(', ' + st.call_of(b, scope) for b in branches)})"
+
+## Functions
+
+@_stage(ir.LambdaHOAS)
+def _(st: _Stager, n: ir.LambdaHOAS, scope: _Scope):
+    fn = st.fresh("f")
+    body = _Scope(scope, n.bv_name, st.fresh("x"))
+    ret = st.ev(n.body, body)
+    scope.lines += [f"def {fn}({body.param}):", *_indent(body.lines), f"    return {ret}"]
+    if scope.exports is not None:
+        scope.exports.append(fn)
+    e = f"_Fn({fn}, lambda: {st.type_dom(n.T.argT, scope)})"
+    st.defs[e] = fn
+    return e
+
+@_stage(ir.Compose)
+def _(st: _Stager, n, scope):
+    fs = st.locals(n.children, scope)
+    fn = st.compose(fs, scope)
+    e = f"_Fn({fn}, lambda: {fs[-1]}.dom)"
+    st.defs[e] = fn
+    return e
+
+@_stage(ir.Apply)
+def _(st: _Stager, n, scope):
+    f, x = n.children
+    if isinstance(f.T, ir.TupleT):
+        return f"_at({st.ev(f, scope)}, {st.ev(x, scope)})"
+    if isinstance(f, ir.VarRef):
+        # A missing element is undefined where it is used
+        return f"{st.ev(f, scope)}.table.get({st.ev(x, scope)}, _FAILED)"
+    return f"{st.call_of(f, scope)}({st.ev(x, scope)})"
+
+def _reduce(template: str, dups: bool = False):
+    def stage(st: _Stager, n, scope):
+        return template.format(st.vals(n.children[0], scope, dups))
+    return stage
+
+_stage(ir.Forall)(_reduce("all({})", dups=True))
+_stage(ir.Exists)(_reduce("any({})", dups=True))
+_stage(ir.AllDistinct)(_reduce("_distinct(list({}))"))
+_stage(ir.AllSame)(_reduce("(len(set({})) <= 1)", dups=True))
+_stage(ir.SumReduce)(_reduce("sum({})"))
+_stage(ir.ProdReduce)(_reduce("_prod({})"))
+
+## Domains
+
+@_stage(ir.Universe)
+def _(st: _Stager, n, scope):
+    return st.universe(n.T.carT, scope)
+
+@_stage(ir.IsMember)
+def _(st: _Stager, n, scope):
+    d, x = n.children
+    return st.member(d, st.ev(x, scope), scope)
@@ -10,7 +10,6 @@ from ..passes.analyses.type_check import type_check
 from ..passes.analyses.ast_printer import print_ast
 from ..passes.analyses.ssa_printer import print_ssa
 from ..passes.analyses.info import count
-from ..utils import BoolLat
 import inspect
 
 @dataclass
@@ -897,10 +896,7 @@ def _make_lambda(argT: TExpr, body: VExpr, bv_name, inj=False) -> FuncExpr:
     assert isinstance(argT, TExpr)
     retT = body.T.node
     lamT = ir.PiTHOAS(argT.node, retT, bv_name=bv_name)
-    lambda_node = ir.LambdaHOAS(lamT, body.node, bv_name=bv_name)
-    if inj:
-        lambda_node._metadata['inj'] = BoolLat.T
-    return lambda_node
+    return ir.LambdaHOAS(lamT, body.node, bv_name=bv_name, inj=inj)
 
 class FuncExpr(VExpr):
     def __post_init__(self):
@@ -918,7 +914,6 @@ class FuncExpr(VExpr):
         assert isinstance(bv.node, ir.BoundVarHOAS)
         assert not bv.node.closed
         body_expr = _call_fn(fn, bv)
-        bv.node.closed=True
         #TODO if inj, add a guard with injective proof
         return wrap(_make_lambda(argT, body_expr, bv.node.name, inj))
 
@@ -932,9 +927,8 @@ class FuncExpr(VExpr):
 
     @property
     def known_inj(self) -> bool:
-        inj = self.node._metadata.get('inj', None)
-        if inj is not None:
-            return inj == BoolLat.T
+        if isinstance(self.node, ir._Lambda):
+            return self.node.inj
         # TODO maybe try to infer?
         return False
 
@@ -147,7 +147,7 @@ class NDDomainExpr(ast.DomainExpr):
                     lo, hi, step = lhs
                     new_dom = (hi-lo).ceildiv(step).fin().forget_view()
                     new_doms.append(new_dom)
-                    cvals.append(lambda i: lo + i*step)
+                    cvals.append(lambda i, lo=lo, step=step: lo + i*step)
             else:
                 raise NotImplementedError(f"Cannot handle {v} in indexing")
         # If no slices, return the element
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import typing as tp
+
+from .spec import PuzzleSpec
+from .smt_backend import SMTBackend
+from ..backends.cnf import CNFEncoder
+
+# Same lowering as SMTBackend (enums stay one-hot in CNF since EncodeEnums
+# gives them a Fin refinement), then a pure SAT encoding (backends/cnf.py).
+class CNFBackend:
+    def __init__(self, spec: PuzzleSpec, max_dom_size: int = 10**6):
+        self.spec = spec
+        self.max_dom_size = max_dom_size
+
+    def lower(self) -> PuzzleSpec:
+        """Runs the lowering passes, returning a spec of scalar constraints."""
+        return SMTBackend(self.spec, max_dom_size=self.max_dom_size).lower()
+
+    def encode(self, **kwargs) -> CNFEncoder:
+        """Encodes the lowered spec. kwargs are passed on to CNFEncoder."""
+        spec = self.lower()
+        enc = CNFEncoder(spec.sym, **kwargs)
+        enc.encode_spec(spec._spec)
+        return enc
+
+    def generate(self, out: tp.Optional[tp.TextIO] = None, **kwargs) -> tp.Optional[str]:
+        """Writes the spec as DIMACS to out, or returns it as a string if out is None."""
+        enc = self.encode(**kwargs)
+        if out is not None:
+            enc.write(out)
+            return None
+        import io
+        buf = io.StringIO()
+        enc.write(buf)
+        return buf.getvalue()
+
+    def write(self, path: str, **kwargs) -> CNFEncoder:
+        """Writes the DIMACS file, returning the encoder to decode models with."""
+        enc = self.encode(**kwargs)
+        with open(path, "w") as f:
+            enc.write(f)
+        return enc
@@ -56,6 +56,7 @@ class SymTable:
             else:
                 entries[sid] = SymEntry(
                     name=e.name,
+                    kind=e.kind,
                     invalid=True,
                     **e._metadata
                 )
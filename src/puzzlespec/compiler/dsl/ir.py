@@ -2,7 +2,7 @@ from __future__ import annotations
 import typing as tp
 # Unified Types and IR
 from dataclasses import dataclass
-import functools as ft
+import weakref
 
 # Every node stores three kinds of data:
 #   1. _children:       structural child Nodes (e.g. the N in Fin(N))
@@ -10,9 +10,41 @@ import functools as ft
 #   3. _fields:         non-Node scalar data (e.g. the 5 in Lit(5))
 # All three participate in hashing and equality.
 # A fourth kind, _metadata, holds ad-hoc non-Node data (e.g. analysis results)
-# that does NOT affect hashing or equality but is copied on replace().
+# that does NOT affect hashing or equality. It belongs to the one shared node,
+# so replace() does not carry it over: the result may be an existing node.
+# Anything that distinguishes two nodes is a field.
+#
+# Nodes are hash-consed: every constructor call (including the one inside
+# replace()) goes through _intern_table, so structurally equal nodes are the
+# same object and equality is an identity check. The table is weak-valued so
+# nodes that are no longer referenced anywhere are collected as usual.
+#
+# Nodes have no __dict__: _InternMeta gives every subclass __slots__ for the
+# _fields and _named_children it declares (named child 'T' lives in slot '_T').
+_intern_table: 'weakref.WeakValueDictionary[tuple, Node]' = weakref.WeakValueDictionary()
+
+def num_interned() -> int:
+    return len(_intern_table)
+
+class _InternMeta(type):
+    def __new__(mcls, name, bases, ns, **kwargs):
+        if '__slots__' not in ns:
+            inherited = {s for b in bases for k in b.__mro__ for s in getattr(k, '__slots__', ())}
+            own = (*ns.get('_fields', ()), *(f"_{n}" for n in ns.get('_named_children', ())))
+            ns['__slots__'] = tuple(s for s in own if s not in inherited)
+        return super().__new__(mcls, name, bases, ns, **kwargs)
+
+    def __call__(cls, *args, **kwargs):
+        node = super().__call__(*args, **kwargs)
+        existing = _intern_table.get(node._key)
+        if existing is not None:
+            return existing
+        _intern_table[node._key] = node
+        return node
+
 _op_cnt = 0
-class Node:
+class Node(metaclass=_InternMeta):
+    __slots__ = ('_children', '_key', '_hash', '_meta', '__weakref__')
     _fields: tp.Tuple[str, ...] = ()
     _named_children: tp.Tuple[str, ...] = ()
 
@@ -23,38 +55,35 @@ class Node:
         if self._numc >= 0 and len(children) != self._numc:
             raise TypeError(f"Expected {self._numc} children, got {len(children)}")
         self._children: tp.Tuple[Node, ...] = children
-        self._metadata = {}
+        self._meta = None
+        # Children are already interned, so the key only needs their identity
+        self._key = (
+            self._opcode,
+            tuple(getattr(self, f) for f in self._fields),
+            children,
+            tuple(getattr(self, n) for n in self._named_children),
+        )
+        self._hash = hash(self._key)
+
+    def __setattr__(self, name, value):
+        # A node is interned under its key, so its fields, children and key
+        # are fixed once __init__ has set _hash. Only _meta may change.
+        if name != '_meta' and hasattr(self, '_hash'):
+            raise AttributeError(f"Cannot set {name} of an interned {type(self).__name__}")
+        object.__setattr__(self, name, value)
 
     # ---- Hashing (all 3 kinds contribute) ----
 
-    @ft.cached_property
-    def _hash(self):
-        return hash((
-            self._opcode,
-            tuple(self.field_dict.values()),
-            tuple(c._hash for c in self._children),
-            tuple(
-                nc._hash if nc is not None else -(i + 1)
-                for i, nc in enumerate(self.named_children_dict.values())
-            ),
-        ))
-
     def __hash__(self) -> int:
         return self._hash
 
-    # ---- Equality (all 3 kinds contribute) ----
+    # ---- Equality (all 3 kinds contribute, via interning) ----
 
     def __eq__(self, other):
-        if self is other:
-            return True
-        if not isinstance(other, Node):
-            return False
-        if self._hash != other._hash:
-            return False
-        return (self._opcode == other._opcode
-                and self.field_dict == other.field_dict
-                and self._children == other._children
-                and self.named_children_dict == other.named_children_dict)
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
 
     def __lt__(self, other: 'Node'):
         if self._opcode != other._opcode:
@@ -76,23 +105,27 @@ class Node:
     @property
     def all_nodes(self) -> tp.Tuple['Node', ...]:
         """All Node-valued parts: _children + non-None named children."""
-        named = tuple(nc for nc in self.named_children_dict.values() if nc is not None)
-        return self._children + named
+        return self._children + tuple(nc for nc in self._key[3] if nc is not None)
 
-    @ft.cached_property
+    @property
     def named_children_dict(self) -> tp.Dict[str, tp.Optional['Node']]:
         """Map from named child name to its value (or None)."""
-        return {n: getattr(self, n) for n in self._named_children}
+        return dict(zip(self._named_children, self._key[3]))
 
-    @ft.cached_property
+    @property
     def field_dict(self):
-        fd = {f: getattr(self, f) for f in self._fields}
-        assert all(not isinstance(v, Node) for v in fd.values())
-        return fd
+        return dict(zip(self._fields, self._key[1]))
 
     @property
     def field_vals(self):
-        return tuple(self.field_dict.values())
+        return self._key[1]
+
+    @property
+    def _metadata(self) -> tp.Dict[str, tp.Any]:
+        # Allocated on first use; most nodes never carry metadata
+        if self._meta is None:
+            self._meta = {}
+        return self._meta
 
     # ---- Traversal ----
 
@@ -109,13 +142,13 @@ class Node:
     # ---- Construction ----
 
     def replace(self, *new_children: 'Node', **kwargs: tp.Any) -> 'Node':
-        new_fields = {**self.field_dict, **kwargs}
-        if (new_fields == self.field_dict) and (new_children == self._children):
+        if not kwargs and new_children == self._children:
+            return self
+        field_dict = self.field_dict
+        new_fields = {**field_dict, **kwargs}
+        if (new_fields == field_dict) and (new_children == self._children):
             return self
-        new_node = type(self)(*new_children, **new_fields)
-        for k, v in self._metadata.items():
-            new_node._metadata[k] = v
-        return new_node
+        return type(self)(*new_children, **new_fields)
 
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
@@ -144,7 +177,7 @@ class Node:
         setattr(cls, "__match_args__", match_args)
 
 class MetaVar(Node):
-    _params = ('id',)
+    _fields = ('id',)
     _numc = 0
     def __init__(self, id: int):
         self.id = id
@@ -185,14 +218,14 @@ class Type(Node):
         return stripT(self)
 
     def replace(self, *new_children, ref, view, obl, **field_kwargs):
-        new_fields = {**self.field_dict, **field_kwargs}
-        if (ref is self._ref and view is self._view and obl is self._obl and
-                new_fields == self.field_dict and new_children == self._children):
+        same_named = ref is self._ref and view is self._view and obl is self._obl
+        if same_named and not field_kwargs and new_children == self._children:
             return self
-        new_node = type(self)(*new_children, ref=ref, view=view, obl=obl, **new_fields)
-        for k, v in self._metadata.items():
-            new_node._metadata[k] = v
-        return new_node
+        field_dict = self.field_dict
+        new_fields = {**field_dict, **field_kwargs}
+        if same_named and new_fields == field_dict and new_children == self._children:
+            return self
+        return type(self)(*new_children, ref=ref, view=view, obl=obl, **new_fields)
 
 ## Base types
 class UnitT(Type):
@@ -346,14 +379,14 @@ class Value(Node):
         return self._obl
 
     def replace(self, *new_children, T, obl, **field_kwargs):
-        new_fields = {**self.field_dict, **field_kwargs}
-        if (T is self._T and obl is self._obl and
-                new_fields == self.field_dict and new_children == self._children):
+        same_named = T is self._T and obl is self._obl
+        if same_named and not field_kwargs and new_children == self._children:
+            return self
+        field_dict = self.field_dict
+        new_fields = {**field_dict, **field_kwargs}
+        if same_named and new_fields == field_dict and new_children == self._children:
             return self
-        new_node = type(self)(T, *new_children, obl=obl, **new_fields)
-        for k, v in self._metadata.items():
-            new_node._metadata[k] = v
-        return new_node
+        return type(self)(T, *new_children, obl=obl, **new_fields)
 
 class VarRef(Value):
     _fields = ("sid",)
@@ -381,12 +414,14 @@ class Unit(Value):
 
 # (lamda x:paramT body) -> (paramT -> type(body))
 class _Lambda(Value):
-    pass
+    # inj: the function is known to be injective
+    _fields = ('inj',)
 
 class Lambda(_Lambda):
     _numc = 1
-    def __init__(self, T: Type, body: Value, obl=None):
+    def __init__(self, T: Type, body: Value, obl=None, inj: bool=False):
         assert isinstance(T, PiT)
+        self.inj = inj
         super().__init__(T, body, obl=obl)
 
 ### Int/Bool
@@ -848,11 +883,12 @@ class PiTHOAS(_PiT):
         return self._children[1]
 
 class LambdaHOAS(_Lambda):
-    _fields = ('bv_name',)
+    _fields = ('bv_name', 'inj')
     _numc = 1
-    def __init__(self, T: Type, body: Value, bv_name: str, obl=None):
+    def __init__(self, T: Type, body: Value, bv_name: str, obl=None, inj: bool=False):
         assert isinstance(T, PiTHOAS)
         self.bv_name = bv_name
+        self.inj = inj
         super().__init__(T, body, obl=obl)
 
     @property
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import importlib
+import pickle
+import typing as tp
+import zlib
+
+from . import ir
+
+# Compact serialization of IR DAGs, e.g. to hand a lowered spec to worker
+# processes without rebuilding it from the DSL.
+#
+# The DAG is written in topological order as one record per distinct node:
+#   (class index, field values, child indices, named child indices)
+# with indices into the records written before it, so shared subterms are
+# written once. Classes are named by module and name (opcodes depend on
+# definition order, so they are not stable across processes). Loading calls
+# the constructors, which re-interns every node in the loading process.
+#
+# A _DenseLayout maps node keys to positions; its keys are written as the
+# indices of their nodes, which are made part of the DAG for that purpose.
+
+_FORMAT = 1
+
+class _Dense(tuple):
+    """A serialized _DenseLayout: (node index, position) pairs."""
+
+def _layout_nodes(layout: ir._FuncLitLayout) -> tp.Iterator[ir.Node]:
+    if isinstance(layout, ir._DenseLayout):
+        for key in layout.val_map:
+            yield _from_key(key)
+
+def _from_key(key: tp.Tuple) -> ir.Node:
+    node = ir._intern_table.get(key)
+    if node is None:
+        opcode, fields, children, named = key
+        node = _build(_OPCODES[opcode], fields, children, named)
+    return node
+
+def _build(cls: tp.Type[ir.Node], fields, children, named) -> ir.Node:
+    fields = dict(zip(cls._fields, fields))
+    named = dict(zip(cls._named_children, named))
+    if issubclass(cls, ir.Value):
+        return cls(named['T'], *children, obl=named['obl'], **fields)
+    return cls(*children, **named, **fields)
+
+def _subclasses(cls):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _subclasses(sub)
+
+class _Opcodes(dict):
+    # Classes can be defined after this module is imported (e.g. in ast_nd)
+    def __missing__(self, opcode):
+        self.update((c._opcode, c) for c in _subclasses(ir.Node))
+        return self[opcode]
+
+_OPCODES = _Opcodes()
+
+def dumps(root: ir.Node) -> bytes:
+    """Serializes the DAG under root."""
+    index: tp.Dict[ir.Node, int] = {}
+    classes: tp.Dict[type, int] = {}
+    records = []
+    stack = [(root, False)]
+    while stack:
+        node, ready = stack.pop()
+        if node in index:
+            continue
+        layouts = [v for v in node.field_vals if isinstance(v, ir._FuncLitLayout)]
+        if not ready:
+            stack.append((node, True))
+            for c in node.all_nodes:
+                if c not in index:
+                    stack.append((c, False))
+            for layout in layouts:
+                stack.extend((n, False) for n in _layout_nodes(layout) if n not in index)
+            continue
+        fields = tuple(
+            _Dense((index[_from_key(k)], i) for k, i in v.val_map.items())
+            if isinstance(v, ir._DenseLayout) else v
+            for v in node.field_vals
+        )
+        cls = classes.setdefault(type(node), len(classes))
+        named = tuple(None if n is None else index[n] for n in node._key[3])
+        records.append((cls, fields, tuple(index[c] for c in node.children), named))
+        index[node] = len(records)-1
+    names = tuple(f"{c.__module__}:{c.__name__}" for c in classes)
+    return zlib.compress(pickle.dumps((_FORMAT, names, records), protocol=pickle.HIGHEST_PROTOCOL))
+
+def loads(data: bytes) -> ir.Node:
+    """Rebuilds (and interns) the DAG serialized by dumps."""
+    fmt, names, records = pickle.loads(zlib.decompress(data))
+    if fmt != _FORMAT:
+        raise ValueError(f"Unknown IR serialization format {fmt}")
+    classes = []
+    for name in names:
+        module, cls = name.split(":")
+        classes.append(getattr(importlib.import_module(module), cls))
+    nodes: tp.List[ir.Node] = []
+    for cls, fields, children, named in records:
+        fields = tuple(
+            ir._DenseLayout(val_map={nodes[i]._key: pos for i, pos in v})
+            if isinstance(v, _Dense) else v
+            for v in fields
+        )
+        nodes.append(_build(
+            classes[cls],
+            fields,
+            tuple(nodes[i] for i in children),
+            tuple(None if i is None else nodes[i] for i in named),
+        ))
+    return nodes[-1]
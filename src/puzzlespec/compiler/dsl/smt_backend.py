@@ -1,37 +1,59 @@
+from __future__ import annotations
+
+import typing as tp
+
 from .spec import PuzzleSpec
-from ..passes.pass_base import Pass, Context, PassManager
-from ..passes.transforms.scalarize import Scalarize
-from ..passes.transforms.encode_enums import EncodeEnums
+from ..passes.pass_base import Context
+from ..backends.passes.scalarize import Scalarize
+from ..backends.passes.encode_enums import EncodeEnums
+from ..backends.smtlib import SMTLibEmitter, BVEmitter
+from ..passes.analyses.intervals import IntervalAnalysis
 # Strategy
 # Phase 1: Prep spec to be encodable using SMT
 #   - Concretize Domains. All domains must be finite and fixed
 #       - Eg Fin(v) -> Fin(fixed_max)
 #       - forall(x in Fin(v) f(x)) -> forall(x in Fin(fixed_max), (x<v) => f(x)))
+# Phase 2: Lower to scalars (as SpecTemplate does)
+#   - optimize, so domains reduce to literals Scalarize can enumerate
+#   - EncodeEnums: enums -> Int/Bool
+#   - Scalarize (aggressive): func vars -> one var per element, quantifiers
+#     -> Conj/Disj, grounding every lambda over a domain of at most
+#     max_dom_size elements
+# Phase 3: Stream the scalar spec out as SMT-LIB2 (backends/smtlib.py)
+#   - Ints as Int (QF_LIA/QF_NIA), or, with bitvectors=True, IntervalAnalysis
+#     bounds every Int term and BVEmitter prints them as bitvectors of the
+#     smallest width holding them all (QF_BV)
 class SMTBackend:
-    def __init__(self, spec: PuzzleSpec):
+    def __init__(self, spec: PuzzleSpec, max_dom_size: int = 10**6):
         self.spec = spec
+        self.max_dom_size = max_dom_size
 
-    def generate(self) -> str:
-        spec = self.spec
+    def lower(self) -> PuzzleSpec:
+        """Runs the lowering passes, returning a spec of scalar constraints."""
+        spec = self.spec.optimize()
         # PromoteDomainsToUniverse (TODO)
         # ExpandFiniteUniverses (TODO)
-        # EncodeEnums
-        print("Before EncodeEnums:")
         spec = spec.transform(EncodeEnums(), ctx=Context(spec.envs_obj))
-        spec.pretty_print()
-        #spec = spec.optimize()
-        #spec.pretty_print()
-        assert 0
+        spec = spec.transform(Scalarize(max_dom_size=self.max_dom_size, aggressive=True), ctx=Context(spec.envs_obj))
+        return spec.optimize()
+
+    def generate(self, out: tp.Optional[tp.TextIO] = None, bitvectors: bool = False, **kwargs) -> tp.Optional[str]:
+        """Writes the spec as SMT-LIB2 to out, or returns it as a string if out is None.
 
-       
-        print(self.spec.pretty())
-        # ScalarizeVars
-        print("Before ScalarizeVars:")
-        spec = self.spec.transform(Scalarize(), ctx=Context(self.spec.envs_obj))
-        spec = spec.optimize(aggressive=True)
-        spec.pretty()
+        With bitvectors, Ints are encoded as minimal-width bitvectors, which
+        solve much faster on small (e.g. digit) domains; every Int must then
+        be bounded. kwargs are passed on to SMTLibEmitter/BVEmitter.
+        """
+        spec = self.lower()
+        import io
+        buf = io.StringIO() if out is None else out
+        if bitvectors:
+            intervals = IntervalAnalysis()(spec._spec, Context())
+            BVEmitter(buf, intervals, spec.sym, **kwargs).emit_spec(spec._spec)
+        else:
+            SMTLibEmitter(buf, spec.sym, **kwargs).emit_spec(spec._spec)
+        return buf.getvalue() if out is None else None
 
-        # IntToBV
-        #   - Interval analysis for Ints
-        #   - Bitvector encoding for Ints
-        # Emit using hwtypes
\ No newline at end of file
+    def write(self, path: str, **kwargs):
+        with open(path, "w") as f:
+            self.generate(f, **kwargs)
@@ -5,8 +5,9 @@ from ..passes.envobj import EnvsObj, OblsObj
 from . import ir
 from ..passes.analyses.pretty_printer import PrettyPrinterPass, PrettyPrintedExpr, pretty_spec
 from .envs import SymTable
-from ..passes.pass_base import PassManager, Context, Pass
-from ..passes.transforms.beta_reduction import BetaReductionPass, BetaReductionHOAS
+from ..passes.pass_base import PassManager, Context, Pass, FusedTransform
+from ..passes.transforms.beta_reduction import BetaReductionPass
+from ..passes.transforms.nbe import NbEPass
 from ..passes.transforms import CanonicalizePass, ConstFoldPass, AlgebraicSimplificationPass, DomainSimplificationPass
 from ..passes.transforms.guard_opt import GuardOpt, GuardLift
 #from ..passes.analyses.constraint_categorizer import ConstraintCategorizer, ConstraintCategorizerVals
@@ -20,7 +21,8 @@ class PuzzleSpec:
         name: str,
         sym: SymTable,
         rules: ir.TupleLit=None,
-        obls: ir.TupleLit=None
+        obls: ir.TupleLit=None,
+        type_map: TypeMap=None
     ):
         self.name = name
         self.sym = sym
@@ -34,7 +36,7 @@ class PuzzleSpec:
             assert isinstance(obls, ir.TupleLit)
         self._spec = ir.Spec(cons=rules, obls=obls)
         #self._ph_check()
-        self.type_check()
+        self.type_check(type_map)
 
     def _ph_check(self):
         def check(node: ir.Node):
@@ -61,9 +63,14 @@ class PuzzleSpec:
         pm.run(node, ctx)
         return ctx
 
-    def type_check(self):
+    # seed: the TypeMap of an earlier tree, whose nodes need no re-check
+    def type_check(self, seed: TypeMap=None):
         ctx = Context(self.envs_obj)
+        if seed is not None:
+            ctx.add(seed)
+            ctx.invalidate()
         self.analyze([TypeCheckingPass()], ctx=ctx)
+        self.type_map = ctx.get(TypeMap)
 
     # applies passes, copies the sym table, returns a new spec
     def transform(
@@ -96,10 +103,11 @@ class PuzzleSpec:
             sym=new_sym,
             rules=new_spec_node.cons,
             obls=new_obls,
+            type_map=ctx.try_get(TypeMap) or ctx.stale(TypeMap),
         )
 
     def optimize(self) -> 'PuzzleSpec':
-        ctx = Context(self.envs_obj)
+        ctx = Context(self.envs_obj, self.type_map)
         analysis_map = {
             TypeMap: TypeCheckingPass()
         }
@@ -107,11 +115,13 @@ class PuzzleSpec:
         base_opt = [
             GuardLift(),
             [
-                CanonicalizePass(),
-                AlgebraicSimplificationPass(),
-                ConstFoldPass(),
-                DomainSimplificationPass(),
-                BetaReductionHOAS(),
+                FusedTransform(
+                    CanonicalizePass(),
+                    AlgebraicSimplificationPass(),
+                    ConstFoldPass(),
+                    DomainSimplificationPass(),
+                ),
+                NbEPass(),
             ]
         ]
         opt_passes = base_opt
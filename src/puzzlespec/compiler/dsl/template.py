@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import random
+import typing as tp
+from functools import cached_property
+
+from . import ir, ast, utils
+from .spec import PuzzleSpec
+from ..passes.pass_base import Context
+from ..passes.transforms.substitution import SubMapping, SubstitutionPass
+from ..backends.passes.scalarize import Scalarize, ScalarVarsObj
+from ..backends.passes.encode_enums import EncodeEnums
+from ..backends.passes.symmetry import BreakSymmetries, Symmetries, SymmetryAnalysis
+from ..backends.fd import FDSolver
+
+# Compile once, instantiate many.
+#
+# A SpecTemplate lowers its spec once per parameter assignment: the params
+# are substituted, and the result goes through EncodeEnums, Scalarize and
+# optimize into an FDSolver. The gen vars (e.g. givens) are left as
+# variables, so their scalar parts become the template's clue slots: an
+# instance is solved by binding the slots as assumptions of the same solver,
+# with no recompilation.
+#
+# Gen var values follow the structure of the var's type:
+#   Int/Bool            an int/bool
+#   Tuple               a tuple
+#   Sum                 (variant index, payload); for U(Unit) + D, None or a value
+#   Func                a Mapping from domain elements (as ints or tuples of
+#                       ints) to values, or a callable on them. Elements a
+#                       Mapping leaves out are not bound.
+#
+# Since every call reuses the one solver, generation loops (count the
+# solutions, blank a clue, count again) only pay for the changed assumptions:
+# count_solutions blocks each solution it finds within a push/pop of the
+# solver, and minimize is such a loop.
+#
+# With break_symmetries, compile also detects the symmetries of the lowered
+# spec (backends/passes/symmetry.py). Instances that bind no gen var, i.e.
+# generating a solved grid or counting all solutions, then go to a second
+# solver whose spec has lex-leader constraints added. It finds one
+# representative per class of symmetric solutions. A seeded template maps the
+# representative it generates by a random symmetry, so generated grids stay
+# random. Instances with clues keep the plain solver, since clues are not
+# symmetric in general.
+
+def _slot_sids(slot: ir.Node) -> tp.Iterator[int]:
+    if isinstance(slot, ir.VarRef):
+        yield slot.sid
+    elif isinstance(slot, (ir.TupleLit, ir.SumLit)):
+        for c in slot.children:
+            yield from _slot_sids(c)
+    elif isinstance(slot, ir.FuncLit):
+        for c in slot.elems:
+            yield from _slot_sids(c)
+
+class CompiledTemplate:
+    """A spec lowered for one parameter assignment."""
+    def __init__(self, spec: PuzzleSpec, slots: tp.Mapping[str, ir.Node], outputs: tp.Mapping[str, ir.Node],
+                 seed: tp.Optional[int] = None, symmetries: tp.Optional[Symmetries] = None):
+        self.spec = spec
+        self.slots = slots
+        self.outputs = outputs
+        self.seed = seed
+        # Used for instances that bind no gen var (see break_symmetries)
+        self.symmetries = symmetries if symmetries else None
+        self._rng = random.Random(seed)
+        self._keys: tp.Dict[ir.FuncLit, tp.List[tp.Any]] = {}
+
+    @cached_property
+    def solver(self) -> FDSolver:
+        # Built on first use: a spec handed to other backends never grounds one
+        return FDSolver(self.spec._spec, self.spec.sym, seed=self.seed)
+
+    @cached_property
+    def broken_solver(self) -> FDSolver:
+        """The solver for the spec with its symmetries broken."""
+        spec = self.spec.transform(BreakSymmetries(), ctx=Context(self.symmetries))
+        return FDSolver(spec._spec, spec.sym, seed=self.seed)
+
+    def assumptions(self, **gen_vals) -> tp.Dict[int, int]:
+        """The scalar assignment (by sid) binding the given gen vars."""
+        out = {}
+        for name, val in gen_vals.items():
+            if name not in self.slots:
+                raise ValueError(f"{name} is not a gen var of this template")
+            self._bind(self.slots[name], val, out)
+        return out
+
+    def solve(self, **gen_vals) -> tp.Optional[tp.Dict[str, tp.Any]]:
+        """Solves the instance given by gen_vals, returning the values of the
+        other vars by name, or None if it has no solution."""
+        assume = self.assumptions(**gen_vals)
+        if self.symmetries is not None and not assume:
+            vals = self.broken_solver.solve()
+            if vals is not None and self.seed is not None:
+                vals = self.symmetries.shuffle(vals, self._rng)
+        else:
+            vals = self.solver.solve(assume)
+        if vals is None:
+            return None
+        return {name: self._read(slot, vals) for name, slot in self.outputs.items()}
+
+    def count_solutions(self, limit: int = 2, **gen_vals) -> int:
+        """The number of solutions of the instance, up to limit. Solutions are
+        told apart by the values of the non-gen vars. With symmetries broken,
+        an instance that binds no gen var counts solutions up to symmetry (at
+        least one per class)."""
+        over = [sid for slot in self.outputs.values() for sid in _slot_sids(slot)]
+        assume = self.assumptions(**gen_vals)
+        solver = self.broken_solver if self.symmetries is not None and not assume else self.solver
+        return solver.count_solutions(assume, limit, over)
+
+    def minimize(self, name: str, clues: tp.Mapping, blank: tp.Any = None,
+                 order: tp.Optional[tp.Iterable] = None, **gen_vals) -> tp.Dict:
+        """Blanks the clues of the func gen var name one at a time (in order,
+        or the Mapping's order), keeping each blank that leaves the solution
+        unique. Returns the clues with the blanked ones set to blank."""
+        clues = dict(clues)
+        if self.count_solutions(**gen_vals, **{name: clues}) != 1:
+            raise ValueError("The clues do not have a unique solution")
+        for k in (list(clues) if order is None else order):
+            old = clues[k]
+            if old == blank:
+                continue
+            clues[k] = blank
+            if self.count_solutions(**gen_vals, **{name: clues}) != 1:
+                clues[k] = old
+        return clues
+
+    def keys(self, func: ir.FuncLit) -> tp.List[tp.Any]:
+        if func not in self._keys:
+            self._keys[func] = [utils._unpack(e) for e in utils._iterate(func.children[0])]
+        return self._keys[func]
+
+    def _bind(self, slot: ir.Node, val, out: tp.Dict[int, int]):
+        match slot:
+            case ir.VarRef():
+                out[slot.sid] = int(val)
+            case ir.Lit() | ir.Unit():
+                pass
+            case ir.TupleLit():
+                for s, v in zip(slot.children, val, strict=True):
+                    self._bind(s, v, out)
+            case ir.SumLit():
+                tag, *elems = slot.children
+                if len(elems) == 2 and isinstance(elems[0], ir.Unit):
+                    idx, val = (0, None) if val is None else (1, val)
+                else:
+                    idx, val = val
+                self._bind(tag, idx, out)
+                self._bind(elems[idx], val, out)
+            case ir.FuncLit():
+                if isinstance(val, tp.Mapping):
+                    for k, s in zip(self.keys(slot), slot.elems):
+                        if k in val:
+                            self._bind(s, val[k], out)
+                else:
+                    for k, s in zip(self.keys(slot), slot.elems):
+                        self._bind(s, val(k), out)
+            case _:
+                raise ValueError(f"Cannot bind {slot}")
+
+    def _read(self, slot: ir.Node, vals: tp.Mapping[int, tp.Any]):
+        match slot:
+            case ir.VarRef():
+                return vals.get(slot.sid)
+            case ir.Lit():
+                return slot.val
+            case ir.Unit():
+                return None
+            case ir.TupleLit():
+                return tuple(self._read(s, vals) for s in slot.children)
+            case ir.SumLit():
+                tag, *elems = slot.children
+                idx = self._read(tag, vals)
+                payload = self._read(elems[idx], vals)
+                if len(elems) == 2 and isinstance(elems[0], ir.Unit):
+                    return None if idx == 0 else payload
+                return (idx, payload)
+            case ir.FuncLit():
+                return {k: self._read(s, vals) for k, s in zip(self.keys(slot), slot.elems)}
+        raise ValueError(f"Cannot read {slot}")
+
+
+class SpecTemplate:
+    """A spec whose params are fixed per compile() and whose gen vars are
+    bound per instance.
+
+        tmpl = SpecTemplate(spec, gen_vars=["givens"])
+        sudoku9 = tmpl.compile(N=9)         # lowered once, then cached
+        sudoku9.solve(givens=clues)         # per instance: assumptions only
+    """
+    def __init__(self, spec: PuzzleSpec, gen_vars: tp.Iterable[str], max_dom_size: int = 10**6,
+                 seed: tp.Optional[int] = None, break_symmetries: bool = False):
+        self.spec = spec
+        self.gen_vars = tuple(gen_vars)
+        # With a seed, solutions are drawn at random (e.g. to generate puzzles)
+        self.seed = seed
+        self.break_symmetries = break_symmetries
+        # FDSolver needs every quantifier grounded
+        self.max_dom_size = max_dom_size
+        for name in self.gen_vars:
+            if spec.sym.get_sid(name) is None:
+                raise ValueError(f"{name} is not a var of {spec.name}")
+        self._compiled: tp.Dict[tp.Tuple, CompiledTemplate] = {}
+
+    def compile(self, **params) -> CompiledTemplate:
+        key = tuple(sorted(params.items()))
+        if key not in self._compiled:
+            self._compiled[key] = self._lower(params)
+        return self._compiled[key]
+
+    def _lower(self, params: tp.Mapping[str, tp.Any]) -> CompiledTemplate:
+        spec = self.spec
+        submap = SubMapping()
+        for name, val in params.items():
+            sid = spec.sym.get_sid(name)
+            if sid is None or name in self.gen_vars:
+                raise ValueError(f"{name} is not a param of {spec.name}")
+            submap.add(
+                match=lambda node, sid=sid: isinstance(node, ir.VarRef) and node.sid == sid,
+                replace=lambda node, val=ast.VExpr.make(val).node: val
+            )
+        if params:
+            spec = spec.transform(SubstitutionPass(), ctx=Context(submap))
+        spec = spec.transform(EncodeEnums(), ctx=Context(spec.envs_obj))
+        ctx = Context(spec.envs_obj)
+        spec_s = spec.transform(Scalarize(max_dom_size=self.max_dom_size, aggressive=True), ctx=ctx)
+        scalar_vars = ctx.get(ScalarVarsObj).vars
+        # Int/Bool vars are left as they are by Scalarize
+        free = {v.sid: v for v in spec_s.free_vars}
+        slots = {}
+        for sid, e in spec.sym.entries.items():
+            if sid in spec.sym and (v := scalar_vars.get(sid, free.get(sid))) is not None:
+                slots[e.name] = v
+        outputs = {name: s for name, s in slots.items() if name not in self.gen_vars}
+        slots = {name: slots[name] for name in self.gen_vars if name in slots}
+        spec_s = spec_s.optimize()
+        symmetries = None
+        if self.break_symmetries:
+            symmetries = SymmetryAnalysis()(spec_s._spec, ctx)
+        return CompiledTemplate(spec_s, slots, outputs, seed=self.seed, symmetries=symmetries)
@@ -3,6 +3,11 @@ from . import ir
 import typing as tp
 import itertools as it
 import functools as ft
+import math
+import operator
+import weakref
+
+import numpy as np
 
 def _is_type(T: ir.Type) -> bool:
     return isinstance(T, ir.Type)
@@ -25,10 +30,25 @@ def _is_value(V: ir.Value) -> bool:
 def _is_domain(V: ir.Value) -> bool:
     return _is_value(V) and _is_kind(V.T, ir.DomT)
 
+# Iterative DAG search: returns a node reachable from node satisfying pred (or None)
+def _find_node(node: ir.Node, pred: tp.Callable[[ir.Node], bool]) -> tp.Optional[ir.Node]:
+    seen = {node}
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if pred(n):
+            return n
+        for c in n.all_nodes:
+            if c not in seen:
+                seen.add(c)
+                stack.append(c)
+    return None
+
+def _any_node(node: ir.Node, pred: tp.Callable[[ir.Node], bool]) -> bool:
+    return _find_node(node, pred) is not None
+
 def _has_bv(bv: ir.BoundVarHOAS, node: ir.Node):
-    if node is bv:
-        return True
-    return any(_has_bv(bv, c) for c in node.all_nodes)
+    return _any_node(node, lambda n: n is bv)
     
 def _get_bvs(node: ir.Node) -> set[ir.BoundVarHOAS]:
     if isinstance(node, ir.BoundVarHOAS):
@@ -52,22 +72,31 @@ def _substitute(node: ir.Node, cache: tp.Mapping[ir.Node, ir.Node]):
     #    lam_T, lam_bv, lam_body = node.children
     #    if lam_bv == bv:
     #        raise ValueError(f"Cannot substitute into lambda placeholder {node}")
-    if node in cache:
-        return cache[node]
-    new_children = tuple(_substitute(c, cache) for c in node.children)
+    # Explicit-stack post-order: a node is rebuilt once all of its parts are in cache
+    stack = [(node, False)]
+    while stack:
+        n, expanded = stack.pop()
+        if n in cache:
+            continue
+        if not expanded:
+            stack.append((n, True))
+            stack.extend((c, False) for c in n.all_nodes if c not in cache)
+            continue
+        cache[n] = _rebuild(n, cache)
+    return cache[node]
+
+# Rebuilds node with every child and named child replaced by its entry in new
+def _rebuild(node: ir.Node, new: tp.Mapping[ir.Node, ir.Node]) -> ir.Node:
+    new_children = tuple(new[c] for c in node.children)
     if isinstance(node, ir.Value):
-        new_T = _substitute(node.T, cache)
-        new_obl = _substitute(node.obl, cache) if node.obl is not None else None
-        new_node = node.replace(*new_children, T=new_T, obl=new_obl)
+        new_obl = new[node.obl] if node.obl is not None else None
+        return node.replace(*new_children, T=new[node.T], obl=new_obl)
     elif isinstance(node, ir.Type):
-        new_ref = _substitute(node.ref, cache) if node.ref is not None else None
-        new_view = _substitute(node.view, cache) if node.view is not None else None
-        new_obl = _substitute(node.obl, cache) if node.obl is not None else None
-        new_node = node.replace(*new_children, ref=new_ref, view=new_view, obl=new_obl)
-    else:
-        new_node = node.replace(*new_children)
-    cache[node] = new_node
-    return new_node
+        new_ref = new[node.ref] if node.ref is not None else None
+        new_view = new[node.view] if node.view is not None else None
+        new_obl = new[node.obl] if node.obl is not None else None
+        return node.replace(*new_children, ref=new_ref, view=new_view, obl=new_obl)
+    return node.replace(*new_children)
 
 #def _applyT(lamT: ir.LambdaT, arg: ir.Value):
 #    assert isinstance(arg, ir.Value)
@@ -81,14 +110,10 @@ def _substitute(node: ir.Node, cache: tp.Mapping[ir.Node, ir.Node]):
 
 # Checks for any bound/free vars
 def _is_concrete(node: ir.Node):
-    if isinstance(node, (ir.VarRef, ir.BoundVar, ir.VarHOAS, ir.BoundVarHOAS)):
-        return False
-    return all(_is_concrete(c) for c in node.all_nodes)
+    return not _any_node(node, lambda n: isinstance(n, (ir.VarRef, ir.BoundVar, ir.VarHOAS, ir.BoundVarHOAS)))
 
 def _has_freevar(node: ir.Node):
-    if isinstance(node, ir.VarRef):
-        return True
-    return any(_has_freevar(c) for c in node.all_nodes)
+    return _any_node(node, lambda n: isinstance(n, ir.VarRef))
 
 def _unpack(node: ir.Node):
     if isinstance(node, ir.TupleLit):
@@ -100,4 +125,412 @@ def _unpack(node: ir.Node):
 def _lit_val(node: ir.Node) -> tp.Optional[int|bool]:
     if isinstance(node, ir.Lit):
         return node.val
-    return None
\ No newline at end of file
+    return None
+# ---- Finite domain enumeration ----
+#
+# _dom_size and _iterate give the size and the elements of a concrete finite
+# domain. Sizes follow from the domain's structure where it determines them
+# (Fin, Range, CartProd, DisjUnion, Slice, Singleton, Empty); DomLit, Image
+# and Restrict are enumerated once to drop duplicates. Domains of Ints or
+# flat Int tuples built from Fin/Range/CartProd (ast_nd.fin, nd_cartprod and
+# their Slices, Images and Restricts) also have an array form, _dom_arrays:
+# one NumPy index array per tuple component, so Images and Restricts of them
+# are evaluated once over the arrays rather than once per element.
+# Everything is cached per interned domain node.
+
+_NONE = object() # cached "not a concrete finite domain"
+_size_cache: 'weakref.WeakKeyDictionary[ir.Node, tp.Any]' = weakref.WeakKeyDictionary()
+_elems_cache: 'weakref.WeakKeyDictionary[ir.Node, tp.Any]' = weakref.WeakKeyDictionary()
+_arrays_cache: 'weakref.WeakKeyDictionary[ir.Node, tp.Any]' = weakref.WeakKeyDictionary()
+_table_cache: 'weakref.WeakKeyDictionary[ir.Node, tp.Any]' = weakref.WeakKeyDictionary()
+
+_EVAL_NARY = {
+    ir.Sum: operator.add,
+    ir.Prod: operator.mul,
+    ir.Conj: np.logical_and,
+    ir.Disj: np.logical_or,
+}
+
+_EVAL_BINARY = {
+    ir.Eq: operator.eq,
+    ir.Lt: operator.lt,
+    ir.LtEq: operator.le,
+    ir.Implies: lambda a, b: np.logical_or(np.logical_not(a), b),
+}
+
+_EVAL_UNARY = {
+    ir.Neg: operator.neg,
+    ir.Not: np.logical_not,
+    ir.Abs: abs,
+}
+
+def _eval(node: ir.Node, env: tp.Mapping[str, tp.Any], memo: tp.Optional[dict] = None) -> tp.Any:
+    """Value of an Int/Bool/tuple expression over literals and the bound
+    variables in env (by name), or None if it is not one. Values are ints,
+    bools, NumPy arrays (when env holds arrays) or tuples of these."""
+    if memo is None:
+        memo = {}
+    if node in memo:
+        return memo[node]
+    ev = lambda n: _eval(n, env, memo)
+    cls = type(node)
+    res = None
+    if cls is ir.Lit:
+        if isinstance(node.T, (ir.IntT, ir.BoolT)):
+            res = node.val
+    elif cls is ir.BoundVarHOAS:
+        res = env.get(node.name)
+    elif cls is ir.TupleLit:
+        vals = [ev(c) for c in node.children]
+        res = None if any(v is None for v in vals) else tuple(vals)
+    elif cls is ir.Proj:
+        v = ev(node.children[0])
+        res = v[node.idx] if isinstance(v, tuple) else None
+    else:
+        vals = [ev(c) for c in node.children]
+        if any(v is None or isinstance(v, tuple) for v in vals):
+            res = None
+        elif cls in _EVAL_NARY and vals:
+            res = ft.reduce(_EVAL_NARY[cls], vals)
+        elif cls in _EVAL_BINARY:
+            res = _EVAL_BINARY[cls](*vals)
+        elif cls in _EVAL_UNARY:
+            res = _EVAL_UNARY[cls](*vals)
+        elif cls in (ir.FloorDiv, ir.Mod, ir.TrueDiv):
+            a, b = vals
+            if not np.any(np.asarray(b) == 0):
+                if cls is ir.Mod:
+                    res = a % b
+                elif cls is ir.FloorDiv or not np.any(np.asarray(a % b) != 0):
+                    # TrueDiv only where it is exact
+                    res = a // b
+        elif cls is ir.Isqrt:
+            a, = vals
+            if isinstance(a, (int, np.integer)) and a >= 0:
+                res = math.isqrt(int(a))
+        elif cls is ir.Ite:
+            c, t, f = vals
+            if any(isinstance(v, np.ndarray) for v in vals):
+                res = np.where(c, t, f)
+            else:
+                res = t if c else f
+    memo[node] = res
+    return res
+
+def _int(node: ir.Node) -> tp.Optional[int]:
+    v = _eval(node, {})
+    if isinstance(v, (int, np.integer)) and not isinstance(v, (bool, np.bool_)):
+        return int(v)
+    return None
+
+def _pack(T: ir.Type, v: tp.Any) -> ir.Value:
+    """The literal of type T for the value v (see _eval)."""
+    if _is_kind(T, ir.TupleT):
+        return ir.TupleLit(T, *(_pack(cT, cv) for cT, cv in zip(T.rawT.children, v)))
+    if _is_kind(T, ir.BoolT):
+        return ir.Lit(T, bool(v))
+    return ir.Lit(T, int(v))
+
+def _is_flat(T: ir.Type) -> bool:
+    # Elements are Ints/Bools or tuples of them
+    if _is_kind(T, ir.TupleT):
+        return all(_is_kind(cT, (ir.IntT, ir.BoolT)) for cT in T.rawT.children)
+    return _is_kind(T, (ir.IntT, ir.BoolT))
+
+def _func_dom(func: ir.Node) -> tp.Optional[ir.Node]:
+    if isinstance(func, ir.FuncLit):
+        return func.children[0]
+    if isinstance(func, ir.LambdaHOAS):
+        return func.T.argT.ref
+    if isinstance(func, ir.Compose) and func.children:
+        return _func_dom(func.children[-1])
+    return None
+
+def _lams(func: ir.Node) -> tp.Tuple[ir.Node, ...]:
+    # The functions applied, first to last
+    if isinstance(func, ir.Compose):
+        return tuple(f for c in reversed(func.children) for f in _lams(c))
+    return (func,)
+
+def _apply(func: ir.Node, elem: ir.Value) -> tp.Optional[ir.Value]:
+    """func applied to the domain element elem: a literal for Int/Bool/tuple
+    results, the normalized node for domain and function results, or None if
+    the result is not concrete."""
+    from ..passes.transforms.nbe import normalize
+    from ..passes.transforms.beta_reduction import applyT
+    val = elem
+    for f in _lams(func):
+        if isinstance(f, ir.FuncLit):
+            i = f.layout.index(val)
+            if i is None:
+                return None
+            val = f.elems[i]
+        elif isinstance(f, ir.LambdaHOAS):
+            val = normalize(ir.Apply(applyT(f.T, val), f, val))
+        else:
+            return None
+        if _is_flat(val.T):
+            v = _eval(val, {})
+            if v is None:
+                return None
+            val = _pack(val.T, v)
+        elif not _is_kind(val.T, (ir.DomT, ir._PiT)):
+            return None
+    return val
+
+def _apply_arrays(func: ir.Node, val: tp.Any, size: int) -> tp.Any:
+    """func applied to every element at once, with val the elements in array
+    form (an array, or a tuple of arrays for tuples); None if func is not an
+    Int/Bool/tuple expression of its argument or a lookup into a FuncLit of
+    such values."""
+    from ..passes.transforms.nbe import normalize
+    for f in _lams(func):
+        if isinstance(f, ir.FuncLit):
+            table = _funclit_arrays(f)
+            if table is None:
+                return None
+            pos = _positions(f.children[0], _columns(val, size))
+            if pos is None or (pos < 0).any():
+                return None
+            val = tuple(c[pos] for c in table) if isinstance(table, tuple) else table[pos]
+        elif isinstance(f, ir.LambdaHOAS):
+            val = _eval(normalize(f).body, {f.bv_name: val})
+        else:
+            return None
+        if val is None:
+            return None
+    return val
+
+def _funclit_arrays(func: ir.FuncLit) -> tp.Any:
+    # The FuncLit's values in domain order, in array form
+    res = _arrays_cache.get(func)
+    if res is None:
+        vals = [_eval(e, {}) for e in func.elems]
+        dom_vals = list(_iterate(func.children[0])) if _dom_size(func.children[0]) == len(vals) else None
+        res = _NONE
+        if dom_vals is not None and vals and all(v is not None for v in vals):
+            # Reorder by layout so position i holds the value at the i-th element
+            order = [func.layout.index(e) for e in dom_vals]
+            if None not in order:
+                vals = [vals[i] for i in order]
+                if all(isinstance(v, tuple) for v in vals):
+                    res = tuple(np.array(c) for c in zip(*vals))
+                elif not any(isinstance(v, tuple) for v in vals):
+                    res = np.array(vals)
+        _arrays_cache[func] = res
+    return None if res is _NONE else res
+
+def _lookup_table(dom: ir.Node) -> tp.Optional[tp.Tuple[tp.List[int], np.ndarray]]:
+    """(lo, table) for a domain with _dom_arrays: table[c - lo] is the
+    position of the element with coordinates c, or -1 if c is in the
+    bounding box but not an element."""
+    res = _table_cache.get(dom)
+    if res is None:
+        cols = _dom_arrays(dom)
+        if cols is None:
+            res = _NONE
+        else:
+            size = len(cols[0])
+            lo = [int(a.min()) if size else 0 for a in cols]
+            shape = [int(a.max()) - l + 1 if size else 0 for a, l in zip(cols, lo)]
+            table = np.full(shape, -1, dtype=np.int64)
+            table[tuple(a - l for a, l in zip(cols, lo))] = np.arange(size)
+            table.flags.writeable = False
+            res = (lo, table)
+        _table_cache[dom] = res
+    return None if res is _NONE else res
+
+def _positions(dom: ir.Node, coords: tp.Sequence[np.ndarray]) -> tp.Optional[np.ndarray]:
+    """Position in dom's iteration order of each coordinate tuple, -1 for
+    those that are not elements; None if dom has no _dom_arrays."""
+    lookup = _lookup_table(dom)
+    if lookup is None or len(coords) != len(lookup[0]):
+        return None
+    lo, table = lookup
+    size = len(coords[0]) if coords else 0
+    if not table.size:
+        return np.full(size, -1, dtype=np.int64)
+    inside = np.ones(size, dtype=bool)
+    idx = []
+    for c, l, n in zip(coords, lo, table.shape):
+        c = np.asarray(c, dtype=np.int64) - l
+        inside &= (c >= 0) & (c < n)
+        idx.append(np.clip(c, 0, n-1))
+    return np.where(inside, table[tuple(idx)], -1)
+
+def _columns(val: tp.Any, size: int) -> tp.Tuple[np.ndarray, ...]:
+    vals = val if isinstance(val, tuple) else (val,)
+    return tuple(np.broadcast_to(v, (size,)) for v in vals)
+
+def _dom_arrays(dom: ir.Node) -> tp.Optional[tp.Tuple[np.ndarray, ...]]:
+    """The elements of dom in iteration order as one index array per tuple
+    component (a single array for Int domains), or None if dom is not a
+    concrete domain of Ints or flat Int tuples built from Fin/Range/CartProd."""
+    res = _arrays_cache.get(dom)
+    if res is None:
+        res = _dom_arrays_uncached(dom)
+        if res is not None:
+            for a in res:
+                a.flags.writeable = False
+        _arrays_cache[dom] = _NONE if res is None else res
+    return None if res is _NONE else res
+
+def _dom_arrays_uncached(dom: ir.Node) -> tp.Optional[tp.Tuple[np.ndarray, ...]]:
+    if not _is_domain(dom) or not _is_flat(dom.T.carT):
+        return None
+    match dom:
+        case ir.Fin(n) if (n := _int(n)) is not None:
+            return (np.arange(max(n, 0)),)
+        case ir.Range(lo, hi, step) if None not in (vals := tuple(_int(v) for v in (lo, hi, step))) and vals[2] != 0:
+            return (np.arange(*vals),)
+        case ir.CartProd():
+            cols = [_dom_arrays(d) for d in dom.children]
+            if any(c is None or len(c) != 1 or _is_kind(d.T.carT, ir.TupleT) for c, d in zip(cols, dom.children)):
+                return None
+            if not cols:
+                return None
+            grid = np.meshgrid(*(c[0] for c in cols), indexing='ij')
+            return tuple(g.reshape(-1) for g in grid)
+        case ir.Slice(base, lo, hi, step):
+            cols = _dom_arrays(base)
+            sl = tuple(_int(v) for v in (lo, hi, step))
+            if cols is None or None in sl or sl[2] == 0:
+                return None
+            return tuple(c[slice(*sl)] for c in cols)
+        case ir.Image(func) | ir.Restrict(func):
+            src = _func_dom(func)
+            cols = _dom_arrays(src) if src is not None else None
+            if cols is None:
+                return None
+            size = len(cols[0])
+            arg = tuple(cols) if _is_kind(src.T.carT, ir.TupleT) else cols[0]
+            val = _apply_arrays(func, arg, size)
+            if val is None:
+                return None
+            if isinstance(dom, ir.Restrict):
+                if isinstance(val, tuple):
+                    return None
+                mask = np.broadcast_to(np.asarray(val, dtype=bool), (size,))
+                return tuple(c[mask] for c in cols)
+            out = _columns(val, size)
+            if len(out) != (len(dom.T.carT.rawT.children) if _is_kind(dom.T.carT, ir.TupleT) else 1):
+                return None
+            if size == 0:
+                return out
+            # Keep the first occurrence of each element, in order
+            _, first = np.unique(np.stack(out), axis=1, return_index=True)
+            first.sort()
+            return tuple(c[first] for c in out)
+    return None
+
+def _dom_size(dom: ir.Node) -> tp.Optional[int]:
+    """The number of elements of dom, or None if dom is not a concrete finite
+    domain."""
+    res = _size_cache.get(dom)
+    if res is None:
+        res = _dom_size_uncached(dom)
+        _size_cache[dom] = _NONE if res is None else res
+    return None if res is _NONE else res
+
+def _dom_size_uncached(dom: ir.Node) -> tp.Optional[int]:
+    match dom:
+        case ir.Empty():
+            return 0
+        case ir.Singleton():
+            return 1
+        case ir.Fin(n) if (n := _int(n)) is not None:
+            return max(n, 0)
+        case ir.Range(lo, hi, step) if None not in (vals := tuple(_int(v) for v in (lo, hi, step))) and vals[2] != 0:
+            return len(range(*vals))
+        case ir.CartProd() | ir.DisjUnion():
+            sizes = [_dom_size(d) for d in dom.children]
+            if None in sizes:
+                return None
+            return math.prod(sizes) if isinstance(dom, ir.CartProd) else sum(sizes)
+        case ir.Slice(base, lo, hi, step):
+            n = _dom_size(base)
+            sl = tuple(_int(v) for v in (lo, hi, step))
+            if n is None or None in sl or sl[2] == 0:
+                return None
+            return len(range(n)[slice(*sl)])
+    if (cols := _dom_arrays(dom)) is not None:
+        return len(cols[0])
+    elems = _elements(dom)
+    return None if elems is None else len(elems)
+
+def _elements(dom: ir.Node) -> tp.Optional[tp.List[ir.Value]]:
+    """All elements of a DomLit, Image or Restrict, without duplicates (cached
+    by _iterate), or None if they are not concrete."""
+    elems = _elems_cache.get(dom)
+    if elems is not None:
+        return None if elems is _NONE else elems
+    match dom:
+        case ir.DomLit():
+            vals = list(dom.children)
+            if not all(_is_concrete(v) for v in vals):
+                vals = None
+        case ir.Image(func) | ir.Restrict(func):
+            src = _func_dom(func)
+            vals = None
+            if src is not None and _dom_size(src) is not None:
+                vals = []
+                for e in _iterate(src):
+                    r = _apply(func, e)
+                    if r is None or (isinstance(dom, ir.Restrict) and not isinstance(r, ir.Lit)):
+                        vals = None
+                        break
+                    if isinstance(dom, ir.Image):
+                        vals.append(r)
+                    elif r.val is True:
+                        vals.append(e)
+        case _:
+            vals = None
+    if vals is not None:
+        # Elements are interned, so duplicates are the same node
+        vals = list(dict.fromkeys(vals))
+    _elems_cache[dom] = _NONE if vals is None else vals
+    return vals
+
+def _iterate(dom: ir.Node) -> tp.Iterator[ir.Value]:
+    """The elements of the finite domain dom in iteration order, generated
+    lazily and cached once exhausted. Raises ValueError if dom is not a
+    concrete finite domain."""
+    if _dom_size(dom) is None:
+        raise ValueError(f"Cannot enumerate domain {dom}")
+    elems = _elems_cache.get(dom)
+    if elems is None and (cols := _dom_arrays(dom)) is not None:
+        carT = dom.T.carT
+        vals = zip(*(c.tolist() for c in cols)) if _is_kind(carT, ir.TupleT) else cols[0].tolist()
+        elems = [_pack(carT, v) for v in vals]
+        _elems_cache[dom] = elems
+    if elems is None:
+        elems = _elements(dom)
+    if elems is not None:
+        yield from elems
+        return
+    out = []
+    for e in _generate(dom):
+        out.append(e)
+        yield e
+    _elems_cache[dom] = out
+
+def _generate(dom: ir.Node) -> tp.Iterator[ir.Value]:
+    carT = dom.T.carT
+    match dom:
+        case ir.Singleton(v):
+            yield v
+        case ir.Fin(n):
+            for i in range(max(_int(n), 0)):
+                yield ir.Lit(carT, i)
+        case ir.Range(lo, hi, step):
+            for i in range(_int(lo), _int(hi), _int(step)):
+                yield ir.Lit(carT, i)
+        case ir.CartProd():
+            for es in it.product(*(list(_iterate(d)) for d in dom.children)):
+                yield ir.TupleLit(carT, *es)
+        case ir.DisjUnion():
+            for i, d in enumerate(dom.children):
+                for e in _iterate(d):
+                    yield ir.Inj(carT, e, idx=i)
+        case ir.Slice(base, lo, hi, step):
+            yield from list(_iterate(base))[_int(lo):_int(hi):_int(step)]
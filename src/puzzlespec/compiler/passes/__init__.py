@@ -1 +1 @@
-from .pass_base import PassManager, Context, Transform, Analysis, AnalysisObject
\ No newline at end of file
+from .pass_base import PassManager, Context, Transform, Analysis, AnalysisObject, FusedTransform
\ No newline at end of file
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import typing as tp
 
-from ..pass_base import Analysis, AnalysisObject, Context, handles
+from ..pass_base import Analysis, AnalysisObject, Context, VCType, VCValue, handles
 from ...dsl import ir
 from ..envobj import EnvsObj
 
@@ -26,15 +26,30 @@ class VarGetter(Analysis):
         return VarSet(self.visit(root))
 
     def visit(self, node: ir.Node):
-        vars: tp.List[tp.Set[ir.Node]] = self.visit_children(node)
+        return self._union(self.visit_children(node))
+
+    @staticmethod
+    def _union(vc) -> tp.Set[ir.Node]:
+        # Vars referenced only by a type, refinement or obligation (e.g. in
+        # the domain of a quantifier) are free vars too
+        if isinstance(vc, (VCValue, VCType)):
+            vars: tp.List[tp.Set[ir.Node]] = list(vc.children)
+        else:
+            vars = list(vc)
+        if isinstance(vc, VCValue):
+            vars += [vc.T, vc.obl]
+        elif isinstance(vc, VCType):
+            vars += [vc.ref, vc.view, vc.obl]
         val = set()
         for pset in vars:
-            val |= pset
-        return val       
+            if pset:
+                val |= pset
+        return val
 
     @handles(ir.VarRef)
     def _(self, node: ir.VarRef):
-        return set([node])
+        # With the vars of its type, e.g. N in Fin(N) -> Digits
+        return {node} | self._union(self.visit_children(node))
         #if node.sid not in self.nmap:
         #    self.nmap[node.sid] = ir.VarRef(node.T.rawT, node.sid, node.name)
         #return set([self.nmap[node.sid]])
@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import math
+import typing as tp
+
+from ..pass_base import Analysis, AnalysisObject, Context, handles
+from ...dsl import ir, utils
+
+# Integer interval analysis.
+#
+# Every Int-valued node gets a sound interval [lo, hi] of the values it can
+# take: the hull of what its operation allows given its operands' intervals,
+# intersected with the bounds of its type's refinement. Refinements are read
+# off the domain: Fin(n) is [0, n-1], Range(lo, hi, step) lies between its
+# endpoints, a DomLit or FuncLit Image is the hull of its elements, and a
+# Restrict by a predicate (e.g. Nat, {b | 0 < b}) is tightened by the
+# comparisons of the bound var against bounded terms in the predicate.
+#
+# Internally unbounded ends are -inf/inf; Intervals.of reports them as None.
+
+Interval = tp.Tuple[tp.Union[int, float], tp.Union[int, float]]
+
+_TOP: Interval = (-math.inf, math.inf)
+
+def _meet(a: Interval, b: Interval) -> Interval:
+    return (max(a[0], b[0]), min(a[1], b[1]))
+
+def _hull(*ivs: Interval) -> Interval:
+    if not ivs:
+        return _TOP
+    return (min(i[0] for i in ivs), max(i[1] for i in ivs))
+
+def _add(a: Interval, b: Interval) -> Interval:
+    return (a[0] + b[0], a[1] + b[1])
+
+def _mul1(x, y):
+    # 0 * inf is 0 here: the finite side is exactly 0
+    return 0 if x == 0 or y == 0 else x * y
+
+def _mul(a: Interval, b: Interval) -> Interval:
+    ps = [_mul1(x, y) for x in a for y in b]
+    return (min(ps), max(ps))
+
+def _neg(a: Interval) -> Interval:
+    return (-a[1], -a[0])
+
+def _abs(a: Interval) -> Interval:
+    if a[0] >= 0:
+        return a
+    if a[1] <= 0:
+        return _neg(a)
+    return (0, max(-a[0], a[1]))
+
+def _floordiv1(x, y):
+    if math.isinf(x) or math.isinf(y):
+        if math.isinf(y) and not math.isinf(x):
+            # x // (+-inf) tends to 0 or -1
+            return 0 if (x >= 0) == (y > 0) else -1
+        return math.inf if (x > 0) == (y > 0) else -math.inf
+    return x // y
+
+def _floordiv(a: Interval, b: Interval) -> Interval:
+    # Floor division is monotone in a and, for divisors of one sign, in b, so
+    # the bounds are at the corners of each sign's part of b
+    parts = [p for p in ((max(b[0], 1), b[1]), (b[0], min(b[1], -1))) if p[0] <= p[1]]
+    if not parts:
+        return _TOP
+    qs = [_floordiv1(x, y) for lo, hi in parts for x in a for y in (lo, hi)]
+    return (min(qs), max(qs))
+
+def _mod(a: Interval, b: Interval) -> Interval:
+    # Floor modulus takes the divisor's sign and is smaller in magnitude
+    m = max(abs(b[0]), abs(b[1])) - 1
+    lo = 0 if b[0] > 0 else -m
+    hi = 0 if b[1] < 0 else m
+    if b[0] > 0 and a[0] >= 0:
+        # Nonnegative dividend: a % b <= a
+        hi = min(hi, a[1])
+    return (lo, hi)
+
+def _isqrt(a: Interval) -> Interval:
+    lo = math.isqrt(int(a[0])) if 0 < a[0] < math.inf else 0
+    hi = a[1] if math.isinf(a[1]) else math.isqrt(max(int(a[1]), 0))
+    return (lo, hi)
+
+def _is_int(node: ir.Node) -> bool:
+    return isinstance(node, ir.Value) and isinstance(node.T, ir.IntT)
+
+def _width(iv: Interval) -> tp.Optional[int]:
+    """Bits of the smallest two's complement bitvector holding iv."""
+    lo, hi = iv
+    if math.isinf(lo) or math.isinf(hi):
+        return None
+    w = 1
+    while not (-(1 << (w-1)) <= lo and hi <= (1 << (w-1)) - 1):
+        w += 1
+    return w
+
+
+class Intervals(AnalysisObject):
+    def __init__(self, intervals: tp.Dict[ir.Node, Interval]):
+        self.intervals = intervals
+
+    def of(self, node: ir.Node) -> tp.Optional[tp.Tuple[tp.Optional[int], tp.Optional[int]]]:
+        """The interval of an Int-valued node (None for an unbounded end), or
+        None if the node was not analyzed."""
+        iv = self.intervals.get(node)
+        if iv is None:
+            return None
+        return tuple(None if math.isinf(v) else int(v) for v in iv)
+
+    def width(self, node: ir.Node) -> tp.Optional[int]:
+        """Bits of the smallest signed bitvector holding every value of node,
+        or None if it is unbounded."""
+        iv = self.intervals.get(node)
+        return None if iv is None else _width(iv)
+
+
+class IntervalAnalysis(Analysis):
+    requires = ()
+    produces = (Intervals,)
+    name = "intervals"
+
+    def run(self, root: ir.Node, ctx: Context) -> Intervals:
+        self.visit(root)
+        return Intervals({n: iv for n, iv in self._cache.items() if iv is not None})
+
+    def _iv(self, node: ir.Node) -> Interval:
+        iv = self.visit(node)
+        return _TOP if iv is None else iv
+
+    def _typed(self, node: ir.Node, iv: Interval) -> tp.Optional[Interval]:
+        if not _is_int(node):
+            return None
+        ref = node.T.ref
+        if ref is not None:
+            iv = _meet(iv, self._dom(ref))
+        return iv
+
+    def _dom(self, dom: ir.Node) -> Interval:
+        """Bounds on the elements of an Int domain."""
+        match dom:
+            case ir.Fin(n):
+                return (0, self._iv(n)[1] - 1)
+            case ir.Range(lo, hi, step):
+                lo, hi, step = self._iv(lo), self._iv(hi), self._iv(step)
+                if step[0] > 0:
+                    return (lo[0], hi[1] - 1)
+                if step[1] < 0:
+                    return (hi[0] + 1, lo[1])
+                return _hull(lo, (hi[0] + 1, hi[1] - 1))
+            case ir.DomLit():
+                return _hull(*(self._iv(e) for e in dom.children))
+            case ir.Singleton(e):
+                return self._iv(e)
+            case ir.Slice(d, _, _, _):
+                return self._dom(d)
+            case ir.Restrict(lam) if isinstance(lam, ir.LambdaHOAS):
+                return self._restrict(lam)
+            case ir.Image(func):
+                return self._codom(func)
+        return _TOP
+
+    def _restrict(self, lam: ir.LambdaHOAS) -> Interval:
+        iv = _TOP
+        argT = lam.T.argT if isinstance(lam.T, ir.PiTHOAS) else None
+        if isinstance(argT, ir.IntT) and argT.ref is not None:
+            iv = self._dom(argT.ref)
+        is_bv = lambda n: isinstance(n, ir.BoundVarHOAS) and n.name == lam.bv_name
+        preds = [lam.body]
+        while preds:
+            p = preds.pop()
+            if isinstance(p, ir.Conj):
+                preds.extend(p.children)
+                continue
+            if not isinstance(p, (ir.Lt, ir.LtEq, ir.Eq)):
+                continue
+            a, b = p.children
+            strict = isinstance(p, ir.Lt)
+            if is_bv(a) and not is_bv(b):
+                bound = self._iv(b)
+                if isinstance(p, ir.Eq):
+                    iv = _meet(iv, bound)
+                else:
+                    iv = _meet(iv, (-math.inf, bound[1] - strict))
+            elif is_bv(b) and not is_bv(a):
+                bound = self._iv(a)
+                if isinstance(p, ir.Eq):
+                    iv = _meet(iv, bound)
+                else:
+                    iv = _meet(iv, (bound[0] + strict, math.inf))
+        return iv
+
+    def _codom(self, func: ir.Node) -> Interval:
+        """Bounds on the values of a function."""
+        if isinstance(func, ir.FuncLit):
+            return _hull(*(self._iv(e) for e in func.elems))
+        if isinstance(func, ir.TupleLit):
+            return _hull(*(self._iv(e) for e in func.children))
+        if isinstance(func, ir.LambdaHOAS):
+            return self._iv(func.body)
+        if isinstance(func, ir.Compose) and func.children:
+            # The outermost function is applied last
+            return self._codom(func.children[0])
+        resT = getattr(func.T, "resT", None)
+        if isinstance(resT, ir.IntT) and resT.ref is not None:
+            return self._dom(resT.ref)
+        return _TOP
+
+    def _card_max(self, dom: ir.Node) -> tp.Union[int, float]:
+        """An upper bound on the size of dom."""
+        size = utils._dom_size(dom)
+        if size is not None:
+            return size
+        match dom:
+            case ir.Fin(n):
+                return max(self._iv(n)[1], 0)
+            case ir.DomLit():
+                return len(dom.children)
+            case ir.Restrict(lam) if isinstance(lam, ir.LambdaHOAS) and isinstance(lam.T, ir.PiTHOAS):
+                argT = lam.T.argT
+                if argT.ref is not None:
+                    return self._card_max(argT.ref)
+            case ir.Slice(d, _, _, _):
+                return self._card_max(d)
+            case ir.CartProd():
+                bounds = [self._card_max(d) for d in dom.children]
+                return 0 if 0 in bounds else math.prod(bounds)
+        return math.inf
+
+    def _elems(self, func: ir.Node) -> tp.Optional[tp.Sequence[Interval]]:
+        if isinstance(func, ir.TupleLit):
+            return [self._iv(e) for e in func.children]
+        if isinstance(func, ir.FuncLit):
+            return [self._iv(e) for e in func.elems]
+        return None
+
+    def visit(self, node: ir.Node):
+        # Everything else is bounded by its type alone
+        self.visit_children(node)
+        return self._typed(node, _TOP)
+
+    @handles(ir.Lit)
+    def _(self, node: ir.Lit):
+        self.visit_children(node)
+        if not _is_int(node):
+            return None
+        return (node.val, node.val)
+
+    @handles(ir.Sum)
+    def _(self, node: ir.Sum):
+        iv = (0, 0)
+        for c in node.children:
+            iv = _add(iv, self._iv(c))
+        return self._typed(node, iv)
+
+    @handles(ir.Prod)
+    def _(self, node: ir.Prod):
+        iv = (1, 1)
+        for c in node.children:
+            iv = _mul(iv, self._iv(c))
+        return self._typed(node, iv)
+
+    @handles(ir.Neg)
+    def _(self, node: ir.Neg):
+        return self._typed(node, _neg(self._iv(node.children[0])))
+
+    @handles(ir.Abs)
+    def _(self, node: ir.Abs):
+        return self._typed(node, _abs(self._iv(node.children[0])))
+
+    @handles(ir.FloorDiv)
+    def _(self, node: ir.FloorDiv):
+        a, b = node.children
+        return self._typed(node, _floordiv(self._iv(a), self._iv(b)))
+
+    @handles(ir.Mod)
+    def _(self, node: ir.Mod):
+        a, b = node.children
+        return self._typed(node, _mod(self._iv(a), self._iv(b)))
+
+    @handles(ir.Isqrt)
+    def _(self, node: ir.Isqrt):
+        return self._typed(node, _isqrt(self._iv(node.children[0])))
+
+    @handles(ir.Ite)
+    def _(self, node: ir.Ite):
+        _, t, f = node.children
+        self.visit_children(node)
+        return self._typed(node, _hull(self._iv(t), self._iv(f)))
+
+    @handles(ir.Card)
+    def _(self, node: ir.Card):
+        self.visit_children(node)
+        size = utils._dom_size(node.children[0])
+        if size is not None:
+            return self._typed(node, (size, size))
+        return self._typed(node, (0, self._card_max(node.children[0])))
+
+    @handles(ir.Apply)
+    def _(self, node: ir.Apply):
+        self.visit_children(node)
+        return self._typed(node, self._codom(node.children[0]))
+
+    @handles(ir.SumReduce)
+    def _(self, node: ir.SumReduce):
+        self.visit_children(node)
+        func = node.children[0]
+        elems = self._elems(func)
+        if elems is not None:
+            iv = (0, 0)
+            for e in elems:
+                iv = _add(iv, e)
+        else:
+            # Up to card(dom) values of the body
+            body = self._codom(func)
+            n = math.inf
+            if isinstance(func.T, ir.PiTHOAS) and func.T.argT.ref is not None:
+                n = self._card_max(func.T.argT.ref)
+            iv = _hull((0, 0), _mul((0, n), body))
+        return self._typed(node, iv)
+
+    @handles(ir.ProdReduce)
+    def _(self, node: ir.ProdReduce):
+        self.visit_children(node)
+        elems = self._elems(node.children[0])
+        iv = _TOP
+        if elems is not None:
+            iv = (1, 1)
+            for e in elems:
+                iv = _mul(iv, e)
+        return self._typed(node, iv)
+
+
+def get_intervals(node: ir.Node) -> Intervals:
+    return IntervalAnalysis()(node, Context())
@@ -19,6 +19,9 @@ class _Map:
         self.Tmap[key] = value
 
 class TypeMap(AnalysisObject):
+    # Nodes are interned, so a node's type outlives the tree it was checked in
+    incremental = True
+
     def __init__(self, Tmap: tp.Dict[ir.Node, ir.Type]):
         self.Tmap = Tmap
 
@@ -32,9 +35,50 @@ class TypeCheckingPass(Analysis):
     def run(self, root: ir.Node, ctx: Context) -> AnalysisObject:
         self.bctx: tp.List[ir.Type] = []
         self.Tmap = _Map()
+        # Only check nodes the last (invalidated) run has not seen
+        stale = ctx.stale(TypeMap)
+        if stale is not None:
+            self._seed(root, stale.Tmap.Tmap)
         self.visit(root)
         return TypeMap(self.Tmap)
 
+    def _seed(self, root: ir.Node, old: tp.Dict[ir.Node, ir.Type]):
+        """Copies the types of old that belong to nodes under root, so the
+        map does not keep the dropped parts of earlier trees."""
+        seen = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            T = old.get(node)
+            if T is not None:
+                self.Tmap[node] = T
+                self._cache[node] = T
+            stack.extend(node.all_nodes)
+
+    # BoundVar types are looked up in the binder context (bctx), which holds
+    # the argument type of each Lambda and PiT the walk is in the body of
+    def _parts(self, node: ir.Node):
+        if isinstance(node, ir.Lambda):
+            body, = node.children
+            return tuple(c for c in node.all_nodes if c is not body), body
+        if isinstance(node, ir.PiT):
+            argT, resT = node.children
+            return tuple(c for c in node.all_nodes if c is not resT), resT
+        return node.all_nodes, None
+
+    def _enter(self, node: ir.Node):
+        if isinstance(node, ir.Lambda):
+            argT = self.visit(node.T).argT
+        else:
+            argT = self.visit(node.children[0])
+        self.bctx.append(argT)
+
+    def _exit(self, node: ir.Node):
+        self.bctx.pop()
+
     def check_node_attrs(self, node: ir.Node):
         """Type-check the named children (obl, ref, view) on any node."""
         if isinstance(node, ir.Value):
@@ -136,13 +180,10 @@ class TypeCheckingPass(Analysis):
         if not _is_type(argT):
             raise TypeError(f"LambdaT argT must be a type, got {argT}")
         new_argT = self.visit(argT)
-        self.bctx.append(new_argT)
-        # Visit body and get its type
+        # The body was checked with new_argT bound (see _enter)
         new_resT = self.visit(resT)
         if not _is_type(new_resT):
             raise TypeError(f"LambdaT body must be a type, got {new_resT}")
-        # Pop bound context
-        self.bctx.pop()
         T = ir.PiT(new_argT, new_resT)
         self.Tmap[node] = T
         return T
@@ -215,21 +256,18 @@ class TypeCheckingPass(Analysis):
     def _(self, node: ir.Lambda):
         self.check_node_attrs(node)
         # Verify type is LambdaT
-        lamT, body = node.children
-        argT, resT = self.visit(lamT)
+        body, = node.children
+        lamT = self.visit(node.T)
+        argT, resT = lamT.argT, lamT.resT
         # Verify body is a Value
         if not _is_value(body):
             raise TypeError(f"Lambda body must be a Value, got {body}")
-        # Push parameter type onto bound context for body checking
-        self.bctx.append(argT)
-        # Visit body and get its type
+        # The body was checked with argT bound (see _enter)
         bodyT = self.visit(body)
-        # Pop bound context
-        self.bctx.pop()
         # Verify body type matches LambdaT result type
         if not _is_same_kind(bodyT, resT):
             raise TypeError(f"Lambda body type {bodyT} does not match LambdaT result type {resT}")
-        T = ir.ArrowT(argT, resT)
+        T = lamT
         self.Tmap[node] = T
         return T
 
@@ -809,9 +847,9 @@ class TypeCheckingPass(Analysis):
     @handles(ir.FuncLit)
     def _(self, node: ir.FuncLit):
         T, domT, *elemsT = self.visit_children(node)
-        # Verify type is FuncT
-        if not _is_kind(T, ir.FuncT):
-            raise TypeError(f"FuncLit must have FuncT type, got {T}")
+        # Verify type is a PiT
+        if not _is_kind(T, ir._PiT):
+            raise TypeError(f"FuncLit must have PiT type, got {T}")
         # Verify domain argument is a domain
         if not _is_kind(domT, ir.DomT):
             raise TypeError(f"FuncLit expects domain argument, got {domT}")
@@ -819,8 +857,8 @@ class TypeCheckingPass(Analysis):
             if len(elemsT) != len(node.layout.val_map):
                 raise TypeError(f"FuncLit has {len(elemsT)} elements but layout has {len(node.layout.val_map)} elements")
             for i, elemT in enumerate(elemsT):
-                if not _is_same_kind(elemT, T.piT.resT):
-                    raise TypeError(f"FuncLit element {i} type {elemT} does not match function result type {T.piT.resT}")
+                if not _is_same_kind(elemT, T.resT):
+                    raise TypeError(f"FuncLit element {i} type {elemT} does not match function result type {T.resT}")
         elif isinstance(node.layout, ir._SparseLayout):
             raise NotImplementedError("SparseFuncLit not implemented")
         else:
@@ -1117,6 +1155,9 @@ class StripType(Analysis):
         # Only recurse into _children (Type nodes), skip named children (ref/view/obl)
         return tuple(self.visit(c) for c in node.children)
 
+    def _parts(self, node: ir.Node):
+        return node.children, None
+
     ##############################
     ## Core-level IR Type nodes
     ##############################
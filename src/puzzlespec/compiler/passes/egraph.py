@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+import math
+import typing as tp
+
+from ..dsl import ir
+from .pass_base import Transform
+
+# An e-node is an IR node whose all_nodes are replaced by e-class ids. The
+# head holds the rest of the node's _key (opcode, fields) plus the number of
+# definitional children and which named children are present, so two e-nodes
+# are congruent exactly when their heads match and their args are in the same
+# e-classes. Types and obligations are therefore shared and rewritten too.
+class ENode(tp.NamedTuple):
+    head: tp.Tuple[tp.Any, ...]
+    args: tp.Tuple[int, ...]
+
+class EClass:
+    __slots__ = ('id', 'nodes', 'parents')
+
+    def __init__(self, cid: int):
+        self.id = cid
+        # e-node -> insertion stamp (later e-nodes win cost ties)
+        self.nodes: tp.Dict[ENode, int] = {}
+        self.parents: tp.List[tp.Tuple[ENode, int]] = []
+
+CostModel = tp.Callable[[ir.Node, tp.Sequence[float]], float]
+
+def node_count(node: ir.Node, child_costs: tp.Sequence[float]) -> float:
+    return 1 + sum(child_costs)
+
+def _card(dom: tp.Optional[ir.Node]) -> tp.Optional[int]:
+    match dom:
+        case ir.Fin(ir.Lit() as n):
+            return n.val
+        case ir.Range(ir.Lit() as lo, ir.Lit() as hi, ir.Lit() as step):
+            return len(range(lo.val, hi.val, step.val))
+        case ir.Singleton():
+            return 1
+        case ir.Empty():
+            return 0
+        case ir.DomLit():
+            return len(dom.children)
+        case ir.CartProd():
+            sizes = [_card(d) for d in dom.children]
+            if None in sizes:
+                return None
+            return math.prod(sizes)
+    return None
+
+def grounding_size(node: ir.Node, child_costs: tp.Sequence[float], unknown: int = 16) -> float:
+    """Approximate size of the node once quantifiers are grounded: the body of
+    a lambda counts once per element of its domain (unknown domains count as
+    `unknown` elements)."""
+    if isinstance(node, ir._Lambda):
+        argT = node.T.children[0]
+        size = _card(argT.ref) if isinstance(argT, ir.Type) else None
+        return 1 + (unknown if size is None else size) * sum(child_costs)
+    return 1 + sum(child_costs)
+
+def _head(node: ir.Node) -> tp.Tuple[tp.Any, ...]:
+    opcode, fields, children, named = node._key
+    return (opcode, fields, len(children), tuple(nc is not None for nc in named))
+
+def _instantiate(template: ir.Node, args: tp.Sequence[ir.Node]) -> ir.Node:
+    """Rebuilds template with args in place of its all_nodes."""
+    numc = len(template.children)
+    named = iter(args[numc:])
+    kwargs = {
+        name: (next(named) if nc is not None else None)
+        for name, nc in zip(template._named_children, template._key[3])
+    }
+    return template.replace(*args[:numc], **kwargs)
+
+
+class Rule:
+    """A rewrite rule over Values: apply returns a node equal to node, or None."""
+    name: str = "rule"
+
+    def apply(self, node: ir.Value) -> tp.Optional[ir.Node]:
+        raise NotImplementedError()
+
+class HandlerRule(Rule):
+    """The @handles rules of a Transform, applied to one node at a time.
+
+    The node's children are already e-class representatives, so the pass's
+    child visits return them unchanged. The pass instance is owned by the rule
+    from then on. Only passes FusedTransform accepts can be used.
+    """
+    def __init__(self, p: Transform):
+        if not (isinstance(p, Transform) and p.enable_memoization and p.iterative and not p.requires):
+            raise ValueError(f"Cannot use {type(p).__name__} as a rewrite rule")
+        self.p = p
+        self.name = p.name
+        p._bframes = []
+        p.visit = lambda node: node
+
+    def apply(self, node: ir.Value) -> tp.Optional[ir.Node]:
+        return self.p._dispatch[type(node)](self.p, node)
+
+
+class EGraph:
+    """Union-find over e-classes of hash-consed e-nodes, rebuilt egg-style.
+
+    add/union leave congruence to be restored by rebuild(); saturate() runs
+    rules to a fixed point (or a limit) and extract() picks the cheapest term.
+    """
+    def __init__(self):
+        self._parent: tp.List[int] = []
+        self.classes: tp.Dict[int, EClass] = {}
+        self._memo: tp.Dict[ENode, int] = {}
+        self._templates: tp.Dict[tuple, ir.Node] = {}
+        self._terms: tp.Dict[ir.Node, int] = {}
+        self._worklist: tp.List[int] = []
+        # Classes added or merged into since saturate() last looked, and the
+        # rules and cheapest e-nodes it last saw
+        self._dirty: tp.Set[int] = set()
+        self._saturated: tp.Tuple[tp.Tuple[Rule, ...], tp.Dict[int, ENode]] = ((), {})
+        self._stamp = 0
+
+    def __len__(self):
+        return len(self._memo)
+
+    def find(self, cid: int) -> int:
+        root = cid
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[cid] != root:
+            self._parent[cid], cid = root, self._parent[cid]
+        return root
+
+    def canonicalize(self, enode: ENode) -> ENode:
+        return ENode(enode.head, tuple(self.find(a) for a in enode.args))
+
+    def add(self, enode: ENode) -> int:
+        enode = self.canonicalize(enode)
+        cid = self._memo.get(enode)
+        if cid is not None:
+            return self.find(cid)
+        cid = len(self._parent)
+        self._parent.append(cid)
+        eclass = EClass(cid)
+        self._stamp += 1
+        eclass.nodes[enode] = self._stamp
+        self.classes[cid] = eclass
+        for a in set(enode.args):
+            self.classes[a].parents.append((enode, cid))
+        self._memo[enode] = cid
+        self._dirty.add(cid)
+        return cid
+
+    def add_term(self, node: ir.Node) -> int:
+        """Adds node and all of its sub-nodes, returns its e-class."""
+        terms = self._terms
+        stack = [(node, False)]
+        while stack:
+            n, expanded = stack.pop()
+            if n in terms:
+                continue
+            if not expanded:
+                stack.append((n, True))
+                stack.extend((c, False) for c in n.all_nodes)
+                continue
+            head = _head(n)
+            self._templates.setdefault(head, n)
+            terms[n] = self.add(ENode(head, tuple(terms[c] for c in n.all_nodes)))
+        return self.find(terms[node])
+
+    def union(self, a: int, b: int) -> bool:
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        ca, cb = self.classes[a], self.classes[b]
+        if len(ca.parents) < len(cb.parents):
+            a, b, ca, cb = b, a, cb, ca
+        self._parent[b] = a
+        ca.nodes.update(cb.nodes)
+        ca.parents.extend(cb.parents)
+        del self.classes[b]
+        self._worklist.append(a)
+        self._dirty.add(a)
+        return True
+
+    def rebuild(self):
+        while self._worklist:
+            todo = {self.find(c) for c in self._worklist}
+            self._worklist = []
+            for cid in todo:
+                self._repair(self.find(cid))
+
+    def _repair(self, cid: int):
+        eclass = self.classes[cid]
+        for pnode, pcid in eclass.parents:
+            self._memo.pop(pnode, None)
+            self._memo[self.canonicalize(pnode)] = self.find(pcid)
+        new_parents: tp.Dict[ENode, int] = {}
+        for pnode, pcid in eclass.parents:
+            pnode = self.canonicalize(pnode)
+            if pnode in new_parents:
+                self.union(pcid, new_parents[pnode])
+            new_parents[pnode] = self.find(pcid)
+        if self.find(cid) != cid:
+            # Merged by a congruence found above; the merged class is queued
+            return
+        eclass.parents = list(new_parents.items())
+        nodes: tp.Dict[ENode, int] = {}
+        for n, stamp in eclass.nodes.items():
+            n = self.canonicalize(n)
+            nodes[n] = max(stamp, nodes.get(n, 0))
+        eclass.nodes = nodes
+
+    def costs(self, cost: CostModel = node_count) -> tp.Dict[int, tp.Tuple[float, int, ENode]]:
+        """Cheapest e-node of every e-class as (cost, -stamp, e-node).
+
+        The cost of an e-node must exceed the cost of each of its children,
+        which keeps the chosen e-nodes acyclic.
+        """
+        best: tp.Dict[int, tp.Tuple[float, int, ENode]] = {}
+        changed = True
+        while changed:
+            changed = False
+            for cid, eclass in self.classes.items():
+                for n, stamp in eclass.nodes.items():
+                    child_best = [best.get(self.find(a)) for a in n.args]
+                    if None in child_best:
+                        continue
+                    c = (cost(self._templates[n.head], [b[0] for b in child_best]), -stamp, n)
+                    if cid not in best or c[:2] < best[cid][:2]:
+                        best[cid] = c
+                        changed = True
+        return best
+
+    def _build(self, cid: int, best, built: tp.Dict[int, ir.Node]) -> ir.Node:
+        stack = [(self.find(cid), False)]
+        while stack:
+            c, expanded = stack.pop()
+            if c in built:
+                continue
+            n = best[c][2]
+            if not expanded:
+                stack.append((c, True))
+                stack.extend((self.find(a), False) for a in n.args)
+                continue
+            built[c] = _instantiate(self._templates[n.head], [built[self.find(a)] for a in n.args])
+        return built[self.find(cid)]
+
+    def extract(self, cid: int, cost: CostModel = node_count) -> ir.Node:
+        return self._build(cid, self.costs(cost), {})
+
+    def _touched(self, best, prev: tp.Dict[int, ENode]) -> tp.Set[int]:
+        """The classes whose cheapest term may differ from last round's:
+        those added or merged into, those whose cheapest e-node is not the one
+        in prev, and the classes whose cheapest e-nodes have those as args."""
+        todo = [self.find(c) for c in self._dirty]
+        todo.extend(cid for cid, b in best.items() if prev.get(cid) != b[2])
+        self._dirty = set()
+        touched: tp.Set[int] = set()
+        while todo:
+            cid = todo.pop()
+            if cid in touched:
+                continue
+            touched.add(cid)
+            for pnode, pcid in self.classes[cid].parents:
+                pcid = self.find(pcid)
+                if pcid not in touched and pcid in best and best[pcid][2] == self.canonicalize(pnode):
+                    todo.append(pcid)
+        return touched
+
+    def saturate(self, rules: tp.Sequence[Rule], cost: CostModel = node_count, iter_limit: int = 16, node_limit: int = 100_000) -> bool:
+        """Applies rules until nothing changes; returns False if a limit was hit first.
+
+        Each round instantiates e-nodes with the current cheapest term of each
+        child e-class and offers them to every rule; a rule is offered the
+        same term only once. After the first round, and on a later call with
+        the same rules, only the e-nodes of classes whose cheapest term may
+        have changed, and their parent e-nodes, are offered again.
+
+        Rules are functions of a term, not patterns, so there is no e-matching
+        against every member of a child class: a rewrite that needs a child
+        in a form other than its cheapest one is not found.
+        """
+        tried: tp.Set[tp.Tuple[int, ir.Node]] = set()
+        rules = tuple(rules)
+        if rules != self._saturated[0]:
+            self._dirty.update(self.classes)
+        for _ in range(iter_limit):
+            best = self.costs(cost)
+            offers: tp.Dict[ENode, int] = {}
+            for cid in self._touched(best, self._saturated[1]):
+                eclass = self.classes[cid]
+                offers.update(dict.fromkeys(eclass.nodes, cid))
+                for pnode, pcid in eclass.parents:
+                    offers[self.canonicalize(pnode)] = self.find(pcid)
+            self._saturated = (rules, {cid: b[2] for cid, b in best.items()})
+            built: tp.Dict[int, ir.Node] = {}
+            matches = []
+            for n, cid in offers.items():
+                if not isinstance(self._templates[n.head], ir.Value):
+                    continue
+                if not all(self.find(a) in best for a in n.args):
+                    continue
+                children = [self._build(a, best, built) for a in n.args]
+                node = _instantiate(self._templates[n.head], children)
+                for i, rule in enumerate(rules):
+                    if (i, node) in tried:
+                        continue
+                    tried.add((i, node))
+                    new = rule.apply(node)
+                    if new is not None and new is not node:
+                        matches.append((cid, new))
+            changed = False
+            for cid, new in matches:
+                changed |= self.union(cid, self.add_term(new))
+            self.rebuild()
+            if not changed:
+                return True
+            if len(self) > node_limit:
+                return False
+        return False
+
+
+class EqualitySaturation(Transform):
+    """Simplifies by equality saturation instead of ordered passes.
+
+    The tree is loaded into an EGraph, the rules are saturated over it and the
+    cheapest equivalent tree under the cost model is extracted.
+    """
+    name = "eq_sat"
+    enable_memoization = False
+
+    def __init__(self, rules: tp.Optional[tp.Sequence[Rule]] = None, cost: CostModel = node_count, iter_limit: int = 16, node_limit: int = 100_000):
+        if rules is None:
+            rules = default_rules()
+        self.rules = rules
+        self.cost = cost
+        self.iter_limit = iter_limit
+        self.node_limit = node_limit
+
+    def run(self, root: ir.Node, ctx) -> ir.Node:
+        egraph = EGraph()
+        cid = egraph.add_term(root)
+        egraph.saturate(self.rules, self.cost, self.iter_limit, self.node_limit)
+        return egraph.extract(cid, self.cost)
+
+def default_rules() -> tp.List[Rule]:
+    """The rewrites of the simplify() group as e-graph rules."""
+    from .transforms import CanonicalizePass, ConstFoldPass, AlgebraicSimplificationPass, DomainSimplificationPass
+    from .transforms.guard_opt import GuardOpt
+    return [
+        HandlerRule(CanonicalizePass()),
+        HandlerRule(ConstFoldPass()),
+        HandlerRule(AlgebraicSimplificationPass()),
+        HandlerRule(DomainSimplificationPass()),
+        HandlerRule(GuardOpt()),
+    ]
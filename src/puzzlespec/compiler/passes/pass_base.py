@@ -1,10 +1,11 @@
 from __future__ import annotations
-from functools import singledispatchmethod, singledispatch
 import typing as tp
 from typing import TYPE_CHECKING
 from abc import ABC, abstractmethod
 import inspect
 from dataclasses import dataclass
+from collections import OrderedDict
+import weakref
 
 from puzzlespec.compiler.dsl.ir import LambdaHOAS, Node
 
@@ -55,11 +56,16 @@ class VCType:
 
 class AnalysisObject(ABC):
     persistent = False
+    # Results are per-node facts that stay true for any node still present
+    # after a rewrite. On invalidation the object is kept as a stale seed
+    # (Context.stale) that the producing analysis can start from.
+    incremental = False
     gen_pass = None
 
 class Context:
     def __init__(self, *args):
         self._store: tp.Dict[tp.Type[AnalysisObject], AnalysisObject] = {}
+        self._stale: tp.Dict[tp.Type[AnalysisObject], AnalysisObject] = {}
         for arg in args:
             self.add(arg)
 
@@ -68,6 +74,7 @@ class Context:
             raise ValueError(f"Context already contains {type(result)}")
         assert isinstance(result, AnalysisObject)
         self._store[type(result)] = result
+        self._stale.pop(type(result), None)
 
     def get(self, cls: tp.Type[AnalysisObject], *args) -> AnalysisObject:
         if len(args) >1:
@@ -84,14 +91,101 @@ class Context:
             return None
         return self._store[cls]
     
+    def stale(self, cls: tp.Type[AnalysisObject]) -> tp.Optional[AnalysisObject]:
+        """The last invalidated result of an incremental analysis, if any."""
+        return self._stale.get(cls)
+
     def invalidate(self):
         new_store = {}
         for cls, aobj in self._store.items():
             if cls.persistent:
                 new_store[cls] = aobj
+            elif cls.incremental:
+                self._stale[cls] = aobj
         self._store = new_store
 
-    
+# cache_size of the pure rewrites that share their memo table across runs
+SHARED_CACHE_SIZE = 1 << 16
+
+_SAME = object()
+
+class _LRUCache(tp.MutableMapping):
+    """Memo table bounded to maxsize entries, evicting the least recently used.
+
+    Keys are held weakly, so the nodes of a spec nobody uses any more leave
+    the table (and the intern table) instead of being pinned until evicted.
+    A key is a node, or a (binder, BoundVar) pair held by its binder. A
+    result that is its own key is stored as _SAME so it does not pin it.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        # (ref to anchor, rest of key) -> result. The ref is always the one
+        # in _anchors, so entries can still be found once it is dead.
+        self._data: OrderedDict = OrderedDict()
+        # ref to anchor -> (the same ref, with the callback; rests of its keys)
+        self._anchors: tp.Dict[weakref.ref, tp.Tuple[weakref.ref, tp.Set]] = {}
+
+    @staticmethod
+    def _split(key):
+        if isinstance(key, tuple):
+            return key
+        return key, None
+
+    def _drop(self, ref: weakref.ref):
+        _, rests = self._anchors.pop(ref, (None, ()))
+        for rest in rests:
+            self._data.pop((ref, rest), None)
+
+    def __getitem__(self, key):
+        anchor, rest = self._split(key)
+        k = (weakref.ref(anchor), rest)
+        val = self._data[k]
+        self._data.move_to_end(k)
+        return anchor if val is _SAME else val
+
+    def __contains__(self, key):
+        anchor, rest = self._split(key)
+        return (weakref.ref(anchor), rest) in self._data
+
+    def __setitem__(self, key, value):
+        anchor, rest = self._split(key)
+        entry = self._anchors.get(weakref.ref(anchor))
+        if entry is None:
+            ref = weakref.ref(anchor, self._drop)
+            entry = self._anchors[ref] = (ref, set())
+        ref, rests = entry
+        rests.add(rest)
+        k = (ref, rest)
+        self._data[k] = _SAME if value is anchor else value
+        self._data.move_to_end(k)
+        if len(self._data) > self.maxsize:
+            (old, old_rest), _ = self._data.popitem(last=False)
+            _, old_rests = self._anchors[old]
+            old_rests.discard(old_rest)
+            if not old_rests:
+                del self._anchors[old]
+
+    def __delitem__(self, key):
+        anchor, rest = self._split(key)
+        ref, rests = self._anchors[weakref.ref(anchor)]
+        del self._data[(ref, rest)]
+        rests.discard(rest)
+        if not rests:
+            del self._anchors[ref]
+
+    def __iter__(self):
+        for ref, rest in list(self._data):
+            anchor = ref()
+            if anchor is not None:
+                yield anchor if rest is None else (anchor, rest)
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+        self._anchors.clear()
+
 class Pass(ABC):
     _debug: bool=False
     name: str
@@ -108,9 +202,50 @@ class Pass(ABC):
             mnames = ", ".join(str(m.__qualname__) for m in missing_deps)
             raise RuntimeError(f"Pass {self.name} requires {missing_deps}")
 
+    # Memo table lifetime. 0 gives every run a fresh dict. A positive size
+    # (usually SHARED_CACHE_SIZE) gives the pass class one LRU table, shared
+    # by all instances and runs, holding at most cache_size entries. A pure
+    # rewrite sets it so its results are reused across runs and fixed-point
+    # iterations. Only passes whose results depend on nothing but the
+    # visited node (no instance state, no Context) may set it.
+    cache_size: int = 0
+
     @abstractmethod
     def __call__(self, root: ir.Node, ctx) -> ir.Node: ...
 
+    # How _visit_postorder walks below a node: the parts the handler visits
+    # outside the node's scope, and the one part (or None) it visits inside
+    # it. Passes that carry context into a binder's body (a binder type
+    # stack, state collected per scope) set it up in _enter and tear it down
+    # in _exit, which the walk calls around the scoped part; their handlers
+    # then only read what _exit left. A pass that visits fewer parts than
+    # all_nodes, or skips a subtree, returns just those.
+    def _parts(self, node: ir.Node) -> tp.Tuple[tp.Tuple[ir.Node, ...], tp.Optional[ir.Node]]:
+        return node.all_nodes, None
+
+    def _enter(self, node: ir.Node):
+        pass
+
+    def _exit(self, node: ir.Node):
+        pass
+
+    def _new_cache(self) -> tp.MutableMapping:
+        cls = type(self)
+        if self.cache_size <= 0:
+            return {}
+        cache = cls.__dict__.get("_shared_cache", None)
+        if cache is None or cache.maxsize != self.cache_size:
+            cache = _LRUCache(self.cache_size)
+            cls._shared_cache = cache
+        return cache
+
+    @classmethod
+    def clear_cache(cls):
+        """Drops the results shared across runs (see cache_size)."""
+        cache = cls.__dict__.get("_shared_cache", None)
+        if cache is not None:
+            cache.clear()
+
 _PENDING: dict[tuple[str, str], list[tuple[tp.Callable, tuple[type, ...]]]] = {}
 
 def _second_param_name(fn: tp.Callable) -> str:
@@ -168,20 +303,117 @@ def handles(*explicit_types: type, mark_invalid=False):
         return fn
     return deco
 
+def _ir_subclasses(root: type) -> tp.Iterator[type]:
+    stack = [root]
+    while stack:
+        T = stack.pop()
+        yield T
+        stack.extend(T.__subclasses__())
+
+class _DispatchTable(dict):
+    """Maps an IR class to the function a pass runs for it: fn(self, node).
+
+    Built once per pass class. A class's own @handles registrations are
+    resolved along the IR class's MRO first; otherwise the pass's own visit
+    (if it defines one) is used, and then the parent pass's table, ending at
+    the generic visit of the base. Entries for IR classes defined after the
+    pass are resolved on first lookup.
+    """
+    def __init__(self, own: tp.Dict[type, tp.Callable], visit: tp.Optional[tp.Callable], parent: tp.Union['_DispatchTable', tp.Callable]):
+        super().__init__()
+        self.own = own
+        self.visit = visit
+        self.parent = parent
+        for T in _ir_subclasses(Node):
+            self[T]
+
+    def __missing__(self, T: type) -> tp.Callable:
+        for B in T.__mro__:
+            if B in self.own:
+                fn = self.own[B]
+                break
+        else:
+            if self.visit is not None:
+                fn = self.visit
+            elif isinstance(self.parent, _DispatchTable):
+                fn = self.parent[T]
+            else:
+                fn = self.parent
+        self[T] = fn
+        return fn
+
+def _dispatch_table(cls: type, base: type) -> _DispatchTable:
+    own = {}
+    # consume exactly the queued (fn, types) for THIS class
+    for fn, types in _PENDING.pop((cls.__module__, cls.__qualname__), []):
+        for t in types:
+            own[t] = fn
+    parent = getattr(super(cls, cls), "_dispatch", None) or base.visit
+    return _DispatchTable(own, cls.__dict__.get("visit", None), parent)
+
+# Steps of _visit_postorder
+_WALK, _DISPATCH, _ENTER, _EXIT = range(4)
+
+def _visit_postorder(p: tp.Union['Analysis', 'Transform'], root: ir.Node) -> tp.Any:
+    """Explicit-stack post-order driver shared by Analysis and Transform.
+
+    Dispatches every uncached node reachable from root only after the parts
+    its handler visits have been visited, so the handler's own visit_children
+    calls are cache hits and the Python stack depth no longer grows with the
+    IR depth. Which parts those are, and the scope a part is walked in, come
+    from the pass (Pass._parts, _enter, _exit). For Transforms, Lambda/PiT
+    binder frames are pushed while the walk is below them, so BoundVar cache
+    keys match what the handlers see.
+    """
+    from ..dsl import ir
+    cache = p._cache
+    bframes = getattr(p, '_bframes', None)
+    stack = [(root, _WALK)]
+    while stack:
+        node, step = stack.pop()
+        if step == _ENTER:
+            p._enter(node)
+            continue
+        if step == _EXIT:
+            p._exit(node)
+            continue
+        is_binder = bframes is not None and isinstance(node, (ir.Lambda, ir.PiT))
+        if step == _DISPATCH:
+            if is_binder:
+                bframes.pop()
+            if p._cache_key(node) not in cache:
+                p._visit_node(node)
+            continue
+        if p._cache_key(node) in cache:
+            continue
+        stack.append((node, _DISPATCH))
+        if is_binder:
+            bframes.append(node)
+        parts, scoped = p._parts(node)
+        if scoped is not None:
+            stack.append((node, _EXIT))
+            stack.append((scoped, _WALK))
+            stack.append((node, _ENTER))
+        stack.extend((c, _WALK) for c in reversed(parts))
+    return cache[p._cache_key(root)]
+
 class Analysis(Pass):
     enable_memoization=True
+    # Visit via _visit_postorder. Passes whose handlers depend on traversal
+    # context or visit other parts than all_nodes describe that with _parts,
+    # _enter and _exit; ones whose handlers cannot be driven this way (e.g.
+    # they re-enter subtrees in a new context) must set this False.
+    iterative=True
     
-    def __call__(self, root: ir.Node, ctx: 'Context', cache = {}) -> ir.Node:
+    def __call__(self, root: ir.Node, ctx: 'Context') -> ir.Node:
         if not isinstance(root, Node):
             raise ValueError(f"Can only analyze nodes, got {root}")
-        if self.enable_memoization:
-            self._cache = cache
         if self._debug:
             self._dindent=0
         self.ensure_dependencies(ctx)
-        # Initialize memoization for this transformation
+        # Initialize memoization for this analysis
         if self.enable_memoization:
-            self._cache = {}
+            self._cache = self._new_cache()
         aobj = self.run(root, ctx)
         if not isinstance(aobj, AnalysisObject):
             raise RuntimeError(f"Analysis pass {self.name} did not return an AnalysisObject, {aobj}")
@@ -190,6 +422,9 @@ class Analysis(Pass):
     def visit(self, node: ir.Node) -> tp.Any:
         self.visit_children(node)
 
+    def _cache_key(self, node: ir.Node):
+        return node
+
     @abstractmethod
     def run(self, root: ir.Node, ctx: 'Context'):
         raise NotImplementedError()
@@ -215,38 +450,16 @@ class Analysis(Pass):
         if "run" not in cls.__dict__:
             raise ValueError("Must override run")
          
-        v = cls.__dict__.get("visit", None)
-        if v is None:
-            def v(self, node):
-                return super(cls, self).visit(node)
-
-        # Define the base dispatcher visit method
-        def _base(self, node):
-            return v(self, node)
-        dispatcher = singledispatchmethod(_base)
-        
-        # Add the dispatched methods
+        table = _dispatch_table(cls, Analysis)
+        cls._dispatch = table
         from ..dsl import ir
-        # consume exactly the queued (fn, types) for THIS class
-        key = (cls.__module__, cls.__qualname__)
-        for fn, types in _PENDING.pop(key, []):
-            for t in types:
-                dispatcher.register(t)(fn)
 
-        # Define custom visit function to do caching
-        def visit(self, node: ir.Node):
-            if self._debug:
-                print("|  "*self._dindent + f"{node.__class__.__name__}({node.field_dict}): {str(node._hash)[-5:]} (", end="")
-            if self.enable_memoization:
-                if node in self._cache:
-                    if self._debug:
-                        print(" (cached) )")
-                    return self._cache[node]
+        # Dispatches a single node and caches the result
+        def _visit_node(self, node: ir.Node):
             if self._debug:
                 print("")
                 self._dindent += 1
-            # Hacked way to get the dispatcher to work without binding to an instance
-            new_val = dispatcher.__get__(self, type(self))(node) 
+            new_val = table[type(node)](self, node)
             
             if self.enable_memoization:
                 # Add new node to cache
@@ -256,24 +469,38 @@ class Analysis(Pass):
                 self._dindent -= 1
                 print("|  "*self._dindent + ")")
             return new_val
+
+        # Define custom visit function to do caching
+        def visit(self, node: ir.Node):
+            if self._debug:
+                print("|  "*self._dindent + f"{node.__class__.__name__}({node.field_dict}): {str(node._hash)[-5:]} (", end="")
+            if self.enable_memoization:
+                if node in self._cache:
+                    if self._debug:
+                        print(" (cached) )")
+                    return self._cache[node]
+                if self.iterative:
+                    return _visit_postorder(self, node)
+            return self._visit_node(node)
+        setattr(cls, "_visit_node", _visit_node)
         setattr(cls, "visit", visit)
 
 
 class Transform(Pass):
     enable_memoization=True
     cse=False
+    # See Analysis.iterative
+    iterative=True
     
-    def __call__(self, root: ir.Node, ctx: 'Context', cache = {}) -> ir.Node:
+    def __call__(self, root: ir.Node, ctx: 'Context') -> ir.Node:
         if not isinstance(root, Node):
             raise ValueError(f"Can only transform nodes, got {root}")
-        if self.enable_memoization:
-            self._cache = cache
         if self._debug:
             self._dindent=0
         self.ensure_dependencies(ctx)
         # Initialize memoization for this transformation
         if self.enable_memoization:
-            self._cache = {}
+            self._cache = self._new_cache()
             self._bframes = []
         new_root = self.run(root, ctx)
         if isinstance(new_root, tuple):
@@ -304,6 +531,12 @@ class Transform(Pass):
     def run(self, root: ir.Node, ctx: 'Context') -> ir.Node:
         return self.visit(root)
 
+    def _cache_key(self, node: ir.Node):
+        from ..dsl import ir
+        if isinstance(node, ir.BoundVar):
+            return (self._bframes[-(node.idx+1)], node)
+        return node
+
     def visit_children(self, node: ir.Node):
         from ..dsl import ir
         children = tuple(self.visit(c) for c in node.children)
@@ -323,44 +556,20 @@ class Transform(Pass):
         if "__call__" in cls.__dict__:
             raise ValueError("Cannot override __call__")
          
-        v = cls.__dict__.get("visit", None)
-        if v is None:
-            def v(self, node):
-                return super(cls, self).visit(node)
-
-        # Define the base dispatcher visit method
-        def _base(self, node):
-            return v(self, node)
-        dispatcher = singledispatchmethod(_base)
-        
-        # Add the dispatched methods
+        table = _dispatch_table(cls, Transform)
+        cls._dispatch = table
         from ..dsl import ir
-        # consume exactly the queued (fn, types) for THIS class
-        key = (cls.__module__, cls.__qualname__)
-        for fn, types in _PENDING.pop(key, []):
-            for t in types:
-                dispatcher.register(t)(fn)
 
-        # Define custom visit function that creates new keys
-        def visit(self, node: ir.Node):
-            if self._debug:
-                print("|  "*self._dindent + f"{node.__class__.__name__}({node.field_dict}): {str(node._hash)[-5:]}", end="(")
+        # Dispatches a single node and caches the result
+        def _visit_node(self, node: ir.Node):
             if self.enable_memoization:
-                if isinstance(node, ir.BoundVar):
-                    cache_key = (self._bframes[-(node.idx+1)], node)
-                else:
-                    cache_key = node
-                if cache_key in self._cache:
-                    if self._debug:
-                        print(" (cached) )")
-                    return self._cache[cache_key]
+                cache_key = self._cache_key(node)
                 if isinstance(node, (ir.Lambda, ir.PiT)):
                     self._bframes.append(node)
             if self._debug:
                 print("")
                 self._dindent += 1
-            # Hacked way to get the dispatcher to work without binding to an instance
-            new_node = dispatcher.__get__(self, type(self))(node)
+            new_node = table[type(node)](self, node)
 
             # Allows returning different instance of the value-same node
             if not self.cse and new_node == node:
@@ -376,8 +585,77 @@ class Transform(Pass):
                 self._dindent -=1
                 print("|  "*self._dindent + ")")
             return new_node
+
+        # Define custom visit function that creates new keys
+        def visit(self, node: ir.Node):
+            if self._debug:
+                print("|  "*self._dindent + f"{node.__class__.__name__}({node.field_dict}): {str(node._hash)[-5:]}", end="(")
+            if self.enable_memoization:
+                cache_key = self._cache_key(node)
+                if cache_key in self._cache:
+                    if self._debug:
+                        print(" (cached) )")
+                    return self._cache[cache_key]
+                if self.iterative:
+                    return _visit_postorder(self, node)
+            return self._visit_node(node)
+        setattr(cls, "_visit_node", _visit_node)
         setattr(cls, "visit", visit)
 
+class FusedTransform(Transform):
+    """Runs several rewrite passes as a single bottom-up traversal.
+
+    Each node is rebuilt from its already-normalized children, then every
+    component pass's handler is tried on it in order. When one rewrites the
+    node, the result is normalized in turn (its unchanged sub-nodes are cache
+    hits), so a node is only left once no component changes it. Components
+    see the fused result whenever they visit a child.
+
+    Components must be memoized, iterative Transforms that need nothing from
+    the Context, do no per-run setup in run() and walk nodes the default way
+    (no _parts, _enter or _exit of their own).
+    """
+    name = "fused"
+
+    def __init__(self, *passes: Transform):
+        for p in passes:
+            if not (isinstance(p, Transform) and p.enable_memoization and p.iterative and not p.requires):
+                raise ValueError(f"Cannot fuse {type(p).__name__}")
+            if any(getattr(type(p), h) is not getattr(Pass, h) for h in ("_parts", "_enter", "_exit")):
+                raise ValueError(f"Cannot fuse {type(p).__name__}")
+        self.passes = passes
+        self.name = "fused(" + ", ".join(p.name for p in passes) + ")"
+
+    def run(self, root: ir.Node, ctx: 'Context') -> ir.Node:
+        self._active = set()
+        for p in self.passes:
+            p._bframes = self._bframes
+            # Child visits made by the component's handlers land here
+            p.visit = self.visit
+        try:
+            return self.visit(root)
+        finally:
+            for p in self.passes:
+                del p.visit
+
+    def visit(self, node: ir.Node) -> ir.Node:
+        from ..dsl import ir
+        new_node = super().visit(node)
+        active = {node, new_node} - self._active
+        self._active |= active
+        for p in self.passes:
+            rewritten = p._dispatch[type(new_node)](p, new_node)
+            if rewritten != new_node:
+                if rewritten in self._active:
+                    raise RuntimeError(f"{self.name} did not converge on {type(node).__name__}")
+                new_node = self.visit(rewritten)
+                break
+        self._active -= active
+        # A fused result is its own normal form
+        if new_node is not node and not isinstance(new_node, ir.BoundVar) and new_node not in self._cache:
+            self._cache[new_node] = new_node
+        return new_node
+
 class PassManager:
     def __init__(self, *passes: Pass, verbose: int=0, max_iter=5, analysis_map: tp.Mapping[tp.Type[AnalysisObject], Analysis] = {}):
         self.analysis_map = analysis_map
@@ -2,7 +2,7 @@ from __future__ import annotations
 import math
 from re import L
 
-from ..pass_base import Transform, Context, handles
+from ..pass_base import Transform, Context, handles, SHARED_CACHE_SIZE
 from ...dsl import ir, ast
 from ....libs import std
 from ._obl_utils import _with_obl
@@ -31,6 +31,7 @@ class AlgebraicSimplificationPass(Transform):
     requires: tp.Tuple[type, ...] = ()
     produces: tp.Tuple[type, ...] = ()
     name = "alg_simplification"
+    cache_size = SHARED_CACHE_SIZE
 
     # Arithmetic
 
@@ -304,33 +305,29 @@ class AlgebraicSimplificationPass(Transform):
             result = ir.Apply(T, cases[idx], val)
             return _with_obl(result, vc.obl)
         if isinstance(scrut, ir.SumLit):
-            # Match(SumLit(tag, *elems), *branch_lams) -> ApplyFunc(FuncLit(...), tag)
+            # Match(SumLit(tag, *elems), *cases) -> Ite(tag=0, case0(elem0), Ite(tag=1, ...))
             tag, *elems = scrut.children
-            # Create Fin domain for indices
-            n = len(elems)
-            fin_domT = ir.DomT.make(carT=ir.IntT(), fin=True, ord=True)
-            fin_dom = ir.Fin(fin_domT, ir.Lit(ir.IntT(), val=n))
-            # Apply each branch lambda to its corresponding element
-            func_elems = []
-            val_map = {}
-            for i in range(n):
-                # Apply branch_lams[i] to elems[i]
-                applied = ir.Apply(T, cases[i], elems[i])
-                applied = self.visit(applied)  # Simplify the application
-                func_elems.append(applied)
-                # Map index i to position i in FuncLit
-                idx_lit = ir.Lit(ir.IntT(), val=i)
-                val_map[idx_lit._key] = i
-            # Create FuncLit with Fin domain
-            layout = ir._DenseLayout(val_map=val_map)
-            lamT = ir.LambdaT(ir.IntT(), T)
-            funcT = ir.FuncT(fin_dom, lamT)
-            func_lit = ir.FuncLit(funcT, fin_dom, *func_elems, layout=layout)
-            # Apply the function to tag
-            result = ir.ApplyFunc(T, func_lit, tag)
+            assert len(elems) == len(cases) and len(cases) > 0
+            branches = [self.visit(ir.Apply(T, case, elem)) for case, elem in zip(cases, elems)]
+            result = branches[-1]
+            for i in reversed(range(len(branches) - 1)):
+                is_i = ir.Eq(ir.BoolT(), tag, ir.Lit(ir.IntT(), val=i))
+                result = ir.Ite(T, is_i, branches[i], result)
             return _with_obl(result, vc.obl)
         return node.replace(scrut, *cases, T=T, obl=vc.obl)
 
+    @handles(ir.Apply)
+    def _(self, node: ir.Apply):
+        vc = self.visit_children(node)
+        T = vc.T
+        func, arg = vc.children
+        if isinstance(func, ir.FuncLit):
+            # FuncLit lookup at a literal key
+            idx = func.layout.index(arg)
+            if idx is not None:
+                return _with_obl(func.elems[idx], vc.obl)
+        return node.replace(func, arg, T=T, obl=vc.obl)
+
     @handles(ir.Proj)
     def _(self, node: ir.Proj):
         vc = self.visit_children(node)
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from ..pass_base import Transform, Context, handles
 from ...dsl import ir
-from ...dsl.utils import substitute
+from ...dsl.utils import substitute, _any_node
 import typing as tp
 from ..analyses.pretty_printer import pretty
 
@@ -15,59 +15,121 @@ def beta_reduce_HOAS(node: ir.Node):
 def applyT(lamT: ir.Node, arg: ir.Value):
     assert isinstance(lamT, (ir.PiT, ir.PiTHOAS))
     assert isinstance(arg, ir.Value)
+    if isinstance(lamT, ir.PiTHOAS) and not _any_node(lamT.resT, lambda n: isinstance(n, ir.BoundVarHOAS) and n.name == lamT.bv_name):
+        # Not dependent: the argument (possibly large) need not be walked
+        return lamT.resT
     appT = ir.ApplyT(lamT, arg)
     T = beta_reduce_HOAS(appT)
     return T
 
+def _rebuild(t: ir.Node, new_nodes: tp.Sequence[ir.Node], **fields) -> ir.Node:
+    """Rebuilds t with new_nodes in place of its all_nodes (and fields updated)."""
+    numc = len(t.children)
+    named = iter(new_nodes[numc:])
+    kwargs = {
+        name: (next(named) if nc is not None else None)
+        for name, nc in zip(t._named_children, t._key[3])
+    }
+    return t.replace(*new_nodes[:numc], **kwargs, **fields)
+
 # High level algortihm:
 # add 1 to all bound vars in arg
 # Do substition: body[BV0 -> (arg+1)]
 # do body - 1
 class BetaReductionPass(Transform):
-    enable_memoization = False
+    # Reduction of a de Bruijn term depends only on the term, so results are
+    # memoized (which also runs the pass on the iterative driver).
     requires: tp.Tuple[type, ...] = ()
     produces: tp.Tuple[type, ...] = ()
     name = "beta_reduction"
 
+    def __init__(self):
+        # Keyed on (op, node, k) where op is ('shift', d) or ('subst', j, s)
+        # and k the cutoff/depth, so shared subterms of a DAG are shifted and
+        # substituted once per binder depth, across all redexes of a run.
+        self._bv_memo: tp.Dict[tp.Tuple[tp.Any, ir.Node, int], ir.Node] = {}
+        self._nfree: tp.Dict[ir.Node, int] = {}
+
     def run(self, root: ir.Node, ctx: Context):
         return self.visit(root)
 
     # ---------- helpers ----------
 
-    def _replace(self, t: ir.Node, *new_children) -> ir.Node:
-        """Helper to call replace with the correct kwargs depending on node kind."""
-        if isinstance(t, ir.Value):
-            return t.replace(*new_children, T=t.T, obl=t.obl)
-        elif isinstance(t, ir.Type):
-            return t.replace(*new_children, ref=t.ref, view=t.view, obl=t.obl)
-        return t.replace(*new_children)
+    def _scoped(self, t: ir.Node, k: int) -> tp.List[tp.Tuple[ir.Node, int]]:
+        """
+        The all_nodes of t paired with the number of enclosing binders each
+        is under, given that t itself is under k. A Lambda binds in its body,
+        a PiT in its resT; the types and obligations of a node are under the
+        same binders as the node.
+        """
+        if isinstance(t, ir.Lambda):
+            ks = (k + 1,)
+        elif isinstance(t, ir.PiT):
+            ks = (k, k + 1)
+        else:
+            ks = (k,) * len(t.children)
+        return [*zip(t.children, ks), *((nc, k) for nc in t.all_nodes[len(ks):])]
+
+    def free_bound(self, t: ir.Node) -> int:
+        """
+        One more than the largest de Bruijn index free in t, or 0 if t is
+        closed. Shifting or substituting at cutoff >= free_bound(t) leaves t
+        unchanged.
+        """
+        nfree = self._nfree
+        stack = [(t, False)]
+        while stack:
+            n, expanded = stack.pop()
+            if n in nfree:
+                continue
+            subs = self._scoped(n, 0)
+            if not expanded:
+                stack.append((n, True))
+                stack.extend((c, False) for c, _ in subs)
+                continue
+            bound = n.idx + 1 if isinstance(n, ir.BoundVar) else 0
+            nfree[n] = max([bound, *(nfree[c] - ck for c, ck in subs)])
+        return nfree[t]
+
+    def _map_bvs(self, t: ir.Node, k: int, op: tp.Tuple, lo: int, on_bv: tp.Callable[[ir.BoundVar, int, tp.List[ir.Node]], ir.Node]) -> ir.Node:
+        """
+        Rebuilds t bottom-up with an explicit stack, replacing every BoundVar
+        bv by on_bv(bv, k, new) where new are its rebuilt all_nodes and k is the starting k plus the number of
+        binders passed on the way down. Subterms whose free indices are all
+        below k + lo are returned as is; results are memoized under op.
+        """
+        memo = self._bv_memo
+        stack = [(t, k, False)]
+        while stack:
+            n, nk, expanded = stack.pop()
+            key = (op, n, nk)
+            if key in memo:
+                continue
+            if self.free_bound(n) <= nk + lo:
+                memo[key] = n
+                continue
+            subs = self._scoped(n, nk)
+            if not expanded:
+                stack.append((n, nk, True))
+                stack.extend((c, ck, False) for c, ck in subs)
+                continue
+            new = [memo[(op, c, ck)] for c, ck in subs]
+            if isinstance(n, ir.BoundVar):
+                memo[key] = on_bv(n, nk, new)
+            else:
+                memo[key] = _rebuild(n, new)
+        return memo[(op, t, k)]
 
     def shift(self, t: ir.Node, d: int, cutoff: int = 0) -> ir.Node:
         """
         shift(d, cutoff, t): add d to all BoundVar indices >= cutoff
         (standard TAPL shift)
         """
-        if isinstance(t, ir.BoundVar):
-            k = t.idx
-            if k >= cutoff:
-                return ir.BoundVar(t.T, k + d)
-            else:
-                return t
-
-        if isinstance(t, ir.Lambda):
-            body = t.children[0]
-            body2 = self.shift(body, d, cutoff + 1)
-            return self._replace(t, body2)
-
-        if isinstance(t, ir.PiT):
-            argT, resT = t.children
-            argT2 = self.shift(argT, d, cutoff)
-            resT2 = self.shift(resT, d, cutoff + 1)
-            return t.replace(argT2, resT2, ref=t.ref, view=t.view, obl=t.obl)
-
-        # generic n-ary node: no new binder
-        new_children = [self.shift(c, d, cutoff) for c in t.children]
-        return self._replace(t, *new_children)
+        def on_bv(bv: ir.BoundVar, c: int, new: tp.List[ir.Node]):
+            if bv.idx >= c:
+                return _rebuild(bv, new, idx=bv.idx + d)
+            return _rebuild(bv, new)
+        return self._map_bvs(t, cutoff, ('shift', d), 0, on_bv)
 
     def subst(self, t: ir.Node, j: int, s: ir.Node, depth: int = 0) -> ir.Node:
         """
@@ -75,26 +137,11 @@ class BetaReductionPass(Transform):
         in t, where depth is how many binders we've gone under so far.
         This is the TAPL-style subst with de Bruijn indices.
         """
-        if isinstance(t, ir.BoundVar):
-            k = t.idx
-            if k == j + depth:
-                return self.shift(s, depth)
-            else:
-                return t
-
-        if isinstance(t, ir.Lambda):
-            body = t.children[0]
-            body2 = self.subst(body, j, s, depth + 1)
-            return self._replace(t, body2)
-
-        if isinstance(t, ir.PiT):
-            argT, resT = t.children
-            argT2 = self.subst(argT, j, s, depth)
-            resT2 = self.subst(resT, j, s, depth + 1)
-            return t.replace(argT2, resT2, ref=t.ref, view=t.view, obl=t.obl)
-
-        new_children = [self.subst(c, j, s, depth) for c in t.children]
-        return self._replace(t, *new_children)
+        def on_bv(bv: ir.BoundVar, dp: int, new: tp.List[ir.Node]):
+            if bv.idx == j + dp:
+                return self.shift(s, dp)
+            return _rebuild(bv, new)
+        return self._map_bvs(t, depth, ('subst', j, s), j, on_bv)
 
     # ---------- visitors ----------
 
@@ -106,8 +153,10 @@ class BetaReductionPass(Transform):
     @handles(ir.Apply)
     def _(self, node: ir.Apply):
         # first recursively reduce inside
-        T, lam, arg = self.visit_children(node)
-        assert isinstance(lam, ir.Lambda)
+        vc = self.visit_children(node)
+        lam, arg = vc.children
+        if not isinstance(lam, ir.Lambda):
+            return node.replace(lam, arg, T=vc.T, obl=vc.obl)
         body = lam.children[0]
 
         # 1. shift argument up by 1 for the binder we're eliminating
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import typing as tp
 
-from ..pass_base import Transform, Context, handles
+from ..pass_base import Transform, Context, handles, SHARED_CACHE_SIZE
 from ...dsl import ir
 
 class CanonicalizePass(Transform):
@@ -10,6 +10,7 @@ class CanonicalizePass(Transform):
     """
 
     name = "canonicalize"
+    cache_size = SHARED_CACHE_SIZE
 
     def run(self, root: ir.Node, ctx: Context) -> ir.Node:
         result = self.visit(root)
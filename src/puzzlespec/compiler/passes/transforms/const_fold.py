@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from ..pass_base import Transform, Context, handles
+from ..pass_base import Transform, Context, handles, SHARED_CACHE_SIZE
 from ...dsl import ir, utils, ast
 from ._obl_utils import _with_obl
 import math
@@ -16,6 +16,7 @@ class ConstFoldPass(Transform):
     requires: tp.Tuple[type, ...] = ()
     produces: tp.Tuple[type, ...] = ()
     name = "const_prop"
+    cache_size = SHARED_CACHE_SIZE
 
     def run(self, root: ir.Node, ctx: Context):
         return self.visit(root)
@@ -19,8 +19,11 @@ class DomainSimplificationPass(Transform):
     name = "dom_simplification"
     #_debug=True
 
-    def run(self, root: ir.Node, ctx: Context):
+    def __init__(self):
+        # Identity lambdas seen so far; a property of the node, kept across runs
         self.ids = set()
+
+    def run(self, root: ir.Node, ctx: Context):
         new_root = self.visit(root)
         return new_root
 
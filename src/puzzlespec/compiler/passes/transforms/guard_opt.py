@@ -57,10 +57,18 @@ class GuardLift(Transform):
     produces: tp.Tuple[type, ...] = ()
 
     def run(self, root: ir.Node, ctx: Context) -> ir.Node:
+        # The predicates collected outside each binder the walk is in
         self.bstack = []
+        # The predicates that depend on a binder, left by _exit for its handler
+        self.dep_preds = []
         self.preds = set()
         new_root = self.visit(root)
-        if len(self.preds) > 0:
+        if len(self.preds) > 0 and isinstance(new_root, ir.Spec):
+            # A Spec has no obligation of its own: lifted predicates join its obls
+            cons, obls = new_root.children
+            preds = (*obls.children, *(p for p in self.preds if p not in obls.children))
+            new_root = ir.Spec(cons, ir.TupleLit(ir.TupleT(*(p.T for p in preds)), *preds))
+        elif len(self.preds) > 0:
             new_root = ast.wrap(new_root).guard(std.all(ast.wrap(p) for p in self.preds)).node
         return new_root
 
@@ -86,6 +94,27 @@ class GuardLift(Transform):
             new_children = self.visit_children(node)
             return node.replace(*new_children)
 
+    # Collected predicates depend on the enclosing binder: those collected in
+    # a binder's body that mention its bound var are guarded there, the
+    # others are lifted further out. The handlers do not visit ref, view or
+    # obl of a binder, so neither does the walk.
+    def _parts(self, node: ir.Node):
+        if isinstance(node, ir.LambdaHOAS):
+            return (node.T,), node.children[0]
+        if isinstance(node, ir.PiTHOAS):
+            argT, resT = node.children
+            return (argT,), resT
+        return node.all_nodes, None
+
+    def _enter(self, node: ir.Node):
+        self.bstack.append(self.preds)
+        self.preds = set()
+
+    def _exit(self, node: ir.Node):
+        dep_preds, ndep_preds = self.filter_preds(node.bv_name)
+        self.preds = self.bstack.pop() | ndep_preds
+        self.dep_preds.append(dep_preds)
+
     def filter_preds(self, bv_name: str):
         dep_preds = set()
         ndep_preds = set()
@@ -100,12 +129,8 @@ class GuardLift(Transform):
     def _(self, node: ir.LambdaHOAS):
         body = node.children[0]
         newT = self.visit(node.T)
-        cur_preds = self.preds
-        self.preds = set()
         new_body = self.visit(body)
-        dep_preds, ndep_preds = self.filter_preds(node.bv_name)
-        self.preds = cur_preds | ndep_preds
-        new_obl = None
+        dep_preds = self.dep_preds.pop()
         if len(dep_preds) > 0:
             new_body = ast.wrap(new_body).guard(std.all(ast.wrap(p) for p in dep_preds)).node
         return node.replace(new_body, T=newT, obl=None)
@@ -114,11 +139,8 @@ class GuardLift(Transform):
     def _(self, node: ir.PiTHOAS):
         argT, resT = node.children
         new_argT = self.visit(argT)
-        cur_preds = self.preds
-        self.preds = set()
         new_resT = self.visit(resT)
-        dep_preds, ndep_preds = self.filter_preds(node.bv_name)
-        self.preds = cur_preds | ndep_preds
+        dep_preds = self.dep_preds.pop()
         if len(dep_preds) > 0:
             new_resT = ast.wrapT(new_resT).guard(std.all(ast.wrap(p) for p in dep_preds)).node
         return node.replace(new_argT, new_resT, ref=node.ref, view=node.view, obl=None)
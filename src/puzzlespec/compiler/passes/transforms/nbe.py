@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import typing as tp
+
+from ..pass_base import Transform, Context
+from ...dsl import ir
+from .beta_reduction import _rebuild
+
+# Normalization by evaluation.
+#
+# A term is evaluated into a semantic value and read back ("quoted") to IR:
+#   - ir.Node     a normal form with no free de Bruijn variables; it reads back
+#                 to itself at any binder depth
+#   - _Var        a de Bruijn variable, identified by its binder level
+#                 (levels count binders from the root, so unlike indices they
+#                 do not change under binders)
+#   - _Closure    a Lambda/PiT (or HOAS variant) with its environment; applying
+#                 it evaluates the body with the argument bound
+#   - _Neutral    any other node with a _Var or _Closure among its parts
+# Apply/ApplyT of a closure are reduced during evaluation, so the argument is
+# never substituted into (or shifted within) the body as a term. Evaluation
+# and readback are memoized on the node and the part of the environment it
+# can see, so a shared subterm is normalized once per distinct environment.
+
+class _Var:
+    __slots__ = ('level', 'T', 'obl')
+
+    def __init__(self, level: int, T=None, obl=None):
+        self.level = level
+        self.T = T
+        self.obl = obl
+
+class _Closure:
+    __slots__ = ('node', 'env', 'names')
+
+    def __init__(self, node: ir.Node, env: tuple, names: tp.Dict[str, tp.Any]):
+        self.node = node
+        self.env = env
+        self.names = names
+
+class _Neutral:
+    __slots__ = ('node', 'args')
+
+    def __init__(self, node: ir.Node, args: tp.List[tp.Any]):
+        self.node = node
+        self.args = args
+
+_BINDERS = (ir.Lambda, ir.PiT, ir.LambdaHOAS, ir.PiTHOAS)
+
+def normalize(node: ir.Node) -> ir.Node:
+    return NbEPass().run(node, Context())
+
+class NbEPass(Transform):
+    """Beta-normalizes Apply/ApplyT of lambdas by evaluation and readback.
+
+    Works on de Bruijn (Lambda/PiT/BoundVar) and HOAS (LambdaHOAS/PiTHOAS/
+    BoundVarHOAS) binders, and reads each binder back in the form it came in.
+    Unlike BetaReductionPass and BetaReductionHOAS the result is fully
+    normal: redexes created by a reduction are reduced too.
+
+    Evaluation and readback use explicit stacks within a scope and recurse
+    only into lambda bodies and applied closures, so nesting of binders and
+    redexes (not the depth of the IR) is bounded by the recursion limit.
+    """
+    enable_memoization = False
+    requires: tp.Tuple[type, ...] = ()
+    produces: tp.Tuple[type, ...] = ()
+    name = "nbe"
+
+    def __init__(self):
+        self._free: tp.Dict[ir.Node, tp.Tuple[int, tp.FrozenSet[str]]] = {}
+        self._evals: tp.Dict[tuple, tp.Any] = {}
+        self._quotes: tp.Dict[tp.Tuple[int, int], tp.Tuple[tp.Any, ir.Node]] = {}
+
+    def run(self, root: ir.Node, ctx: Context):
+        return self.quote(self.eval(root, (), {}), 0)
+
+    # ---------- free variables ----------
+
+    def free(self, t: ir.Node) -> tp.Tuple[int, tp.FrozenSet[str]]:
+        """(one more than the largest free de Bruijn index, free HOAS names) of t."""
+        free = self._free
+        stack = [(t, False)]
+        while stack:
+            n, expanded = stack.pop()
+            if n in free:
+                continue
+            if not expanded:
+                stack.append((n, True))
+                stack.extend((c, False) for c in n.all_nodes if c not in free)
+                continue
+            bound = n.idx + 1 if isinstance(n, ir.BoundVar) else 0
+            names = {n.name} if isinstance(n, ir.BoundVarHOAS) else set()
+            for i, c in enumerate(n.all_nodes):
+                cb, cn = free[c]
+                if isinstance(n, (ir.LambdaHOAS, ir.PiTHOAS)) and i == _body_pos(n):
+                    cn = cn - {n.bv_name}
+                elif isinstance(n, (ir.Lambda, ir.PiT)) and i == _body_pos(n):
+                    cb -= 1
+                bound = max(bound, cb)
+                names |= cn
+            free[n] = (bound, frozenset(names))
+        return free[t]
+
+    # ---------- evaluation ----------
+
+    def _key(self, node: ir.Node, env: tuple, names: tp.Dict[str, tp.Any]) -> tuple:
+        nb, nn = self.free(node)
+        if nb > len(env):
+            # Open de Bruijn term: variables past env read back past the root
+            return (node, env, len(env))
+        return (node, env[len(env)-nb:] if nb else (), tuple(names.get(n) for n in sorted(nn)))
+
+    def eval(self, node: ir.Node, env: tuple, names: tp.Dict[str, tp.Any]):
+        """
+        Evaluates node under env (de Bruijn values, innermost last) and names
+        (HOAS values). Sub-nodes in the same scope are evaluated with an
+        explicit stack; only applying a closure recurses.
+        """
+        evals = self._evals
+        root_key = self._key(node, env, names)
+        stack = [(node, root_key, False)]
+        while stack:
+            n, key, expanded = stack.pop()
+            if key in evals:
+                continue
+            deps = self._deps(n, env, names, evals)
+            if deps and not expanded:
+                stack.append((n, key, True))
+                stack.extend((c, self._key(c, env, names), False) for c in deps)
+                continue
+            val = self._eval(n, env, names, evals)
+            if val is None:
+                # A neutral Apply: its remaining parts are needed after all
+                stack.append((n, key, True))
+                stack.extend((c, self._key(c, env, names), False) for c in n.all_nodes)
+                continue
+            evals[key] = val
+        return evals[root_key]
+
+    def _deps(self, n: ir.Node, env, names, evals) -> tp.Sequence[ir.Node]:
+        """The parts of n that must be evaluated before n."""
+        if isinstance(n, ir.BoundVar):
+            if n.idx < len(env) and not isinstance(env[-(n.idx+1)], _Var):
+                return ()
+            return n.all_nodes
+        if isinstance(n, ir.BoundVarHOAS) and n.name in names:
+            return ()
+        if isinstance(n, _BINDERS):
+            return ()
+        if isinstance(n, (ir.Apply, ir.ApplyT)):
+            return n.children
+        return n.all_nodes
+
+    def _eval(self, node: ir.Node, env: tuple, names: tp.Dict[str, tp.Any], evals):
+        get = lambda c: evals[self._key(c, env, names)]
+        if isinstance(node, ir.BoundVar):
+            if node.idx < len(env):
+                v = env[-(node.idx+1)]
+                if not isinstance(v, _Var):
+                    return v
+                level = v.level
+            else:
+                level = len(env) - node.idx - 1
+            obl = get(node.obl) if node.obl is not None else None
+            return _Var(level, get(node.T), obl)
+        if isinstance(node, ir.BoundVarHOAS) and node.name in names:
+            return names[node.name]
+        if isinstance(node, _BINDERS):
+            return _Closure(node, env, names)
+        if isinstance(node, (ir.Apply, ir.ApplyT)):
+            func, arg = node.children
+            fv = get(func)
+            if isinstance(fv, _Closure):
+                return self.apply(fv, get(arg))
+            if any(self._key(c, env, names) not in evals for c in node.all_nodes):
+                return None
+        args = [get(c) for c in node.all_nodes]
+        if all(isinstance(a, ir.Node) for a in args):
+            return _rebuild(node, args)
+        return _Neutral(node, args)
+
+    def apply(self, clo: _Closure, arg):
+        lam = clo.node
+        body = lam.children[_body_pos(lam)]
+        if isinstance(lam, (ir.LambdaHOAS, ir.PiTHOAS)):
+            return self.eval(body, clo.env, {**clo.names, lam.bv_name: arg})
+        return self.eval(body, clo.env + (arg,), clo.names)
+
+    # ---------- readback ----------
+
+    def quote(self, val, level: int) -> ir.Node:
+        """
+        Reads val back to IR under level enclosing binders. Neutral parts are
+        read back with an explicit stack; only closures recurse.
+        """
+        quotes = self._quotes
+        stack = [(val, False)]
+        while stack:
+            v, expanded = stack.pop()
+            if isinstance(v, ir.Node) or (id(v), level) in quotes:
+                continue
+            if isinstance(v, _Var):
+                parts = [p for p in (v.T, v.obl) if p is not None]
+            elif isinstance(v, _Neutral):
+                parts = v.args
+            else:
+                parts = ()
+            if parts and not expanded:
+                stack.append((v, True))
+                stack.extend((p, False) for p in parts)
+                continue
+            # Keep v alive so its id is not reused while memoized
+            quotes[(id(v), level)] = (v, self._quote(v, level))
+        return self._quoted(val, level)
+
+    def _quoted(self, val, level: int) -> ir.Node:
+        if isinstance(val, ir.Node):
+            return val
+        return self._quotes[(id(val), level)][1]
+
+    def _quote(self, val, level: int) -> ir.Node:
+        if isinstance(val, _Var):
+            obl = self._quoted(val.obl, level) if val.obl is not None else None
+            return ir.BoundVar(self._quoted(val.T, level), level - val.level - 1, obl=obl)
+        if isinstance(val, _Neutral):
+            return _rebuild(val.node, [self._quoted(a, level) for a in val.args])
+        lam, env, names = val.node, val.env, val.names
+        pos = _body_pos(lam)
+        new = []
+        for i, c in enumerate(lam.all_nodes):
+            if i != pos:
+                new.append(self.quote(self.eval(c, env, names), level))
+            elif isinstance(lam, (ir.LambdaHOAS, ir.PiTHOAS)):
+                # The binder's own name is not substituted inside its body
+                inner = {k: v for k, v in names.items() if k != lam.bv_name}
+                new.append(self.quote(self.eval(c, env, inner), level))
+            else:
+                new.append(self.quote(self.eval(c, env + (_Var(level),), names), level + 1))
+        return _rebuild(lam, new)
+
+def _body_pos(binder: ir.Node) -> int:
+    """Position in all_nodes of the part a binder scopes over."""
+    return 1 if isinstance(binder, (ir.PiT, ir.PiTHOAS)) else 0
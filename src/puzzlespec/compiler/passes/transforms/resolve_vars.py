@@ -1,6 +1,7 @@
 from ..pass_base import Analysis, Transform, Context, AnalysisObject, handles
 from ..envobj import EnvsObj, SymTable
 from ...dsl import ir, ast
+from ...dsl.utils import _find_node
 import typing as tp
 
 def resolve_bound_vars(root: ir.Node) -> ir.Node:
@@ -24,21 +25,18 @@ class ResolveBoundVars(Transform):
         return new_root
 
     def _check_no_hoas(self, node):
-        if isinstance(node, (ir.BoundVarHOAS, ir.LambdaHOAS, ir.PiTHOAS)):
-            raise ValueError(f"Failed resolve bound, found {node}")
-        for c in node.all_nodes:
-            self._check_no_hoas(c)
+        is_hoas = lambda n: isinstance(n, (ir.BoundVarHOAS, ir.LambdaHOAS, ir.PiTHOAS))
+        if (found := _find_node(node, is_hoas)) is not None:
+            raise ValueError(f"Failed resolve bound, found {found}")
 
     @handles(ir.LambdaHOAS)
     def _(self, node):
         body, = node.children
-        T = node.T  # PiTHOAS
-        bv = T.children[0]  # BoundVarHOAS from PiTHOAS's argT
-        new_T = self.visit(T)
-        self.stack.append(bv)
+        new_T = self.visit(node.T)
+        self.stack.append(node.bv_name)
         new_body = self.visit(body)
         self.stack.pop()
-        return ir.Lambda(new_T, new_body)
+        return ir.Lambda(new_T, new_body, inj=node.inj)
 
     @handles(ir.Lambda)
     def _(self, node):
@@ -47,16 +45,16 @@ class ResolveBoundVars(Transform):
         self.stack.append(None)
         new_body = self.visit(body)
         self.stack.pop()
-        return ir.Lambda(new_T, new_body)
+        return ir.Lambda(new_T, new_body, inj=node.inj)
 
     @handles(ir.PiTHOAS)
     def _(self, node):
-        bv, bodyT = node.children
-        bv_T = self.visit(bv.T)
-        self.stack.append(bv)
+        argT, bodyT = node.children
+        new_argT = self.visit(argT)
+        self.stack.append(node.bv_name)
         new_bodyT = self.visit(bodyT)
         self.stack.pop()
-        return ir.PiT(bv_T, new_bodyT)
+        return ir.PiT(new_argT, new_bodyT)
 
     @handles(ir.PiT)
     def _(self, node):
@@ -71,8 +69,8 @@ class ResolveBoundVars(Transform):
     def _(self, use):
         # find binder in stack from the end
         for depth_from_end, binder in enumerate(reversed(self.stack)):
-            if binder == use:
-                return ir.BoundVar(idx=depth_from_end)
+            if binder == use.name:
+                return ir.BoundVar(self.visit(use.T), idx=depth_from_end)
         # if we get here, no binder in scope
         raise ValueError(f"Unbound placeholder {use} (stack={self.stack})")
 
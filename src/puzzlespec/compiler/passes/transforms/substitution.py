@@ -25,13 +25,28 @@ class SubstitutionPass(Transform):
 
     def run(self, root: ir.Node, ctx: Context):
         self.sub_mapping = ctx.get(SubMapping)
+        # Replacements found by _parts, for the handler
+        self.replaced = {}
         return self.visit(root)
-    
-    # TODO inefficient
-    def visit(self, node: ir.Node):
+
+    def _match(self, node: ir.Node):
         for submap in self.sub_mapping:
             if submap.match(node):
-                return submap.replace(node)
+                return submap
+        return None
+
+    # Matches top-down: the walk does not descend into replaced nodes
+    def _parts(self, node: ir.Node):
+        submap = self._match(node)
+        if submap is not None:
+            self.replaced[node] = submap.replace(node)
+            return (), None
+        return node.all_nodes, None
+
+    # TODO inefficient
+    def visit(self, node: ir.Node):
+        if node in self.replaced:
+            return self.replaced.pop(node)
         vc = self.visit_children(node)
         if isinstance(node, ir.Value):
             return node.replace(*vc.children, T=vc.T, obl=vc.obl)
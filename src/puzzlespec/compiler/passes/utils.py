@@ -1,8 +1,9 @@
 from ..dsl import ir
-from .pass_base import PassManager, Context
+from .pass_base import PassManager, Context, Transform, FusedTransform
 from .analyses.type_check import TypeCheckingPass, TypeMap
 from .transforms import CanonicalizePass, DomainSimplificationPass
-from .transforms.beta_reduction import BetaReductionHOAS, BetaReductionPass
+from .transforms.beta_reduction import BetaReductionPass
+from .transforms.nbe import NbEPass
 #from .transforms.refine import RefineSimplify
 from .transforms import ConstFoldPass, AlgebraicSimplificationPass
 from .transforms.resolve_vars import ResolveBoundVars
@@ -11,18 +12,31 @@ from .transforms.curry import CurryPass
 from .transforms.nd_simplification import NDSimplificationPass
 from .analyses.verifydag import VerifyDag
 import enum
+import typing as tp
+
+def simplify_group(hoas: bool=False) -> tp.List[Transform]:
+    """The rewrites simplify() iterates to a fixed point, fused into one traversal.
+
+    Beta reduction evaluates whole terms (NbEPass), so it cannot be fused and
+    runs as its own pass.
+    """
+    rewrites = [
+        CanonicalizePass(),
+        ConstFoldPass(),
+        AlgebraicSimplificationPass(),
+        DomainSimplificationPass(),
+        GuardOpt(),
+    ]
+    if hoas:
+        return [FusedTransform(*rewrites), NbEPass()]
+    return [FusedTransform(*rewrites, BetaReductionPass())]
 
 def simplify(node: ir.Node, hoas: bool=False, strip_guards=False, verbose: int = 0, max_iter: int=5) -> ir.Node:
     opt_passes = [
         TypeCheckingPass(),
         GuardLift(),
         [
-            CanonicalizePass(),
-            ConstFoldPass(),
-            AlgebraicSimplificationPass(),
-            DomainSimplificationPass(),
-            GuardOpt(),
-            BetaReductionHOAS() if hoas else BetaReductionPass(),
+            *simplify_group(hoas),
             VerifyDag()
         ],
         NDSimplificationPass(),
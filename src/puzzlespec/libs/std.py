@@ -99,7 +99,7 @@ def make_enum(*labels: str, name: str=None) -> tp.Tuple[ast.DomainExpr, _EnumAtt
         labels = [l for l in labels[0]]
     T = enumT(*labels, name=name)
     enum_attrs = _EnumAttrs(T.node)
-    dom_node = ir.Universe(ir.DomT(T.node, ord=False))
+    dom_node = ir.Universe(ir.DomT(T.node))
     dom = ast.DomainExpr(dom_node)
     return dom, enum_attrs
 
@@ -4,6 +4,7 @@ from __future__ import annotations
 #from puzzlespec.libs import optional as opt, topology as topo, nd
 from ...compiler.dsl import ir, ast
 from .tactic import Tactic
+from .index import TacticIndex
 import typing as tp
 from dataclasses import dataclass
 
@@ -36,24 +37,27 @@ class Justification:
         for g in self.goals:
             g.parents.append(self)
 
-@dataclass
+@dataclass(eq=False)
 class GoalNode:
+    """A goal under a set of facts. The engine makes one per simplified goal
+    and fact set (see DischargeEngine.build_goal), so nodes compare by
+    identity and subgoals reached twice are shared."""
     goal: ir.Node
     kind: tp.Literal["base", "and", "or"]
-    facts: tp.Tuple[ir.Node]
+    facts: tp.FrozenSet[ir.Node]
     status: tp.Literal["New", "Expanded", "Proven", "Disproven", "Failed"] = "New"
     def __post_init__(self):
-        self.goal = ast.wrap(self.goal).simplify().node
         self.justs: tp.List[Justification] = []
-        self.parents: tp.List[GoalNode] = []
+        self.parents: tp.List[Justification] = []
+        # The candidate tactics of a base goal not yet tried
+        self.tactics: tp.Optional[tp.Iterator[Tactic]] = None
 
     def add_justification(self, just: Justification):
         self.justs.append(just)
 
-    def __eq__(self, other):
-        if not isinstance(other, GoalNode):
-            return False
-        return self.goal==other.goal
+    @property
+    def settled(self) -> bool:
+        return self.status in ("Proven", "Disproven", "Failed")
 
     
 
@@ -61,16 +65,34 @@ class DischargeEngine(Engine):
     def __init__(self, *tactics: Tactic, verbose=0, max_iter=10):
         self.verbose=verbose
         self.tactics = tactics
+        self.index = TacticIndex(tactics)
         self.max_iter = max_iter
+        # The goal DAG, kept across prove_backwards calls: one node per
+        # (simplified goal, fact set). Settled nodes are the proof cache.
+        self.goals: tp.Dict[tp.Tuple[ir.Node, tp.FrozenSet[ir.Node]], GoalNode] = {}
+        self._simplified: tp.Dict[ir.Node, ir.Node] = {}
 
-    def build_goal(self, goal: ir.Node, facts):
-        return GoalNode(goal, kind=None, facts=facts)
+    def simplify(self, node: ir.Node) -> ir.Node:
+        res = self._simplified.get(node)
+        if res is None:
+            res = self._simplified[node] = ast.wrap(node).simplify().node
+            self._simplified[res] = res
+        return res
+
+    def build_goal(self, goal: ir.Node, facts: tp.Iterable[ir.Node]) -> GoalNode:
+        """The node of goal under facts, made on first use."""
+        goal = self.simplify(goal)
+        facts = frozenset(facts)
+        key = (goal, facts)
+        goalN = self.goals.get(key)
+        if goalN is None:
+            goalN = self.goals[key] = GoalNode(goal, kind=None, facts=facts)
+        return goalN
 
     def prove_backwards(self, goal, wits: tp.List[ir.Node]) -> str:
         assert isinstance(goal, ir.Node)
         assert all(isinstance(wit, ir.Node) for wit in wits)
-        self.root_wits = set([ast.wrap(w).simplify().node for w in wits])
-        goal = ast.wrap(goal).simplify().node
+        self.root_wits = frozenset(self.simplify(w) for w in wits)
         self.root_goal = self.build_goal(goal, self.root_wits)
         self.work: tp.List[GoalNode] = []
         self.work.append(self.root_goal)
@@ -85,10 +107,12 @@ class DischargeEngine(Engine):
         goal = goalN.goal
         if goal == ir.Lit(ir.BoolT(), True):
             goalN.status = "Proven"
+        elif goal == ir.Lit(ir.BoolT(), False):
+            goalN.status = "Disproven"
         elif goal in goalN.facts:
             goalN.status = "Proven"
         elif isinstance(goal, ir.Conj):
-            children = [self.build_goal(c) for c in goal.children[1:]]
+            children = [self.build_goal(c, goalN.facts) for c in goal.children]
             goalN.status = "Expanded"
             goalN.kind = "and"
             for c in children:
@@ -97,57 +121,102 @@ class DischargeEngine(Engine):
             just = Justification('And', 'and', tuple(children), goalN)
             goalN.add_justification(just)
         elif isinstance(goal, ir.Disj):
-            children = [self.build_goal(c) for c in goal.children[1:]]
+            children = [self.build_goal(c, goalN.facts) for c in goal.children]
             goalN.status = "Expanded"
             goalN.kind = "or"
-            # Only add 1st branch
+            # Only add 1st branch; the next ones if it fails
             self.work.append(children[0])
             # Create justification
             just = Justification('Or', 'or', tuple(children), goalN)
             goalN.add_justification(just)
         else:
             goalN.kind = "base"
-            # Try proving with tactics
-            progress = self.prove_backwards_tactics(goalN)
-            if not progress:
-                raise ValueError("Not proved :(")
+            # Try proving with tactics; with none, it Failed
+            self.prove_backwards_tactics(goalN)
         print(f"  {goalN.status}")
-        if goalN.status == "Proven":
+        # Subgoals shared with earlier work may already be settled
+        for just in goalN.justs:
+            self.settle(goalN, just)
+        if goalN.settled:
             self.propogate_justifications(goalN)
-    
+
+    def settle(self, goalN: GoalNode, just: Justification):
+        """Settles goalN by a justification whose goals are settled. Only
+        the structural And/Or justifications can disprove it. An Or whose
+        branch failed goes on to the next one, and likewise a tactic whose
+        subgoals failed to the next candidate tactic; goalN Failed once none
+        is left."""
+        if goalN.settled:
+            return
+        status = just.status
+        gs = [g.status for g in just.goals]
+        if status == "Proven" or (status == "Disproven" and just.tactic in ('And', 'Or')):
+            goalN.status = status
+        elif just.kind == 'and':
+            if not any(s in ("Disproven", "Failed") for s in gs):
+                return
+            if not isinstance(just.tactic, Tactic):
+                goalN.status = "Failed"
+            elif just is goalN.justs[-1] and self.prove_backwards_tactics(goalN):
+                # Earlier tactics have failed already, so only the last one
+                # moves on
+                self.settle(goalN, goalN.justs[-1])
+        elif all(g.settled for g in just.goals):
+            goalN.status = "Failed"
+        elif "Expanded" not in gs:
+            self.work.append(next(g for g in just.goals if g.status == "New"))
+
+    def is_ancestor(self, node: GoalNode, goalN: GoalNode) -> bool:
+        """Whether goalN is node or depends on it: a justification of node
+        needing goalN would be a cycle."""
+        seen = set()
+        stack = [goalN]
+        while stack:
+            g = stack.pop()
+            if g is node:
+                return True
+            if g in seen:
+                continue
+            seen.add(g)
+            stack.extend(j.parent for j in g.parents)
+        return False
+
     def propogate_justifications(self, goalN: GoalNode):
-        assert goalN.status == "Proven"
+        assert goalN.settled
         for j in goalN.parents:
             assert isinstance(j, Justification)
-            statuses = [g.status for g in j.goals]
-            if j.kind=="and":
-                if all(s=='Proven' for s in statuses):
-                    pgoal = j.parent
-                    pgoal.status = "Proven"
-                    self.propogate_justifications(pgoal)
-            else:
-                raise NotImplementedError()
-
-    def prove_backwards_tactics(self, goalN: GoalNode):
+            pgoal = j.parent
+            if pgoal.settled:
+                continue
+            self.settle(pgoal, j)
+            if pgoal.settled:
+                self.propogate_justifications(pgoal)
+
+    def prove_backwards_tactics(self, goalN: GoalNode) -> bool:
+        """Expands goalN by its next candidate tactic that applies. With none
+        left, goalN Failed."""
         assert goalN.kind=='base'
-        progress = False
-        for t in self.tactics:
+        if goalN.tactics is None:
+            goalN.tactics = iter(self.index.candidates(goalN.goal))
+        for t in goalN.tactics:
             sub_goals = t.apply_backward(goalN.goal)
             if sub_goals is None:
                 continue
+            sub_goals = [self.build_goal(g, goalN.facts) for g in sub_goals]
+            # Skip tactics that lead back to a goal being proved, or to one
+            # already known not to hold
+            if any(g.status in ("Disproven", "Failed") or self.is_ancestor(g, goalN) for g in sub_goals):
+                continue
             # Applied tactic successfully!
             # Add a justification edge.
-            sub_goals = [self.build_goal(g, list(goalN.facts)) for g in sub_goals]
             for g in sub_goals:
                 self.work.append(g)
             just = Justification(t, 'and', tuple(sub_goals), goalN)
             goalN.status = "Expanded"
             goalN.add_justification(just)
-            progress=True
-            break
-        if not progress:
-            goalN.status = "Failed"
-        return progress
+            return True
+        goalN.status = "Failed"
+        return False
             
 
 
@@ -0,0 +1,81 @@
+from ...compiler.dsl import ir
+from .tactic import Tactic
+import typing as tp
+
+# A discrimination tree over the conclusion templates of tactics.
+#
+# A template is flattened in preorder to a path of symbols: a node is its
+# (_opcode, field values, arity), as match_template compares them, and a
+# MetaVar is a wildcard. The paths share a trie. A goal is looked up by
+# walking the trie along the goal's own preorder: a node follows the edge of
+# its symbol and goes on into its children, or follows the wildcard edge and
+# skips its whole subterm. The tactics reached are the ones whose templates
+# can match the goal, found in time bounded by the goal's size and the trie
+# paths it agrees with, not by the number of tactics. match_template still
+# has the last word: the tree does not check that a repeated MetaVar is
+# bound to the same node each time.
+
+_STAR = None
+
+def _symbol(node: ir.Node):
+    if isinstance(node, ir.MetaVar):
+        return _STAR
+    return (node._opcode, node.field_vals, len(node.children))
+
+def _preorder(node: ir.Node) -> tp.Iterator[ir.Node]:
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        yield n
+        if not isinstance(n, ir.MetaVar):
+            stack.extend(reversed(n.children))
+
+class _Trie:
+    __slots__ = ('edges', 'items')
+
+    def __init__(self):
+        self.edges: tp.Dict[tp.Any, _Trie] = {}
+        # Positions of the tactics whose templates end here
+        self.items: tp.List[int] = []
+
+class TacticIndex:
+    def __init__(self, tactics: tp.Iterable[Tactic] = ()):
+        self.tactics: tp.List[Tactic] = []
+        self.root = _Trie()
+        for t in tactics:
+            self.add(t)
+
+    def __len__(self):
+        return len(self.tactics)
+
+    def add(self, tactic: Tactic):
+        node = self.root
+        for n in _preorder(tactic.q):
+            node = node.edges.setdefault(_symbol(n), _Trie())
+        node.items.append(len(self.tactics))
+        self.tactics.append(tactic)
+
+    def candidates(self, goal: ir.Node) -> tp.List[Tactic]:
+        """The tactics whose conclusions may match goal, in the order they
+        were added."""
+        found = []
+        # Each entry is a trie node and the goal subterms still to walk, as a
+        # linked list (term, rest)
+        stack = [(self.root, (goal, None))]
+        while stack:
+            node, todo = stack.pop()
+            if todo is None:
+                found.extend(node.items)
+                continue
+            term, rest = todo
+            star = node.edges.get(_STAR)
+            if star is not None:
+                stack.append((star, rest))
+            if isinstance(term, ir.MetaVar):
+                continue
+            child = node.edges.get(_symbol(term))
+            if child is not None:
+                for c in reversed(term.children):
+                    rest = (c, rest)
+                stack.append((child, rest))
+        return [self.tactics[i] for i in sorted(found)]
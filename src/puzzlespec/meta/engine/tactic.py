@@ -40,20 +40,24 @@ import typing as tp
 #            actions.append(AddWitness(pred))
 #        return actions
 
+def _rebuild(node: ir.Node, fn: tp.Callable[[ir.Node], ir.Node]) -> ir.Node:
+    # Named children (a Value's T and obl, a Type's ref/view/obl) are passed
+    # back by name, as replace expects them
+    named = {n: None if c is None else fn(c) for n, c in node.named_children_dict.items()}
+    return node.replace(*(fn(c) for c in node.children), **named)
+
 def open_lambda(lam: ir.LambdaHOAS, mvar: ir.MetaVar) -> ir.Node:
     def _open(node: ir.Node):
         if isinstance(node, ir.BoundVarHOAS) and node.name==lam.bv_name:
             return mvar
-        children = [_open(c) for c in node.children]
-        return node.replace(*children)
+        return _rebuild(node, _open)
     return _open(lam.body)
 
 def substitute(node: ir.Node, env: tp.Mapping[int, ir.Node]) -> ir.Node:
     if isinstance(node, ir.MetaVar):
         assert node.id in env
         return env[node.id]
-    new_children = [substitute(c, env) for c in node.children]
-    return node.replace(*new_children)
+    return _rebuild(node, lambda c: substitute(c, env))
 
 class Tactic:
     def __init__(
@@ -112,7 +116,7 @@ def match_template(val: ir.Node, template: ir.Node, env):
         else:
             env = {**env, template.id: val}
         return env
-    if type(val) == type(template) and val.field_dict == template.field_dict:
+    if type(val) == type(template) and val.field_dict == template.field_dict and len(val.children) == len(template.children):
     #if type(val) == type(template):
         envs = [match_template(vc, tc, env) for vc, tc in zip(val.children, template.children)]
         env = {}
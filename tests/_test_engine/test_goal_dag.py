@@ -0,0 +1,61 @@
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.meta import DischargeEngine, Tactic
+
+IntT, BoolT = ir.IntT(), ir.BoolT()
+M0 = ir.MetaVar(0)
+x = ir.VarRef(IntT, 0)
+
+def lit(v):
+    return ir.Lit(IntT, v)
+
+def lt(a, b):
+    return ir.Lt(BoolT, a, b)
+
+def chain(lo, hi):
+    # (m < lo) -> (m < hi)
+    return Tactic((ir.Universe(ir.DomT(IntT)),), lt(M0, lit(lo)), lt(M0, lit(hi)))
+
+def test_goal_dag():
+    # x<5 <- x<3 <- x<1; x<3 <- x<5 would be a cycle, and is skipped
+    e = DischargeEngine(chain(3, 5), chain(5, 3), chain(1, 3))
+    facts = [lt(x, lit(1))]
+    assert e.prove_backwards(lt(x, lit(5)), facts) == "Proven"
+    n = len(e.goals)
+    x3 = e.build_goal(lt(x, lit(3)), e.root_wits)
+    assert x3.status == "Proven" and len(x3.justs) == 1 and x3.justs[0].tactic is e.tactics[2]
+    # Proven subgoals are shared: no new work, and no new nodes
+    assert e.prove_backwards(lt(x, lit(3)), facts) == "Proven"
+    assert e.root_goal is x3 and len(e.goals) == n
+    goal = ir.Conj(BoolT, lt(x, lit(5)), lt(x, lit(3)))
+    assert e.prove_backwards(goal, facts) == "Proven"
+    assert len(e.goals) == n + 1
+    # Other facts are another goal
+    assert e.build_goal(lt(x, lit(3)), []) is not x3
+    assert e.prove_backwards(ir.Conj(BoolT, lt(x, lit(3)), ir.Lit(BoolT, False)), facts) == "Disproven"
+
+def test_conj_disj():
+    e = DischargeEngine(chain(3, 5), chain(1, 3))
+    y = ir.VarRef(IntT, 1)
+    facts = [lt(x, lit(1)), lt(y, lit(7))]
+    # The first conjunct is checked too
+    assert e.prove_backwards(ir.Conj(BoolT, lt(x, lit(0)), lt(x, lit(3))), facts) == "Failed"
+    assert e.prove_backwards(ir.Conj(BoolT, lt(y, lit(0)), lt(x, lit(5))), facts) == "Failed"
+    assert e.prove_backwards(ir.Conj(BoolT, ir.Lit(BoolT, False), lt(x, lit(3))), facts) == "Disproven"
+    assert e.prove_backwards(ir.Conj(BoolT, lt(x, lit(3)), lt(y, lit(7))), facts) == "Proven"
+    # The failure is cached, and does not spoil what does hold
+    assert e.prove_backwards(lt(x, lit(5)), facts) == "Proven"
+    assert e.prove_backwards(ir.Conj(BoolT, lt(x, lit(0)), lt(x, lit(3))), facts) == "Failed"
+    # A failed branch of an Or moves on to the next
+    assert e.prove_backwards(ir.Disj(BoolT, lt(y, lit(0)), lt(x, lit(5))), facts) == "Proven"
+    assert e.prove_backwards(ir.Disj(BoolT, lt(y, lit(0)), lt(x, lit(0))), facts) == "Failed"
+
+def test_tactic_fallback():
+    # x<5 <- x<3 fails, so x<5 <- x<4 is tried next
+    e = DischargeEngine(chain(3, 5), chain(4, 5))
+    facts = [lt(x, lit(4))]
+    assert e.prove_backwards(lt(x, lit(5)), facts) == "Proven"
+    assert e.build_goal(lt(x, lit(3)), e.root_wits).status == "Failed"
+    assert [j.tactic for j in e.root_goal.justs] == list(e.tactics)
+    assert e.prove_backwards(lt(x, lit(5)), facts) == "Proven"
+    # With every candidate failed, so does the goal
+    assert e.prove_backwards(lt(x, lit(5)), [lt(x, lit(7))]) == "Failed"
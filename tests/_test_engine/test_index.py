@@ -0,0 +1,46 @@
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.meta import Tactic
+from puzzlespec.meta.engine.index import TacticIndex
+from puzzlespec.meta.engine.tactic import match_template
+
+IntT, BoolT = ir.IntT(), ir.BoolT()
+M0, M1 = ir.MetaVar(0), ir.MetaVar(1)
+
+def lit(v):
+    return ir.Lit(IntT, v)
+
+def tactic(q, n):
+    return Tactic(tuple(ir.Universe(ir.DomT(IntT)) for _ in range(n)), ir.Lit(BoolT, True), q)
+
+def test_candidates():
+    x, y = ir.VarRef(IntT, 0), ir.VarRef(IntT, 1)
+    tactics = [tactic(ir.Lt(BoolT, M0, lit(k)), 1) for k in range(200)]
+    tactics += [
+        tactic(ir.Eq(BoolT, M0, M0), 1),
+        tactic(ir.Eq(BoolT, M0, M1), 2),
+        tactic(ir.Lt(BoolT, lit(0), M0), 1),
+        tactic(ir.Not(BoolT, ir.Eq(BoolT, M0, lit(0))), 1),
+        tactic(M0, 1),
+    ]
+    index = TacticIndex(tactics)
+    assert len(index) == len(tactics)
+    goals = [
+        ir.Lt(BoolT, x, lit(7)),
+        ir.Lt(BoolT, lit(0), lit(7)),
+        ir.Lt(BoolT, lit(0), x),
+        ir.Eq(BoolT, x, x),
+        ir.Eq(BoolT, x, y),
+        ir.Not(BoolT, ir.Eq(BoolT, ir.Sum(IntT, x, y), lit(0))),
+        ir.Not(BoolT, ir.Eq(BoolT, x, lit(1))),
+        ir.Conj(BoolT, ir.Lt(BoolT, x, lit(7)), ir.Eq(BoolT, x, y)),
+    ]
+    for goal in goals:
+        cands = index.candidates(goal)
+        # Nothing that matches is missed, and the order is kept
+        matching = [t for t in tactics if match_template(goal, t.q, {}) is not None]
+        assert [t for t in cands if match_template(goal, t.q, {}) is not None] == matching
+        assert cands == [t for t in tactics if t in cands]
+        assert len(cands) <= 4
+    # The repeated MetaVar is left to match_template
+    assert len(index.candidates(ir.Eq(BoolT, x, y))) == 3
+    assert index.candidates(ir.Lt(BoolT, x, lit(7))) == [tactics[7], tactics[-1]]
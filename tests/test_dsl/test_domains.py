@@ -0,0 +1,75 @@
+"""Finite domain enumeration: utils._dom_size, _iterate and _dom_arrays."""
+import numpy as np
+import pytest
+
+from puzzlespec.compiler.dsl import ast_nd, ir, utils
+
+IntT = ir.IntT()
+BoolT = ir.BoolT()
+
+
+def lit(val):
+    return ir.Lit(IntT, val)
+
+
+def fin(n):
+    return ir.Fin(ir.DomT(IntT), lit(n))
+
+
+def lam(argT, resT, body, name="x"):
+    return ir.LambdaHOAS(ir.PiTHOAS(argT, resT, name), body, name)
+
+
+def vals(dom):
+    return [utils._unpack(e) for e in utils._iterate(dom)]
+
+
+def test_structural():
+    carT = ir.TupleT(IntT, IntT)
+    cp = ir.CartProd(ir.DomT(carT), fin(2), ir.Range(ir.DomT(IntT), lit(1), lit(7), lit(3)))
+    assert utils._dom_size(cp) == 4
+    assert vals(cp) == [(0, 1), (0, 4), (1, 1), (1, 4)]
+    sl = ir.Slice(ir.DomT(carT), cp, lit(1), lit(4), lit(2))
+    assert utils._dom_size(sl) == 2 and vals(sl) == [(0, 4), (1, 4)]
+    sumT = ir.SumT(IntT, IntT)
+    du = ir.DisjUnion(ir.DomT(sumT), fin(2), ir.Singleton(ir.DomT(IntT), lit(5)))
+    assert utils._dom_size(du) == 3
+    assert [(e.idx, e.children[0].val) for e in utils._iterate(du)] == [(0, 0), (0, 1), (1, 5)]
+    dl = ir.DomLit(ir.DomT(IntT), lit(3), lit(1), lit(3))
+    assert utils._dom_size(dl) == 2 and vals(dl) == [3, 1]
+    assert utils._dom_size(ir.Empty(ir.DomT(IntT))) == 0
+
+
+def test_image_and_restrict():
+    x = ir.BoundVarHOAS(ir.IntT(ref=fin(7)), True, "x")
+    halves = ir.Image(ir.DomT(IntT), lam(x.T, IntT, ir.FloorDiv(IntT, x, lit(2))))
+    assert utils._dom_size(halves) == 4
+    assert vals(halves) == [0, 1, 2, 3]
+    assert utils._dom_arrays(halves)[0].tolist() == [0, 1, 2, 3]
+    odd = ir.Restrict(ir.DomT(IntT), lam(x.T, BoolT, ir.Eq(BoolT, ir.Mod(IntT, x, lit(2)), lit(1))))
+    assert vals(odd) == [1, 3, 5]
+    f = ir.FuncLit(ir.PiTHOAS(ir.IntT(ref=fin(3)), IntT, "x"), fin(3), lit(4), lit(4), lit(2),
+                   layout=ir._DenseLayout(val_map={lit(i)._key: i for i in range(3)}))
+    assert vals(ir.Image(ir.DomT(IntT), f)) == [4, 2]
+
+
+def test_nd_arrays():
+    cells = ast_nd.nd_cartprod(ast_nd.fin(2), ast_nd.fin(3)).node
+    assert isinstance(cells, ir.Image)
+    arrays = utils._dom_arrays(cells)
+    assert [a.tolist() for a in arrays] == np.indices((2, 3)).reshape(2, -1).tolist()
+    assert utils._dom_size(cells) == 6
+    elems = list(utils._iterate(cells))
+    assert [utils._unpack(e) for e in elems] == [(r, c) for r in range(2) for c in range(3)]
+    # Cached per interned node
+    assert all(a is b for a, b in zip(elems, utils._iterate(cells)))
+    assert utils._dom_arrays(cells) is arrays
+
+
+def test_not_concrete():
+    dom = ir.Fin(ir.DomT(IntT), ir.VarRef(IntT, 0))
+    assert utils._dom_size(dom) is None and utils._dom_arrays(dom) is None
+    with pytest.raises(ValueError):
+        list(utils._iterate(dom))
+    dl = ir.DomLit(ir.DomT(IntT), lit(1), ir.VarRef(IntT, 0))
+    assert utils._dom_size(dl) is None
@@ -18,6 +18,16 @@ def bool_lit(val):
     return ir.Lit(ir.BoolT(), val)
 
 
+def _walk(node):
+    stack, seen = [node], set()
+    while stack:
+        n = stack.pop()
+        if n not in seen:
+            seen.add(n)
+            yield n
+            stack.extend(n.all_nodes)
+
+
 # ---------------------------------------------------------------------------
 # Basic Value hashing
 # ---------------------------------------------------------------------------
@@ -275,12 +285,23 @@ class TestMetadataDoesNotAffectEquality:
         a._metadata["extra"] = 999
         assert hash(a) == h_before
 
-    def test_metadata_copied_on_replace(self):
+    def test_metadata_not_copied_on_replace(self):
+        # The result may be a node shared with other users
+        shared = int_lit(99)
         a = int_lit(42)
         a._metadata["tag"] = "original"
         b = a.replace(T=ir.IntT(), obl=None, val=99)
-        assert b._metadata["tag"] == "original"
-        assert b != a  # different val field
+        assert b is shared
+        assert "tag" not in b._metadata
+
+    def test_inj_is_a_field(self):
+        argT = ir.IntT()
+        lamT = ir.PiTHOAS(argT, ir.IntT(), bv_name="x")
+        body = ir.BoundVarHOAS(argT, False, "x")
+        plain = ir.LambdaHOAS(lamT, body, bv_name="x")
+        inj = ir.LambdaHOAS(lamT, body, bv_name="x", inj=True)
+        assert plain != inj and not plain.inj
+        assert inj.replace(int_lit(1), T=lamT, obl=None).inj
 
 
 # ---------------------------------------------------------------------------
@@ -331,3 +352,99 @@ class TestHashConsingInCollections:
         assert d[k2] == "guarded"
         k3 = ir.Lit(ir.IntT(), 1)
         assert k3 not in d
+
+
+# ---------------------------------------------------------------------------
+# Interning: structurally equal nodes are the same object
+# ---------------------------------------------------------------------------
+
+class TestInterning:
+    def test_same_literal_is_same_object(self):
+        assert int_lit(42) is int_lit(42)
+
+    def test_nested_is_same_object(self):
+        a = ir.Sum(ir.IntT(), int_lit(1), int_lit(2))
+        b = ir.Sum(ir.IntT(), int_lit(1), int_lit(2))
+        assert a is b
+        assert a.children[0] is b.children[0]
+
+    def test_named_children_interned(self):
+        ref = ir.Fin(ir.DomT(ir.IntT()), int_lit(5))
+        a = ir.IntT(ref=ref, obl=bool_lit(True))
+        b = ir.IntT(ref=ir.Fin(ir.DomT(ir.IntT()), int_lit(5)), obl=bool_lit(True))
+        assert a is b
+
+    def test_replace_returns_interned(self):
+        a = ir.Sum(ir.IntT(), int_lit(1), int_lit(2))
+        b = ir.Sum(ir.IntT(), int_lit(1), int_lit(3))
+        c = b.replace(int_lit(1), int_lit(2), T=ir.IntT(), obl=None)
+        assert c is a
+
+    def test_different_fields_not_shared(self):
+        assert ir.BoundVar(ir.IntT(), idx=0) is not ir.BoundVar(ir.IntT(), idx=1)
+
+    def test_metavars_distinct(self):
+        assert ir.MetaVar(0) is not ir.MetaVar(1)
+        assert ir.MetaVar(0) is ir.MetaVar(0)
+
+    def test_key_matches_structure(self):
+        a = ir.Sum(ir.IntT(), int_lit(1), int_lit(2))
+        assert a._key == ir.Sum(ir.IntT(), int_lit(1), int_lit(2))._key
+        assert a._key != ir.Prod(ir.IntT(), int_lit(1), int_lit(2))._key
+
+    def test_interned_nodes_immutable(self):
+        import pytest
+        a = int_lit(7)
+        with pytest.raises(AttributeError):
+            a.val = 8
+        with pytest.raises(AttributeError):
+            ir.BoundVarHOAS(ir.IntT(), False, "x").closed = True
+        assert int_lit(7).val == 7
+
+    def test_lambda_binder_matches_key(self):
+        from puzzlespec.libs import nd
+        lam = nd.fin(3).map(lambda i: i + 1).node
+        bvs = [n for n in _walk(lam) if isinstance(n, ir.BoundVarHOAS)]
+        assert bvs
+        for bv in bvs:
+            assert bv.field_dict["closed"] == bv.closed
+            assert bv.replace(T=bv.T, obl=bv.obl) is bv
+
+    def test_unreferenced_nodes_collected(self):
+        import gc
+        gc.collect()
+        before = ir.num_interned()
+        nodes = [int_lit(10_000 + i) for i in range(100)]
+        assert ir.num_interned() >= before + 100
+        del nodes
+        gc.collect()
+        assert ir.num_interned() <= before
+
+
+# ---------------------------------------------------------------------------
+# Slotted layout
+# ---------------------------------------------------------------------------
+
+class TestSlots:
+    def test_no_instance_dict(self):
+        for node in (int_lit(3), ir.IntT(), ir.EnumT("Color", ("R", "G")),
+                     ir.BoundVar(ir.IntT(), idx=0), ir.MetaVar(3)):
+            assert not hasattr(node, "__dict__")
+
+    def test_fields_and_named_children_are_slots(self):
+        assert "val" in ir.Lit.__slots__
+        assert {"_T", "_obl"} <= set(ir.Value.__slots__)
+        assert {"_ref", "_view", "_obl"} <= set(ir.Type.__slots__)
+
+    def test_metadata_allocated_lazily(self):
+        a = int_lit(123_456)
+        assert a._meta is None
+        a._metadata["tag"] = 1
+        assert a._meta == {"tag": 1}
+
+    def test_accessors(self):
+        ref = ir.Fin(ir.DomT(ir.IntT()), int_lit(5))
+        T = ir.IntT(ref=ref)
+        assert T.named_children_dict == {"ref": ref, "view": None, "obl": None}
+        assert T.all_nodes == (ref,)
+        assert ir.EnumT("C", ("R",)).field_dict == {"name": "C", "labels": ("R",)}
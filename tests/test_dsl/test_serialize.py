@@ -0,0 +1,52 @@
+"""Compact IR serialization: dumps/loads round trips."""
+import gc
+
+from puzzlespec.compiler.dsl import ir, serialize
+
+IntT = ir.IntT()
+BoolT = ir.BoolT()
+
+
+def lit(val):
+    return ir.Lit(IntT, val)
+
+
+def fin_var(sid, n):
+    return ir.VarRef(ir.IntT(ref=ir.Fin(ir.DomT(IntT), lit(n))), sid)
+
+
+def make_spec():
+    x, y = fin_var(0, 9), fin_var(1, 9)
+    s = ir.Sum(IntT, x, y)
+    dom = ir.Fin(ir.DomT(IntT), lit(3))
+    elems = [lit(5), s, lit(7)]
+    layout = ir._DenseLayout(val_map={lit(i)._key: i for i in range(3)})
+    f = ir.FuncLit(ir.PiTHOAS(ir.IntT(ref=dom), IntT, "i"), dom, *elems, layout=layout)
+    cons = (ir.Lt(BoolT, s, lit(10)), ir.Eq(BoolT, ir.Apply(IntT, f, lit(1)), lit(8)))
+    return ir.Spec(ir.TupleLit(ir.TupleT(BoolT, BoolT), *cons), ir.TupleLit(ir.TupleT()))
+
+
+def test_round_trip_is_identity():
+    spec = make_spec()
+    assert serialize.loads(serialize.dumps(spec)) is spec
+
+
+def test_shared_nodes_written_once():
+    x = fin_var(0, 9)
+    s = x
+    for _ in range(30):
+        s = ir.Sum(IntT, s, s)
+    data = serialize.dumps(s)
+    # A tree print would be 2**30 nodes
+    assert len(data) < 1000
+    assert serialize.loads(data) is s
+
+
+def test_rebuilt_after_collection():
+    data = serialize.dumps(make_spec())
+    text = repr(make_spec())
+    gc.collect()
+    spec = serialize.loads(data)
+    assert repr(spec) == text
+    f = spec.cons.children[1].children[0].children[0]
+    assert isinstance(f, ir.FuncLit) and f.layout.index(lit(2)) == 2
@@ -0,0 +1,51 @@
+"""SpecTemplate: lower once per param assignment, solve instances by assumptions."""
+import pytest
+
+from puzzlespec.compiler.backends.fd import _AllDistinct
+from puzzlespec.compiler.dsl.template import SpecTemplate
+from test_passes.conftest import check_sudoku, sudoku
+
+
+def test_instances():
+    tmpl = SpecTemplate(sudoku(), gen_vars=["givens"])
+    compiled = tmpl.compile(N=4)
+    assert tmpl.compile(N=4) is compiled
+    assert set(compiled.slots) == {"givens"} and set(compiled.outputs) == {"cell_digits"}
+    # Every row, column and tile is one AllDistinct
+    assert sum(c.idx.shape[0] for c in compiled.solver.constraints if isinstance(c, _AllDistinct)) == 12
+    for clues in ({(0, 0): 2, (1, 1): 1}, {(0, 3): 1, (3, 0): 1, (1, 2): None}, {}):
+        sol = compiled.solve(givens=clues)
+        check_sudoku(sol["cell_digits"], clues)
+    # Every clue slot bound: None for blank
+    full = {(r, c): None for r in range(4) for c in range(4)}
+    assert compiled.solve(givens=lambda rc: full[rc]) is not None
+    # The 2x2 tiles rule out a 2 at (0, 0) and (1, 1)
+    assert compiled.solve(givens={(0, 0): 2, (1, 1): 2}) is None
+    assert compiled.solve(givens={(0, 0): 2, (2, 2): 2}) is not None
+
+
+def test_bad_names():
+    with pytest.raises(ValueError):
+        SpecTemplate(sudoku(), gen_vars=["clues"])
+    tmpl = SpecTemplate(sudoku(), gen_vars=["givens"])
+    with pytest.raises(ValueError):
+        tmpl.compile(M=4)
+    with pytest.raises(ValueError):
+        tmpl.compile(N=4).solve(cell_digits={})
+
+
+def test_count_and_minimize():
+    compiled = SpecTemplate(sudoku(), gen_vars=["givens"], seed=0).compile(N=4)
+    # 288 4x4 Sudokus, 12 per first row
+    assert compiled.count_solutions(givens={(0, 0): 1, (0, 1): 2, (0, 2): 3, (0, 3): 4}, limit=20) == 12
+    assert compiled.count_solutions(givens={(0, 0): 1, (0, 1): 2, (0, 2): 3}) == 2
+    sol = compiled.solve()["cell_digits"]
+    clues = compiled.minimize("givens", sol)
+    kept = {rc: v for rc, v in clues.items() if v is not None}
+    assert 0 < len(kept) < 16
+    assert compiled.count_solutions(givens=clues) == 1
+    assert compiled.solve(givens=clues)["cell_digits"] == sol
+    # Minimal: no kept clue can be blanked
+    assert all(compiled.count_solutions(givens={**clues, rc: None}) == 2 for rc in kept)
+    with pytest.raises(ValueError):
+        compiled.minimize("givens", {(0, 0): 1})
@@ -1,10 +1,12 @@
 """Shared fixtures and helpers for pass tests."""
+import numpy as np
 import pytest
-from puzzlespec import Int, Bool, var, param, func_var
+from puzzlespec import Int, Bool, PuzzleSpecBuilder, U, Unit, var, param, func_var
 from puzzlespec.compiler.dsl import ir, ast
+from puzzlespec.compiler.backends.evaluator import CheckResult, Evaluator
 from puzzlespec.compiler.dsl.ast import IntExpr, BoolExpr, DomainExpr, FuncExpr
 from puzzlespec.compiler.passes.pass_base import Context
-from puzzlespec.libs import std
+from puzzlespec.libs import nd, std, topology as topo
 
 
 def run_transform(cls, node, **kwargs):
@@ -20,3 +22,75 @@ def run_analysis(cls, node, ctx=None):
     if ctx is None:
         ctx = Context()
     return p(node, ctx)
+
+
+def sudoku():
+    """Sudoku of any size N, with optional clues in givens."""
+    p = PuzzleSpecBuilder()
+    N = var(std.Nat, name='N')
+    bs = std.isqrt(N)
+    Cells = nd.fin(N)*nd.fin(N)
+    Digits = nd.range(1, N+1)
+    cell_digits = func_var(Cells, Digits, name="cell_digits")
+    p += nd.rows(cell_digits).forall(lambda vals: std.distinct(vals))
+    p += nd.cols(cell_digits).forall(lambda vals: std.distinct(vals))
+    p += nd.tiles(cell_digits, size=(bs, bs), stride=(bs, bs)).forall(lambda vals: std.distinct(vals))
+    givens = func_var(Cells, U(Unit) + Digits, name="givens")
+    p += Cells.forall(lambda c: givens(c).match(lambda _: True, lambda d: cell_digits(c) == d))
+    return p.build("Sudoku")
+
+
+# A solution of the 4x4 sudoku
+GRID = np.array([[1, 2, 3, 4],
+                 [3, 4, 1, 2],
+                 [2, 1, 4, 3],
+                 [4, 3, 2, 1]])
+
+
+def sudoku4():
+    """The 4x4 sudoku with no params or clues."""
+    p = PuzzleSpecBuilder()
+    Cells = nd.fin(4)*nd.fin(4)
+    cell_digits = func_var(Cells, nd.range(1, 5), name="cell_digits")
+    p += nd.rows(cell_digits).forall(lambda vals: std.distinct(vals))
+    p += nd.cols(cell_digits).forall(lambda vals: std.distinct(vals))
+    p += nd.tiles(cell_digits, size=(2, 2), stride=(2, 2)).forall(lambda vals: std.distinct(vals))
+    return p.build("Sudoku4")
+
+
+def check_sudoku(sol, clues={}, N=4, bs=2):
+    """Asserts sol, by cell, is a sudoku solution that keeps the clues
+    (None for a blank)."""
+    grid = [[sol[(r, c)] for c in range(N)] for r in range(N)]
+    full = list(range(1, N+1))
+    assert all(sorted(row) == full for row in grid)
+    assert all(sorted(col) == full for col in zip(*grid))
+    assert all(sorted(grid[br+r][bc+c] for r in range(bs) for c in range(bs)) == full
+               for br in range(0, N, bs) for bc in range(0, N, bs))
+    assert all(v is None or grid[r][c] == v for (r, c), v in clues.items())
+
+
+def unruly(n):
+    """Unruly on an n x n grid: no three in a line alike, rows and columns balanced."""
+    p = PuzzleSpecBuilder()
+    BW, C = std.make_enum('B', 'W')
+    color = func_var(topo.Grid2D(n, n).cells(), BW, name='color')
+    for size in ((1, 3), (3, 1)):
+        p += nd.tiles(color, size=size, stride=(1, 1)).forall(lambda w: ~std.all_same(w))
+    for i in range(n):
+        p += std.sum([(color((i, j)) == C.B).to_int() for j in range(n)]) == n//2
+        p += std.sum([(color((j, i)) == C.B).to_int() for j in range(n)]) == n//2
+    return p.build("Unruly")
+
+
+def agrees(spec, assignments, results):
+    """Asserts that results, one per assignment, match Evaluator's: a
+    CheckResult reports the same violations, a bool the same verdict."""
+    ev = Evaluator(spec)
+    assert len(results) == len(assignments)
+    for values, res in zip(assignments, results):
+        ref = ev.check(values)
+        if isinstance(res, CheckResult):
+            assert res.violated == ref.violated and res.invalid == ref.invalid
+        else:
+            assert res == ref.ok
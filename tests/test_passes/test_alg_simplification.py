@@ -87,3 +87,15 @@ def test_proj_tuple():
     node = tup[0].node
     result = run_transform(AlgebraicSimplificationPass, node)
     assert isinstance(result, ir.VarHOAS)
+
+
+def test_funclit_lookup():
+    # [x, y, 7](1) => y, and a non-literal key is left alone
+    IntT = ir.IntT()
+    dom = ir.Fin(ir.DomT(IntT), ir.Lit(IntT, 3))
+    x, y = var(Int, name='x').node, var(Int, name='y').node
+    f = ir.FuncLit(ir.PiTHOAS(ir.IntT(ref=dom), IntT, "i"), dom, x, y, ir.Lit(IntT, 7),
+                   layout=ir._DenseLayout(val_map={ir.Lit(IntT, i)._key: i for i in range(3)}))
+    assert run_transform(AlgebraicSimplificationPass, ir.Apply(IntT, f, ir.Lit(IntT, 1))) is y
+    result = run_transform(AlgebraicSimplificationPass, ir.Apply(IntT, f, x))
+    assert isinstance(result, ir.Apply)
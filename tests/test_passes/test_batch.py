@@ -0,0 +1,99 @@
+"""Vectorized checking of batches of assignments."""
+import numpy as np
+import pytest
+
+from puzzlespec import Int, PuzzleSpecBuilder, func_var, var
+from puzzlespec.compiler.backends.batch import BatchVerifier, verify
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.libs import nd, std
+from .conftest import GRID, agrees, sudoku, unruly
+
+
+def _verify(spec, batch, **shared):
+    """BatchVerifier's verdicts, which must match Evaluator's candidate by
+    candidate."""
+    (name, vals), = batch.items()
+    ok = BatchVerifier(spec).verify({name: vals, **shared})
+    assert ok.shape == (len(vals),)
+    agrees(spec, [{name: v, **shared} for v in vals], ok.tolist())
+    return ok
+
+
+def _sudokus(rng, n):
+    # Valid grids, relabelled and with a few cells changed
+    grids = np.stack([rng.permutation(4)[GRID-1] + 1 for _ in range(n)])
+    for g in grids[n//2:]:
+        g[tuple(rng.integers(0, 4, size=2))] = rng.integers(0, 6)
+    return grids
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_sudoku(optimize):
+    spec = sudoku().optimize() if optimize else sudoku()
+    grids = _sudokus(np.random.default_rng(0), 40)
+    ok = _verify(spec, {"cell_digits": grids}, N=4, givens={})
+    assert ok[:20].all() and not ok[20:].all()
+    _verify(spec, {"cell_digits": grids}, N=4, givens={(0, 0): 1, (3, 3): 1})
+
+
+def test_givens():
+    spec = sudoku()
+    bv = BatchVerifier(spec)
+    # A batch of clues against one grid: masked where there is no clue
+    clues = np.ma.masked_array(np.stack([GRID]*3), mask=True)
+    clues[1, 0, 0] = 1
+    clues[2, 0, 0] = 2
+    assert bv.verify(N=4, cell_digits=GRID, givens=clues).tolist() == [True, True, False]
+    with pytest.raises(ValueError, match="Batches of"):
+        bv.verify(N=4, cell_digits=np.stack([GRID]*2), givens=clues)
+    with pytest.raises(ValueError, match="shape"):
+        bv.verify(N=4, cell_digits=GRID[:3], givens={})
+
+
+def test_unruly():
+    spec = unruly(6)
+    rng = np.random.default_rng(1)
+    grids = rng.integers(0, 2, size=(200, 6, 6))
+    valid = np.array([[0, 0, 1, 0, 1, 1],
+                      [1, 1, 0, 1, 0, 0],
+                      [0, 1, 0, 0, 1, 1],
+                      [1, 0, 1, 1, 0, 0],
+                      [0, 1, 1, 0, 0, 1],
+                      [1, 0, 0, 1, 1, 0]])
+    grids[:2] = valid
+    grids[1, 0, :3] = 1
+    ok = _verify(spec, {"color": grids})
+    assert ok[0] and not ok[1]
+    # Labels, and enum codes out of range
+    labels = np.where(valid == 0, 'B', 'W')
+    assert verify(spec, color=labels[None]).tolist() == [True]
+    bad = valid.copy()
+    bad[0, 0] = 2
+    assert verify(spec, color=np.stack([valid, bad])).tolist() == [True, False]
+
+
+def test_undefined():
+    p = PuzzleSpecBuilder()
+    n = var(std.Nat, name='n')
+    xs = func_var(nd.fin(n), nd.range(0, 10), name='xs')
+    d = var(Int, name='d')
+    total = std.sum([xs(0), xs(1), xs(2)])
+    p += total == 10
+    p += (total // d) == 5
+    p += nd.fin(n).exists(lambda i: xs(i) == 0)
+    spec = p.build("Arith")
+    for s in (spec, spec.optimize()):
+        bv = BatchVerifier(s)
+        # Scalar vars take a batch too; d=0 divides by zero
+        ok = bv.verify(n=3, xs=[[0, 3, 7], [0, 3, 7], [1, 2, 7], [0, 3, 7]], d=[2, 0, 2, -2])
+        assert ok.tolist() == [True, False, False, False]
+
+
+def test_scalar_spec():
+    IntT = ir.IntT()
+    x = [ir.VarRef(ir.IntT(ref=ir.Fin(ir.DomT(IntT), ir.Lit(IntT, 3))), i) for i in range(3)]
+    tup = ir.TupleLit(ir.TupleT(*(v.T for v in x)), *x)
+    cons = (ir.AllDistinct(ir.BoolT(), tup), ir.Eq(ir.BoolT(), ir.SumReduce(IntT, tup), ir.Lit(IntT, 3)))
+    spec = ir.Spec(ir.TupleLit(ir.TupleT(*(c.T for c in cons)), *cons), ir.TupleLit(ir.TupleT()))
+    ok = verify(spec, {0: [2, 1, 3, 0], 1: [0, 1, 0, 1], 2: 1})
+    assert ok.tolist() == [True, False, False, False]
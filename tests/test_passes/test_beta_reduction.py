@@ -1,7 +1,9 @@
-"""BetaReductionHOAS: substitute argument into lambda body at application sites."""
+"""BetaReductionHOAS and BetaReductionPass: substitute argument into lambda body
+at application sites."""
 from puzzlespec import Int, var
 from puzzlespec.compiler.dsl import ir, ast
-from puzzlespec.compiler.passes.transforms.beta_reduction import BetaReductionHOAS
+from puzzlespec.compiler.passes.transforms.beta_reduction import BetaReductionHOAS, BetaReductionPass
+from puzzlespec.compiler.passes.transforms.resolve_vars import resolve_bound_vars
 from puzzlespec.libs import nd
 from .conftest import run_transform
 
@@ -36,3 +38,57 @@ def test_no_reduce_standalone():
     lam = nd.fin(5).map(lambda i: i + 1).node
     result = run_transform(BetaReductionHOAS, lam)
     assert isinstance(result, ir.LambdaHOAS)
+
+
+# ---------- de Bruijn BetaReductionPass ----------
+
+IntT = ir.IntT()
+
+
+def test_free_bound():
+    p = BetaReductionPass()
+    bv0, bv2 = ir.BoundVar(IntT, 0), ir.BoundVar(IntT, 2)
+    assert p.free_bound(ir.Lit(IntT, 1)) == 0
+    assert p.free_bound(ir.Sum(IntT, bv0, bv2)) == 3
+    # λ. BV2 has BV1 free; λ. BV0 is closed
+    assert p.free_bound(ir.Lambda(ir.PiT(IntT, IntT), bv2)) == 2
+    assert p.free_bound(ir.Lambda(ir.PiT(IntT, IntT), bv0)) == 0
+
+
+def test_shift_skips_closed_subterms():
+    p = BetaReductionPass()
+    closed = ir.Lambda(ir.PiT(IntT, IntT), ir.Sum(IntT, ir.BoundVar(IntT, 0), ir.Lit(IntT, 1)))
+    term = ir.Sum(IntT, closed, ir.BoundVar(IntT, 0))
+    new = p.shift(term, 1)
+    assert new.children[0] is closed
+    assert new.children[1] is ir.BoundVar(IntT, 1)
+    # The shift of each subterm is memoized for later calls
+    assert p.shift(term, 1) is new
+    assert p._bv_memo[(('shift', 1), term, 0)] is new
+
+
+def test_shift_reaches_named_children():
+    # λ. (BV0 ▷ BV0 < BV1): the obligation's BV1 is free and gets shifted
+    p = BetaReductionPass()
+    obl = ir.Lt(ir.BoolT(), ir.BoundVar(IntT, 0), ir.BoundVar(IntT, 1))
+    lam = ir.Lambda(ir.PiT(IntT, IntT), ir.BoundVar(IntT, 0, obl=obl))
+    body = p.shift(lam, 2).children[0]
+    assert body.idx == 0
+    assert body.obl is ir.Lt(ir.BoolT(), ir.BoundVar(IntT, 0), ir.BoundVar(IntT, 3))
+
+
+def test_apply_of_non_lambda_is_kept():
+    f = ir.BoundVar(ir.PiT(IntT, IntT), 0)
+    app = ir.Apply(IntT, f, ir.Lit(IntT, 3))
+    root = ir.Lambda(ir.PiT(ir.PiT(IntT, IntT), IntT), app)
+    assert run_transform(BetaReductionPass, root) is root
+
+
+def _redexes(node):
+    return sum(isinstance(n, ir.Apply) and isinstance(n.children[0], ir.Lambda) for n in set(_all_nodes(node)))
+
+
+def test_resolved_nd_index_map_reduces():
+    root = resolve_bound_vars(nd.rows(nd.fin(3) * nd.fin(3)).node)
+    assert not any(isinstance(n, (ir.BoundVarHOAS, ir.LambdaHOAS)) for n in _all_nodes(root))
+    assert _redexes(run_transform(BetaReductionPass, root)) < _redexes(root)
@@ -0,0 +1,137 @@
+"""CNFEncoder: scalar IR to CNF with cardinality encodings."""
+import io
+import itertools
+
+import pytest
+
+from puzzlespec.compiler.backends.cnf import CNFEncoder, emit_dimacs
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.dsl.cnf_backend import CNFBackend
+from .conftest import sudoku4
+
+z3 = pytest.importorskip("z3")
+
+IntT = ir.IntT()
+BoolT = ir.BoolT()
+
+
+def lit(val):
+    return ir.Lit(IntT, val)
+
+
+def fin_var(sid, n):
+    return ir.VarRef(ir.IntT(ref=ir.Fin(ir.DomT(IntT), lit(n))), sid)
+
+
+def tup(*vals):
+    return ir.TupleLit(ir.TupleT(*(v.T for v in vals)), *vals)
+
+
+def solver(enc):
+    buf = io.StringIO()
+    enc.write(buf)
+    s = z3.Solver()
+    xs = {}
+    def z(l):
+        v = xs.setdefault(abs(l), z3.Bool(f"x{abs(l)}"))
+        return v if l > 0 else z3.Not(v)
+    for line in buf.getvalue().splitlines():
+        if line.startswith(("c", "p")):
+            continue
+        s.add(z3.Or([z(int(t)) for t in line.split()[:-1]]))
+    return s, z
+
+
+def model(s, enc):
+    m = s.model()
+    return [l for l in range(1, enc.nvars+1) if z3.is_true(m.eval(z3.Bool(f"x{l}"), model_completion=True))]
+
+
+@pytest.mark.parametrize("n, lo, hi, encoding", [
+    (5, 0, 1, "pairwise"),
+    (9, 0, 1, "sequential"),
+    (8, 0, 3, "sequential"),
+    (8, 0, 6, "totalizer"),
+    (8, 2, 5, "totalizer"),
+    (7, 1, 1, "sequential"),
+])
+def test_cardinality(n, lo, hi, encoding):
+    enc = CNFEncoder()
+    xs = [enc.new_var() for _ in range(n)]
+    enc.card(xs, lo, hi)
+    assert enc.encodings[encoding] == 1
+    s, z = solver(enc)
+    for bits in itertools.product((0, 1), repeat=n):
+        assume = [z(x if b else -x) for x, b in zip(xs, bits)]
+        assert (s.check(*assume) == z3.sat) == (lo <= sum(bits) <= hi)
+
+
+def test_reified_cardinality():
+    enc = CNFEncoder()
+    bs = [ir.VarRef(BoolT, i) for i in range(5)]
+    count = ir.Sum(IntT, *(ir.Ite(IntT, b, lit(1), lit(0)) for b in bs))
+    e = enc.bool_term(ir.Eq(BoolT, count, lit(2)))
+    s, z = solver(enc)
+    for bits in itertools.product((0, 1), repeat=5):
+        assume = [z(enc.var_map[i] if b else -enc.var_map[i]) for i, b in enumerate(bits)]
+        assert s.check(*assume, z(e)) == (z3.sat if sum(bits) == 2 else z3.unsat)
+        assert s.check(*assume, z(-e)) == (z3.unsat if sum(bits) == 2 else z3.sat)
+
+
+@pytest.mark.parametrize("op, f", [(ir.Eq, int.__eq__), (ir.Lt, int.__lt__), (ir.LtEq, int.__le__)])
+def test_reified_comparison(op, f):
+    enc = CNFEncoder()
+    x, y = fin_var(0, 3), fin_var(1, 4)
+    e = enc.bool_term(op(BoolT, ir.Sum(IntT, x, lit(1)), y))
+    s, z = solver(enc)
+    for a, b in itertools.product(range(3), range(4)):
+        assume = [z(enc.var_map[0][a]), z(enc.var_map[1][b])]
+        assert s.check(*assume, z(e)) == (z3.sat if f(a+1, b) else z3.unsat)
+        assert s.check(*assume, z(-e)) == (z3.unsat if f(a+1, b) else z3.sat)
+
+
+def test_latin_square():
+    N = 4
+    cells = [[fin_var(r*N+c, N) for c in range(N)] for r in range(N)]
+    cons = [ir.AllDistinct(BoolT, tup(*row)) for row in cells]
+    cons += [ir.AllDistinct(BoolT, tup(*col)) for col in zip(*cells)]
+    cons.append(ir.Eq(BoolT, cells[0][0], lit(2)))
+    cons.append(ir.Lt(BoolT, cells[1][1], cells[0][1]))
+    spec = ir.Spec(tup(*cons), tup())
+    out = io.StringIO()
+    enc = emit_dimacs(spec, out=out)
+    text = out.getvalue()
+    assert f"p cnf {enc.nvars} {enc.nclauses}" in text
+    assert text.startswith("c var 0 v0 ")
+    s, _ = solver(enc)
+    assert s.check() == z3.sat
+    vals = enc.decode(model(s, enc))
+    grid = [[vals[r*N+c] for c in range(N)] for r in range(N)]
+    assert all(sorted(row) == list(range(N)) for row in grid)
+    assert all(sorted(col) == list(range(N)) for col in zip(*grid))
+    assert grid[0][0] == 2 and grid[1][1] < grid[0][1]
+
+
+def test_all_same_and_unsat():
+    xs = [fin_var(i, 3) for i in range(3)]
+    spec = ir.Spec(tup(ir.AllSame(BoolT, tup(*xs)), ir.Eq(BoolT, xs[0], lit(1)), ir.Lt(BoolT, lit(1), xs[2])), tup())
+    s, _ = solver(emit_dimacs(spec))
+    assert s.check() == z3.unsat
+
+
+def test_unencodable_domain():
+    x = ir.VarRef(IntT, 0)
+    with pytest.raises(ValueError):
+        emit_dimacs(ir.Spec(tup(ir.Lt(BoolT, x, lit(3))), tup()))
+
+
+def test_dsl_puzzle_solution_count():
+    enc = CNFBackend(sudoku4()).encode()
+    s, z = solver(enc)
+    n = 0
+    while s.check() == z3.sat:
+        vals = enc.decode(model(s, enc))
+        assert len(vals) == 16 and sorted(vals.values()) == [v for v in range(1, 5) for _ in range(4)]
+        s.add(z3.Or([z(-enc.var_map[sid][v]) for sid, v in vals.items()]))
+        n += 1
+    assert n == 288
@@ -0,0 +1,93 @@
+"""Context invalidation: persistent and incremental analyses."""
+from puzzlespec import Int, PuzzleSpecBuilder, var
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.passes.pass_base import AnalysisObject, Context, PassManager, Transform, handles
+from puzzlespec.compiler.passes.analyses.type_check import TypeCheckingPass, TypeMap
+from puzzlespec.compiler.passes.transforms.const_fold import ConstFoldPass
+
+
+class Facts(AnalysisObject):
+    pass
+
+
+class Persistent(AnalysisObject):
+    persistent = True
+
+
+def two():
+    return ir.Sum(ir.IntT(), ir.Lit(ir.IntT(), 1), ir.Lit(ir.IntT(), 1))
+
+
+class CountingTypeCheck(TypeCheckingPass):
+    name = "counting_type_check"
+
+    @handles(ir.Node)
+    def _(self, node: ir.Node):
+        self.checked.append(node)
+        return TypeCheckingPass._dispatch[type(node)](self, node)
+
+    def run(self, root, ctx):
+        self.checked = []
+        return super().run(root, ctx)
+
+
+def test_invalidate_keeps_persistent():
+    ctx = Context(Facts(), Persistent())
+    ctx.invalidate()
+    assert ctx.try_get(Facts) is None
+    assert ctx.try_get(Persistent) is not None
+    assert ctx.stale(Facts) is None
+
+
+def test_type_map_rechecks_only_new_nodes():
+    x = var(Int, name='x')
+    y = var(Int, name='y')
+    old = ir.Lt(ir.BoolT(), (x * y).node, two())
+    ctx = Context()
+    PassManager(TypeCheckingPass()).run(old, ctx)
+    new = PassManager(ConstFoldPass()).run(old, ctx)
+    assert ctx.try_get(TypeMap) is None
+    assert ctx.stale(TypeMap) is not None
+
+    p = CountingTypeCheck()
+    tmap = p(new, ctx)
+    ctx.add(tmap)
+    assert ctx.stale(TypeMap) is None
+    # Only the rebuilt comparison and the folded literal are new
+    assert set(p.checked) == {new, new.children[1]}
+    assert tmap.Tmap[old.children[0]] is not None
+
+
+def test_type_map_keeps_only_reachable_nodes():
+    x = var(Int, name='x')
+    y = var(Int, name='y')
+    old = ir.Lt(ir.BoolT(), (x * y).node, two())
+    ctx = Context()
+    PassManager(TypeCheckingPass()).run(old, ctx)
+    new = PassManager(ConstFoldPass()).run(old, ctx)
+    tmap = TypeCheckingPass()(new, ctx)
+    assert old not in tmap.Tmap.Tmap and two() not in tmap.Tmap.Tmap
+    assert tmap.Tmap.Tmap.keys() == TypeCheckingPass()(new, Context()).Tmap.Tmap.keys()
+
+
+def test_optimize_reuses_type_map(monkeypatch):
+    p = PuzzleSpecBuilder()
+    x = var(Int, name='x')
+    y = var(Int, name='y')
+    p += x * y < 1 + 1
+    p += (x + 0) * y > 0
+    spec = p.build("Small", opt=False)
+    checked = []
+    visit_node = TypeCheckingPass._visit_node
+    def counting(self, node):
+        checked.append(node)
+        return visit_node(self, node)
+    monkeypatch.setattr(TypeCheckingPass, "_visit_node", counting)
+    opt = spec.optimize()
+    assert opt is not spec
+    seeded = set(checked)
+    checked.clear()
+    opt.type_check()
+    # Nodes the optimization kept are not checked again
+    assert 0 < len(seeded) < len(checked)
+    assert not seeded & spec.type_map.Tmap.Tmap.keys()
@@ -0,0 +1,107 @@
+"""EGraph: congruence closure, saturation with pass handlers as rules, and extraction."""
+from puzzlespec import Int, var
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.passes.egraph import (
+    EGraph, EqualitySaturation, Rule, grounding_size, node_count,
+)
+from puzzlespec.compiler.passes.analyses.info import count
+from puzzlespec.libs import nd
+from .conftest import run_transform
+from .test_fused import exprs, fused
+
+
+def int_lit(val):
+    return ir.Lit(ir.IntT(), val)
+
+
+class Commute(Rule):
+    name = "commute"
+
+    def apply(self, node):
+        if isinstance(node, ir.Sum) and len(node.children) == 2:
+            a, b = node.children
+            return ir.Sum(node.T, b, a, obl=node.obl)
+        return None
+
+
+def test_congruence_after_union():
+    x, y = ir.VarRef(ir.IntT(), 0), ir.VarRef(ir.IntT(), 1)
+    eg = EGraph()
+    fx = eg.add_term(ir.Neg(ir.IntT(), x))
+    fy = eg.add_term(ir.Neg(ir.IntT(), y))
+    assert eg.find(fx) != eg.find(fy)
+    eg.union(eg.add_term(x), eg.add_term(y))
+    eg.rebuild()
+    assert eg.find(fx) == eg.find(fy)
+
+
+def test_extract_cheapest():
+    x = ir.VarRef(ir.IntT(), 0)
+    big = ir.Sum(ir.IntT(), x, int_lit(0))
+    eg = EGraph()
+    cid = eg.add_term(big)
+    eg.union(cid, eg.add_term(x))
+    eg.rebuild()
+    assert eg.extract(cid) is x
+
+
+def test_saturates_with_non_terminating_rule():
+    # A rule a pass pipeline would apply forever only adds one e-node here
+    x, y = ir.VarRef(ir.IntT(), 0), ir.VarRef(ir.IntT(), 1)
+    node = ir.Sum(ir.IntT(), x, y)
+    eg = EGraph()
+    cid = eg.add_term(node)
+    assert eg.saturate([Commute()])
+    assert len(eg.classes[eg.find(cid)].nodes) == 2
+
+
+def test_saturate_offers_only_touched_classes():
+    class Seen(Rule):
+        def __init__(self):
+            self.seen = []
+
+        def apply(self, node):
+            self.seen.append(node)
+            return None
+
+    x, y, z = (ir.VarRef(ir.IntT(), i) for i in range(3))
+    eg = EGraph()
+    eg.add_term(ir.Neg(ir.IntT(), ir.Sum(ir.IntT(), x, y)))
+    seen = Seen()
+    rules = [Commute(), seen]
+    assert eg.saturate(rules)
+    assert ir.Sum(ir.IntT(), y, x) in seen.seen
+    # Saturated classes are not offered again
+    seen.seen.clear()
+    assert eg.saturate(rules)
+    assert seen.seen == []
+    neg_z = ir.Neg(ir.IntT(), z)
+    eg.add_term(neg_z)
+    assert eg.saturate(rules)
+    assert set(seen.seen) == {z, neg_z}
+    # Other rules see every class
+    seen.seen.clear()
+    assert eg.saturate([seen])
+    assert len(seen.seen) == 7
+
+
+def test_matches_or_improves_on_fused():
+    for e in exprs():
+        node = e.node
+        result = run_transform(EqualitySaturation, node)
+        assert count(result, unique=False) <= count(fused(node), unique=False)
+
+
+def test_simplifies():
+    x = var(Int, name='x')
+    node = (-(-(x + (2 - 2))) * (3 - 2)).node
+    assert run_transform(EqualitySaturation, node) is x.node
+
+
+def test_grounding_size_scales_with_domain():
+    lam5 = nd.fin(5).map(lambda i: i + 1).node
+    lam7 = nd.fin(7).map(lambda i: i + 1).node
+    body_cost = [3.0]
+    assert grounding_size(lam5, body_cost) == 1 + 5 * 3
+    assert grounding_size(lam7, body_cost) == 1 + 7 * 3
+    assert node_count(lam5, body_cost) == 4
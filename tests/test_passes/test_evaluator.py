@@ -0,0 +1,104 @@
+"""Concrete evaluation of specs on full assignments."""
+import numpy as np
+import pytest
+
+from puzzlespec import Int, PuzzleSpecBuilder, func_var, var
+from puzzlespec.compiler.backends.evaluator import Evaluator, check
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.dsl.template import SpecTemplate
+from puzzlespec.libs import nd, std, topology as topo
+from .conftest import GRID, sudoku
+
+
+@pytest.fixture(scope="module")
+def sudoku_ev():
+    return Evaluator(sudoku())
+
+
+def test_sudoku(sudoku_ev):
+    ev = sudoku_ev
+    assert ev.check(N=4, cell_digits=GRID, givens={}).ok
+    # Dict input, with clues; missing clues are None
+    sol = {(r, c): int(GRID[r, c]) for r in range(4) for c in range(4)}
+    assert ev.check(N=4, cell_digits=sol, givens={(0, 0): 1, (3, 3): 1})
+    # The solver's solutions check
+    compiled = SpecTemplate(sudoku(), gen_vars=["givens"]).compile(N=4)
+    assert ev.check(N=4, cell_digits=compiled.solve()["cell_digits"], givens={}).ok
+
+
+def test_sudoku_violations(sudoku_ev):
+    ev = sudoku_ev
+    rules = ev.rules
+    # Swapping two cells of a row within a tile only breaks columns
+    bad = GRID.copy()
+    bad[0, [0, 1]] = bad[0, [1, 0]]
+    res = ev.check(N=4, cell_digits=bad, givens={})
+    assert not res and res.violated == [rules[1]] and res.invalid == []
+    bad = GRID.copy()
+    bad[0, [1, 2]] = bad[0, [2, 1]]
+    assert ev.check(N=4, cell_digits=bad, givens={}).violated == [rules[1], rules[2]]
+    res = ev.check(N=4, cell_digits=GRID, givens={(0, 0): 2})
+    assert res.violated == [rules[3]]
+    # Out of range digits are reported by name; rules still see them
+    bad = GRID.copy()
+    bad[0, 0] = 7
+    res = ev.check(N=4, cell_digits=bad, givens={})
+    assert res.invalid == ["cell_digits"] and res.violated == []
+
+
+def test_bad_names(sudoku_ev):
+    with pytest.raises(ValueError, match="not a var"):
+        sudoku_ev.check(N=4, cell_digits=GRID, givens={}, foo=1)
+    with pytest.raises(ValueError, match="No value for"):
+        sudoku_ev.check(N=4, cell_digits=GRID)
+
+
+def test_enum_labels():
+    p = PuzzleSpecBuilder()
+    Colors, C = std.make_enum('R', 'G', 'B')
+    color = func_var(topo.Grid2D(2, 2).cells(), Colors, name='color')
+    for size in ((1, 2), (2, 1)):
+        p += nd.tiles(color, size=size, stride=(1, 1)).forall(lambda w: std.distinct(w))
+    p += color((0, 0)) == C.R
+    spec = p.build("Coloring")
+    assert check(spec, color={(0, 0): 'R', (0, 1): 'G', (1, 0): 'B', (1, 1): 'R'}).ok
+    # Indices stand in for labels
+    assert check(spec, color=np.array([[0, 1], [1, 0]])).ok
+    assert len(check(spec, color=np.array([[1, 0], [0, 0]])).violated) == 3
+
+
+def test_undefined():
+    p = PuzzleSpecBuilder()
+    n = var(std.Nat, name='n')
+    xs = func_var(nd.fin(n), nd.range(0, 10), name='xs')
+    d = var(Int, name='d')
+    total = std.sum([xs(0), xs(1), xs(2)])
+    p += total == 10
+    p += (total // d) == 5
+    p += nd.fin(n).exists(lambda i: xs(i) == 0)
+    spec = p.build("Arith")
+    for s in (spec, spec.optimize()):
+        ev = Evaluator(s)
+        assert ev.check(n=3, xs=[0, 3, 7], d=2).ok
+        # Division by zero only fails its own rule
+        res = ev.check(n=3, xs=[0, 3, 7], d=0)
+        assert len(res.violated) == 1 and res.invalid == []
+        assert len(ev.check(n=3, xs=[1, 2, 7], d=2).violated) == 1
+        # n=0 breaks the refinement and the access obligations
+        res = ev.check(n=0, xs=[], d=2)
+        assert res.invalid == ["n"] and len(res.violated) == len(ev.rules)
+
+
+def test_scalar_spec():
+    # AllDistinct and a sum over tuples, keyed by sid
+    IntT = ir.IntT()
+    x = [ir.VarRef(ir.IntT(ref=ir.Fin(ir.DomT(IntT), ir.Lit(IntT, 3))), i) for i in range(3)]
+    tup = ir.TupleLit(ir.TupleT(*(v.T for v in x)), *x)
+    cons = (ir.AllDistinct(ir.BoolT(), tup), ir.Eq(ir.BoolT(), ir.SumReduce(IntT, tup), ir.Lit(IntT, 3)))
+    spec = ir.Spec(ir.TupleLit(ir.TupleT(*(c.T for c in cons)), *cons), ir.TupleLit(ir.TupleT()))
+    ev = Evaluator(spec)
+    assert ev.check({0: 2, 1: 0, 2: 1}).ok
+    res = ev.check({0: 1, 1: 1, 2: 1})
+    assert res.violated == [cons[0]] and res.invalid == []
+    res = ev.check({0: 3, 1: 0, 2: 0})
+    assert res.violated == [cons[0]] and res.invalid == [0]
@@ -0,0 +1,147 @@
+"""FDSolver: propagation and search over scalar IR."""
+import itertools
+
+import numpy as np
+import pytest
+
+from puzzlespec.compiler.backends import fd
+from puzzlespec.compiler.backends.fd import FDSolver, _luby, solve
+from puzzlespec.compiler.dsl import ir
+
+IntT = ir.IntT()
+BoolT = ir.BoolT()
+
+
+def lit(val):
+    return ir.Lit(IntT, val)
+
+
+def fin_var(sid, n):
+    return ir.VarRef(ir.IntT(ref=ir.Fin(ir.DomT(IntT), lit(n))), sid)
+
+
+def tup(*vals):
+    return ir.TupleLit(ir.TupleT(*(v.T for v in vals)), *vals)
+
+
+def spec(*cons):
+    return ir.Spec(tup(*cons), tup())
+
+
+def test_luby():
+    assert [_luby(i) for i in range(1, 16)] == [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8]
+
+
+def test_popcount_without_bitwise_count(monkeypatch):
+    rows = np.random.default_rng(0).integers(0, 2**63, size=(4, 5, 3), dtype=np.uint64)
+    rows[0, 0, 0] = np.uint64(2**64 - 1)
+    expected = [[sum(bin(int(w)).count("1") for w in row) for row in m] for m in rows]
+    assert fd._popcount_bytes(rows).tolist() == expected
+    # The solver runs on it as on NumPy < 2.0
+    monkeypatch.setattr(fd, "_popcount", fd._popcount_bytes)
+    xs = [fin_var(i, 3) for i in range(3)]
+    sol = solve(spec(ir.AllDistinct(BoolT, tup(*xs)), ir.Eq(BoolT, xs[0], lit(2))))
+    assert sol[0] == 2 and sorted(sol.values()) == [0, 1, 2]
+
+
+@pytest.mark.parametrize("restart_base", [1, 64])
+def test_latin_square(restart_base):
+    N = 5
+    cells = [[fin_var(r*N+c, N) for c in range(N)] for r in range(N)]
+    cons = [ir.AllDistinct(BoolT, tup(*row)) for row in cells]
+    cons += [ir.AllDistinct(BoolT, tup(*col)) for col in zip(*cells)]
+    cons += [ir.Lt(BoolT, cells[i][i], cells[i][(i+1) % N]) for i in range(N)]
+    sol = solve(spec(*cons), restart_base=restart_base)
+    grid = [[sol[r*N+c] for c in range(N)] for r in range(N)]
+    assert all(sorted(row) == list(range(N)) for row in grid)
+    assert all(sorted(col) == list(range(N)) for col in zip(*grid))
+    assert all(grid[i][i] < grid[i][(i+1) % N] for i in range(N))
+
+
+def test_pigeonhole_unsat():
+    xs = [fin_var(i, 3) for i in range(4)]
+    s = FDSolver(spec(ir.AllDistinct(BoolT, tup(*xs))))
+    assert s.solve() is None
+    assert s.nodes == 0
+
+
+def brute(xs, ns, pred):
+    return [vals for vals in itertools.product(*(range(n) for n in ns)) if pred(*vals)]
+
+
+def test_linear_and_disjunction():
+    x, y, z = fin_var(0, 5), fin_var(1, 5), fin_var(2, 5)
+    cons = [
+        ir.Eq(BoolT, ir.Sum(IntT, x, ir.Prod(IntT, lit(2), y), ir.Neg(IntT, z)), lit(4)),
+        ir.Disj(BoolT, ir.Lt(BoolT, x, lit(1)), ir.Eq(BoolT, z, lit(3))),
+        ir.Not(BoolT, ir.Eq(BoolT, y, z)),
+    ]
+    sol = solve(spec(*cons))
+    vals = (sol[0], sol[1], sol[2])
+    expected = brute([x, y, z], [5, 5, 5], lambda a, b, c: a + 2*b - c == 4 and (a < 1 or c == 3) and b != c)
+    assert vals in expected
+
+
+def test_count_of_bools():
+    bs = [ir.VarRef(BoolT, i) for i in range(6)]
+    count = ir.SumReduce(IntT, tup(*(ir.Ite(IntT, b, lit(1), lit(0)) for b in bs)))
+    cons = [ir.Eq(BoolT, count, lit(4)), ir.Implies(BoolT, bs[0], bs[1]), ir.Not(BoolT, bs[1])]
+    sol = solve(spec(*cons))
+    assert sum(sol[i] for i in range(6)) == 4
+    assert sol[1] is False and sol[0] is False
+
+
+def test_all_same_and_member():
+    xs = [fin_var(i, 6) for i in range(3)]
+    odd = ir.DomLit(ir.DomT(IntT), lit(1), lit(3), lit(5))
+    cons = [ir.AllSame(BoolT, tup(*xs)), ir.IsMember(BoolT, odd, xs[0]), ir.Lt(BoolT, lit(2), xs[2])]
+    sol = solve(spec(*cons))
+    assert sol[0] == sol[1] == sol[2] in (3, 5)
+    cons.append(ir.Not(BoolT, ir.IsMember(BoolT, odd, xs[1])))
+    assert solve(spec(*cons)) is None
+
+
+def test_unencodable():
+    with pytest.raises(ValueError):
+        FDSolver(spec(ir.Lt(BoolT, ir.VarRef(IntT, 0), lit(3))))
+    x, y = fin_var(0, 3), fin_var(1, 3)
+    with pytest.raises(ValueError):
+        FDSolver(spec(ir.Eq(BoolT, ir.Prod(IntT, x, y), lit(2))))
+
+
+def test_assumptions():
+    N = 4
+    xs = [fin_var(i, N) for i in range(N*N)]
+    cons = [ir.AllDistinct(BoolT, tup(*(xs[r*N + c] for c in range(N)))) for r in range(N)]
+    cons += [ir.AllDistinct(BoolT, tup(*(xs[r*N + c] for r in range(N)))) for c in range(N)]
+    s = FDSolver(spec(*cons))
+    for clues in ({0: 3, 5: 3}, {0: 1, 1: 2, 4: 2}, {}):
+        sol = s.solve(clues)
+        assert all(sol[i] == v for i, v in clues.items())
+        grid = [[sol[r*N+c] for c in range(N)] for r in range(N)]
+        assert all(sorted(row) == list(range(N)) for row in grid)
+        assert all(sorted(col) == list(range(N)) for col in zip(*grid))
+    # Conflicting or out of domain assumptions, then a solvable one again
+    assert s.solve({0: 2, 1: 2}) is None
+    assert s.solve({0: N}) is None
+    assert s.solve({0: 2})[0] == 2
+
+
+def test_count_and_block():
+    # Latin squares of order 3: 12, of which 2 have a given first row
+    N = 3
+    xs = [fin_var(i, N) for i in range(N*N)]
+    cons = [ir.AllDistinct(BoolT, tup(*(xs[r*N + c] for c in range(N)))) for r in range(N)]
+    cons += [ir.AllDistinct(BoolT, tup(*(xs[r*N + c] for r in range(N)))) for c in range(N)]
+    s = FDSolver(spec(*cons), seed=1)
+    assert s.count_solutions(limit=20) == 12
+    assert s.count_solutions({0: 0, 1: 1, 2: 2}, limit=20) == 2
+    assert s.count_solutions({0: 0, 1: 1, 2: 2, 3: 1}) == 1
+    assert s.count_solutions({0: 0, 1: 1, 2: 2}, over=[0, 1, 2]) == 1
+    # Blocks stay until popped
+    s.push()
+    sol = s.solve()
+    s.block(sol)
+    assert s.count_solutions(limit=20) == 11
+    s.pop()
+    assert s.count_solutions(limit=20) == 12
@@ -0,0 +1,72 @@
+"""FusedTransform: several rewrite passes in one traversal, matching the separate pipeline."""
+import pytest
+from puzzlespec import Int, Bool, var
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.passes.pass_base import PassManager, Context, FusedTransform
+from puzzlespec.compiler.passes.transforms import (
+    CanonicalizePass, ConstFoldPass, AlgebraicSimplificationPass, DomainSimplificationPass,
+)
+from puzzlespec.compiler.passes.transforms.beta_reduction import BetaReductionHOAS
+from puzzlespec.compiler.passes.transforms.guard_opt import GuardOpt, GuardLift
+from puzzlespec.libs import std, nd
+
+
+def rewrites():
+    return [
+        CanonicalizePass(),
+        ConstFoldPass(),
+        AlgebraicSimplificationPass(),
+        DomainSimplificationPass(),
+        GuardOpt(),
+    ]
+
+
+def separate(node):
+    return PassManager(rewrites(), max_iter=20).run(node, Context())
+
+
+def fused(node):
+    p = FusedTransform(*rewrites())
+    result, _ = p(node, Context())
+    return result
+
+
+def exprs():
+    x = var(Int, name='x')
+    y = var(Int, name='y')
+    b = var(Bool, name='b')
+    return [
+        (x + 0) * 1,
+        (x + (2 * 3)) + (y - y),
+        -(-(x + 1)) + (4 - 4),
+        ((x * 0) + y) == y,
+        ~(~b) & (x + 1 < x + 2),
+        nd.fin(5).map(lambda i: (i * 1 + x) + 0).image,
+    ]
+
+
+@pytest.mark.parametrize("idx", range(6))
+def test_matches_separate_pipeline(idx):
+    node = exprs()[idx].node
+    assert fused(node) is separate(node)
+
+
+def test_single_traversal_reaches_fixed_point():
+    x = var(Int, name='x')
+    node = (-(-(x + (2 - 2))) * (3 - 2)).node
+    result = fused(node)
+    assert fused(result) is result
+    assert isinstance(result, ir.VarHOAS)
+
+
+def test_components_restored():
+    passes = rewrites()
+    fused_pass = FusedTransform(*passes)
+    fused_pass((var(Int, name='x') + 0).node, Context())
+    assert all("visit" not in p.__dict__ for p in passes)
+
+
+@pytest.mark.parametrize("p", [GuardLift(), BetaReductionHOAS()])
+def test_rejects_context_dependent_passes(p):
+    with pytest.raises(ValueError):
+        FusedTransform(ConstFoldPass(), p)
@@ -0,0 +1,91 @@
+"""Batched grounding (backends/passes/ground.py) and Scalarize's use of it."""
+import numpy as np
+
+from puzzlespec.compiler.backends.passes.ground import ground, index_domain
+from puzzlespec.compiler.backends.passes.scalarize import Scalarize
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.dsl.envs import SymTable
+from puzzlespec.compiler.passes.envobj import EnvsObj
+from puzzlespec.compiler.passes.pass_base import Context, PassManager
+from puzzlespec.compiler.passes.transforms.nbe import normalize
+
+IntT = ir.IntT()
+BoolT = ir.BoolT()
+carT = ir.TupleT(IntT, IntT)
+
+
+def lit(val):
+    return ir.Lit(IntT, val)
+
+
+def fin(n):
+    return ir.Fin(ir.DomT(IntT), lit(n))
+
+
+def cells(n, m):
+    return ir.CartProd(ir.DomT(carT), fin(n), fin(m))
+
+
+def lam(argT, resT, body, name="x"):
+    return ir.LambdaHOAS(ir.PiTHOAS(argT, resT, name), body, name)
+
+
+def funclit(dom, resT, elems):
+    index = index_domain(dom)
+    argT = ir.TupleT(*dom.T.carT.children, ref=dom) if index.is_tuple else ir.IntT(ref=dom)
+    layout = ir._DenseLayout(val_map={e._key: i for i, e in enumerate(index.elems())})
+    return ir.FuncLit(ir.PiTHOAS(argT, resT, "c"), dom, *elems, layout=layout)
+
+
+def test_index_domain():
+    index = index_domain(cells(2, 3))
+    assert index.size == 6 and index.is_tuple
+    assert index.elems()[4] is ir.TupleLit(carT, lit(1), lit(1))
+    assert index.positions([np.array([1, 0, 2]), np.array([2, 0, 0])]).tolist() == [5, 0, -1]
+    sl = index_domain(ir.Slice(ir.DomT(carT), cells(2, 3), lit(1), lit(6), lit(2)))
+    assert [e.children[1].val for e in sl.elems()] == [1, 0, 2]
+    assert index_domain(ir.Fin(ir.DomT(IntT), ir.VarRef(IntT, 0))) is None
+
+
+def test_batched_body():
+    N = 4
+    dom = cells(N, N)
+    vs = [ir.VarRef(IntT, i) for i in range(N*N)]
+    f = funclit(dom, IntT, vs)
+    x = ir.BoundVarHOAS(ir.TupleT(IntT, IntT, ref=dom), True, "x")
+    i, j = ir.Proj(IntT, x, 0), ir.Proj(IntT, x, 1)
+    body = ir.Ite(BoolT, ir.Lt(BoolT, i, j),
+                  ir.Eq(BoolT, ir.Sum(IntT, ir.Apply(IntT, f, x), lit(1)), ir.Apply(IntT, f, ir.TupleLit(carT, j, i))),
+                  ir.LtEq(BoolT, ir.Prod(IntT, lit(2), i), ir.Sum(IntT, j, lit(3))))
+    got = ground(lam(x.T, BoolT, body), index_domain(dom))
+    for k, (a, b) in enumerate((a, b) for a in range(N) for b in range(N)):
+        then = ir.Eq(BoolT, ir.Sum(IntT, vs[a*N+b], lit(1)), vs[b*N+a])
+        assert got[k] is ir.Ite(BoolT, ir.Lit(BoolT, a < b), then, ir.Lit(BoolT, 2*a <= b+3))
+
+
+def test_nested_binder_per_element():
+    dom = fin(5)
+    x = ir.BoundVarHOAS(ir.IntT(ref=dom), True, "x")
+    y = ir.BoundVarHOAS(ir.IntT(ref=fin(3)), True, "y")
+    inner = lam(y.T, BoolT, ir.Lt(BoolT, ir.Sum(IntT, x, y), lit(5)), "y")
+    body = ir.Conj(BoolT, ir.Forall(BoolT, inner), ir.Lt(BoolT, x, lit(3)))
+    outer = lam(x.T, BoolT, body)
+    got = ground(outer, index_domain(dom))
+    for v in range(5):
+        expected = normalize(ir.Apply(BoolT, lam(x.T, BoolT, ir.Forall(BoolT, inner)), lit(v)))
+        assert got[v] is ir.Conj(BoolT, expected, ir.Lit(BoolT, v < 3))
+
+
+def test_scalarize_forall():
+    N = 3
+    dom = cells(N, N)
+    vs = [ir.VarRef(IntT, i) for i in range(N*N)]
+    f = funclit(dom, IntT, vs)
+    x = ir.BoundVarHOAS(ir.TupleT(IntT, IntT, ref=dom), True, "x")
+    body = ir.Lt(BoolT, ir.Apply(IntT, f, x), ir.Sum(IntT, ir.Proj(IntT, x, 0), lit(1)))
+    root = ir.Forall(BoolT, lam(x.T, BoolT, body))
+    run = lambda batch: PassManager(Scalarize(aggressive=True, batch=batch)).run(root, Context(EnvsObj(SymTable())))
+    batched = run(True)
+    assert batched is ir.Conj(BoolT, *(ir.Lt(BoolT, vs[a*N+b], lit(a+1)) for a in range(N) for b in range(N)))
+    unbatched = run(False)
+    assert isinstance(unbatched, ir.Conj) and len(unbatched.children) == N*N
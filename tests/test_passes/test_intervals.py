@@ -0,0 +1,57 @@
+"""IntervalAnalysis: sound bounds for Int-valued terms."""
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.passes.analyses.intervals import get_intervals
+from puzzlespec.libs import std
+
+IntT = ir.IntT()
+BoolT = ir.BoolT()
+
+
+def lit(val):
+    return ir.Lit(IntT, val)
+
+
+def fin_var(sid, n):
+    return ir.VarRef(ir.IntT(ref=ir.Fin(ir.DomT(IntT), lit(n))), sid)
+
+
+def intervals(*terms):
+    iv = get_intervals(ir.TupleLit(ir.TupleT(*(t.T for t in terms)), *terms))
+    return [iv.of(t) for t in terms]
+
+
+def test_arithmetic():
+    x, y = fin_var(0, 9), fin_var(1, 4)
+    assert intervals(
+        ir.Sum(IntT, x, y, lit(-3)),
+        ir.Prod(IntT, x, ir.Neg(IntT, y)),
+        ir.FloorDiv(IntT, x, ir.Sum(IntT, y, lit(1))),
+        ir.FloorDiv(IntT, lit(7), ir.Sum(IntT, y, lit(-1))),
+        ir.Mod(IntT, x, lit(4)),
+        ir.Mod(IntT, lit(2), ir.Sum(IntT, y, lit(1))),
+        ir.Abs(IntT, ir.Sum(IntT, y, ir.Neg(IntT, x))),
+        ir.Ite(IntT, ir.Lt(BoolT, x, y), x, lit(20)),
+    ) == [(-3, 8), (-24, 0), (0, 8), (-7, 7), (0, 3), (0, 2), (0, 8), (0, 20)]
+
+
+def test_refinements():
+    x = fin_var(0, 9)
+    nat = ir.VarRef(std.Nat.node, 1)
+    dom = ir.DomLit(ir.DomT(IntT), lit(3), lit(-5), lit(4))
+    z = ir.VarRef(ir.IntT(ref=dom), 2)
+    assert intervals(nat, ir.Sum(IntT, nat, x), ir.Neg(IntT, nat), z, ir.Mod(IntT, nat, lit(7))) == \
+        [(1, None), (1, None), (None, -1), (-5, 4), (0, 6)]
+
+
+def test_card_and_reduce():
+    x, y = fin_var(0, 9), fin_var(1, 4)
+    n = ir.Sum(IntT, y, lit(2))
+    tup = ir.TupleLit(ir.TupleT(IntT, IntT, IntT), x, y, lit(1))
+    assert intervals(
+        ir.Card(IntT, ir.Fin(ir.DomT(IntT), n)),
+        ir.Card(IntT, ir.Fin(ir.DomT(IntT), lit(6))),
+        ir.SumReduce(IntT, tup),
+        ir.ProdReduce(IntT, tup),
+    ) == [(0, 5), (6, 6), (1, 12), (0, 24)]
+    iv = get_intervals(ir.Sum(IntT, x, y))
+    assert iv.width(x) == 5 and iv.width(ir.Sum(IntT, x, y)) == 5
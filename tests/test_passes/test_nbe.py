@@ -0,0 +1,62 @@
+"""NbEPass: beta normalization by evaluation and readback."""
+import sys
+
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.passes.pass_base import Context, PassManager
+from puzzlespec.compiler.passes.transforms.beta_reduction import BetaReductionHOAS, BetaReductionPass
+from puzzlespec.compiler.passes.transforms.nbe import NbEPass
+from puzzlespec.libs import nd
+from .conftest import run_transform
+
+IntT = ir.IntT()
+
+
+def lit(val):
+    return ir.Lit(IntT, val)
+
+
+def test_reduces_under_binder():
+    # λ. (λ. λ. BV1)(BV0)  ->  λ. λ. BV1
+    fT = ir.PiT(IntT, IntT)
+    inner = ir.Lambda(fT, ir.BoundVar(IntT, 1))
+    app = ir.Apply(fT, ir.Lambda(ir.PiT(IntT, fT), inner), ir.BoundVar(IntT, 0))
+    root = ir.Lambda(ir.PiT(IntT, fT), app)
+    assert run_transform(NbEPass, root) is ir.Lambda(root.T, inner)
+
+
+def test_reduces_created_redexes():
+    # (λf. f(3))(λx. x + 1)  ->  3 + 1, which BetaReductionPass needs two runs for
+    fT = ir.PiT(IntT, IntT)
+    inc = ir.Lambda(fT, ir.Sum(IntT, ir.BoundVar(IntT, 0), lit(1)))
+    call3 = ir.Lambda(ir.PiT(fT, IntT), ir.Apply(IntT, ir.BoundVar(fT, 0), lit(3)))
+    root = ir.Apply(IntT, call3, inc)
+    assert run_transform(NbEPass, root) is ir.Sum(IntT, lit(3), lit(1))
+    once = run_transform(BetaReductionPass, root)
+    assert isinstance(once, ir.Apply)
+
+
+def test_open_root():
+    # BV0 + (λ. BV1)(5): free variables keep their indices
+    lam = ir.Lambda(ir.PiT(IntT, IntT), ir.BoundVar(IntT, 1))
+    root = ir.Sum(IntT, ir.BoundVar(IntT, 0), ir.Apply(IntT, lam, lit(5)))
+    assert run_transform(NbEPass, root) is ir.Sum(IntT, ir.BoundVar(IntT, 0), ir.BoundVar(IntT, 0))
+
+
+def test_hoas_matches_beta_reduction_hoas():
+    arr = nd.fin(4) * nd.fin(4)
+    root = nd.tiles(arr, (2, 2), (2, 2)).forall(lambda t: t.size == 4).node
+    expected = PassManager(BetaReductionHOAS(), max_iter=20).run(root, Context())
+    assert run_transform(NbEPass, root) is expected
+
+
+def test_deep_ir():
+    depth = 3 * sys.getrecursionlimit()
+    body = ir.BoundVar(IntT, 0)
+    for i in range(depth):
+        body = ir.Sum(IntT, lit(i), body)
+    root = ir.Apply(IntT, ir.Lambda(ir.PiT(IntT, IntT), body), lit(7))
+    result = run_transform(NbEPass, root)
+    for i in reversed(range(depth)):
+        assert result.children[0] is lit(i)
+        result = result.children[1]
+    assert result is lit(7)
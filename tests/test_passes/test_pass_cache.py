@@ -0,0 +1,81 @@
+"""Memo tables shared across runs for passes that set cache_size."""
+import gc
+
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.passes.pass_base import Transform, Context, handles
+from puzzlespec.compiler.passes.transforms.const_fold import ConstFoldPass
+from .conftest import run_transform
+
+
+class CountingFold(ConstFoldPass):
+    name = "counting_fold"
+    cache_size = 8
+    visited = []
+
+    @handles(ir.Lit, ir.VarRef, ir.Sum, ir.Not)
+    def _(self, node: ir.Node):
+        CountingFold.visited.append(node)
+        return ConstFoldPass._dispatch[type(node)](self, node)
+
+
+def int_lit(val):
+    return ir.Lit(ir.IntT(), val)
+
+
+def setup_function():
+    CountingFold.clear_cache()
+    CountingFold.visited.clear()
+
+
+def test_per_run_cache_by_default():
+    class Plain(Transform):
+        name = "plain"
+    node = ir.Sum(ir.IntT(), int_lit(1), int_lit(2))
+    p = Plain()
+    p(node, Context())
+    first = p._cache
+    p(node, Context())
+    assert p._cache is not first
+
+
+def test_cache_shared_across_runs_and_instances():
+    x = ir.VarRef(ir.IntT(), 0)
+    node = ir.Sum(ir.IntT(), x, int_lit(2))
+    result = run_transform(CountingFold, node)
+    n_visited = len(CountingFold.visited)
+    assert n_visited > 0
+    assert run_transform(CountingFold, node) is result
+    assert len(CountingFold.visited) == n_visited
+
+
+def test_only_changed_region_revisited():
+    x = ir.VarRef(ir.IntT(), 0)
+    node = ir.Sum(ir.IntT(), x, int_lit(2))
+    run_transform(CountingFold, node)
+    CountingFold.visited.clear()
+    bigger = ir.Sum(ir.IntT(), node, int_lit(3))
+    run_transform(CountingFold, bigger)
+    assert set(CountingFold.visited) == {bigger, int_lit(3)}
+
+
+def test_cache_is_bounded():
+    node = ir.VarRef(ir.IntT(), 0)
+    for i in range(20):
+        node = ir.Sum(ir.IntT(), node, int_lit(i))
+        run_transform(CountingFold, node)
+    assert len(CountingFold._shared_cache) == CountingFold.cache_size
+    assert CountingFold.__dict__["_shared_cache"] is not ConstFoldPass.__dict__.get("_shared_cache")
+
+
+def test_cache_does_not_keep_nodes_alive():
+    x = ir.VarRef(ir.IntT(), 0)
+    node = ir.Sum(ir.IntT(), ir.Sum(ir.IntT(), x, int_lit(2)), int_lit(3))
+    run_transform(CountingFold, node)
+    assert len(CountingFold._shared_cache) > 0
+    n_interned = ir.num_interned()
+    del node
+    CountingFold.visited.clear()
+    gc.collect()
+    # Only what x keeps alive is left
+    assert ir.num_interned() < n_interned
+    assert all(k is x or k == x.T for k in CountingFold._shared_cache)
@@ -0,0 +1,58 @@
+"""Portfolio solving: racing solver configurations over serialized IR."""
+import multiprocessing
+
+import pytest
+
+from puzzlespec.compiler.backends import portfolio
+from puzzlespec.compiler.backends.portfolio import PortfolioConfig, PortfolioSolver, default_configs
+from puzzlespec.compiler.dsl.template import SpecTemplate
+from .conftest import check_sudoku, sudoku
+
+
+CLUES = {(0, 0): 2, (1, 2): 4, (3, 3): 1}
+
+
+def test_every_config():
+    pytest.importorskip("z3")
+    compiled = SpecTemplate(sudoku(), gen_vars=["givens"]).compile(N=4)
+    solver = PortfolioSolver(compiled)
+    assert {c.encoding for c in solver.configs} == {"fd", "cnf", "smt", "bv"}
+    out = compiled.outputs["cell_digits"]
+    for config in solver.configs:
+        # In process, on the serialized spec
+        vals = portfolio._run(solver.data, config, compiled.assumptions(givens=CLUES))
+        check_sudoku(compiled._read(out, vals), CLUES)
+        assert portfolio._run(solver.data, config, compiled.assumptions(givens={(0, 0): 1, (0, 1): 1})) is None
+
+
+def test_race():
+    solver = PortfolioSolver(SpecTemplate(sudoku(), gen_vars=["givens"]).compile(N=4), configs=default_configs(4))
+    sol, config = solver.solve(givens=CLUES)
+    assert config in solver.configs
+    check_sudoku(sol["cell_digits"], CLUES)
+    assert solver.solve(givens={(0, 0): 1, (0, 1): 1})[0] is None
+
+
+def test_spec_and_spawned_workers():
+    # Spawned workers share nothing with this process but the serialized IR
+    configs = [PortfolioConfig("fd", seed=0), PortfolioConfig("bogus")]
+    sol = portfolio.PortfolioSolver(sudoku(), configs, mp_context=multiprocessing.get_context("spawn"), N=4).solve()[0]
+    check_sudoku(sol["cell_digits"], {})
+    # A failing config drops out; if all fail, the error is raised
+    with pytest.raises(ValueError):
+        PortfolioSolver(sudoku(), [PortfolioConfig("bogus")], N=4).solve()
+
+
+def test_unknown_is_not_unsat():
+    pytest.importorskip("z3")
+    compiled = SpecTemplate(sudoku(), gen_vars=["givens"]).compile(N=4)
+    solver = PortfolioSolver(compiled)
+    give_up = (("max_conflicts", 0),)
+    for encoding in ("cnf", "smt", "bv"):
+        with pytest.raises(RuntimeError, match="z3 gave up"):
+            portfolio._run(solver.data, PortfolioConfig(encoding, params=give_up), compiled.assumptions(givens=CLUES))
+    # The configs that give up drop out, and the one that finishes decides
+    configs = [PortfolioConfig("smt", params=give_up), PortfolioConfig("cnf", params=give_up), PortfolioConfig("fd")]
+    sol, config = PortfolioSolver(compiled, configs, max_workers=2).solve(givens=CLUES)
+    assert config.encoding == "fd"
+    check_sudoku(sol["cell_digits"], CLUES)
@@ -0,0 +1,179 @@
+"""SMTLibEmitter: streaming scalar IR to SMT-LIB2."""
+import io
+import subprocess
+import sys
+
+import pytest
+
+from puzzlespec.compiler.backends.evaluator import Evaluator
+from puzzlespec.compiler.backends.smtlib import SMTLibEmitter, emit_smtlib
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.dsl.smt_backend import SMTBackend
+from .conftest import sudoku4
+
+IntT = ir.IntT()
+BoolT = ir.BoolT()
+
+
+def lit(val):
+    return ir.Lit(IntT, val)
+
+
+def fin_var(sid, n):
+    return ir.VarRef(ir.IntT(ref=ir.Fin(ir.DomT(IntT), lit(n))), sid)
+
+
+def spec(*cons):
+    return ir.Spec(ir.TupleLit(ir.TupleT(*(BoolT for _ in cons)), *cons), ir.TupleLit(ir.TupleT()))
+
+
+def test_declares_with_refinement():
+    x = fin_var(0, 9)
+    text = emit_smtlib(spec(ir.Lt(BoolT, lit(2), x)))
+    lines = text.splitlines()
+    assert lines[0] == "(set-logic QF_LIA)"
+    assert "(declare-fun v0 () Int)" in lines
+    assert "(assert (and (<= 0 v0) (< v0 9)))" in lines
+    assert "(assert (< 2 v0))" in lines
+    assert lines[-1] == "(check-sat)"
+
+
+def test_shared_term_defined_once():
+    x, y = fin_var(0, 9), fin_var(1, 9)
+    s = ir.Sum(IntT, x, y)
+    text = emit_smtlib(spec(ir.Lt(BoolT, s, lit(10)), ir.Lt(BoolT, lit(3), s)))
+    assert text.count("(+ v0 v1)") == 1
+    assert "(define-fun _t0 () Int (+ v0 v1))" in text
+    assert "(assert (< _t0 10))" in text
+    assert "(assert (< 3 _t0))" in text
+
+
+def test_nonlinear_logic():
+    x, y = fin_var(0, 9), fin_var(1, 9)
+    text = emit_smtlib(spec(ir.Eq(BoolT, ir.Prod(IntT, x, y), lit(12))))
+    assert text.startswith("(set-logic QF_NIA)")
+    text = emit_smtlib(spec(ir.Eq(BoolT, ir.Prod(IntT, lit(3), y), lit(12))))
+    assert text.startswith("(set-logic QF_LIA)")
+
+
+def test_streams_to_out():
+    xs = [fin_var(i, 4) for i in range(4)]
+    out = io.StringIO()
+    tup = ir.TupleLit(ir.TupleT(*(x.T for x in xs)), *xs)
+    assert emit_smtlib(spec(ir.AllDistinct(BoolT, tup)), out=out) is None
+    assert "(assert (distinct v0 v1 v2 v3))" in out.getvalue()
+
+
+def test_unencodable_refinement():
+    x = ir.VarRef(ir.IntT(ref=ir.Fin(ir.DomT(IntT), fin_var(1, 9))), 0)
+    with pytest.raises(ValueError):
+        emit_smtlib(spec(ir.Lt(BoolT, lit(2), x)))
+
+
+def test_z3_parses_output():
+    z3 = pytest.importorskip("z3")
+    xs = [fin_var(i, 3) for i in range(3)]
+    tup = ir.TupleLit(ir.TupleT(*(x.T for x in xs)), *xs)
+    total = ir.Sum(IntT, *xs)
+    text = emit_smtlib(spec(ir.AllDistinct(BoolT, tup), ir.Eq(BoolT, total, lit(3)), ir.Lt(BoolT, xs[0], xs[1])))
+    s = z3.Solver()
+    s.add(z3.parse_smt2_string(text))
+    assert s.check() == z3.sat
+    m = s.model()
+    vals = [m.eval(z3.Int(f"v{i}")).as_long() for i in range(3)]
+    assert sorted(vals) == [0, 1, 2] and vals[0] < vals[1]
+
+
+def range_var(sid, lo, hi):
+    return ir.VarRef(ir.IntT(ref=ir.Range(ir.DomT(IntT), lit(lo), lit(hi), lit(1))), sid)
+
+
+def test_bitvectors_minimal_width():
+    x = fin_var(0, 9)
+    text = emit_smtlib(spec(ir.Lt(BoolT, ir.Sum(IntT, x, x), lit(10))), bitvectors=True)
+    lines = text.splitlines()
+    assert lines[0] == "(set-logic QF_BV)"
+    # x + x is at most 16, which takes 6 signed bits
+    assert "(declare-fun v0 () (_ BitVec 6))" in lines
+    assert "(assert (and (bvsle (_ bv0 6) v0) (bvsle v0 (_ bv8 6))))" in lines
+    assert "(assert (bvslt (bvadd v0 v0) (_ bv10 6)))" in lines
+    # An unbounded Int has no bitvector encoding
+    with pytest.raises(ValueError):
+        emit_smtlib(spec(ir.Lt(BoolT, lit(2), ir.VarRef(IntT, 1))), bitvectors=True)
+
+
+@pytest.mark.parametrize("make, f", [
+    (lambda x, y: ir.Eq(BoolT, ir.FloorDiv(IntT, x, y), lit(-2)), lambda a, b: a // b == -2),
+    (lambda x, y: ir.Eq(BoolT, ir.Mod(IntT, x, y), lit(-1)), lambda a, b: a % b == -1),
+    (lambda x, y: ir.Lt(BoolT, ir.Abs(IntT, ir.Sum(IntT, y, ir.Neg(IntT, x))), lit(3)), lambda a, b: abs(b - a) < 3),
+    (lambda x, y: ir.Lt(BoolT, lit(40), ir.Prod(IntT, x, y, y)), lambda a, b: a*b*b > 40),
+])
+def test_bitvectors_match_ints(make, f):
+    z3 = pytest.importorskip("z3")
+    x, y = fin_var(0, 9), range_var(1, -4, 5)
+    # y != 0 keeps division defined
+    text = emit_smtlib(spec(make(x, y), ir.Not(BoolT, ir.Eq(BoolT, y, lit(0)))), bitvectors=True)
+    s = z3.Solver()
+    s.from_string(text)
+    found = set()
+    while s.check() == z3.sat:
+        m = s.model()
+        decls = {d.name(): d for d in m.decls()}
+        found.add((m[decls["v0"]].as_signed_long(), m[decls["v1"]].as_signed_long()))
+        s.add(z3.Or([d() != m[d] for d in decls.values()]))
+    assert found == {(a, b) for a in range(9) for b in range(-4, 5) if b != 0 and f(a, b)}
+
+
+@pytest.mark.parametrize("bitvectors", [False, True])
+@pytest.mark.parametrize("make, f", [
+    (lambda x, y: ir.Eq(BoolT, ir.FloorDiv(IntT, x, y), lit(-4)), lambda a, b: a // b == -4),
+    (lambda x, y: ir.Eq(BoolT, ir.Mod(IntT, x, y), lit(-1)), lambda a, b: a % b == -1),
+    (lambda x, y: ir.Eq(BoolT, ir.FloorDiv(IntT, x, lit(-3)), y), lambda a, b: a // -3 == b),
+    (lambda x, y: ir.Eq(BoolT, ir.Mod(IntT, x, lit(-3)), y), lambda a, b: a % -3 == b),
+])
+def test_negative_divisors_match_evaluator(make, f, bitvectors):
+    z3 = pytest.importorskip("z3")
+    x, y = range_var(0, -9, 9), range_var(1, -3, 0)
+    s = spec(make(x, y))
+    solver = z3.Solver()
+    solver.from_string(emit_smtlib(s, bitvectors=bitvectors))
+    found = set()
+    while solver.check() == z3.sat:
+        m = solver.model()
+        # The model also interprets division by zero; only the vars count
+        decls = [d for d in m.decls() if d.name() in ("v0", "v1")]
+        vals = {d.name(): m[d].as_signed_long() if bitvectors else m[d].as_long() for d in decls}
+        found.add((vals["v0"], vals["v1"]))
+        solver.add(z3.Or([d() != m[d] for d in decls]))
+    ev = Evaluator(s)
+    expected = {(a, b) for a in range(-9, 9) for b in range(-3, 0) if ev.check({0: a, 1: b}).ok}
+    assert expected == {(a, b) for a in range(-9, 9) for b in range(-3, 0) if f(a, b)}
+    assert found == expected
+
+
+@pytest.mark.parametrize("bitvectors", [False, True])
+def test_generate_dsl_puzzle(bitvectors):
+    z3 = pytest.importorskip("z3")
+    text = SMTBackend(sudoku4()).generate(bitvectors=bitvectors)
+    s = z3.Solver()
+    s.from_string(text)
+    n = 0
+    while s.check() == z3.sat:
+        m = s.model()
+        cells = [d for d in m.decls() if d.arity() == 0]
+        assert len(cells) == 16
+        vals = sorted(m[d].as_signed_long() if bitvectors else m[d].as_long() for d in cells)
+        assert vals == [v for v in range(1, 5) for _ in range(4)]
+        s.add(z3.Or([d() != m[d] for d in cells]))
+        n += 1
+    assert n == 288
+
+
+@pytest.mark.parametrize("stmt", [
+    "import puzzlespec.compiler.dsl.smt_backend",
+    "import puzzlespec.compiler.dsl.cnf_backend",
+    "from puzzlespec.compiler.backends import SMTBackend, CNFBackend",
+])
+def test_backends_import_alone(stmt):
+    # In a fresh interpreter, so nothing is imported beforehand
+    subprocess.run([sys.executable, "-c", stmt], check=True)
@@ -0,0 +1,104 @@
+"""Staged evaluation: specs compiled to Python for repeated checking."""
+import numpy as np
+import pytest
+
+from puzzlespec import Int, PuzzleSpecBuilder, func_var, var
+from puzzlespec.compiler.backends.staged import StagedEvaluator
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.libs import nd, std
+from .conftest import GRID, agrees, sudoku, unruly
+
+
+def _check(spec, assignments):
+    """StagedEvaluator's results, which must match Evaluator's assignment by
+    assignment."""
+    st = StagedEvaluator(spec)
+    results = [st.check(values) for values in assignments]
+    agrees(spec, assignments, results)
+    return results
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_sudoku(optimize):
+    spec = sudoku().optimize() if optimize else sudoku()
+    rows = GRID.copy()
+    rows[0, [0, 1]] = rows[0, [1, 0]]
+    both = GRID.copy()
+    both[0, [1, 2]] = both[0, [2, 1]]
+    bad = GRID.copy()
+    bad[0, 0] = 7
+    sol = {(r, c): int(GRID[r, c]) for r in range(4) for c in range(4)}
+    res = _check(spec, [
+        dict(N=4, cell_digits=GRID, givens={}),
+        dict(N=4, cell_digits=sol, givens={(0, 0): 1, (3, 3): 1}),
+        dict(N=4, cell_digits=GRID, givens={(0, 0): 2}),
+        dict(N=4, cell_digits=rows, givens={}),
+        dict(N=4, cell_digits=both, givens={}),
+        dict(N=4, cell_digits=bad, givens={}),
+        dict(N=1, cell_digits=[[1]], givens={}),
+        dict(N=4, cell_digits=GRID[:3], givens={}),
+    ])
+    assert [r.ok for r in res] == [True, True, False, False, False, False, False, False]
+    assert res[5].invalid == ["cell_digits"]
+
+
+def test_unruly():
+    spec = unruly(6)
+    valid = np.array([[0, 0, 1, 0, 1, 1],
+                      [1, 1, 0, 1, 0, 0],
+                      [0, 1, 0, 0, 1, 1],
+                      [1, 0, 1, 1, 0, 0],
+                      [0, 1, 1, 0, 0, 1],
+                      [1, 0, 0, 1, 1, 0]])
+    grids = np.random.default_rng(1).integers(0, 2, size=(20, 6, 6))
+    grids[0] = valid
+    grids[1] = valid
+    grids[1, 0, :3] = 1
+    grids[2] = valid
+    grids[2, 0, 0] = 2
+    labels = np.where(valid == 0, 'B', 'W')
+    res = _check(spec, [dict(color=g) for g in grids] + [dict(color=labels)])
+    assert res[0].ok and not res[1].ok and res[-1].ok
+    assert res[2].invalid == ["color"]
+
+
+def test_undefined():
+    p = PuzzleSpecBuilder()
+    n = var(std.Nat, name='n')
+    xs = func_var(nd.fin(n), nd.range(0, 10), name='xs')
+    d = var(Int, name='d')
+    total = std.sum([xs(0), xs(1), xs(2)])
+    p += total == 10
+    p += (total // d) == 5
+    p += nd.fin(n).exists(lambda i: xs(i) == 0)
+    spec = p.build("Arith")
+    for s in (spec, spec.optimize()):
+        # What is kept between checks is redone when n changes
+        res = _check(s, [
+            dict(n=3, xs=[0, 3, 7], d=2),
+            dict(n=3, xs=[0, 3, 7], d=0),
+            dict(n=3, xs=[1, 2, 7], d=2),
+            dict(n=0, xs=[], d=2),
+            dict(n="3", xs=[0, 3, 7], d=2),
+            dict(n=3, xs=[0, 3, 7], d=-2),
+        ])
+        assert [r.ok for r in res] == [True, False, False, False, False, False]
+        assert res[3].invalid == ["n"] and res[4].invalid == ["n", "xs"]
+
+
+def test_scalar_spec():
+    IntT = ir.IntT()
+    x = [ir.VarRef(ir.IntT(ref=ir.Fin(ir.DomT(IntT), ir.Lit(IntT, 3))), i) for i in range(3)]
+    tup = ir.TupleLit(ir.TupleT(*(v.T for v in x)), *x)
+    cons = (ir.AllDistinct(ir.BoolT(), tup), ir.Eq(ir.BoolT(), ir.SumReduce(IntT, tup), ir.Lit(IntT, 3)))
+    spec = ir.Spec(ir.TupleLit(ir.TupleT(*(c.T for c in cons)), *cons), ir.TupleLit(ir.TupleT()))
+    res = _check(spec, [{0: 2, 1: 0, 2: 1}, {0: 1, 1: 1, 2: 1}, {0: 3, 1: 0, 2: 0}, {0: 1.0, 1: 0, 2: 2}])
+    assert [r.ok for r in res] == [True, False, False, False]
+
+
+def test_source():
+    st = StagedEvaluator(sudoku())
+    compile(st.source, "<staged>", "exec")
+    assert "def _check(" in st.source
+    with pytest.raises(ValueError, match="No value for"):
+        st.check(N=4, cell_digits=GRID)
@@ -0,0 +1,99 @@
+"""Symmetry detection and lex-leader symmetry breaking."""
+import itertools
+
+from puzzlespec import PuzzleSpecBuilder, func_var
+from puzzlespec.compiler.dsl import ir
+from puzzlespec.compiler.dsl.template import SpecTemplate
+from puzzlespec.compiler.passes.analyses.getter import get_vars
+from puzzlespec.libs import nd, std, topology as topo
+from .conftest import check_sudoku, sudoku
+
+
+def coloring(nR, nC, fix=False):
+    """Proper 3-colorings of an nR x nC grid."""
+    p = PuzzleSpecBuilder()
+    grid = topo.Grid2D(nR, nC)
+    Colors, C = std.make_enum('R', 'G', 'B')
+    color = func_var(grid.cells(), Colors, name='color')
+    for size in ((1, 2), (2, 1)):
+        p += nd.tiles(color, size=size, stride=(1, 1)).forall(lambda w: std.distinct(w))
+    if fix:
+        p += color((0, 0)) == C.R
+    return p.build("Coloring")
+
+
+def test_sudoku():
+    compiled = SpecTemplate(sudoku(), gen_vars=["givens"], seed=0, break_symmetries=True).compile(N=4)
+    syms = compiled.symmetries
+    assert [g.name for g in syms.grid] == ['flip_rows', 'flip_cols', 'rot180', 'transpose', 'anti_transpose', 'rot90', 'rot270']
+    assert len(syms.values) == 1 and [v.val for v in syms.values[0].values] == [1, 2, 3, 4]
+    # 288 grids, 12 after breaking; the clues are not symmetric, so an
+    # instance with clues counts with the plain solver
+    assert compiled.count_solutions(limit=400) == 12
+    assert compiled.count_solutions(givens={(0, 0): 1}, limit=400) == 72
+    # Seeded generation maps the representative by a random symmetry
+    sols = [compiled.solve()["cell_digits"] for _ in range(8)]
+    for sol in sols:
+        check_sudoku(sol)
+    assert len({tuple(sorted(s.items())) for s in sols}) > 1
+
+
+def test_no_symmetries_without_flag():
+    compiled = SpecTemplate(sudoku(), gen_vars=["givens"]).compile(N=4)
+    assert compiled.symmetries is None
+    # More than the 12 classes
+    assert compiled.count_solutions(limit=13) == 13
+
+
+def test_coloring():
+    syms = SpecTemplate(coloring(3, 3), gen_vars=(), break_symmetries=True).compile().symmetries
+    assert len(syms.values) == 1 and [v.val for v in syms.values[0].values] == [0, 1, 2]
+    assert len(syms.grid) == 7
+    # No transposes of a rectangle
+    syms = SpecTemplate(coloring(2, 3), gen_vars=(), break_symmetries=True).compile().symmetries
+    assert [g.name for g in syms.grid] == ['flip_rows', 'flip_cols', 'rot180']
+    # Fixing a corner leaves only the transpose fixing it, and no value symmetry
+    syms = SpecTemplate(coloring(3, 3, fix=True), gen_vars=(), break_symmetries=True).compile().symmetries
+    assert syms.values == [] and [g.name for g in syms.grid] == ['transpose']
+
+
+def _orbits(nR, nC):
+    """Classes of proper 3-colorings of an nR x nC grid under flips and
+    color permutations, by brute force."""
+    cells = [(r, c) for r in range(nR) for c in range(nC)]
+    ops = [lambda r, c: (r, c), lambda r, c: (nR-1-r, c),
+           lambda r, c: (r, nC-1-c), lambda r, c: (nR-1-r, nC-1-c)]
+    seen, orbits = set(), 0
+    for cols in itertools.product(range(3), repeat=len(cells)):
+        g = dict(zip(cells, cols))
+        if any(g[r, c] == g[r+1, c] for r in range(nR-1) for c in range(nC)):
+            continue
+        if any(g[r, c] == g[r, c+1] for r in range(nR) for c in range(nC-1)):
+            continue
+        key = tuple(cols)
+        if key in seen:
+            continue
+        orbits += 1
+        for op in ops:
+            for perm in itertools.permutations(range(3)):
+                seen.add(tuple(perm[g[op(r, c)]] for r, c in cells))
+    return orbits
+
+
+def test_breaking_is_sound():
+    compiled = SpecTemplate(coloring(2, 3), gen_vars=(), break_symmetries=True).compile()
+    broken = compiled.count_solutions(limit=10**4)
+    plain = compiled.solver.count_solutions({}, 10**4, None)
+    assert plain == 54
+    # At least one solution per class survives
+    assert _orbits(2, 3) <= broken < plain
+
+
+def test_vars_in_types():
+    # N occurs only in the types of x and of the literal
+    IntT = ir.IntT()
+    N, M = ir.VarRef(IntT, 5), ir.VarRef(IntT, 6)
+    x = ir.VarRef(ir.IntT(ref=ir.Fin(ir.DomT(IntT), N)), 1)
+    assert get_vars(ir.Eq(ir.BoolT(), x, ir.Lit(IntT, 1))) == {x, N}
+    lit = ir.Lit(ir.IntT(ref=ir.Fin(ir.DomT(IntT), M)), 0)
+    assert get_vars(ir.Eq(ir.BoolT(), lit, ir.Lit(IntT, 1))) == {M}
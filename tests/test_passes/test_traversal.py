@@ -0,0 +1,169 @@
+"""Pass traversal engine: handler dispatch tables, and explicit-stack traversal
+of trees deeper than the recursion limit."""
+import sys
+
+from puzzlespec.compiler.dsl import ast, ir, utils
+from puzzlespec.compiler.passes.analyses.info import count
+from puzzlespec.compiler.passes.analyses.type_check import TypeCheckingPass, stripT
+from puzzlespec.compiler.passes.pass_base import Context, Transform, handles
+from puzzlespec.compiler.passes.transforms.beta_reduction import BetaReductionPass
+from puzzlespec.compiler.passes.transforms.canonicalize import CanonicalizePass
+from puzzlespec.compiler.passes.transforms.const_fold import ConstFoldPass
+from puzzlespec.compiler.passes.transforms.substitution import SubMapping, SubstitutionPass
+from .conftest import run_transform
+
+DEPTH = 3 * sys.getrecursionlimit()
+
+
+def int_lit(val):
+    return ir.Lit(ir.IntT(), val)
+
+
+class NegateInts(Transform):
+    name = "negate_ints"
+
+    @handles(ir.Lit)
+    def _(self, node: ir.Lit):
+        if isinstance(node.T, ir.IntT):
+            return ir.Lit(node.T, -node.val)
+        return node
+
+    @handles(ir.Value)
+    def _(self, node: ir.Value):
+        return super().visit(node)
+
+
+class NegateIntsKeepSums(NegateInts):
+    name = "negate_ints_keep_sums"
+
+    @handles(ir.Sum)
+    def _(self, node: ir.Sum):
+        return node
+
+
+def int_lit(val):
+    return ir.Lit(ir.IntT(), val)
+
+
+def test_dispatch_table_resolves_by_mro():
+    table = NegateInts._dispatch
+    assert table[ir.Lit] is not table[ir.Sum]
+    assert table[ir.Sum] is table[ir.Not]
+    assert table[ir.IntT] is Transform.visit
+
+
+def test_dispatch_table_inherits_parent_handlers():
+    table = NegateIntsKeepSums._dispatch
+    assert table[ir.Lit] is NegateInts._dispatch[ir.Lit]
+    assert table[ir.Sum] is not NegateInts._dispatch[ir.Sum]
+    node = ir.Neg(ir.IntT(), ir.Sum(ir.IntT(), int_lit(1), int_lit(2)))
+    assert run_transform(NegateInts, node) is ir.Neg(ir.IntT(), ir.Sum(ir.IntT(), int_lit(-1), int_lit(-2)))
+    assert run_transform(NegateIntsKeepSums, node) is node
+
+
+def not_chain(leaf, depth=DEPTH):
+    node = leaf
+    for _ in range(depth):
+        node = ir.Not(ir.BoolT(), node)
+    return node
+
+
+def sum_chain(leaf, depth=DEPTH):
+    node = leaf
+    for i in range(depth):
+        node = ir.Sum(ir.IntT(), int_lit(i), node)
+    return node
+
+
+def test_const_fold_deep_not_chain():
+    result = run_transform(ConstFoldPass, not_chain(ir.Lit(ir.BoolT(), True)))
+    assert result is ir.Lit(ir.BoolT(), DEPTH % 2 == 0)
+
+
+def test_canonicalize_flattens_deep_sum_chain():
+    x = ir.VarRef(ir.IntT(), 0)
+    result = run_transform(CanonicalizePass, sum_chain(x))
+    assert isinstance(result, ir.Sum)
+    assert len(result.children) == DEPTH + 1
+
+
+def test_analysis_deep_chain():
+    assert count(not_chain(ir.Lit(ir.BoolT(), True)), unique=True) == DEPTH + 2
+
+
+def test_utils_deep_chain():
+    x = ir.VarRef(ir.IntT(), 0)
+    chain = sum_chain(x)
+    assert utils._has_freevar(chain)
+    assert not utils._is_concrete(chain)
+    assert utils._is_concrete(sum_chain(int_lit(0)))
+    new = utils._substitute(chain, {x: int_lit(7)})
+    assert not utils._has_freevar(new)
+
+
+def test_beta_reduction_deep_body():
+    # (λ. BV0 + (0 + (1 + ...)))(5)
+    body = sum_chain(ir.BoundVar(ir.IntT(), 0))
+    lam = ir.Lambda(ir.PiT(ir.IntT(), ir.IntT()), body)
+    app = ir.Apply(ir.IntT(), lam, int_lit(5))
+    result = run_transform(BetaReductionPass, app)
+    assert result is sum_chain(int_lit(5))
+
+
+def test_beta_reduction_shift_under_binder():
+    # λ. (λ. λ. BV1)(BV0)  ->  λ. λ. BV1
+    IntT = ir.IntT()
+    fT = ir.PiT(IntT, IntT)
+    inner = ir.Lambda(fT, ir.BoundVar(IntT, 1))
+    outer = ir.Lambda(ir.PiT(IntT, fT), inner)
+    app = ir.Apply(fT, outer, ir.BoundVar(IntT, 0))
+    root = ir.Lambda(ir.PiT(IntT, fT), app)
+    result = run_transform(BetaReductionPass, root)
+    assert result is ir.Lambda(root.T, inner)
+
+
+def test_simplify_deep_sum_chain():
+    # Type checking and guard lifting carry binder context, and still walk
+    # the chain without recursing
+    x = ir.VarRef(ir.IntT(), 0)
+    cmp = ir.Lt(ir.BoolT(), sum_chain(x), int_lit(3))
+    result = ast.wrap(cmp).simplify().node
+    assert result is ir.Lt(ir.BoolT(), ir.Sum(ir.IntT(), int_lit(DEPTH*(DEPTH-1)//2), x), int_lit(3))
+
+
+def test_type_check_binder_context():
+    # λ:Int. λ:Bool. BV0 ∧ (BV1 + (0 + ...)) < 3
+    IntT, BoolT = ir.IntT(), ir.BoolT()
+    inner_body = ir.Conj(BoolT, ir.BoundVar(BoolT, 0), ir.Lt(BoolT, sum_chain(ir.BoundVar(IntT, 1)), int_lit(3)))
+    innerT = ir.PiT(BoolT, BoolT)
+    lam = ir.Lambda(ir.PiT(IntT, innerT), ir.Lambda(innerT, inner_body))
+    tmap = TypeCheckingPass()(lam, Context())
+    assert tmap.Tmap[ir.BoundVar(BoolT, 0)] is BoolT
+    assert tmap.Tmap[ir.BoundVar(IntT, 1)] is IntT
+    assert tmap.Tmap[lam] is lam.T
+
+
+def test_strip_type_deep():
+    T = ir.IntT()
+    for _ in range(DEPTH):
+        T = ir.TupleT(T, ir.BoolT(), obl=ir.Lit(ir.BoolT(), True))
+    stripped = stripT(T)
+    for _ in range(DEPTH):
+        assert stripped.obl is None
+        stripped = stripped.children[0]
+    assert stripped is ir.IntT()
+
+
+def test_substitution_deep_chain():
+    x, y = ir.VarRef(ir.IntT(), 0), ir.VarRef(ir.IntT(), 1)
+    inner = ir.Sum(ir.IntT(), x, y)
+    submap = SubMapping()
+    seen = []
+    def match(node):
+        seen.append(node)
+        return node is inner
+    submap.add(match, lambda node: int_lit(7))
+    result, _ = SubstitutionPass()(sum_chain(inner), Context(submap))
+    assert result is sum_chain(int_lit(7))
+    # Replaced nodes are not descended into
+    assert x not in seen and y not in seen